@@ -12,8 +12,8 @@ from .model import Model, PropertyRequiredException  # noqa: F401
 
 # Field metadata types
 from .fields import (  # noqa: F401
-    Required, Generator, Converter, Default, Validators, Marshal,
-    MongoIndex, MongoTextIndex, MongoUniqueIndex,
+    Required, Generator, Converter, Default, Validators, Marshal, Ref,
+    MongoIndex, MongoTextIndex, MongoUniqueIndex, MongoCaseInsensitiveIndex, MongoGeoIndex,
     FieldProxy, AppKernelMeta,
     get_field_meta, get_field_validators_meta, get_field_marshaller,
     is_field_required, is_field_omitted,
@@ -25,10 +25,22 @@ from .fields import (  # noqa: F401
 from .validators import NotEmpty, Regexp, Past, Future, ValidationException, Email, Min, Max, Validator, Unique  # noqa: F401
 
 # Generators & converters
-from .generators import create_uuid_generator, date_now_generator, content_hasher  # noqa: F401
+from .generators import (  # noqa: F401
+    create_uuid_generator, create_uuid7_generator, create_ulid_generator, create_object_id_generator,
+    date_now_generator, content_hasher,
+)
 
 # Repository
-from .repository import Repository, AuditableRepository, MongoQuery, MongoRepository, Query  # noqa: F401
+from .repository import (  # noqa: F401
+    Repository, AuditableRepository, MongoQuery, MongoRepository, Query, QueryCostException, QueryCostPolicy,
+    ResultPage,
+)
+from .pipelines import NamedPipeline, Param, pipeline_metrics  # noqa: F401
+from .materialized import MaterializedView, refresh_view  # noqa: F401
+from .read_routing import ReadPolicy, causal_session, reading  # noqa: F401
+from .patch_retry import PatchRetryPolicy, conflict_metrics  # noqa: F401
+from .geo import GeoJSON, GeoPoint, GeoPolygon  # noqa: F401
+from .time_series import TimeSeriesOptions  # noqa: F401
 
 # Service
 from .service import ServiceException  # noqa: F401
@@ -41,6 +53,8 @@ from .engine import AppKernelEngine, ResourceController, CorsConfig  # noqa: F40
 from .openapi import OpenAPISchemaGenerator  # noqa: F401
 from .http_client import HttpClientConfig, CircuitBreakerConfig, CircuitOpenError  # noqa: F401
 from .rate_limit import RateLimitConfig  # noqa: F401
+from .index_advisor import IndexAdvisor, IndexAdvisorConfig, IndexReport, QueryShape  # noqa: F401
+from .mongo_metrics import MongoMetrics  # noqa: F401
 
 # Configuration
 from .configuration import config  # noqa: F401
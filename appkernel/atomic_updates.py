@@ -0,0 +1,425 @@
+"""Atomic field updates sent over HTTP.
+
+``PATCH {model}/{id}`` accepts, besides a plain partial document, three payloads which are compiled
+to a single atomic ``find_one_and_update`` and answered with the updated document, so that clients do
+not have to GET, modify and PUT:
+
+- an update operator document, e.g. ``{"$inc": {"stock": -1}, "$set": {"status": "RESERVED"}}``,
+  restricted to :data:`UPDATE_OPERATORS`;
+- a JSON Merge Patch (RFC 7386) sent as ``application/merge-patch+json``: members set to ``null``
+  are removed, nested objects are merged member by member and every other value replaces the
+  stored one;
+- a JSON Patch (RFC 6902) sent as ``application/json-patch+json``: ``add``, ``remove``, ``replace``
+  and ``test`` operations become targeted ``$set``, ``$unset``, ``$push`` and ``$pull`` updates of
+  single (array) elements and conditions of the filter, so that one element of a large embedded
+  list is changed without sending the whole list. A ``test`` of ``/version`` makes the patch
+  conditional on the version, like a versioned save.
+
+Every path must start with a field of the Model (``id``, ``version`` and other repository managed
+fields cannot be updated) and resolve through nested Models, list indexes and dict keys to a declared
+field; only untyped (``Any``, ``dict``) content accepts arbitrary paths. ``$inc`` and ``$mul`` only
+apply to numeric fields, required fields cannot be removed, the values of ``$set``, ``$min`` and
+``$max`` are validated (type and field validators) and converted like the field they are written to,
+and those of ``$push``, ``$addToSet`` and ``$pull`` like an item of the list.
+"""
+from __future__ import annotations
+
+import types
+from collections.abc import Callable
+from dataclasses import dataclass
+from decimal import Decimal
+from enum import Enum
+from typing import Annotated, Any, Union, get_args, get_origin
+
+from pydantic import ValidationError
+
+from .fields import extract_base_type, get_field_validators_meta, is_field_required
+from .geo import GeoJSON
+from .model import Model
+from .patch_retry import FIELD_VERSIONS
+from .validators import ValidationException, Validator
+
+MERGE_PATCH_MEDIA_TYPE = 'application/merge-patch+json'
+JSON_PATCH_MEDIA_TYPE = 'application/json-patch+json'
+JSON_PATCH_OPERATIONS = ('add', 'remove', 'replace', 'test')
+UPDATE_OPERATORS = frozenset({'$set', '$unset', '$inc', '$mul', '$min', '$max', '$currentDate', '$push',
+                              '$addToSet', '$pull'})
+_NUMERIC_OPERATORS = frozenset({'$inc', '$mul'})
+_VALIDATED_OPERATORS = frozenset({'$set', '$min', '$max'})
+_ARRAY_OPERATORS = frozenset({'$push', '$addToSet', '$pull'})
+_ARRAY_MODIFIERS = {'$push': frozenset({'$each', '$position', '$slice', '$sort'}), '$addToSet': frozenset({'$each'})}
+_PULL_CONDITIONS = frozenset({'$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$in', '$nin'})
+_NUMERIC_TYPES = (int, float, Decimal)
+_MANAGED_FIELDS = frozenset({'_id', 'id', 'version', '_type', FIELD_VERSIONS})
+
+
+def is_operator_update(document: Any) -> bool:
+    """True if the document is an update operator document rather than a partial document."""
+    return isinstance(document, dict) and any(str(key).startswith('$') for key in document)
+
+
+def is_merge_patch(content_type: str | None) -> bool:
+    return (content_type or '').split(';')[0].strip().lower() == MERGE_PATCH_MEDIA_TYPE
+
+
+def merge_patch_to_update(patch: Any) -> dict[str, dict[str, Any]]:
+    """Translate a JSON Merge Patch into ``$set`` and ``$unset`` of dotted paths.
+
+    Nested objects are merged into the stored sub-document, so their parent must be a
+    sub-document or missing. The dotted paths are validated by :func:`compile_operator_update`.
+    """
+    if not isinstance(patch, dict) or not patch:
+        raise ValidationException('A merge patch must be a non-empty JSON object.')
+    to_set: dict[str, Any] = {}
+    to_unset: dict[str, Any] = {}
+
+    def merge(prefix: str, node: dict[str, Any]) -> None:
+        for key, value in node.items():
+            path = f'{prefix}{key}'
+            if value is None:
+                to_unset[path] = ''
+            elif isinstance(value, dict) and value:
+                merge(f'{path}.', value)
+            else:
+                to_set[path] = value
+
+    merge('', patch)
+    update = {}
+    if to_set:
+        update['$set'] = to_set
+    if to_unset:
+        update['$unset'] = to_unset
+    return update
+
+
+def _check_path(model_class: type, path: str) -> str:
+    segments = path.split('.')
+    if any(not segment or segment.startswith('$') for segment in segments):
+        raise ValidationException(f'The update path {path!r} is not valid.')
+    name = segments[0]
+    if name in _MANAGED_FIELDS:
+        raise ValidationException(f'The field {name!r} is maintained by the repository.')
+    if name not in model_class.model_fields:
+        raise ValidationException(f'{model_class.__name__} has no field {name!r}.')
+    return name
+
+
+@dataclass(frozen=True)
+class _ResolvedPath:
+    """Where a dotted path leads: the field of the (nested) Model owning the addressed value, the
+    list indexes (``None``) and dict keys below that field, and the type of the addressed value."""
+    owner: type
+    name: str
+    below: tuple[str | None, ...]
+    annotation: Any
+    indexes: frozenset[int]
+
+
+def _value_type(annotation: Any) -> Any:
+    """The annotation without ``Annotated`` metadata and ``None`` of an optional."""
+    while True:
+        origin = get_origin(annotation)
+        if origin is Annotated:
+            annotation = get_args(annotation)[0]
+        elif origin is Union or isinstance(annotation, types.UnionType):
+            options = [arg for arg in get_args(annotation) if arg is not type(None)]
+            if len(options) != 1:
+                return Any
+            annotation = options[0]
+        else:
+            return annotation
+
+
+def _resolve_path(model_class: type, segments: list[str]) -> _ResolvedPath:
+    """Resolve the segments of an update path through nested Models, list indexes and dict keys.
+
+    Raises:
+        ValidationException: A segment is neither a field of a nested Model, an index of a list
+            nor a key of a dict.
+    """
+    owner, name, below, indexes = model_class, segments[0], [], set()
+    annotation = model_class.model_fields[name].annotation
+    for position, segment in enumerate(segments[1:], start=1):
+        value_type = _value_type(annotation)
+        origin = get_origin(value_type) or value_type
+        if value_type is Any:
+            below.append(segment)
+        elif isinstance(value_type, type) and issubclass(value_type, Model) and segment in value_type.model_fields:
+            owner, name, below = value_type, segment, []
+            annotation = value_type.model_fields[segment].annotation
+        elif origin is list and segment.isdigit():
+            below.append(None)
+            indexes.add(position)
+            annotation = (get_args(value_type) or (Any,))[0]
+        elif origin is dict:
+            below.append(segment)
+            annotation = (get_args(value_type) or (Any, Any))[-1]
+        else:
+            raise ValidationException(f"The update path {'.'.join(segments)!r} does not lead to a field "
+                                      f'of {model_class.__name__}.')
+    return _ResolvedPath(owner, name, tuple(below), _value_type(annotation), frozenset(indexes))
+
+
+def _path_value(model_class: type, segments: list[str], value: Any, converter_func: Callable | None) -> Any:
+    """The value written to the path, validated and converted like the field it lands in."""
+    resolved = _resolve_path(model_class, segments)
+    for step in reversed(resolved.below):
+        value = [value] if step is None else {step: value}
+    converted = _field_value(resolved.owner, resolved.name, value, converter_func)
+    for step in resolved.below:
+        converted = converted[0] if step is None else converted[step]
+    return converted
+
+
+def _array_argument(model_class: type, operator: str, path: str, value: Any,
+                    converter_func: Callable | None) -> Any:
+    """The argument of ``$push``, ``$addToSet`` or ``$pull`` with its items validated like the list items."""
+    segments = path.split('.')
+    resolved = _resolve_path(model_class, segments)
+    if resolved.annotation is not Any and (get_origin(resolved.annotation) or resolved.annotation) is not list:
+        raise ValidationException(f'{operator} needs a list field, got {path!r}.')
+
+    def item(element: Any) -> Any:
+        return _path_value(model_class, segments + ['0'], element, converter_func)
+
+    if not isinstance(value, dict) or not any(str(key).startswith('$') for key in value):
+        return item(value)
+    if operator == '$pull':
+        if not set(value) <= _PULL_CONDITIONS:
+            raise ValidationException(f"$pull takes an item or a condition of {', '.join(sorted(_PULL_CONDITIONS))}, "
+                                      f'got {value!r}.')
+        conditions = {}
+        for condition, operand in value.items():
+            if condition in ('$in', '$nin'):
+                if not isinstance(operand, list):
+                    raise ValidationException(f'{condition} takes a list, got {operand!r}.')
+                conditions[condition] = [item(element) for element in operand]
+            else:
+                conditions[condition] = item(operand)
+        return conditions
+    if '$each' not in value or not set(value) <= _ARRAY_MODIFIERS[operator] or not isinstance(value['$each'], list):
+        raise ValidationException(f"{operator} takes an item or a list of items in $each with the modifiers "
+                                  f"{', '.join(sorted(_ARRAY_MODIFIERS[operator]))}, got {value!r}.")
+    for modifier in ('$position', '$slice'):
+        if modifier in value and (isinstance(value[modifier], bool) or not isinstance(value[modifier], int)):
+            raise ValidationException(f'{modifier} must be an integer, got {value[modifier]!r}.')
+    if '$sort' in value and value['$sort'] not in (1, -1) and not (isinstance(value['$sort'], dict) and all(
+            direction in (1, -1) for direction in value['$sort'].values())):
+        raise ValidationException(f"$sort takes 1, -1 or a document of them, got {value['$sort']!r}.")
+    return {**value, '$each': [item(element) for element in value['$each']]}
+
+
+def _check_conflicts(paths: list[str]) -> None:
+    ordered = sorted(paths)
+    for first, second in zip(ordered, ordered[1:]):
+        if first == second or second.startswith(f'{first}.'):
+            raise ValidationException(f'The update paths {first!r} and {second!r} conflict.')
+
+
+def compile_operator_update(model_class: type, update: Any,
+                            converter_func: Callable | None = None) -> dict[str, dict[str, Any]]:
+    """Validate an update operator document against the Model and return the update to send.
+
+    Raises:
+        ValidationException: Unknown operator or field, a managed or required field, a non numeric
+            ``$inc`` / ``$mul``, a value which does not fit the field or conflicting paths.
+    """
+    if not isinstance(update, dict) or not update:
+        raise ValidationException('An update must be a non-empty JSON object.')
+    compiled: dict[str, dict[str, Any]] = {}
+    paths = []
+    for operator, arguments in update.items():
+        if operator not in UPDATE_OPERATORS:
+            raise ValidationException(f"Unsupported update operator {operator!r}; "
+                                      f"allowed: {', '.join(sorted(UPDATE_OPERATORS))}.")
+        if not isinstance(arguments, dict) or not arguments:
+            raise ValidationException(f'The arguments of {operator} must be a non-empty JSON object.')
+        compiled[operator] = {}
+        for path, value in arguments.items():
+            _check_path(model_class, path)
+            resolved = _resolve_path(model_class, path.split('.'))
+            if operator in _NUMERIC_OPERATORS:
+                field_type = resolved.annotation
+                if isinstance(value, bool) or not isinstance(value, _NUMERIC_TYPES) or not (field_type is Any or (
+                        isinstance(field_type, type) and issubclass(field_type, _NUMERIC_TYPES))):
+                    raise ValidationException(f'{operator} needs a numeric field and value, got {path!r}: {value!r}.')
+            elif operator == '$unset' and resolved.below and resolved.below[-1] is None:
+                raise ValidationException(f'$unset would leave a null in the list {path!r}; use $pull.')
+            elif operator == '$unset' and not resolved.below and \
+                    is_field_required(resolved.owner.model_fields[resolved.name]):
+                raise ValidationException(f'The required field {path!r} cannot be removed.')
+            elif operator == '$currentDate' and value is not True and value not in ({'$type': 'date'},
+                                                                                      {'$type': 'timestamp'}):
+                raise ValidationException(f'$currentDate takes true or a $type, got {value!r}.')
+            elif operator in _VALIDATED_OPERATORS:
+                value = _path_value(model_class, path.split('.'), value, converter_func)
+            elif operator in _ARRAY_OPERATORS:
+                value = _array_argument(model_class, operator, path, value, converter_func)
+            compiled[operator][path] = value
+            paths.append(path)
+    _check_conflicts(paths)
+    return compiled
+
+
+def _field_value(model_class: type, name: str, value: Any, converter_func: Callable | None) -> Any:
+    """The value validated like the field and converted like it is stored on save."""
+    field_info = model_class.model_fields[name]
+    field_type, _ = extract_base_type(field_info.annotation)
+    if isinstance(field_type, type) and issubclass(field_type, Enum) and isinstance(value, str) \
+            and value in field_type.__members__:
+        value = field_type[value]  # enums are stored by name
+    try:
+        validated = model_class.__pydantic_validator__.validate_assignment(model_class.model_construct(), name, value)
+    except ValidationError as verr:
+        raise ValidationException(f'Invalid value for {name!r}: {verr.errors()[0].get("msg")}') from verr
+    if getattr(validated, name, None) is not None:
+        for validator in get_field_validators_meta(field_info):
+            (validator if isinstance(validator, Validator) else validator()).validate(name, getattr(validated, name))
+    stored = Model.to_dict(validated, convert_id=True, validate=False, converter_func=converter_func)
+    return stored.get(name)
+
+
+def updated_fields(update: dict[str, dict[str, Any]]) -> set[str]:
+    """The top level fields an update writes."""
+    return {path.split('.')[0] for arguments in update.values() for path in arguments}
+
+
+class JsonPatch(list):
+    """The operations of a JSON Patch (RFC 6902) document, as received by ``patch_object``."""
+
+
+def is_json_patch(content_type: str | None) -> bool:
+    return (content_type or '').split(';')[0].strip().lower() == JSON_PATCH_MEDIA_TYPE
+
+
+def _pointer(pointer: Any) -> list[str]:
+    if not isinstance(pointer, str) or not pointer.startswith('/') or pointer == '/':
+        raise ValidationException(f'The JSON pointer {pointer!r} does not address a field.')
+    return [segment.replace('~1', '/').replace('~0', '~') for segment in pointer[1:].split('/')]
+
+
+def _test_expression(segments: list[str], indexes: frozenset[int], value: Any) -> dict[str, Any]:
+    """An ``$expr`` comparing the whole value at the path with ``value``: unlike a query equality it
+    does not match an array merely containing the value. List indexes use ``$arrayElemAt``."""
+    expression: Any = f'${segments[0]}'
+    for position, segment in enumerate(segments[1:], start=1):
+        if position in indexes:
+            expression = {'$arrayElemAt': [expression, int(segment)]}
+        elif isinstance(expression, str):
+            expression = f'{expression}.{segment}'
+        else:
+            expression = {'$getField': {'field': {'$literal': segment}, 'input': expression}}
+    return {'$eq': [expression, {'$literal': value}]}
+
+
+def _scalar_type(annotation: Any) -> bool:
+    origin = get_origin(annotation) or annotation
+    return annotation is not Any and origin not in (list, dict) and not (
+        isinstance(annotation, type) and issubclass(annotation, (Model, GeoJSON)))
+
+
+def _overlap(first: str, second: str) -> bool:
+    return first == second or first.startswith(f'{second}.') or second.startswith(f'{first}.')
+
+
+def compile_json_patch(model_class: type, operations: Any,
+                       converter_func: Callable | None = None) -> tuple[dict[str, Any], dict[str, dict[str, Any]]]:
+    """Compile a JSON Patch into the filter conditions and the update operators of one update.
+
+    ``test`` operations become conditions of the filter: an equality for scalar fields and an
+    ``$expr`` equality of the whole value for lists, sub-documents and untyped fields, as RFC 6902
+    compares whole values. The conditions are checked against the stored document, before any of
+    the writes, so a ``test`` of a path written by an earlier operation of the patch is rejected.
+    ``replace`` and ``remove`` additionally require their target to exist (so a failed precondition
+    matches no document), ``add`` and ``replace`` become ``$set`` (``$push`` with ``$position`` for
+    array insertions, ``$push`` for the ``-`` index), ``remove`` becomes ``$unset``. Numeric segments
+    address array elements. An array element can only be removed after a ``test`` of its value, and
+    is removed with ``$pull``, which removes every element equal to it. Written values are validated
+    like the (nested) field they land in. ``move`` and ``copy`` are not supported.
+
+    Raises:
+        ValidationException: The patch is malformed, addresses unknown or managed fields, writes
+            invalid values, tests a path it has written before or writes overlapping paths.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValidationException('A JSON patch must be a non-empty JSON array.')
+    conditions: dict[str, Any] = {}
+    expressions: list[dict[str, Any]] = []
+    tested: dict[str, Any] = {}
+    update: dict[str, dict[str, Any]] = {}
+    paths = []
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in JSON_PATCH_OPERATIONS:
+            raise ValidationException(f"Unsupported JSON patch operation {operation!r}; "
+                                      f"supported: {', '.join(JSON_PATCH_OPERATIONS)}.")
+        op = operation['op']
+        segments = _pointer(operation.get('path'))
+        if op != 'remove' and 'value' not in operation:
+            raise ValidationException(f'The {op} operation of {operation["path"]!r} needs a value.')
+        value = operation.get('value')
+        path = '.'.join(segments)
+        if op == 'test':
+            if any(_overlap(path, written) for written in paths):
+                raise ValidationException(f'The test of {operation["path"]!r} follows a write to it; tests are '
+                                          f'checked against the document before the patch.')
+            if path != 'version':
+                _check_path(model_class, path)
+                resolved = _resolve_path(model_class, segments)
+                try:
+                    # compared with the value as it is stored, e.g. nested Models with their _type
+                    value = _path_value(model_class, segments, value, converter_func)
+                except ValidationException:
+                    pass  # a value the field cannot hold is unequal to the stored one: the test fails
+            if path == 'version' or value is None or (
+                    _scalar_type(resolved.annotation) and not isinstance(value, (list, dict))):
+                conditions[path] = value
+            else:
+                expressions.append(_test_expression(segments, resolved.indexes, value))
+            tested[path] = value
+            continue
+        target = segments[:-1] + ['0'] if segments[-1] == '-' else segments
+        _check_path(model_class, '.'.join(target))
+        resolved = _resolve_path(model_class, target)
+        parent, last = '.'.join(segments[:-1]), segments[-1]
+        in_array = len(segments) - 1 in resolved.indexes
+        if op != 'remove':
+            value = _path_value(model_class, target, value, converter_func)
+        if op == 'add' and in_array:
+            if last == '-':
+                if parent not in update.setdefault('$push', {}):
+                    update['$push'][parent] = {'$each': []}
+                    paths.append(parent)
+                elif '$position' in update['$push'][parent]:
+                    raise ValidationException(f'Only one insertion by position into {parent!r} per patch.')
+                update['$push'][parent]['$each'].append(value)
+                continue
+            update.setdefault('$push', {})
+            if parent in update['$push']:
+                raise ValidationException(f'Only one insertion by position into {parent!r} per patch.')
+            update['$push'][parent] = {'$each': [value], '$position': int(last)}
+            paths.append(parent)
+        elif op == 'remove' and in_array:
+            if path not in tested:
+                raise ValidationException(f'Removing the array element {operation["path"]!r} needs a preceding '
+                                          f'test of its value.')
+            update.setdefault('$pull', {})[parent] = tested[path]
+            paths.append(parent)
+        elif op == 'remove':
+            if not resolved.below and is_field_required(resolved.owner.model_fields[resolved.name]):
+                raise ValidationException(f'The required field {path!r} cannot be removed.')
+            conditions.setdefault(path, {'$exists': True})
+            update.setdefault('$unset', {})[path] = ''
+            paths.append(path)
+        elif last == '-':
+            raise ValidationException(f'{operation["path"]!r} addresses the end of a list, which only add takes.')
+        else:
+            if op == 'replace':
+                conditions.setdefault(path, {'$exists': True})
+            update.setdefault('$set', {})[path] = value
+            paths.append(path)
+    if not update:
+        raise ValidationException('A JSON patch must change at least one field.')
+    _check_conflicts(paths)
+    if expressions:
+        conditions['$expr'] = expressions[0] if len(expressions) == 1 else {'$and': expressions}
+    return conditions, update
@@ -0,0 +1,372 @@
+"""Bulk export and import of a Model's collection over HTTP.
+
+Models registered with ``enable_export=True`` get a ``GET {model}/export`` endpoint streaming
+the documents matching the usual query parameters straight from
+:meth:`~appkernel.MongoRepository.stream_by_query`::
+
+    kernel.register(Order, methods=['GET'], enable_export=True)
+
+    GET /orders/export?status=PAID&format=csv&compression=gzip
+
+The rows are written in small chunks and the next batch is only read from the cursor once
+the client consumed the previous chunk, so memory stays flat for any collection size.
+
+Formats: ``ndjson`` (default) and ``csv``; picked with the ``format`` query parameter or
+the ``Accept`` header. Compression: ``gzip`` and, when the ``zstandard`` package is
+installed, ``zstd``; picked with the ``compression`` query parameter or the
+``Accept-Encoding`` header.
+
+Models registered with ``enable_import=True`` get a ``POST {model}/import`` endpoint reading
+NDJSON or CSV from the streamed request body. Rows are validated in batches by the decoder
+pool (:mod:`appkernel.hydration`) and written with unordered ``insert_many`` calls, while a
+per-line error report is streamed back as the import progresses::
+
+    curl -X POST -H 'Content-Type: application/x-ndjson' --data-binary @orders.ndjson /orders/import
+
+    {"line": 17, "error": "PropertyRequiredException/The property [name] on class [Order] is required."}
+    {"_type": "ImportReport", "lines": 250000, "inserted": 249999, "failed": 1, "duration_ms": 8123.4}
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import time
+import zlib
+from collections import deque
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any
+
+from fastapi.responses import StreamingResponse
+from pymongo.errors import BulkWriteError
+
+from .fields import extract_base_type
+from .hydration import decoder_workers, get_decoder_pool
+from .model import Model
+from .util import default_json_serializer, to_boolean
+from .validators import ValidationException
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXPORT_MEDIA_TYPES: dict[str, str] = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_BATCH_SIZE = 500
+ROWS_PER_CHUNK = 200
+IMPORT_BATCH_SIZE = 1000
+
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def available_compressions() -> tuple[str, ...]:
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def negotiate_format(requested: str | None, accept: str | None = None) -> str:
+    """Pick the export format from the ``format`` parameter, falling back to the ``Accept`` header.
+
+    Raises:
+        ValidationException: The requested format is not supported.
+    """
+    if requested:
+        if requested not in EXPORT_MEDIA_TYPES:
+            raise ValidationException(
+                f"format must be one of {', '.join(EXPORT_MEDIA_TYPES)}, got {requested!r}.")
+        return requested
+    if accept and 'text/csv' in accept:
+        return 'csv'
+    return 'ndjson'
+
+
+def negotiate_compression(requested: str | None, accept_encoding: str | None = None) -> str | None:
+    """Pick the content encoding from the ``compression`` parameter or the ``Accept-Encoding`` header.
+
+    Returns ``None`` for an uncompressed response.
+
+    Raises:
+        ValidationException: The requested compression is not supported (or its package is missing).
+    """
+    if requested:
+        if requested in ('none', 'identity'):
+            return None
+        if requested not in available_compressions():
+            raise ValidationException(
+                f"compression must be one of {', '.join(available_compressions())}, got {requested!r}.")
+        return requested
+    offered = {token.split(';')[0].strip() for token in (accept_encoding or '').split(',')}
+    return next((encoding for encoding in available_compressions() if encoding in offered), None)
+
+
+def export_columns(model_class: type) -> list[str]:
+    """The CSV header: the declared, non omitted fields of the Model in declaration order."""
+    return [name for name, info in model_class.model_fields.items() if not info.exclude]
+
+
+def _row(model: Model) -> dict[str, Any]:
+    # stored documents are exported as they are: no generators, no required field checks
+    document = Model.to_dict(model, validate=False, skip_omitted_fields=True)
+    document.pop('_type', None)
+    return document
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list, tuple, set)):
+        return json.dumps(value, default=default_json_serializer)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return default_json_serializer(value)
+
+
+async def ndjson_chunks(models: AsyncIterator[Model]) -> AsyncIterator[str]:
+    """Serialise the models as newline delimited JSON, ``ROWS_PER_CHUNK`` lines at a time."""
+    lines = []
+    async for model in models:
+        lines.append(json.dumps(_row(model), ensure_ascii=False, default=default_json_serializer))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+async def csv_chunks(models: AsyncIterator[Model], columns: list[str]) -> AsyncIterator[str]:
+    """Serialise the models as CSV with a header row; fields not in ``columns`` are dropped."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    rows = 0
+    async for model in models:
+        writer.writerow({key: _csv_value(value) for key, value in _row(model).items()})
+        rows += 1
+        if rows >= ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def compress_chunks(chunks: AsyncIterator[str], encoding: str | None) -> AsyncIterator[bytes]:
+    """Encode the text chunks and compress them on the fly; every compressed block is flushed to the client."""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(wbits=_GZIP_WBITS)
+        async for chunk in chunks:
+            block = compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if block:
+                yield block
+        yield compressor.flush()
+    elif encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor().compressobj()
+        async for chunk in chunks:
+            block = compressor.compress(chunk.encode('utf-8')) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if block:
+                yield block
+        yield compressor.flush()
+    else:
+        async for chunk in chunks:
+            yield chunk.encode('utf-8')
+
+
+def export_stream(model_class: type, models: AsyncIterator[Model], export_format: str,
+                  encoding: str | None) -> AsyncIterator[bytes]:
+    """The response body of an export: serialised in ``export_format`` and compressed with ``encoding``."""
+    chunks = csv_chunks(models, export_columns(model_class)) if export_format == 'csv' else ndjson_chunks(models)
+    return compress_chunks(chunks, encoding)
+
+
+def negotiate_import_format(requested: str | None, content_type: str | None = None) -> str:
+    """Pick the import format from the ``format`` parameter, falling back to the ``Content-Type`` header."""
+    return negotiate_format(requested, content_type)
+
+
+async def iter_body_lines(chunks: AsyncIterator[bytes], encoding: str | None = None) -> AsyncIterator[str]:
+    """Split a streamed (optionally gzip compressed) request body into text lines."""
+    if encoding not in (None, '', 'identity', 'gzip'):
+        raise ValidationException(f'Content-Encoding {encoding!r} is not supported; use gzip or none.')
+    decompressor = zlib.decompressobj(wbits=_GZIP_WBITS) if encoding == 'gzip' else None
+    pending = b''
+    async for chunk in chunks:
+        pending += decompressor.decompress(chunk) if decompressor else chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8')
+    if decompressor:
+        pending += decompressor.flush()
+    if pending.strip():
+        yield pending.rstrip(b'\r').decode('utf-8')
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, str]]:
+    """The ``(line number, line)`` pairs of the non blank lines."""
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line.strip():
+            yield line_number, line
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, list[str] | None]]:
+    """Parse the lines with a single ``csv.reader``; quoted fields may span several lines.
+
+    Yields ``(line number, values)`` pairs numbered by the first line of the record; a record whose
+    quoted field is still open at the end of the body is yielded with ``None`` values.
+    """
+    pending: deque[str] = deque()
+    # the reader only pulls the lines of a record once its quotes are balanced, so pending never runs dry
+    reader = csv.reader(iter(pending.popleft, None))
+    line_number = first_line = 0
+    quoted = False
+    async for line in lines:
+        line_number += 1
+        if not pending:
+            if not line.strip():
+                continue
+            first_line = line_number
+        pending.append(line + '\n')
+        quoted ^= line.count('"') % 2 == 1
+        if not quoted:
+            yield first_line, next(reader)
+    if pending:
+        yield first_line, None
+
+
+_CSV_CONVERTERS = {int: int, float: float, bool: to_boolean}
+
+
+def _parse_csv_value(model_class: type, key: str, raw: str) -> Any:
+    # CSV only carries text: numbers and booleans are converted by the declared field type
+    annotation = getattr(model_class, '__annotations__', {}).get(key)
+    python_type = extract_base_type(annotation)[0] if annotation else None
+    if python_type in _CSV_CONVERTERS:
+        try:
+            return _CSV_CONVERTERS[python_type](raw)
+        except ValueError as exc:
+            raise ValidationException(f'{key}: {raw!r} is not a valid {python_type.__name__}.') from exc
+    if raw[:1] in ('[', '{'):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            pass
+    return raw
+
+
+def _parse_row(model_class: type, row: str | list[str] | None, import_format: str,
+               header: list[str] | None) -> dict[str, Any]:
+    if import_format == 'csv':
+        if row is None:
+            raise ValidationException('the quoted field is not closed before the end of the body.')
+        if len(row) != len(header):
+            raise ValidationException(f'expected {len(header)} columns, found {len(row)}.')
+        return {key: _parse_csv_value(model_class, key, value) for key, value in zip(header, row) if value != ''}
+    document = json.loads(row)
+    if not isinstance(document, dict):
+        raise ValidationException('every line must hold a JSON object.')
+    return document
+
+
+def validate_rows(model_class: type, rows: list[tuple[int, Any]], import_format: str,
+                  header: list[str] | None = None) -> tuple[list[tuple[int, dict[str, Any]]], list[dict[str, Any]]]:
+    """Parse and validate a batch of rows; runs in a decoder worker.
+
+    The rows are NDJSON lines or the values of parsed CSV records. Returns the ``(line number, MongoDB
+    document)`` pairs ready for insertion and the error report entries of the rejected rows.
+    """
+    from .repository import AuditableRepository, mongo_type_converter_to_dict
+    documents, errors = [], []
+    now = datetime.now()
+    for line_number, row in rows:
+        try:
+            instance = Model.from_dict(_parse_row(model_class, row, import_format, header), model_class)
+            document = Model.to_dict(instance, convert_id=True, converter_func=mongo_type_converter_to_dict)
+        except Exception as exc:  # pylint: disable=W0703 - every failure is reported on its line
+            errors.append({'line': line_number, 'error': f'{exc.__class__.__name__}/{exc}'})
+            continue
+        if getattr(model_class, 'time_series', None) is None:
+            document['version'] = 1
+        if issubclass(model_class, AuditableRepository):
+            document['inserted'] = document['updated'] = now
+        documents.append((line_number, document))
+    return documents, errors
+
+
+async def import_rows(model_class: type, lines: AsyncIterator[str], import_format: str = 'ndjson',
+                      batch_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator[dict[str, Any]]:
+    """Validate and insert the rows read from ``lines``; yields error report entries, then a summary.
+
+    Up to one batch per decoder worker is validated while the previous batch is being inserted,
+    so validation and database writes overlap; reading pauses while all workers are busy.
+    """
+    from .repository import _record_write
+    started = time.perf_counter()
+    collection = model_class.get_collection()
+    loop = asyncio.get_running_loop()
+    pool = get_decoder_pool()
+    in_flight: deque[asyncio.Future] = deque()
+    header: list[str] | None = None
+    totals = {'lines': 0, 'inserted': 0, 'failed': 0}
+
+    async def insert(future: asyncio.Future) -> list[dict[str, Any]]:
+        documents, errors = await future
+        totals['failed'] += len(errors)
+        if not documents:
+            return errors
+        try:
+            result = await collection.insert_many([document for _, document in documents], ordered=False)
+            totals['inserted'] += len(result.inserted_ids)
+        except BulkWriteError as bwe:
+            write_errors = bwe.details.get('writeErrors', [])
+            totals['inserted'] += bwe.details.get('nInserted', 0)
+            totals['failed'] += len(write_errors)
+            errors = errors + [{'line': documents[error['index']][0], 'error': error.get('errmsg', 'write error')}
+                               for error in write_errors]
+        _record_write(collection)
+        return sorted(errors, key=lambda entry: entry['line'])
+
+    batch: list[tuple[int, Any]] = []
+    records = _csv_records(lines) if import_format == 'csv' else _ndjson_records(lines)
+    async for line_number, row in records:
+        if import_format == 'csv' and header is None:
+            header = row or []
+            continue
+        batch.append((line_number, row))
+        if len(batch) >= batch_size:
+            totals['lines'] += len(batch)
+            in_flight.append(loop.run_in_executor(pool, validate_rows, model_class, batch, import_format, header))
+            batch = []
+            if len(in_flight) > decoder_workers():
+                for entry in await insert(in_flight.popleft()):
+                    yield entry
+    if batch:
+        totals['lines'] += len(batch)
+        in_flight.append(loop.run_in_executor(pool, validate_rows, model_class, batch, import_format, header))
+    while in_flight:
+        for entry in await insert(in_flight.popleft()):
+            yield entry
+    yield {'_type': 'ImportReport', **totals, 'duration_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+async def report_lines(entries: AsyncIterator[dict[str, Any]]) -> AsyncIterator[str]:
+    async for entry in entries:
+        yield json.dumps(entry, default=default_json_serializer) + '\n'
+
+
+class ImportReportResponse(StreamingResponse):
+    """Streams the import report while the request body is still being read.
+
+    ``StreamingResponse`` watches for client disconnects by reading from the ASGI ``receive``
+    channel, which would swallow the body chunks the import is reading at the same time; a
+    disconnect is noticed by the body stream instead.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
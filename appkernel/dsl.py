@@ -53,6 +53,14 @@ OPS = AttrDict(
     ELEM_DOES_NOT_MATCH=Opex('$elemMatchNot', lambda exp: {'$not': {'$elemMatch': {exp[0]: exp[1]}}}),
     ELEM_LIKE=Opex('$elemMatch',
                    lambda exp: {'$elemMatch': {exp[0]: {'$regex': f'.*{re.escape(exp[1])}.*', '$options': 'i'}}}),
+    # anchored, case-sensitive: served by the bounds of a regular index
+    STARTS_WITH=Opex('startswith', lambda exp: {'$regex': f'^{re.escape(exp)}'}),
+    # prefix as a range, served by a MongoCaseInsensitiveIndex when queried with its collation
+    COLLATED_PREFIX=Opex('startswith', lambda exp: {'$gte': exp, '$lt': f'{exp}\uffff'}),
+    TEXT=Opex('$text', lambda exp: {'$search': exp}),
+    NEAR=Opex('$near', lambda exp: {'$near': exp}),
+    GEO_WITHIN=Opex('$geoWithin', lambda exp: {'$geoWithin': exp if '$centerSphere' in exp else {'$geometry': exp}}),
+    GEO_INTERSECTS=Opex('$geoIntersects', lambda exp: {'$geoIntersects': {'$geometry': exp}}),
     NE=Opex('$ne', lambda exp: {'$ne': exp}),
     MUL=Opex('$mul', lambda exp: exp),
     DIV=Opex('$mul', lambda exp: 1 / exp),
@@ -68,7 +76,9 @@ class DslBase:
     to build lazy expression trees that are translated to MongoDB syntax at
     query time. Supported operators: ``==``, ``!=``, ``<``, ``>``, ``<=``,
     ``>=``, ``%`` (regex/contains), ``&`` (AND), ``|`` (OR), ``+``, ``-``,
-    ``*``, ``/`` (atomic updates).
+    ``*``, ``/`` (atomic updates). ``startswith()`` and ``search()`` build the
+    index-backed prefix and ``$text`` searches, ``near()``, ``within()``,
+    ``within_radius()`` and ``intersects()`` the geo queries of GeoJSON fields.
     """
 
     def __eq__(self, right_hand_side: Any) -> Expression:
@@ -111,6 +121,35 @@ class DslBase:
     __add__ = __create_expression(OPS.ADD)
     __sub__ = __create_expression(OPS.SUB)
 
+    def startswith(self, prefix: str) -> Expression:
+        """Match values starting with ``prefix`` (an anchored regex, which can use an index)."""
+        return Expression(self, OPS.STARTS_WITH, prefix)
+
+    def search(self, terms: str) -> Expression:
+        """Full-text search of ``terms`` in the fields of the collection's text index."""
+        return Expression(self, OPS.TEXT, terms)
+
+    def near(self, point: Any, max_distance: float | None = None, min_distance: float | None = None) -> Expression:
+        """Match locations around a GeoJSON point, nearest first; distances in meters."""
+        near: dict[str, Any] = {'$geometry': _geometry(point)}
+        if max_distance is not None:
+            near['$maxDistance'] = max_distance
+        if min_distance is not None:
+            near['$minDistance'] = min_distance
+        return Expression(self, OPS.NEAR, near)
+
+    def within(self, geometry: Any) -> Expression:
+        """Match locations inside a GeoJSON polygon."""
+        return Expression(self, OPS.GEO_WITHIN, _geometry(geometry))
+
+    def within_radius(self, point: Any, meters: float) -> Expression:
+        """Match locations at most ``meters`` away from a GeoJSON point, unordered."""
+        return Expression(self, OPS.GEO_WITHIN, _center_sphere(_geometry(point), meters))
+
+    def intersects(self, geometry: Any) -> Expression:
+        """Match geometries intersecting a GeoJSON geometry."""
+        return Expression(self, OPS.GEO_INTERSECTS, _geometry(geometry))
+
     def contains(self, rhs: Any) -> Expression:
         return Expression(self, Expression.OPS.ILIKE, '%%%s%%' % rhs)
 
@@ -167,6 +206,26 @@ class CustomProperty(DslBase):
         self.backreference = BackReference(class_name=cls.__name__, parameter_name=property_name)
 
 
+# the key the relevance of a $text search result is projected to
+TEXT_SCORE = 'text_score'
+# the radius MongoDB converts $centerSphere distances with
+EARTH_RADIUS_METERS = 6378100
+
+
+def _geometry(value: Any) -> Any:
+    # GeoJSON field values (appkernel.geo) or plain GeoJSON dicts
+    return value.to_geojson() if hasattr(value, 'to_geojson') else value
+
+
+def _center_sphere(point: dict[str, Any], meters: float) -> dict[str, Any]:
+    return {'$centerSphere': [point['coordinates'], meters / EARTH_RADIUS_METERS]}
+
+
+def geo_within_radius(point: dict[str, Any], meters: float) -> dict[str, Any]:
+    """The ``$geoWithin`` filter of the spherical circle around a GeoJSON point."""
+    return OPS.GEO_WITHIN.lmbda(_center_sphere(point, meters))
+
+
 class SortOrder(IntEnum):
     ASC = 1
     DESC = -1
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import getopt
 import inspect
 import logging
@@ -23,10 +24,14 @@ from starlette.middleware.cors import CORSMiddleware
 from .authorisation import authorize_request
 from .http_client import HttpClientConfig, configure_http_client, close_http_client
 from .rate_limit import RateLimitConfig, RateLimiter, RateLimitMiddleware
+from .index_advisor import IndexAdvisor, IndexAdvisorConfig
+from .materialized import MaterializedViewManager
+from .migration import MigrationRunner
+from .mongo_metrics import MongoMetrics, compression_options, pool_options
 from .infrastructure import CfgEngine
 from .configuration import config
 from .core import AppInitialisationError
-from .iam import RbacMixin
+from .iam import Permission, RbacMixin, Role
 from .model import Model
 from .util import create_custom_error
 
@@ -78,7 +83,7 @@ def get_option_value(option_dict: tuple[str, ...], opts: list[tuple[str, str]])
 
 def get_cmdline_options() -> dict[str, Any]:
     argv = sys.argv[1:]
-    opts, args = getopt.getopt(argv, 'c:dw:h:', ['config-dir=', 'development', 'working-dir=', 'db-host='])
+    opts, args = getopt.getopt(argv, 'c:dw:h:m', ['config-dir=', 'development', 'working-dir=', 'db-host=', 'migrate'])
     cwd = os.path.dirname(os.path.realpath(sys.argv[0]))
     config_dir_param = get_option_value(('-c', '--config-dir'), opts)
 
@@ -100,11 +105,13 @@ def get_cmdline_options() -> dict[str, Any]:
         cwd = f'{cwd.rstrip("/")}'
     development = get_option_value(('-d', '--development'), opts)
     db_host = get_option_value(('-h', '--db-host'), opts)
+    migrate = get_option_value(('-m', '--migrate'), opts)
     return {
         'cfg_dir': cfg_dir,
         'development': development,
         'cwd': cwd,
-        'db': db_host
+        'db': db_host,
+        'migrate': migrate
     }
 
 
@@ -136,6 +143,11 @@ class AppKernelEngine:
             config.url_rules = {}
             config.url_to_endpoint = {}
             config.openapi_endpoints = {}
+            config.index_advisor = None
+            self.materialized_views: MaterializedViewManager | None = None
+            self.migrations: MigrationRunner | None = None
+            self.mongo_metrics: MongoMetrics | None = None
+            config.mongo_metrics = None
             self.before_request_functions: list[Callable] = []
             self.after_request_functions: list[Callable] = []
             self.app_id = app_id
@@ -149,11 +161,11 @@ class AppKernelEngine:
             cwd = self.cmd_line_options.get('cwd')
             self.init_logger(log_folder=cwd, level=log_level)
 
-            # MongoDB — AsyncIOMotorClient can be created without a running event loop
-            db_host = self.cmd_line_options.get('db') or self.cfg_engine.get('appkernel.mongo.host', 'localhost')
-            db_name = self.cfg_engine.get('appkernel.mongo.db', 'app')
-            self.mongo_client = AsyncIOMotorClient(host=db_host)
-            config.mongo_database = self.mongo_client[db_name]
+            # MongoDB, with the pool and command listeners when the driver metrics are enabled
+            if self.cfg_engine.get('appkernel.mongo.metrics', False):
+                self.mongo_metrics = MongoMetrics(pool_options().get('maxPoolSize', 100))
+                config.mongo_metrics = self.mongo_metrics
+            self.__init_mongo_client()
 
             # Wire the FastAPI app with lifespan for clean startup/shutdown
             engine_ref = self
@@ -163,7 +175,16 @@ class AppKernelEngine:
             async def lifespan(fastapi_app: FastAPI):
                 engine_ref.logger.info(f'===== Starting {engine_ref.app_id} =====')
                 configure_http_client(_http_client_config)
+                if engine_ref.materialized_views is not None:
+                    await engine_ref.materialized_views.start()
+                if engine_ref.migrations is not None \
+                        and engine_ref.cfg_engine.get('appkernel.migrations.run_on_startup', False):
+                    engine_ref.migrations.start()
                 yield
+                if engine_ref.migrations is not None:
+                    await engine_ref.migrations.stop()
+                if engine_ref.materialized_views is not None:
+                    await engine_ref.materialized_views.stop()
                 # Shutdown: close HTTP client, then Motor connection
                 await close_http_client()
                 if config and hasattr(config, 'mongo_database') and config.mongo_database is not None:
@@ -225,6 +246,127 @@ class AppKernelEngine:
         self.app.add_middleware(RateLimitMiddleware, limiter=limiter)
         return self
 
+    def enable_index_advisor(self, cfg: IndexAdvisorConfig | None = None) -> AppKernelEngine:
+        """Start recording query shapes so that missing or redundant indexes can be reported.
+
+        Every filter passing through ``find_by_query`` and the query DSL is
+        reduced to its shape (fields, operators, sort) and counted per
+        collection. The advisor is available as ``config.index_advisor``.
+
+        Args:
+            cfg: Advisor settings. Defaults to ``IndexAdvisorConfig()``
+                (report only, no automatic index creation).
+
+        Returns:
+            ``self`` for fluent chaining.
+
+        Example::
+
+            kernel.enable_index_advisor(IndexAdvisorConfig(
+                auto_create=True,
+                auto_create_whitelist=[('name', 'sequence')],
+            ))
+            ...
+            report = await config.index_advisor.report(User)
+        """
+        config.index_advisor = IndexAdvisor(cfg)
+        return self
+
+    def enable_materialized_views(self, *view_classes: type) -> AppKernelEngine:
+        """Keep the given read models refreshed while the application runs.
+
+        Each class must declare a ``materialized_view`` (see
+        :mod:`appkernel.materialized`). On startup, read models that were
+        never built get a full refresh; afterwards they are refreshed on
+        their schedule and/or after source changes. Register the classes as
+        usual to serve them over REST.
+
+        Returns:
+            ``self`` for fluent chaining.
+
+        Example::
+
+            kernel.enable_materialized_views(DailyRevenue)
+            kernel.register(DailyRevenue, methods=['GET'])
+        """
+        if self.materialized_views is None:
+            self.materialized_views = MaterializedViewManager()
+        self.materialized_views.add(*view_classes)
+        return self
+
+    def enable_migrations(self, *model_classes: type) -> AppKernelEngine:
+        """Apply the data migrations declared on the given Models.
+
+        Each class lists its :class:`~appkernel.migration.Migration` objects in a
+        ``migrations`` class variable (see :mod:`appkernel.migration`). Pending
+        migrations run in the background on startup when
+        ``appkernel.migrations.run_on_startup`` is set; starting the application
+        with ``--migrate`` runs them to completion and exits instead of serving.
+
+        Returns:
+            ``self`` for fluent chaining.
+
+        Example::
+
+            kernel.enable_migrations(User, Order)
+        """
+        if self.migrations is None:
+            self.migrations = MigrationRunner()
+        self.migrations.add(*model_classes)
+        return self
+
+    def __init_mongo_client(self) -> None:
+        # AsyncIOMotorClient can be created without a running event loop; it connects on first use
+        db_host = self.cmd_line_options.get('db') or self.cfg_engine.get('appkernel.mongo.host', 'localhost')
+        db_name = self.cfg_engine.get('appkernel.mongo.db', 'app')
+        options = {**pool_options(), **compression_options()}
+        if self.mongo_metrics is not None:
+            options.update(event_listeners=self.mongo_metrics.listeners())
+        self.mongo_client = AsyncIOMotorClient(host=db_host, **options)
+        config.mongo_database = self.mongo_client[db_name]
+
+    def enable_mongo_metrics(
+            self, path: str | None = '/mongo/metrics', permission: Permission | None = None) -> AppKernelEngine:
+        """Collect connection pool and command latency metrics of the MongoDB client.
+
+        Registers PyMongo pool and command listeners (see :mod:`appkernel.mongo_metrics`);
+        the metrics are available as ``config.mongo_metrics`` and, unless ``path`` is
+        ``None``, served as JSON on ``path``. Setting ``appkernel.mongo.metrics`` in the
+        configuration enables the listeners without the endpoint. Call it before the
+        application starts: the (not yet connected) client is replaced.
+
+        The endpoint reveals server addresses and collection names: it is registered with the
+        security middleware and, once :meth:`enable_security` is on, requires ``permission``
+        (``Role('admin')`` by default).
+
+        Returns:
+            ``self`` for fluent chaining.
+
+        Example::
+
+            kernel.enable_mongo_metrics()
+            # GET /mongo/metrics -> {"pools": {"localhost:27017": {"in_use": 3, "checkout_wait": {...}}}, ...}
+        """
+        if self.mongo_metrics is None:
+            self.mongo_metrics = MongoMetrics(pool_options().get('maxPoolSize', 100))
+            config.mongo_metrics = self.mongo_metrics
+            self.mongo_client.close()
+            self.__init_mongo_client()
+        if path is not None:
+            metrics = self.mongo_metrics
+
+            class MongoMetricsEndpoint:
+                pass
+
+            RbacMixin(MongoMetricsEndpoint).require(permission or Role('admin'), methods='GET')
+            config.service_registry['mongo_metrics_get'] = MongoMetricsEndpoint
+            config.url_to_endpoint[f'GET:{path}'] = 'mongo_metrics_get'
+
+            @self.app.get(path, include_in_schema=False)
+            async def mongo_metrics():
+                return metrics.snapshot()
+        return self
+
     def enable_cors(self, cfg: CorsConfig | None = None) -> AppKernelEngine:
         """Enable CORS support for browser-based cross-origin clients.
 
@@ -417,6 +559,9 @@ class AppKernelEngine:
             return create_custom_error(404, msg)
 
     def run(self) -> None:
+        if self.cmd_line_options.get('migrate'):
+            self.run_migrations()
+            return
         self.logger.info(f'===== Starting {self.app_id} =====')
         try:
             import uvicorn
@@ -429,6 +574,19 @@ class AppKernelEngine:
             self.logger.error('uvicorn is required to run the server. Install it with: pip install uvicorn')
             sys.exit(-1)
 
+    def run_migrations(self) -> None:
+        """Run the pending migrations to completion without serving requests (``--migrate``)."""
+        self.logger.info(f'===== Migrating {self.app_id} =====')
+        results = asyncio.run(self.migrations.run_leased()) if self.migrations is not None else []
+        if results is None:
+            self.logger.error('the migrations are run by another instance.')
+            sys.exit(-1)
+        failed = [progress.key for progress in results if progress.status == 'failed']
+        if failed:
+            self.logger.error(f'migrations failed: {", ".join(failed)}')
+            sys.exit(-1)
+        self.logger.info(f'{len(results)} migration(s) completed.')
+
     def init_logger(self, log_folder: str, level: int = logging.DEBUG) -> None:
         assert log_folder is not None, 'The log folder must be provided.'
         if self.development:
@@ -475,6 +633,9 @@ class AppKernelEngine:
         methods: list[str] | None = None,
         enable_hateoas: bool = True,
         tags: list[str] | None = None,
+        time_budget_ms: int | dict[str, int] | None = None,
+        enable_export: bool = False,
+        enable_import: bool = False,
     ) -> ResourceController:
         """Register a Model class or service instance as a set of REST endpoints.
 
@@ -496,6 +657,19 @@ class AppKernelEngine:
                     kernel.register(UserV1Service(), url_base='/v1/', tags=['v1'])
                     kernel.register(UserV2Service(), url_base='/v2/', tags=['v2'])
 
+            time_budget_ms: Database time budget for the CRUD endpoints, in
+                milliseconds.  Either one value or a dict keyed by operation
+                (e.g. ``{'find_by_query': 2000, 'aggregate': 10000}``).  Every
+                Motor operation issued while serving the request gets a
+                ``maxTimeMS`` from the remaining budget; see
+                :mod:`appkernel.time_budget`.
+            enable_export: Expose ``GET {model}/export``, streaming the
+                documents matching the query parameters as NDJSON or CSV,
+                optionally gzip/zstd compressed; see :mod:`appkernel.bulk`.
+            enable_import: Expose ``POST {model}/import``, validating and
+                inserting the NDJSON or CSV rows of the streamed request body
+                in batches; see :mod:`appkernel.bulk`.
+
         Returns:
             :class:`~appkernel.ResourceController` for fluent RBAC chaining.
         """
@@ -506,7 +680,8 @@ class AppKernelEngine:
 
         from appkernel.service import expose_service
         expose_service(service_class_or_instance, self, url_base or self.root_url, methods=methods,
-                       enable_hateoas=enable_hateoas, tags=tags)
+                       enable_hateoas=enable_hateoas, tags=tags, time_budget_ms=time_budget_ms,
+                       enable_export=enable_export, enable_import=enable_import)
         return ResourceController(service_class_or_instance)
 
     def enable_file_storage(
@@ -9,12 +9,13 @@ from __future__ import annotations
 import inspect
 from collections.abc import Callable
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any, Union, get_args, get_origin
 
 from pydantic._internal._model_construction import ModelMetaclass
 
 from .dsl import (
-    DslBase, BackReference, OPS, Marshaller, SortOrder,
+    DslBase, BackReference, Expression, OPS, Marshaller, SortOrder,
     tag_class_items,
 )
 
@@ -67,6 +68,35 @@ class Marshal:
     marshaller: Any
 
 
+@dataclass(frozen=True)
+class Ref:
+    """Marks a field holding the id (or a list of ids) of another Model's document.
+
+    ``model`` is the referenced Model class, or a zero-argument callable returning it for
+    forward references (``Ref(lambda: User)``). When populated, the referenced Model is attached
+    under ``attribute``; by default the field name without its ``_id``/``_ids`` suffix
+    (``owner_id`` -> ``owner``, ``member_ids`` -> ``members``).
+    """
+    model: Any
+    attribute: str | None = None
+
+    def target(self) -> type:
+        """Return the referenced Model class."""
+        if isinstance(self.model, type):
+            return self.model
+        return self.model()
+
+    def attach_as(self, field_name: str) -> str:
+        """Return the name of the attribute the populated Model(s) are attached to."""
+        if self.attribute:
+            return self.attribute
+        if field_name.endswith('_ids'):
+            return f'{field_name[:-4]}s'
+        if field_name.endswith('_id'):
+            return field_name[:-3]
+        return f'{field_name}_ref'
+
+
 # ---------------------------------------------------------------------------
 # MongoDB index metadata
 # ---------------------------------------------------------------------------
@@ -89,6 +119,26 @@ class MongoUniqueIndex(MongoIndex):
     pass
 
 
+@dataclass(frozen=True)
+class MongoGeoIndex(MongoIndex):
+    """``2dsphere`` index of a GeoJSON field (see :mod:`appkernel.geo`)."""
+    pass
+
+
+@dataclass(frozen=True)
+class MongoCaseInsensitiveIndex(MongoIndex):
+    """Index with a case-insensitive collation (``strength`` 2) of ``locale``.
+
+    Queries filtering on the field run with the same collation, so equality, ranges and
+    ``startswith()`` compare the field case-insensitively and are served by the index.
+    """
+    locale: str = 'en'
+
+    @property
+    def collation(self) -> dict[str, Any]:
+        return {'locale': self.locale, 'strength': 2}
+
+
 # ---------------------------------------------------------------------------
 # Helpers to extract metadata from Pydantic FieldInfo
 # ---------------------------------------------------------------------------
@@ -111,6 +161,30 @@ def get_field_index(field_info):
     return get_field_meta(field_info, MongoIndex)
 
 
+def get_field_collation(field_info) -> dict[str, Any] | None:
+    """Return the collation of the field's ``MongoCaseInsensitiveIndex``, if it has one."""
+    index = get_field_index(field_info)
+    return index.collation if isinstance(index, MongoCaseInsensitiveIndex) else None
+
+
+def get_field_ref(field_info):
+    """Extract the Ref metadata from a field."""
+    return get_field_meta(field_info, Ref)
+
+
+@lru_cache(maxsize=None)
+def reference_fields(cls) -> dict[str, Ref]:
+    """Return the Ref markers of a Model class, keyed by field name."""
+    fields = getattr(cls, 'model_fields', None) or {}
+    return {name: ref for name, field_info in fields.items() if (ref := get_field_ref(field_info)) is not None}
+
+
+@lru_cache(maxsize=None)
+def populated_attributes(cls) -> frozenset[str]:
+    """Return the names of the attributes populated references are attached to."""
+    return frozenset(ref.attach_as(name) for name, ref in reference_fields(cls).items())
+
+
 def get_field_validators_meta(field_info):
     """Extract the Validators metadata from a field, returns list of validator instances."""
     v = get_field_meta(field_info, Validators)
@@ -290,6 +364,14 @@ class FieldProxy(DslBase):
                 f'{item_expression.lhs.backreference.class_name}')
         return item_expression
 
+    def startswith(self, prefix):
+        """Match values starting with ``prefix``; case-insensitively on a ``MongoCaseInsensitiveIndex`` field."""
+        backreference = self.backreference
+        if self._field_info is not None and '.' not in backreference.parameter_name \
+                and not backreference.within_an_array and get_field_collation(self._field_info):
+            return Expression(self, OPS.COLLATED_PREFIX, prefix)
+        return super().startswith(prefix)
+
     def asc(self):
         """Return an ascending sort tuple for use with ``query.sort_by()``."""
         return (self.backreference.parameter_name, 1)
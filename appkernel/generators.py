@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import secrets
+import threading
 import uuid
 from datetime import datetime, date, time as dtime
 import time
 import bcrypt
+from bson import ObjectId
 from typing import Any
 from collections.abc import Callable
 
 from appkernel.dsl import Marshaller
 
+_CROCKFORD_BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
 
 class TimestampMarshaller(Marshaller):
     def to_wireformat(self, instance_value: date | datetime | Any) -> float | Any:
@@ -57,6 +62,77 @@ def create_uuid_generator(prefix: str | None = None) -> Callable[[], str]:
     return generate_id
 
 
+class _MonotonicClock:
+    """Millisecond timestamps with a counter, strictly increasing within the process.
+
+    Ids generated in the same millisecond take the next counter value; when the counter runs over,
+    the timestamp is advanced by one millisecond, so the ids of one process never go backwards,
+    not even if the system clock does.
+    """
+
+    def __init__(self, counter_bits: int) -> None:
+        self.counter_bits = counter_bits
+        self.lock = threading.Lock()
+        self.last_ms = 0
+        self.counter = 0
+
+    def next(self) -> tuple[int, int]:
+        with self.lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self.last_ms:
+                # a random start in the lower half leaves room to count up
+                self.last_ms, self.counter = now_ms, secrets.randbits(self.counter_bits - 1)
+            else:
+                self.counter += 1
+                if self.counter >> self.counter_bits:
+                    self.last_ms, self.counter = self.last_ms + 1, secrets.randbits(self.counter_bits - 1)
+            return self.last_ms, self.counter
+
+
+_uuid7_clock = _MonotonicClock(counter_bits=12)
+_ulid_clock = _MonotonicClock(counter_bits=16)
+
+
+def uuid7() -> uuid.UUID:
+    """A version 7 UUID (RFC 9562): 48 bit Unix milliseconds, a 12 bit counter and 62 random bits."""
+    millis, counter = _uuid7_clock.next()
+    value = (millis & 0xFFFF_FFFF_FFFF) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | secrets.randbits(62)
+    return uuid.UUID(int=value)
+
+
+def ulid() -> str:
+    """A ULID: 48 bit Unix milliseconds and 80 bits (a 16 bit counter and 64 random bits), as 26
+    Crockford base32 characters, which sort like the timestamp."""
+    millis, counter = _ulid_clock.next()
+    value = (millis & 0xFFFF_FFFF_FFFF) << 80 | counter << 64 | secrets.randbits(64)
+    return ''.join(_CROCKFORD_BASE32[(value >> shift) & 0x1F] for shift in range(125, -1, -5))
+
+
+def create_uuid7_generator(prefix: str | None = None) -> Callable[[], str]:
+    """Time ordered UUIDv7 ids: new documents are appended at the right edge of the ``_id`` index
+    instead of random places, as with :func:`create_uuid_generator`."""
+    def generate_id() -> str:
+        return f'{prefix or ""}{uuid7()!s}'
+
+    return generate_id
+
+
+def create_ulid_generator(prefix: str | None = None) -> Callable[[], str]:
+    """Time ordered ULID ids, shorter than UUIDs (26 characters) and sorting like their creation time."""
+    def generate_id() -> str:
+        return f'{prefix or ""}{ulid()}'
+
+    return generate_id
+
+
+def create_object_id_generator(prefix: str | None = None) -> Callable[[], ObjectId | str]:
+    """Native MongoDB ObjectIds (12 bytes, time ordered by the second); with a prefix, their hex string."""
+    def generate_id() -> ObjectId | str:
+        return ObjectId() if prefix is None else f'{prefix}{ObjectId()!s}'
+
+    return generate_id
+
+
 def date_now_generator() -> datetime:
     return datetime.now()
 
@@ -0,0 +1,144 @@
+"""GeoJSON field types and the geo queries served by ``2dsphere`` indexes.
+
+Locations stored as two float fields can only be filtered with range queries on each of them,
+which no spatial index serves. Declare a GeoJSON field with a :class:`~appkernel.fields.MongoGeoIndex`
+instead::
+
+    class Shop(Model, MongoRepository):
+        location: Annotated[GeoPoint | None, MongoGeoIndex()] = None
+
+    Shop(location=GeoPoint.of(13.405, 52.52))
+    await Shop.where(Shop.location.near(GeoPoint.of(13.4, 52.5), max_distance=500)).find()
+    await Shop.where(Shop.location.within(GeoPolygon.box(13.3, 52.4, 13.5, 52.6))).find()
+
+Coordinates are ``[longitude, latitude]`` in degrees, as in GeoJSON (RFC 7946); distances are
+meters. The URL query syntax supports a radius (``?location=@13.4,52.5,500``) and a bounding box
+(``?location=@13.3,52.4,13.5,52.6``; min longitude, min latitude, max longitude, max latitude),
+both as ``$geoWithin``, which, unlike ``$near``, also works with ``count_mode``. The edges of a box
+are great circle arcs, so large boxes bulge away from the parallels.
+"""
+from __future__ import annotations
+
+from typing import Any, ClassVar, Literal
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+from .dsl import OPS, geo_within_radius
+from .validators import ValidationException
+
+Position = tuple[float, float]
+
+
+def _check_position(position: Position) -> Position:
+    longitude, latitude = position
+    if not -180 <= longitude <= 180 or not -90 <= latitude <= 90:
+        raise ValueError(f'{list(position)} is not a [longitude, latitude] position.')
+    return position
+
+
+class GeoJSON(BaseModel):
+    """Base of the GeoJSON geometries; stored and sent as ``{"type": ..., "coordinates": ...}``."""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    geometry_types: ClassVar[dict[str, type[GeoJSON]]] = {}
+    type: str
+    coordinates: Any
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        GeoJSON.geometry_types[cls.model_fields['type'].default] = cls
+
+    def to_geojson(self) -> dict[str, Any]:
+        return {'type': self.type, 'coordinates': _as_lists(self.coordinates)}
+
+    @classmethod
+    def json_schema(cls, type_label: str = 'type') -> dict[str, Any]:
+        return {type_label: ['object'], 'required': ['type', 'coordinates'],
+                'properties': {'type': {'enum': [cls.model_fields['type'].default]},
+                               'coordinates': {type_label: ['array']}}}
+
+
+class GeoPoint(GeoJSON):
+    type: Literal['Point'] = 'Point'
+    coordinates: Position
+
+    @classmethod
+    def of(cls, longitude: float, latitude: float) -> GeoPoint:
+        return cls(coordinates=(longitude, latitude))
+
+    @field_validator('coordinates')
+    @classmethod
+    def _valid_position(cls, coordinates: Position) -> Position:
+        return _check_position(coordinates)
+
+
+class GeoPolygon(GeoJSON):
+    """A polygon: an outer ring followed by its holes, each closed (first position == last)."""
+    type: Literal['Polygon'] = 'Polygon'
+    coordinates: list[list[Position]]
+
+    @classmethod
+    def box(cls, min_longitude: float, min_latitude: float, max_longitude: float, max_latitude: float) -> GeoPolygon:
+        if min_longitude >= max_longitude or min_latitude >= max_latitude:
+            raise ValueError('A box needs min longitude < max longitude and min latitude < max latitude.')
+        return cls(coordinates=[[(min_longitude, min_latitude), (max_longitude, min_latitude),
+                                 (max_longitude, max_latitude), (min_longitude, max_latitude),
+                                 (min_longitude, min_latitude)]])
+
+    @field_validator('coordinates')
+    @classmethod
+    def _valid_rings(cls, rings: list[list[Position]]) -> list[list[Position]]:
+        if not rings:
+            raise ValueError('A polygon needs an outer ring.')
+        for ring in rings:
+            if len(ring) < 4 or tuple(ring[0]) != tuple(ring[-1]):
+                raise ValueError('A polygon ring needs at least 4 positions and must be closed.')
+            for position in ring:
+                _check_position(position)
+        return rings
+
+
+def _as_lists(coordinates: Any) -> Any:
+    if isinstance(coordinates, (list, tuple)):
+        return [_as_lists(item) for item in coordinates]
+    return coordinates
+
+
+def geometry_from_dict(value: Any, geometry_class: type[GeoJSON] = GeoJSON) -> GeoJSON | None:
+    """Load a stored or received GeoJSON geometry.
+
+    Raises:
+        ValidationException: The value is not a valid geometry of ``geometry_class``.
+    """
+    if value is None or isinstance(value, GeoJSON):
+        return value
+    geometry_type = value.get('type') if isinstance(value, dict) else None
+    target = GeoJSON.geometry_types.get(geometry_type)
+    if target is None or not issubclass(target, geometry_class):
+        raise ValidationException(f'Expected a GeoJSON {geometry_class.__name__}, got {value!r}.')
+    try:
+        return target.model_validate(value)
+    except ValidationError as verr:
+        raise ValidationException(f'Invalid GeoJSON {geometry_type}: {verr.errors()[0].get("msg")}') from verr
+
+
+def geo_filter(expression: str) -> dict[str, Any]:
+    """The ``$geoWithin`` filter of a URL geo search: ``lon,lat,meters`` or ``min_lon,min_lat,max_lon,max_lat``.
+
+    Raises:
+        ValidationException: The expression is neither a radius nor a bounding box.
+    """
+    try:
+        numbers = [float(item) for item in expression.split(',')]
+        if len(numbers) == 3:
+            longitude, latitude, meters = numbers
+            if meters <= 0:
+                raise ValueError('The radius must be positive.')
+            return geo_within_radius(GeoPoint.of(longitude, latitude).to_geojson(), meters)
+        if len(numbers) == 4:
+            return OPS.GEO_WITHIN.lmbda(GeoPolygon.box(*numbers).to_geojson())
+    except ValidationError as verr:
+        raise ValidationException(f'Invalid geo search {expression!r}: {verr.errors()[0].get("msg")}') from verr
+    except ValueError as verr:
+        raise ValidationException(f'Invalid geo search {expression!r}: {verr}') from verr
+    raise ValidationException(f'A geo search is lon,lat,meters or min_lon,min_lat,max_lon,max_lat, got {expression!r}.')
@@ -0,0 +1,133 @@
+"""Turning raw MongoDB documents into Model instances off the event loop.
+
+``Model.from_dict`` walks every field of every document; for large scans this work, not the
+network, becomes the bottleneck and it blocks the event loop while it runs. The helpers here
+hand whole batches to a shared pool of decoder workers, so the event loop keeps serving
+requests and cursors keep fetching while earlier batches are being decoded.
+
+Offloading has a fixed cost per batch, so only results of at least
+``appkernel.mongo.offload_threshold`` documents (default: 1000) leave the event loop; smaller
+results keep the inline path. Large pages are fetched with ``find_raw_batches`` so that even
+the BSON decoding happens in the workers.
+
+The pool size is read from ``appkernel.mongo.decoder_workers`` (default: up to 4 workers) and its
+kind from ``appkernel.mongo.decoder_pool``:
+
+- ``thread`` (default): keeps the event loop free, but the workers share the GIL, so decoding
+  uses one core at a time;
+- ``process``: decodes on several cores. The raw BSON batches are sent to the workers as bytes,
+  the Models come back pickled, so the Model classes must be importable by module and name (not
+  defined inside a function). Workers are spawned, i.e. start from a fresh interpreter.
+
+``benchmarks/decoder_benchmark.py`` compares the two on the machine at hand.
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+import bson
+from bson.codec_options import CodecOptions
+
+from .configuration import config
+from .model import Model
+
+DEFAULT_DECODER_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_OFFLOAD_THRESHOLD = 1000
+DECODER_POOL_KINDS = ('thread', 'process')
+
+_pool: Executor | None = None
+_pool_lock = threading.Lock()
+
+
+def _cfg(key: str) -> Any:
+    cfg_engine = getattr(config, 'cfg_engine', None)
+    return cfg_engine.get(key, None) if cfg_engine else None
+
+
+def decoder_workers() -> int:
+    """The configured number of decoder workers."""
+    workers = _cfg('appkernel.mongo.decoder_workers')
+    return int(workers) if workers else DEFAULT_DECODER_WORKERS
+
+
+def decoder_pool_kind() -> str:
+    """The configured kind of decoder pool: ``'thread'`` (default) or ``'process'``."""
+    kind = _cfg('appkernel.mongo.decoder_pool') or 'thread'
+    if kind not in DECODER_POOL_KINDS:
+        raise ValueError(f"appkernel.mongo.decoder_pool must be one of {', '.join(DECODER_POOL_KINDS)}, got {kind!r}.")
+    return kind
+
+
+def offload_threshold() -> int:
+    """Result size (in documents) from which decoding is moved to the decoder pool; ``0`` disables offloading."""
+    threshold = _cfg('appkernel.mongo.offload_threshold')
+    return DEFAULT_OFFLOAD_THRESHOLD if threshold is None else int(threshold)
+
+
+def should_offload(expected_size: int) -> bool:
+    threshold = offload_threshold()
+    return threshold > 0 and expected_size >= threshold
+
+
+def get_decoder_pool() -> Executor:
+    """Return the process wide decoder pool, creating it on first use."""
+    global _pool  # pylint: disable=W0603
+    with _pool_lock:
+        if _pool is None:
+            if decoder_pool_kind() == 'process':
+                # forking a process running Motor's threads is unsafe: start the workers from scratch
+                _pool = ProcessPoolExecutor(max_workers=decoder_workers(),
+                                            mp_context=multiprocessing.get_context('spawn'))
+            else:
+                _pool = ThreadPoolExecutor(max_workers=decoder_workers(), thread_name_prefix='appkernel-decoder')
+        return _pool
+
+
+def shutdown_decoder_pool() -> None:
+    """Stop the decoder workers; a new pool is created when needed again."""
+    global _pool  # pylint: disable=W0603
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def hydrate_batch(model_class: type, documents: list[dict[str, Any]]) -> list[Model]:
+    """Convert a batch of MongoDB documents into instances of ``model_class``."""
+    from .repository import mongo_type_converter_from_dict
+    return [Model.from_dict(document, model_class, convert_ids=True, converter_func=mongo_type_converter_from_dict)
+            for document in documents]
+
+
+async def hydrate_in_pool(model_class: type, documents: list[dict[str, Any]]) -> list[Model]:
+    """Like :func:`hydrate_batch`, but runs in the decoder pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_decoder_pool(), hydrate_batch, model_class, documents)
+
+
+async def hydrate(model_class: type, documents: list[dict[str, Any]]) -> list[Model]:
+    """Convert documents inline when there are few of them, in the decoder pool otherwise."""
+    if should_offload(len(documents)):
+        return await hydrate_in_pool(model_class, documents)
+    return hydrate_batch(model_class, documents)
+
+
+def decode_raw_batches(model_class: type, batches: list[bytes], codec_options: CodecOptions) -> list[Model]:
+    """Decode raw BSON batches (as returned by ``find_raw_batches``) straight into Model instances."""
+    return [model for batch in batches
+            for model in hydrate_batch(model_class, bson.decode_all(batch, codec_options))]
+
+
+async def decode_raw_in_pool(model_class: type, batches: list[bytes], codec_options: CodecOptions) -> list[Model]:
+    """Like :func:`decode_raw_batches`, but runs in the decoder pool, one worker task per raw batch."""
+    loop = asyncio.get_running_loop()
+    pool = get_decoder_pool()
+    decoded = await asyncio.gather(*(
+        loop.run_in_executor(pool, decode_raw_batches, model_class, [batch], codec_options) for batch in batches
+    ))
+    return [model for models in decoded for model in models]
@@ -0,0 +1,349 @@
+"""
+Index advisor: learns the shape of the queries issued against each collection
+and compares them with the indexes that actually exist.
+
+A *query shape* is the normalised skeleton of a filter — which fields are
+matched by equality, which by range/other operators, and the requested sort —
+with all literal values stripped. Shapes are counted per collection as queries
+flow through ``MongoRepository.find_by_query`` and ``MongoQuery``, so the
+advisor reflects real traffic rather than what the developer expected.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+logger = logging.getLogger(__name__)
+
+# Operators that select a single key range per value and therefore behave like
+# equality when ordering the fields of a compound index (the "E" in ESR).
+_EQUALITY_OPERATORS: frozenset[str] = frozenset({'$eq', '$in'})
+
+# Logical operators whose operands are whole sub-filters.
+_LOGICAL_OPERATORS: frozenset[str] = frozenset({'$and', '$or', '$nor'})
+
+# Geo predicates, served by 2dsphere indexes rather than the compound indexes suggested here.
+_GEO_OPERATORS: frozenset[str] = frozenset({'$near', '$nearSphere', '$geoWithin', '$geoIntersects'})
+
+# Index key types that cannot serve ordinary equality/range predicates.
+_SPECIAL_INDEX_TYPES: frozenset[Any] = frozenset({'text', '2d', '2dsphere', 'hashed'})
+
+# Pending background index creations; the event loop only keeps weak references to its tasks.
+_background_tasks: set[asyncio.Task] = set()
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """The value-free skeleton of a query.
+
+    Attributes:
+        fields: ``(field_name, operator)`` pairs, sorted. Equality matches are
+            recorded with the ``'$eq'`` operator.
+        sort: ``(field_name, direction)`` pairs in sort order.
+    """
+    fields: tuple[tuple[str, str], ...] = ()
+    sort: tuple[tuple[str, int], ...] = ()
+
+    @property
+    def equality_fields(self) -> tuple[str, ...]:
+        return tuple(sorted({name for name, ops in self.fields if ops in _EQUALITY_OPERATORS}))
+
+    @property
+    def range_fields(self) -> tuple[str, ...]:
+        eq = set(self.equality_fields)
+        return tuple(sorted({name for name, ops in self.fields if ops not in _EQUALITY_OPERATORS} - eq))
+
+    def suggested_index(self) -> tuple[tuple[str, int], ...]:
+        """Compound index keys following the Equality-Sort-Range rule."""
+        keys: list[tuple[str, int]] = [(name, 1) for name in self.equality_fields]
+        seen = set(self.equality_fields)
+        for name, direction in self.sort:
+            if name not in seen:
+                keys.append((name, direction))
+                seen.add(name)
+        keys.extend((name, 1) for name in self.range_fields if name not in seen)
+        return tuple(keys)
+
+    def __str__(self) -> str:
+        filt = ', '.join(f'{name}:{ops}' for name, ops in self.fields) or '-'
+        srt = ', '.join(f'{name}:{direction}' for name, direction in self.sort) or '-'
+        return f'filter({filt}) sort({srt})'
+
+
+def normalise_query_shape(query: dict[str, Any] | None, sort: Any = None) -> QueryShape:
+    """Reduce a MongoDB filter (and optional sort) to its :class:`QueryShape`.
+
+    Args:
+        query: a find() filter dict as produced by ``convert_to_query`` or the DSL.
+        sort: a list of ``(field, direction)`` tuples, a single field name, or ``None``.
+    """
+    collected: set[tuple[str, str]] = set()
+    _collect_fields(query or {}, collected)
+    return QueryShape(fields=tuple(sorted(collected)), sort=_normalise_sort(sort))
+
+
+def _collect_fields(node: Any, collected: set[tuple[str, str]]) -> None:
+    if isinstance(node, list):
+        for item in node:
+            _collect_fields(item, collected)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key in _LOGICAL_OPERATORS:
+            _collect_fields(value, collected)
+        elif key.startswith('$'):
+            # top-level $text, $where, ... are not served by regular indexes
+            continue
+        elif isinstance(value, dict) and value and all(k.startswith('$') for k in value):
+            for ops in value:
+                if ops != '$options' and ops not in _GEO_OPERATORS:
+                    collected.add((key, ops))
+        else:
+            collected.add((key, '$eq'))
+
+
+def _normalise_sort(sort: Any) -> tuple[tuple[str, int], ...]:
+    if not sort:
+        return ()
+    if isinstance(sort, str):
+        return ((sort, 1),)
+    if isinstance(sort, dict):
+        sort = list(sort.items())
+    return tuple((str(name), int(direction)) for name, direction in sort)
+
+
+def _index_serves(shape: QueryShape, index_keys: list[tuple[str, Any]]) -> bool:
+    """True when an index with the given keys can serve the shape without a
+    collection scan or a blocking in-memory sort."""
+    equality = set(shape.equality_fields)
+    eq_prefix = index_keys[:len(equality)]
+    if {name for name, _ in eq_prefix} != equality:
+        return False
+    rest = index_keys[len(equality):]
+    if shape.sort:
+        sort_keys = list(shape.sort)
+        candidate = [(name, int(direction)) for name, direction in rest[:len(sort_keys)]]
+        if [name for name, _ in candidate] != [name for name, _ in sort_keys]:
+            return False
+        same = all(d1 == d2 for (_, d1), (_, d2) in zip(candidate, sort_keys))
+        inverted = all(d1 == -d2 for (_, d1), (_, d2) in zip(candidate, sort_keys))
+        return same or inverted
+    if equality:
+        return True
+    return bool(rest) and rest[0][0] in shape.range_fields
+
+
+def _regular_index_keys(index_info: dict[str, Any]) -> dict[str, list[tuple[str, Any]]]:
+    """Index name -> key list, excluding text/geo/hashed indexes."""
+    result = {}
+    for name, spec in index_info.items():
+        keys = list(spec.get('key', []))
+        if any(direction in _SPECIAL_INDEX_TYPES for _, direction in keys):
+            continue
+        result[name] = keys
+    return result
+
+
+@dataclass
+class IndexSuggestion:
+    """A compound index that would serve one or more observed query shapes."""
+    keys: tuple[tuple[str, int], ...]
+    shapes: list[QueryShape] = field(default_factory=list)
+    occurrences: int = 0
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        return tuple(name for name, _ in self.keys)
+
+
+@dataclass
+class IndexReport:
+    """Result of comparing observed query shapes with a collection's indexes.
+
+    Attributes:
+        collection: the collection name.
+        shapes: observed shapes with their frequency, most frequent first.
+        missing: indexes that would serve shapes currently resolved by a
+            collection scan or an in-memory sort.
+        redundant: names of indexes whose keys are a prefix of another index.
+        unused: names of indexes that served none of the observed shapes.
+    """
+    collection: str
+    shapes: list[tuple[QueryShape, int]] = field(default_factory=list)
+    missing: list[IndexSuggestion] = field(default_factory=list)
+    redundant: list[str] = field(default_factory=list)
+    unused: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'collection': self.collection,
+            'shapes': [{'shape': str(shape), 'count': count} for shape, count in self.shapes],
+            'missing': [{'keys': [list(k) for k in s.keys], 'occurrences': s.occurrences} for s in self.missing],
+            'redundant': list(self.redundant),
+            'unused': list(self.unused),
+        }
+
+
+@dataclass
+class IndexAdvisorConfig:
+    """Configuration for the :class:`IndexAdvisor`.
+
+    Args:
+        max_shapes_per_collection: upper bound on distinct shapes tracked per
+            collection; further new shapes are ignored so that hostile query
+            combinations cannot grow memory without limit. Default: 500.
+        auto_create: when ``True``, missing indexes for whitelisted shapes are
+            created in the background once they were observed
+            ``min_occurrences`` times. Default: ``False``.
+        auto_create_whitelist: field-name tuples (in suggested key order)
+            which may be created automatically, e.g. ``[('name', 'sequence')]``.
+        min_occurrences: how often a shape must be seen before it is
+            auto-created or reported as missing. Default: 1.
+    """
+    max_shapes_per_collection: int = 500
+    auto_create: bool = False
+    auto_create_whitelist: list[tuple[str, ...]] = field(default_factory=list)
+    min_occurrences: int = 1
+
+
+class IndexAdvisor:
+    """Counts query shapes per collection and reports index gaps.
+
+    Enable it on the engine and query the report at runtime::
+
+        kernel.enable_index_advisor(IndexAdvisorConfig(
+            auto_create=True, auto_create_whitelist=[('name', 'sequence')]))
+        ...
+        report = await config.index_advisor.report(User)
+        for suggestion in report.missing:
+            print(suggestion.keys, suggestion.occurrences)
+    """
+
+    def __init__(self, cfg: IndexAdvisorConfig | None = None) -> None:
+        self._cfg = cfg or IndexAdvisorConfig()
+        self._shapes: dict[str, Counter[QueryShape]] = {}
+        self._auto_created: set[tuple[str, tuple[tuple[str, int], ...]]] = set()
+
+    def record(self, collection: AsyncIOMotorCollection | str, query: dict[str, Any] | None,
+               sort: Any = None) -> QueryShape:
+        """Count one occurrence of the query's shape on the given collection."""
+        name = collection if isinstance(collection, str) else collection.name
+        shape = normalise_query_shape(query, sort)
+        counter = self._shapes.setdefault(name, Counter())
+        if shape not in counter and len(counter) >= self._cfg.max_shapes_per_collection:
+            return shape
+        counter[shape] += 1
+        if self._cfg.auto_create and not isinstance(collection, str):
+            self._maybe_auto_create(collection, shape, counter[shape])
+        return shape
+
+    def shapes(self, collection_name: str) -> list[tuple[QueryShape, int]]:
+        """Observed shapes for the collection, most frequent first."""
+        return self._shapes.get(collection_name, Counter()).most_common()
+
+    def reset(self, collection_name: str | None = None) -> None:
+        if collection_name is None:
+            self._shapes.clear()
+        else:
+            self._shapes.pop(collection_name, None)
+
+    async def report(self, model_class_or_collection: Any) -> IndexReport:
+        """Compare the observed shapes with ``index_information()``."""
+        collection = self._resolve_collection(model_class_or_collection)
+        index_info = await collection.index_information()
+        return self.build_report(collection.name, index_info)
+
+    def build_report(self, collection_name: str, index_info: dict[str, Any]) -> IndexReport:
+        observed = self.shapes(collection_name)
+        indexes = _regular_index_keys(index_info)
+        report = IndexReport(collection=collection_name, shapes=observed)
+
+        suggestions: dict[tuple[tuple[str, int], ...], IndexSuggestion] = {}
+        used: set[str] = set()
+        for shape, count in observed:
+            if not shape.fields and not shape.sort:
+                continue
+            serving = [name for name, keys in indexes.items() if _index_serves(shape, keys)]
+            used.update(serving)
+            if serving or count < self._cfg.min_occurrences:
+                continue
+            keys = shape.suggested_index()
+            suggestion = suggestions.setdefault(keys, IndexSuggestion(keys=keys))
+            suggestion.shapes.append(shape)
+            suggestion.occurrences += count
+        report.missing = sorted(suggestions.values(), key=lambda s: s.occurrences, reverse=True)
+
+        for name, keys in indexes.items():
+            if name == '_id_' or index_info[name].get('unique'):
+                continue
+            for other_name, other_keys in indexes.items():
+                if other_name != name and len(other_keys) > len(keys) \
+                        and [(k, int(d)) for k, d in other_keys[:len(keys)]] == [(k, int(d)) for k, d in keys]:
+                    report.redundant.append(name)
+                    break
+            if observed and name not in used:
+                report.unused.append(name)
+        return report
+
+    async def create_missing(self, model_class_or_collection: Any, only_whitelisted: bool = True) -> list[str]:
+        """Create the indexes suggested by :meth:`report`.
+
+        Args:
+            only_whitelisted: restrict creation to ``auto_create_whitelist``.
+
+        Returns:
+            The names of the created indexes.
+        """
+        collection = self._resolve_collection(model_class_or_collection)
+        report = await self.report(collection)
+        created = []
+        for suggestion in report.missing:
+            if only_whitelisted and not self._is_whitelisted(suggestion.keys):
+                continue
+            created.append(await self._create_index(collection, suggestion.keys))
+        return created
+
+    def _is_whitelisted(self, keys: tuple[tuple[str, int], ...]) -> bool:
+        fields = tuple(name for name, _ in keys)
+        return fields in {tuple(w) for w in self._cfg.auto_create_whitelist}
+
+    def _maybe_auto_create(self, collection: AsyncIOMotorCollection, shape: QueryShape, count: int) -> None:
+        keys = shape.suggested_index()
+        marker = (collection.name, keys)
+        if not keys or count < self._cfg.min_occurrences or marker in self._auto_created \
+                or not self._is_whitelisted(keys):
+            return
+        self._auto_created.add(marker)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._create_if_missing(collection, shape))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    async def _create_if_missing(self, collection: AsyncIOMotorCollection, shape: QueryShape) -> None:
+        try:
+            indexes = _regular_index_keys(await collection.index_information())
+            if not any(_index_serves(shape, keys) for keys in indexes.values()):
+                await self._create_index(collection, shape.suggested_index())
+        except Exception as exc:
+            logger.warning(f'index advisor could not create index for {shape} on {collection.name}: {exc}')
+
+    @staticmethod
+    async def _create_index(collection: AsyncIOMotorCollection, keys: tuple[tuple[str, int], ...]) -> str:
+        name = '_'.join(name.replace('.', '_') for name, _ in keys) + '_adv_idx'
+        logger.info(f'index advisor creating index {name} on {collection.name}')
+        return await collection.create_index(list(keys), name=name)
+
+    @staticmethod
+    def _resolve_collection(model_class_or_collection: Any) -> AsyncIOMotorCollection:
+        if hasattr(model_class_or_collection, 'get_collection'):
+            return model_class_or_collection.get_collection()
+        return model_class_or_collection
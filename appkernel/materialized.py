@@ -0,0 +1,298 @@
+"""Materialized read models.
+
+Dashboards aggregating over millions of documents should not run the aggregation on every
+request. A read model declares a trusted pipeline over a source Model; the pipeline output
+is written into the read model's own collection, which is then served through the normal
+``MongoRepository`` and REST surface::
+
+    class DailyRevenue(Model, MongoRepository):
+        id: str | None = None
+        revenue: float | None = None
+        materialized_view: ClassVar[MaterializedView] = MaterializedView(
+            source=Order,
+            pipeline=[
+                {'$group': {'_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created'}},
+                            'revenue': {'$sum': '$total'}}},
+            ],
+            watermark_field='created',
+            # an incremental refresh only aggregates the new orders: add their revenue to the day's total
+            when_matched=[{'$set': {'revenue': {'$add': ['$revenue', '$$new.revenue']}}}],
+            refresh_interval_seconds=300,
+        )
+
+    kernel.enable_materialized_views(DailyRevenue)
+
+A *full* refresh rebuilds the collection with ``$out`` into a scratch collection which then
+replaces the read model collection atomically. An *incremental* refresh only processes the
+source documents whose ``watermark_field`` grew since the previous refresh and upserts the
+output with ``$merge``; a pipeline that groups (``$group``, ``$bucket``, ...) must then combine
+the new partial results with the stored ones in a ``when_matched`` pipeline. Refreshes run on a schedule, after changes reported by a change
+stream (replica sets only), or on demand with :func:`refresh_view`.
+
+Refresh statistics are kept in the ``appkernel_materialized_views`` collection; responses
+served from a read model carry ``X-Materialized-At`` and ``X-Staleness-Seconds`` headers.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from pymongo.errors import PyMongoError
+
+from .configuration import config
+from .core import AppKernelException
+from .repository import validate_pipeline
+
+logger = logging.getLogger(__name__)
+
+METADATA_COLLECTION = 'appkernel_materialized_views'
+STATUS_CACHE_SECONDS = 5.0
+_GROUPING_STAGES = frozenset({'$group', '$bucket', '$bucketAuto', '$count', '$sortByCount'})
+
+
+@dataclass
+class MaterializedView:
+    """Declaration of a materialized read model.
+
+    Args:
+        source: The Model class whose collection is aggregated.
+        pipeline: Trusted aggregation stages; the ``$out``/``$merge`` stage is appended internally.
+        watermark_field: Monotonically growing source field (e.g. ``updated`` or a sequence);
+            enables incremental refreshes. Without it every refresh is a full refresh.
+        merge_on: Field(s) identifying an output document for ``$merge``.
+        when_matched: ``$merge`` ``whenMatched`` action for incremental refreshes: ``'replace'``,
+            ``'merge'``, ``'keepExisting'`` or an update pipeline combining ``$$new`` with the
+            existing document. Required when a pipeline with a ``watermark_field`` groups: the
+            incremental output only covers the new source documents.
+        refresh_interval_seconds: Refresh periodically; ``None`` disables the schedule.
+        follow_changes: Refresh after changes reported by a change stream on the source.
+        debounce_seconds: Delay collecting change events into one refresh.
+    """
+    source: type
+    pipeline: list[dict[str, Any]]
+    watermark_field: str | None = None
+    merge_on: str | list[str] = '_id'
+    when_matched: str | list[dict[str, Any]] = 'replace'
+    refresh_interval_seconds: float | None = None
+    follow_changes: bool = False
+    debounce_seconds: float = 1.0
+
+    def __post_init__(self) -> None:
+        validate_pipeline(self.pipeline, trusted=True)
+        grouping = [name for stage in self.pipeline for name in stage if name in _GROUPING_STAGES]
+        if self.watermark_field is not None and grouping and not isinstance(self.when_matched, list):
+            raise ValueError(f'An incremental refresh of a pipeline with {grouping[0]} only aggregates the new source '
+                             f'documents; declare when_matched as an update pipeline combining $$new with the '
+                             f'stored result (e.g. adding sums), or omit watermark_field.')
+
+    def build_pipeline(self, target: str, since: Any = None, until: Any = None,
+                       incremental: bool = False) -> list[dict[str, Any]]:
+        """Return the pipeline writing into ``target``.
+
+        ``since``/``until`` restrict the source documents to a watermark window; an incremental
+        pipeline ends with ``$merge``, a full one with ``$out``.
+        """
+        stages = list(self.pipeline)
+        if until is not None:
+            window = {'$lte': until} if since is None else {'$gt': since, '$lte': until}
+            stages.insert(0, {'$match': {self.watermark_field: window}})
+        if not incremental:
+            return stages + [{'$out': target}]
+        return stages + [{'$merge': {
+            'into': target, 'on': self.merge_on,
+            'whenMatched': self.when_matched, 'whenNotMatched': 'insert',
+        }}]
+
+
+@dataclass
+class RefreshStats:
+    """Outcome of the last refresh of a read model, as stored in the metadata collection."""
+    view: str
+    mode: str
+    started: datetime
+    finished: datetime | None = None
+    duration_ms: float = 0.0
+    watermark: Any = None
+    refresh_count: int = 0
+    error: str | None = None
+
+    @property
+    def staleness_seconds(self) -> float | None:
+        if self.finished is None:
+            return None
+        return max((datetime.now(timezone.utc) - _aware(self.finished)).total_seconds(), 0.0)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            '_id': self.view, 'mode': self.mode, 'started': self.started, 'finished': self.finished,
+            'duration_ms': self.duration_ms, 'watermark': self.watermark,
+            'refresh_count': self.refresh_count, 'error': self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, document: dict[str, Any]) -> RefreshStats:
+        return cls(view=document['_id'], mode=document.get('mode', 'full'), started=document.get('started'),
+                   finished=document.get('finished'), duration_ms=document.get('duration_ms', 0.0),
+                   watermark=document.get('watermark'), refresh_count=document.get('refresh_count', 0),
+                   error=document.get('error'))
+
+
+def _aware(moment: datetime) -> datetime:
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def get_materialized_view(view_class: type) -> MaterializedView:
+    view = getattr(view_class, 'materialized_view', None)
+    if view is None:
+        raise AppKernelException(f'{view_class.__name__} does not declare a materialized_view.')
+    return view
+
+
+def _metadata_collection():
+    return config.mongo_database.get_collection(METADATA_COLLECTION)
+
+
+_status_cache: dict[str, tuple[float, RefreshStats | None]] = {}
+_refresh_locks: dict[str, asyncio.Lock] = {}
+
+
+async def view_status(view_class: type) -> RefreshStats | None:
+    """Return the last refresh statistics of a read model (cached for a few seconds)."""
+    target = view_class.get_collection().name
+    cached = _status_cache.get(target)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    stats = await _load_status(target)
+    _status_cache[target] = (time.monotonic() + STATUS_CACHE_SECONDS, stats)
+    return stats
+
+
+async def _load_status(target: str) -> RefreshStats | None:
+    document = await _metadata_collection().find_one({'_id': target})
+    return RefreshStats.from_dict(document) if document else None
+
+
+async def refresh_view(view_class: type, full: bool = False) -> RefreshStats:
+    """Refresh a read model now; incremental when possible unless ``full`` is set.
+
+    Concurrent refreshes of the same read model are serialised.
+    """
+    view = get_materialized_view(view_class)
+    target = view_class.get_collection().name
+    lock = _refresh_locks.setdefault(target, asyncio.Lock())
+    async with lock:
+        previous = await _load_status(target)
+        source = view.source.get_collection()
+        incremental = not full and view.watermark_field is not None and previous is not None \
+            and previous.error is None and previous.watermark is not None
+        until = None
+        if view.watermark_field is not None:
+            newest = await source.find_one({view.watermark_field: {'$exists': True}},
+                                           {view.watermark_field: 1}, sort=[(view.watermark_field, -1)])
+            until = newest.get(view.watermark_field) if newest else None
+        stats = RefreshStats(view=target, mode='incremental' if incremental else 'full',
+                             started=datetime.now(timezone.utc),
+                             refresh_count=(previous.refresh_count if previous else 0) + 1,
+                             watermark=previous.watermark if previous else None)
+        started = time.perf_counter()
+        try:
+            if incremental:
+                if until is not None and until != previous.watermark:
+                    pipeline = view.build_pipeline(target, since=previous.watermark, until=until, incremental=True)
+                    await source.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+            else:
+                scratch = f'{target}__rebuild'
+                await source.aggregate(view.build_pipeline(scratch, until=until), allowDiskUse=True).to_list(length=None)
+                await config.mongo_database.get_collection(scratch).rename(target, dropTarget=True)
+                if hasattr(view_class, 'init_indexes'):
+                    await view_class.init_indexes()
+            stats.watermark = until if until is not None else stats.watermark
+        except PyMongoError as exc:
+            stats.error = str(exc)
+            logger.warning(f'refresh of materialized view {target} failed: {exc}')
+        stats.finished = datetime.now(timezone.utc)
+        stats.duration_ms = (time.perf_counter() - started) * 1000
+        if stats.error:
+            # keep serving the previous content; the staleness keeps counting from the last success
+            stats.finished = previous.finished if previous else None
+        await _metadata_collection().replace_one({'_id': target}, stats.to_dict(), upsert=True)
+        _status_cache[target] = (time.monotonic() + STATUS_CACHE_SECONDS, stats)
+        return stats
+
+
+def staleness_headers(stats: RefreshStats | None) -> dict[str, str]:
+    """HTTP headers describing how fresh the content of a read model is."""
+    if stats is None or stats.finished is None:
+        return {'X-Materialized-At': 'never'}
+    return {
+        'X-Materialized-At': _aware(stats.finished).isoformat(),
+        'X-Staleness-Seconds': f'{stats.staleness_seconds:.0f}',
+        'X-Refresh-Duration-Ms': f'{stats.duration_ms:.0f}',
+    }
+
+
+async def view_headers(view_class: type) -> dict[str, str]:
+    """Staleness headers of a read model; empty when the metadata cannot be read."""
+    try:
+        return staleness_headers(await view_status(view_class))
+    except PyMongoError as exc:
+        logger.warning(f'could not read the refresh status of {view_class.__name__}: {exc}')
+        return {}
+
+
+@dataclass
+class MaterializedViewManager:
+    """Runs the scheduled and change driven refreshes of the registered read models."""
+    view_classes: list[type] = field(default_factory=list)
+    _tasks: list[asyncio.Task] = field(default_factory=list, init=False, repr=False)
+
+    def add(self, *view_classes: type) -> None:
+        for view_class in view_classes:
+            get_materialized_view(view_class)
+            if view_class not in self.view_classes:
+                self.view_classes.append(view_class)
+
+    async def start(self) -> None:
+        for view_class in self.view_classes:
+            view = get_materialized_view(view_class)
+            if await view_status(view_class) is None:
+                self._tasks.append(asyncio.create_task(self._refresh_safely(view_class, full=True)))
+            if view.refresh_interval_seconds:
+                self._tasks.append(asyncio.create_task(self._run_schedule(view_class, view)))
+            if view.follow_changes:
+                self._tasks.append(asyncio.create_task(self._follow_changes(view_class, view)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _refresh_safely(self, view_class: type, full: bool = False) -> None:
+        try:
+            await refresh_view(view_class, full=full)
+        except Exception as exc:
+            logger.exception(f'refresh of {view_class.__name__} failed: {exc}')
+
+    async def _run_schedule(self, view_class: type, view: MaterializedView) -> None:
+        while True:
+            await asyncio.sleep(view.refresh_interval_seconds)
+            await self._refresh_safely(view_class)
+
+    async def _follow_changes(self, view_class: type, view: MaterializedView) -> None:
+        try:
+            async with view.source.get_collection().watch() as stream:
+                while stream.alive:
+                    await stream.next()
+                    # fold the burst of events following the first one into a single refresh
+                    await asyncio.sleep(view.debounce_seconds)
+                    while await stream.try_next() is not None:
+                        pass
+                    await self._refresh_safely(view_class)
+        except PyMongoError as exc:
+            logger.warning(f'change stream for {view_class.__name__} is not available ({exc}); '
+                           f'relying on the refresh schedule')
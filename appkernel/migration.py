@@ -0,0 +1,388 @@
+"""Online data migrations.
+
+Schema changes such as new fields with a default or renamed fields are declared on the Model
+and applied to the stored documents in small batches while the application keeps serving::
+
+    class User(Model, MongoRepository):
+        ...
+        migrations: ClassVar[list[Migration]] = [
+            set_default('0001-add-status', 'status', 'ACTIVE'),
+            rename_field('0002-rename-login', 'login', 'username'),
+            Migration('0003-normalise-email', query={'email': {'$regex': '[A-Z]'}},
+                      transform=lambda user: {'$set': {'email': user.email.lower()}}),
+        ]
+
+    kernel.enable_migrations(User)
+
+Documents are read with :meth:`~appkernel.MongoRepository.stream_by_query` in ``_id`` order and
+written back in batches. Every write is conditional, so that a document changed by the application
+meanwhile is not overwritten: a constant ``update`` is sent in an unordered ``bulk_write`` and only
+applies to documents still matching the migration ``query`` (its operators apply to the current
+values); the update returned by a ``transform`` was computed from the values read, it is written
+per document and only while the document still has the ``version`` it was read with (Models
+without a version: while it still matches the ``query``), incrementing the version. A document
+changed in between is read again and transformed anew, up to ``CONFLICT_RETRIES`` times; the
+conflicts are counted in the progress.
+
+A :class:`Throttle` keeps the write rate under ``max_ops_per_second`` and slows down further while
+the secondaries lag behind the primary. After every batch a checkpoint is stored in the
+``appkernel_migrations`` collection, so an interrupted migration resumes after the last migrated
+document, and a completed one is never run again. Migrations run in the background on startup
+(``appkernel.migrations.run_on_startup``) or to completion from the command line with ``--migrate``;
+either way the runner first takes a lease in the same collection, so that of several application
+instances starting at once only one migrates.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+from .configuration import config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLLECTION = 'appkernel_migrations'
+LEASE_ID = 'lease'
+CONFLICT_RETRIES = 3
+
+
+@dataclass
+class Migration:
+    """A data migration of one Model's collection.
+
+    Args:
+        name: Unique (per Model) and stable name; the checkpoint is stored under it.
+        query: Selects the documents to migrate.
+        transform: Receives the Model instance (undeclared fields included) and returns the
+            update document (e.g. ``{'$set': {...}}``) or ``None`` to leave it unchanged; may be async.
+        update: A constant update document, used instead of ``transform``.
+        batch_size: Documents read and written per ``bulk_write``.
+        max_ops_per_second: Upper limit of the write rate; ``None`` for unthrottled.
+        max_replication_lag_seconds: The write rate is reduced while the replication lag is higher.
+        description: Free text shown in the progress report.
+    """
+    name: str
+    query: dict[str, Any] = field(default_factory=dict)
+    transform: Callable[[Any], Any] | None = None
+    update: dict[str, Any] | None = None
+    batch_size: int = 500
+    max_ops_per_second: float | None = 1000
+    max_replication_lag_seconds: float = 10.0
+    description: str | None = None
+
+    def __post_init__(self) -> None:
+        if (self.transform is None) == (self.update is None):
+            raise ValueError(f'Migration {self.name!r} needs exactly one of transform or update.')
+
+    async def update_for(self, model: Any) -> dict[str, Any] | None:
+        if self.update is not None:
+            return self.update
+        result = self.transform(model)
+        return await result if inspect.isawaitable(result) else result
+
+
+def set_default(name: str, field_name: str, value: Any, **options: Any) -> Migration:
+    """Migration filling ``field_name`` with ``value`` in every document which does not have it yet."""
+    return Migration(name, query={field_name: {'$exists': False}}, update={'$set': {field_name: value}},
+                     description=f'set default of {field_name}', **options)
+
+
+def rename_field(name: str, old_name: str, new_name: str, **options: Any) -> Migration:
+    """Migration renaming ``old_name`` to ``new_name`` in every document still carrying the old name."""
+    return Migration(name, query={old_name: {'$exists': True}}, update={'$rename': {old_name: new_name}},
+                     description=f'rename {old_name} to {new_name}', **options)
+
+
+@dataclass
+class MigrationProgress:
+    """Checkpoint and progress metrics of one migration, as stored in the checkpoint collection."""
+    migration: str
+    collection: str
+    status: str = 'running'
+    last_id: Any = None
+    processed: int = 0
+    modified: int = 0
+    conflicts: int = 0
+    batches: int = 0
+    ops_per_second: float = 0.0
+    started: datetime | None = None
+    updated: datetime | None = None
+    finished: datetime | None = None
+    error: str | None = None
+
+    @property
+    def key(self) -> str:
+        return f'{self.collection}:{self.migration}'
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            '_id': self.key, 'migration': self.migration, 'collection': self.collection, 'status': self.status,
+            'last_id': self.last_id, 'processed': self.processed, 'modified': self.modified,
+            'conflicts': self.conflicts, 'batches': self.batches, 'ops_per_second': round(self.ops_per_second, 1), 'started': self.started,
+            'updated': self.updated, 'finished': self.finished, 'error': self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, document: dict[str, Any]) -> MigrationProgress:
+        return cls(**{key: value for key, value in document.items() if key != '_id'})
+
+
+@dataclass
+class Throttle:
+    """Paces batches to ``max_ops_per_second`` and adapts the rate to the replication lag.
+
+    The rate is halved while the slowest secondary lags more than ``max_lag_seconds`` behind
+    the primary, and recovers by 10% per batch once the lag dropped below half of it. When the
+    lag cannot be read (standalone server, missing privileges) only the fixed rate applies.
+    """
+    max_ops_per_second: float | None
+    max_lag_seconds: float = 10.0
+    min_ops_per_second: float = 10.0
+    rate: float | None = field(init=False, default=None)
+    _lag_supported: bool = field(init=False, default=True)
+
+    def __post_init__(self) -> None:
+        self.rate = self.max_ops_per_second
+
+    async def pace(self, operations: int, elapsed: float) -> None:
+        """Wait after a batch of ``operations`` writes which took ``elapsed`` seconds."""
+        if self.rate is None:
+            return
+        lag = await self.replication_lag()
+        if lag is not None and lag > self.max_lag_seconds:
+            self.rate = max(self.rate / 2, self.min_ops_per_second)
+            logger.info(f'replication lag {lag:.1f}s, migration rate reduced to {self.rate:.0f} ops/s')
+        elif lag is not None and lag < self.max_lag_seconds / 2:
+            self.rate = min(self.rate * 1.1, self.max_ops_per_second)
+        delay = operations / self.rate - elapsed
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def replication_lag(self) -> float | None:
+        """Seconds the slowest secondary is behind the primary; ``None`` when it cannot be determined."""
+        if not self._lag_supported:
+            return None
+        try:
+            status = await config.mongo_database.client.admin.command('replSetGetStatus')
+        except (OperationFailure, PyMongoError, AttributeError):
+            self._lag_supported = False
+            return None
+        members = status.get('members', [])
+        primary = next((member for member in members if member.get('stateStr') == 'PRIMARY'), None)
+        secondaries = [member for member in members if member.get('stateStr') == 'SECONDARY']
+        if primary is None or not secondaries:
+            return None
+        slowest = min(member['optimeDate'] for member in secondaries)
+        return max((primary['optimeDate'] - slowest).total_seconds(), 0.0)
+
+
+def _checkpoints():
+    return config.mongo_database.get_collection(CHECKPOINT_COLLECTION)
+
+
+async def migration_status(model_class: type) -> dict[str, dict[str, Any]]:
+    """Progress of every migration declared on the Model, keyed by migration name."""
+    collection_name = model_class.get_collection().name
+    report = {}
+    for migration in getattr(model_class, 'migrations', None) or []:
+        document = await _checkpoints().find_one({'_id': f'{collection_name}:{migration.name}'})
+        report[migration.name] = document or {'migration': migration.name, 'status': 'pending'}
+    return report
+
+
+async def run_migration(model_class: type, migration: Migration, throttle: Throttle | None = None) -> MigrationProgress:
+    """Apply one migration, resuming from its checkpoint; returns the final progress.
+
+    A completed migration is not run again.
+    """
+    collection = model_class.get_collection()
+    checkpoint = await _checkpoints().find_one({'_id': f'{collection.name}:{migration.name}'})
+    progress = MigrationProgress.from_dict(checkpoint) if checkpoint else MigrationProgress(migration.name, collection.name)
+    if progress.status == 'completed':
+        return progress
+    throttle = throttle or Throttle(migration.max_ops_per_second, migration.max_replication_lag_seconds)
+    progress.status, progress.error = 'running', None
+    progress.started = progress.started or datetime.now(timezone.utc)
+    query = migration.query
+    if progress.last_id is not None:
+        logger.info(f'resuming migration {progress.key} after {progress.last_id!r}')
+        query = {'$and': [migration.query, {'_id': {'$gt': progress.last_id}}]}
+    batch: list[Any] = []
+    try:
+        batch_started = time.perf_counter()
+        async for model in model_class.stream_by_query(query, batch_size=migration.batch_size, sort_by='_id'):
+            batch.append(model)
+            if len(batch) >= migration.batch_size:
+                await _write_batch(model_class, migration, batch, progress, throttle, batch_started)
+                batch = []
+                batch_started = time.perf_counter()
+        if batch:
+            await _write_batch(model_class, migration, batch, progress, throttle, batch_started)
+        progress.status, progress.finished = 'completed', datetime.now(timezone.utc)
+    except Exception as exc:
+        progress.status, progress.error = 'failed', f'{exc.__class__.__name__}/{exc}'
+        logger.exception(f'migration {progress.key} failed: {exc}')
+    progress.updated = datetime.now(timezone.utc)
+    await _checkpoints().replace_one({'_id': progress.key}, progress.to_dict(), upsert=True)
+    return progress
+
+
+def _selection(migration: Migration, object_id: Any, version: Any = None) -> dict[str, Any]:
+    """The filter of a conditional write: the document must still match the query (and have ``version``)."""
+    selection = {'_id': object_id} if version is None else {'_id': object_id, 'version': version}
+    return {'$and': [migration.query, selection]} if migration.query else selection
+
+
+def _with_version_increment(update: Any) -> Any:
+    if isinstance(update, list):
+        return [*update, {'$set': {'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}}}]
+    if any('version' in (update.get(operator) or {}) for operator in ('$set', '$inc', '$unset')):
+        return update
+    return {**update, '$inc': {**update.get('$inc', {}), 'version': 1}}
+
+
+async def _write_transformed(model_class: type, collection: Any, migration: Migration, model: Any,
+                             progress: MigrationProgress) -> int:
+    """Write the transform of one document; returns the number of writes sent."""
+    from .model import Model
+    from .repository import mongo_type_converter_from_dict
+    writes = 0
+    for attempt in range(CONFLICT_RETRIES + 1):
+        update = await migration.update_for(model)
+        if not update:
+            return writes
+        version = getattr(model, 'version', None)
+        if version is not None:
+            update = _with_version_increment(update)
+        result = await collection.update_one(_selection(migration, model.id, version), update)
+        writes += 1
+        if result.matched_count:
+            progress.modified += result.modified_count
+            return writes
+        if version is None:
+            return writes  # no longer matching the query: migrated or changed meanwhile
+        progress.conflicts += 1
+        if attempt == CONFLICT_RETRIES:
+            break
+        document = await collection.find_one(_selection(migration, model.id))
+        if document is None:
+            return writes
+        model = Model.from_dict(document, model_class, convert_ids=True, converter_func=mongo_type_converter_from_dict)
+    logger.warning(f'migration {progress.key} skipped {model.id!r}: changed concurrently {CONFLICT_RETRIES + 1} times')
+    return writes
+
+
+async def _write_batch(model_class: type, migration: Migration, batch: list[Any], progress: MigrationProgress,
+                       throttle: Throttle, batch_started: float) -> None:
+    from .repository import _record_write
+    collection = model_class.get_collection()
+    writes = 0
+    if migration.update is not None:
+        operations = [UpdateOne(_selection(migration, model.id), migration.update) for model in batch]
+        result = await collection.bulk_write(operations, ordered=False)
+        progress.modified += result.modified_count
+        writes = len(operations)
+    else:
+        for model in batch:
+            writes += await _write_transformed(model_class, collection, migration, model, progress)
+    if writes:
+        _record_write(collection)
+    progress.processed += len(batch)
+    progress.batches += 1
+    progress.last_id = batch[-1].id
+    elapsed = time.perf_counter() - batch_started
+    progress.ops_per_second = len(batch) / elapsed if elapsed else 0.0
+    progress.updated = datetime.now(timezone.utc)
+    await _checkpoints().replace_one({'_id': progress.key}, progress.to_dict(), upsert=True)
+    await throttle.pace(writes, elapsed)
+
+
+@dataclass
+class MigrationRunner:
+    """Runs the migrations declared on the registered Models, one after the other.
+
+    :meth:`start` and :meth:`run_leased` hold a lease document in the checkpoint collection while
+    running, renewed every third of ``lease_seconds``; a runner which finds the lease held by another
+    instance does not migrate. A crashed instance's lease expires after ``lease_seconds``.
+    """
+    model_classes: list[type] = field(default_factory=list)
+    lease_seconds: float = 60.0
+    owner: str = field(default_factory=lambda: uuid.uuid4().hex)
+    _task: asyncio.Task | None = field(default=None, init=False, repr=False)
+
+    def add(self, *model_classes: type) -> None:
+        for model_class in model_classes:
+            names = [migration.name for migration in getattr(model_class, 'migrations', None) or []]
+            if len(names) != len(set(names)):
+                raise ValueError(f'{model_class.__name__} declares migrations with the same name.')
+            if model_class not in self.model_classes:
+                self.model_classes.append(model_class)
+
+    async def run_all(self) -> list[MigrationProgress]:
+        """Run every pending migration; a failed migration stops the remaining ones of its Model."""
+        results = []
+        for model_class in self.model_classes:
+            for migration in getattr(model_class, 'migrations', None) or []:
+                progress = await run_migration(model_class, migration)
+                results.append(progress)
+                logger.info(f'migration {progress.key}: {progress.status}, {progress.processed} documents processed, '
+                            f'{progress.modified} modified, {progress.conflicts} conflicts')
+                if progress.status == 'failed':
+                    break
+        return results
+
+    async def acquire_lease(self) -> bool:
+        """Take or renew the lease; ``False`` while another runner holds it."""
+        now = datetime.now(timezone.utc)
+        try:
+            await _checkpoints().find_one_and_update(
+                {'_id': LEASE_ID, '$or': [{'owner': self.owner}, {'expires': {'$lt': now}}]},
+                {'$set': {'owner': self.owner, 'expires': now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_lease(self) -> None:
+        await _checkpoints().delete_one({'_id': LEASE_ID, 'owner': self.owner})
+
+    async def run_leased(self) -> list[MigrationProgress] | None:
+        """:meth:`run_all` under the lease; ``None`` when another runner holds it."""
+        if not await self.acquire_lease():
+            logger.info('migrations are run by another instance')
+            return None
+        runner = asyncio.current_task()
+        renewal = asyncio.create_task(self._renew_lease(runner))
+        try:
+            return await self.run_all()
+        finally:
+            renewal.cancel()
+            await asyncio.gather(renewal, return_exceptions=True)
+            await self.release_lease()
+
+    async def _renew_lease(self, runner: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await self.acquire_lease():
+                logger.warning('the migration lease was taken over by another instance, stopping')
+                runner.cancel()
+                return
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run_leased())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -13,14 +13,15 @@ from .core import AppKernelException
 from .validators import Validator, NotEmpty, Unique, Max, Min, Regexp, Email
 from .util import default_json_serializer, OBJ_PREFIX
 
-from .dsl import CustomProperty
+from .dsl import CustomProperty, TEXT_SCORE
+from .geo import GeoJSON, geometry_from_dict
 
 # Import field metadata types and metaclass
 from .fields import (
     AppKernelMeta,
     get_field_validators_meta, get_field_marshaller,
     is_field_required, is_field_omitted, get_field_generator, get_field_converter,
-    get_field_default, extract_base_type,
+    get_field_default, extract_base_type, populated_attributes,
 )
 
 try:
@@ -338,6 +339,8 @@ class Model(BaseModel, metaclass=AppKernelMeta):
                 continue
             elif issubclass(spec.get('type'), Enum):
                 properties[name] = {'enum': describe_enum(spec.get('type'))}
+            elif issubclass(spec.get('type'), GeoJSON):
+                properties[name] = spec.get('type').json_schema(type_label)
             else:
                 if not mongo_compatibility:
                     properties[name] = {type_label: [type_map.get(type_string, 'string')]}
@@ -516,7 +519,20 @@ class Model(BaseModel, metaclass=AppKernelMeta):
         else:
             instance_data = {k: v for k, v in instance.__dict__.items()}
 
+        populated = populated_attributes(instance.__class__) if isinstance(instance, Model) else frozenset()
         for param, obj in instance_data.items():
+            if param in populated:
+                # populated references are a read-side view: never stored, serialised like a top level Model
+                if not convert_id and obj is not None:
+                    result[param] = [Model.to_dict(item, validate=False, skip_omitted_fields=skip_omitted_fields,
+                                                   marshal_values=marshal_values, converter_func=converter_func)
+                                     for item in obj] if isinstance(obj, list) else \
+                        Model.to_dict(obj, validate=False, skip_omitted_fields=skip_omitted_fields,
+                                      marshal_values=marshal_values, converter_func=converter_func)
+                continue
+            if param == TEXT_SCORE and convert_id and param not in cls_fields:
+                # the relevance of a $text search result is not part of the document
+                continue
             if skip_omitted_fields and param in cls_fields:
                 field_info = cls_fields[param]
                 if is_field_omitted(field_info):
@@ -529,6 +545,8 @@ class Model(BaseModel, metaclass=AppKernelMeta):
                 result[param] = Model.to_dict(obj, convert_id, converter_func=converter_func)
             elif isinstance(obj, Enum):
                 result[param] = obj.name
+            elif isinstance(obj, GeoJSON):
+                result[param] = obj.to_geojson()
             elif isinstance(obj, list):
                 result[param] = [Model.to_dict(item, convert_id, converter_func=converter_func)
                                  if isinstance(item, Model) else
@@ -592,6 +610,8 @@ class Model(BaseModel, metaclass=AppKernelMeta):
                                                                converter_func=converter_func))
                     elif python_type and inspect.isclass(python_type) and issubclass(python_type, Enum):
                         setattr(instance, key, python_type[val])
+                    elif python_type and inspect.isclass(python_type) and issubclass(python_type, GeoJSON):
+                        setattr(instance, key, geometry_from_dict(val, python_type))
                     elif isinstance(val, str) and python_type:
                         setattr(instance, key,
                                 string_to_type_converters.get(python_type, default_convert)(val))
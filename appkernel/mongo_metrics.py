@@ -0,0 +1,270 @@
+"""Connection pool and wire compression settings and driver level metrics of the MongoDB client.
+
+The pool of the Motor client is sized from the ``appkernel.mongo.pool`` configuration section,
+and the wire compression is negotiated with the server from ``appkernel.mongo.compressors``::
+
+    mongo:
+      pool:
+        max_pool_size: 100
+        min_pool_size: 10
+        max_idle_time_ms: 60000
+        wait_queue_timeout_ms: 2000
+        max_connecting: 2
+      compressors: [zstd, snappy, zlib]   # in order of preference
+      zlib_compression_level: 6
+
+The server picks the first compressor it supports as well. Compressors whose library is not
+available (``backports.zstd`` before Python 3.14 for zstd, ``python-snappy`` for snappy) are
+skipped by the driver with a warning; zlib is always available.
+
+With ``appkernel.mongo.metrics`` set (or :meth:`AppKernelEngine.enable_mongo_metrics`), PyMongo
+connection pool and command listeners are registered on the client and :class:`MongoMetrics`
+keeps, per server, the connections in use, the requests waiting for a connection and the
+checkout wait times, and, per collection and command, the number of calls, failures and their
+latency. Compare ``max_in_use`` and the wait times with ``max_pool_size`` to size the pool against
+the observed queueing.
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+
+from pymongo import monitoring
+
+from .configuration import config
+
+# cfg.yml key -> MongoClient keyword argument
+POOL_SETTINGS = {
+    'max_pool_size': 'maxPoolSize',
+    'min_pool_size': 'minPoolSize',
+    'max_idle_time_ms': 'maxIdleTimeMS',
+    'wait_queue_timeout_ms': 'waitQueueTimeoutMS',
+    'max_connecting': 'maxConnecting',
+}
+COMPRESSORS = ('zstd', 'snappy', 'zlib')
+# commands carrying the collection name under their own name
+_COLLECTION_COMMANDS = frozenset({
+    'find', 'insert', 'update', 'delete', 'aggregate', 'count', 'distinct', 'findAndModify', 'createIndexes',
+    'dropIndexes', 'listIndexes', 'collMod', 'drop', 'bulkWrite',
+})
+MAX_PENDING_COMMANDS = 10_000
+
+
+def pool_options() -> dict[str, Any]:
+    """The MongoClient keyword arguments of the ``appkernel.mongo.pool`` configuration section."""
+    cfg_engine = getattr(config, 'cfg_engine', None)
+    section = (cfg_engine.get('appkernel.mongo.pool', None) if cfg_engine else None) or {}
+    unknown = set(section) - set(POOL_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown appkernel.mongo.pool settings: {', '.join(sorted(unknown))}; "
+                         f"supported: {', '.join(POOL_SETTINGS)}.")
+    return {POOL_SETTINGS[key]: int(value) for key, value in section.items() if value is not None}
+
+
+def compression_options() -> dict[str, Any]:
+    """The MongoClient keyword arguments of ``appkernel.mongo.compressors`` and ``zlib_compression_level``."""
+    cfg_engine = getattr(config, 'cfg_engine', None)
+    if cfg_engine is None:
+        return {}
+    compressors = cfg_engine.get('appkernel.mongo.compressors', None)
+    if isinstance(compressors, str):
+        compressors = [name.strip() for name in compressors.split(',') if name.strip()]
+    options: dict[str, Any] = {}
+    if compressors:
+        unknown = [name for name in compressors if name not in COMPRESSORS]
+        if unknown:
+            raise ValueError(f"Unknown compressors: {', '.join(unknown)}; supported: {', '.join(COMPRESSORS)}.")
+        options['compressors'] = ','.join(compressors)
+    level = cfg_engine.get('appkernel.mongo.zlib_compression_level', None)
+    if level is not None:
+        if not -1 <= int(level) <= 9:
+            raise ValueError(f'zlib_compression_level must be between -1 and 9, got {level}.')
+        options['zlibCompressionLevel'] = int(level)
+    return options
+
+
+@dataclass
+class Timing:
+    """Count, total and maximum of a duration, in milliseconds."""
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def add(self, duration_ms: float) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'count': self.count, 'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+                'max_ms': round(self.max_ms, 3)}
+
+
+@dataclass
+class PoolStats:
+    """Connection pool state of one server."""
+    open: int = 0
+    in_use: int = 0
+    max_in_use: int = 0
+    waiting: int = 0
+    max_waiting: int = 0
+    checkout_failures: dict[str, int] = field(default_factory=dict)
+    cleared: int = 0
+    checkout_wait: Timing = field(default_factory=Timing)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'open': self.open, 'in_use': self.in_use, 'max_in_use': self.max_in_use, 'waiting': self.waiting,
+                'max_waiting': self.max_waiting, 'checkout_failures': dict(self.checkout_failures),
+                'cleared': self.cleared, 'checkout_wait': self.checkout_wait.to_dict()}
+
+
+@dataclass
+class CommandStats:
+    """Latency of one command on one collection."""
+    latency: Timing = field(default_factory=Timing)
+    failures: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**self.latency.to_dict(), 'failures': self.failures}
+
+
+def _address(address: Any) -> str:
+    host, port = address if isinstance(address, tuple) else (address, None)
+    return f'{host}:{port}' if port else str(host)
+
+
+def command_collection(command_name: str, command: Any) -> str | None:
+    """The name of the collection a command runs on; ``None`` for database and server commands."""
+    if command_name == 'getMore':
+        return command.get('collection')
+    if command_name in _COLLECTION_COMMANDS:
+        value = command.get(command_name)
+        return value if isinstance(value, str) else None
+    return None
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """Tracks connections in use, waiting checkouts and checkout wait times per server."""
+
+    def __init__(self, metrics: MongoMetrics) -> None:
+        self.metrics = metrics
+
+    def _stats(self, event: Any) -> PoolStats:
+        return self.metrics.pools.setdefault(_address(event.address), PoolStats())
+
+    def pool_created(self, event: Any) -> None:
+        with self.metrics.lock:
+            self._stats(event)
+
+    def pool_ready(self, event: Any) -> None:
+        pass
+
+    def pool_cleared(self, event: Any) -> None:
+        with self.metrics.lock:
+            self._stats(event).cleared += 1
+
+    def pool_closed(self, event: Any) -> None:
+        pass
+
+    def connection_created(self, event: Any) -> None:
+        with self.metrics.lock:
+            self._stats(event).open += 1
+
+    def connection_ready(self, event: Any) -> None:
+        pass
+
+    def connection_closed(self, event: Any) -> None:
+        with self.metrics.lock:
+            stats = self._stats(event)
+            stats.open = max(stats.open - 1, 0)
+
+    def connection_check_out_started(self, event: Any) -> None:
+        with self.metrics.lock:
+            stats = self._stats(event)
+            stats.waiting += 1
+            stats.max_waiting = max(stats.max_waiting, stats.waiting)
+
+    def connection_check_out_failed(self, event: Any) -> None:
+        with self.metrics.lock:
+            stats = self._stats(event)
+            stats.waiting = max(stats.waiting - 1, 0)
+            stats.checkout_failures[str(event.reason)] = stats.checkout_failures.get(str(event.reason), 0) + 1
+            stats.checkout_wait.add((event.duration or 0.0) * 1000)
+
+    def connection_checked_out(self, event: Any) -> None:
+        with self.metrics.lock:
+            stats = self._stats(event)
+            stats.waiting = max(stats.waiting - 1, 0)
+            stats.in_use += 1
+            stats.max_in_use = max(stats.max_in_use, stats.in_use)
+            stats.checkout_wait.add((event.duration or 0.0) * 1000)
+
+    def connection_checked_in(self, event: Any) -> None:
+        with self.metrics.lock:
+            stats = self._stats(event)
+            stats.in_use = max(stats.in_use - 1, 0)
+
+
+class CommandLatencyListener(monitoring.CommandListener):
+    """Records the latency and the failures of collection level commands."""
+
+    def __init__(self, metrics: MongoMetrics) -> None:
+        self.metrics = metrics
+        self._pending: dict[tuple[Any, int], str] = {}
+
+    def started(self, event: Any) -> None:
+        collection = command_collection(event.command_name, event.command)
+        if collection is None:
+            return
+        with self.metrics.lock:
+            if len(self._pending) < MAX_PENDING_COMMANDS:
+                self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finished(self, event: Any, failed: bool) -> None:
+        with self.metrics.lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), None)
+            if collection is None:
+                return
+            per_collection = self.metrics.commands.setdefault(collection, {})
+            stats = per_collection.setdefault(event.command_name, CommandStats())
+            stats.latency.add(event.duration_micros / 1000)
+            stats.failures += int(failed)
+
+    def succeeded(self, event: Any) -> None:
+        self._finished(event, failed=False)
+
+    def failed(self, event: Any) -> None:
+        self._finished(event, failed=True)
+
+
+class MongoMetrics:
+    """Driver level pool and command metrics; register :meth:`listeners` on the client."""
+
+    def __init__(self, max_pool_size: int | None = None) -> None:
+        self.max_pool_size = max_pool_size
+        self.lock = threading.Lock()
+        self.pools: dict[str, PoolStats] = {}
+        self.commands: dict[str, dict[str, CommandStats]] = {}
+
+    def listeners(self) -> list[Any]:
+        return [PoolListener(self), CommandLatencyListener(self)]
+
+    def snapshot(self) -> dict[str, Any]:
+        """The current metrics as a JSON serialisable dict."""
+        with self.lock:
+            return {
+                'max_pool_size': self.max_pool_size,
+                'pools': {address: stats.to_dict() for address, stats in self.pools.items()},
+                'commands': {collection: {name: stats.to_dict() for name, stats in commands.items()}
+                             for collection, commands in self.commands.items()},
+            }
+
+    def reset(self) -> None:
+        """Clear the counters; the current pool state (open, in use, waiting) is kept."""
+        with self.lock:
+            for stats in self.pools.values():
+                stats.max_in_use, stats.max_waiting, stats.cleared = stats.in_use, stats.waiting, 0
+                stats.checkout_failures.clear()
+                stats.checkout_wait = Timing()
+            self.commands.clear()
@@ -17,6 +17,7 @@ from __future__ import annotations
 import inspect
 from typing import Any, get_type_hints
 
+from .atomic_updates import JSON_PATCH_MEDIA_TYPE, JSON_PATCH_OPERATIONS, MERGE_PATCH_MEDIA_TYPE
 from .configuration import config
 
 
@@ -72,7 +73,16 @@ _ENVELOPE_SCHEMA: dict[str, Any] = {
 }
 
 # Standard pagination / query parameters added to collection GET routes
-_COLLECTION_QUERY_PARAMS = ('page', 'page_size', 'sort_by', 'sort_order', 'query')
+_COLLECTION_QUERY_PARAMS = ('page', 'page_size', 'sort_by', 'sort_order', 'count_mode', 'query', 'expand')
+_JSON_PATCH_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'required': ['op', 'path'],
+        'properties': {'op': {'type': 'string', 'enum': list(JSON_PATCH_OPERATIONS)}, 'path': {'type': 'string'},
+                       'value': {}},
+    },
+}
 
 
 class OpenAPISchemaGenerator:
@@ -178,8 +188,8 @@ class OpenAPISchemaGenerator:
         """Build query parameter list from decorator ``query_params`` kwarg.
 
         For CRUD collection GET routes the standard pagination parameters
-        (``page``, ``page_size``, ``sort_by``, ``sort_order``, ``query``) are
-        appended automatically.
+        (``page``, ``page_size``, ``sort_by``, ``sort_order``, ``count_mode``,
+        ``query``) are appended automatically.
         """
         params: list[dict] = []
         seen: set[str] = set()
@@ -216,7 +226,13 @@ class OpenAPISchemaGenerator:
         if meta.get('model_class') and method in ('POST', 'PUT'):
             return {'required': True, 'content': {'application/json': {'schema': self._model_schema_ref(meta['model_class'])}}}
 
-        # 4. Generic fallback
+        # 4. CRUD PATCH: a partial document, an update operator document, a JSON Merge Patch or a JSON Patch
+        if meta.get('model_class') and method == 'PATCH':
+            return {'required': True, 'content': {'application/json': {'schema': {'type': 'object'}},
+                                                  MERGE_PATCH_MEDIA_TYPE: {'schema': {'type': 'object'}},
+                                                  JSON_PATCH_MEDIA_TYPE: {'schema': _JSON_PATCH_SCHEMA}}}
+
+        # 5. Generic fallback
         return {'required': False, 'content': {'application/json': {'schema': {'type': 'object'}}}}
 
     def _infer_request_schema(self, handler_func: Any) -> dict | None:
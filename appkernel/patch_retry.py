@@ -0,0 +1,103 @@
+"""Server side retry of PATCH requests rejected by optimistic locking.
+
+A PATCH carrying the ``version`` the client has read is rejected with :exc:`VersionConflictError`
+(HTTP 409) as soon as any other write got in between. On hot documents most of those writes touch
+other fields, and sending the conflict back to the client only makes it re-fetch and retry. With a
+:class:`PatchRetryPolicy` set as the ``patch_retry`` class variable of the Model, ``patch_object``
+retries the patch on the server instead::
+
+    class Order(Model, MongoRepository):
+        status: str | None = None
+        patch_retry: ClassVar[PatchRetryPolicy] = PatchRetryPolicy(max_retries=3)
+
+To tell which fields changed since the version of the client, every write of such a Model stamps
+the version it produced into the ``_field_versions`` document field: a save stamps the whole
+document (``'*'``), a patch the fields it sets. On a conflict the stamps are re-read and the patch
+is applied on top of the current version when none of its fields were written after the version of
+the client, after a jittered backoff and up to ``max_retries`` times. Overlapping changes, and
+documents written before the policy was set (no stamps), still answer with 409. Atomic operator
+updates (see :mod:`appkernel.atomic_updates`) do not know the version they produce and stamp their
+fields as :data:`UNKNOWN_VERSION`, which overlaps with every patch until the next write of the field.
+"""
+from __future__ import annotations
+
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Any
+
+FIELD_VERSIONS = '_field_versions'
+WHOLE_DOCUMENT = '*'
+# stamp of fields written by atomic operator updates, whose resulting version is not known
+UNKNOWN_VERSION = math.inf
+# document keys of a patch which are not fields of the Model
+_NON_FIELD_KEYS = frozenset({'_id', 'id', 'version', '_type', FIELD_VERSIONS})
+
+
+@dataclass
+class ConflictMetrics:
+    """Conflict statistics of the patches of one Model."""
+    conflicts: int = 0
+    retries: int = 0
+    resolved: int = 0
+    overlapping: int = 0
+    exhausted: int = 0
+
+    def to_dict(self) -> dict[str, int]:
+        return {'conflicts': self.conflicts, 'retries': self.retries, 'resolved': self.resolved,
+                'overlapping': self.overlapping, 'exhausted': self.exhausted}
+
+
+@dataclass
+class PatchRetryPolicy:
+    """How ``patch_object`` retries a patch rejected by a version conflict.
+
+    Args:
+        max_retries: Retries after the first conflict; the last conflict is raised.
+        base_delay_ms: Backoff of the first retry, doubled on every further retry.
+        max_delay_ms: Upper bound of the backoff; the actual delay is drawn between 0 and the bound
+            ("full jitter"), so that competing writers do not retry in lockstep.
+    """
+    max_retries: int = 3
+    base_delay_ms: float = 5.0
+    max_delay_ms: float = 100.0
+    metrics: ConflictMetrics = field(init=False, default_factory=ConflictMetrics)
+
+    def __post_init__(self) -> None:
+        if self.max_retries < 0:
+            raise ValueError('max_retries must not be negative.')
+        if not 0 <= self.base_delay_ms <= self.max_delay_ms:
+            raise ValueError('base_delay_ms must be between 0 and max_delay_ms.')
+
+    def backoff_seconds(self, retry: int) -> float:
+        """The jittered delay before the ``retry``-th retry (counted from 0)."""
+        return random.uniform(0, min(self.max_delay_ms, self.base_delay_ms * 2 ** retry)) / 1000
+
+
+def patched_fields(document: dict[str, Any]) -> set[str]:
+    """The Model fields a patch document sets; the top-level field of a dotted key."""
+    return {key.split('.', 1)[0] for key in document} - _NON_FIELD_KEYS
+
+
+def stamp_expression(version: Any, fields: set[str] | None = None) -> Any:
+    """Aggregation expression of the new ``_field_versions`` of a write producing ``version``.
+
+    ``fields`` is ``None`` for a save of the whole document, which replaces the stamps.
+    """
+    if fields is None:
+        return {WHOLE_DOCUMENT: version}
+    return {'$mergeObjects': [{'$ifNull': [f'${FIELD_VERSIONS}', {}]}, {name: version for name in sorted(fields)}]}
+
+
+def overlapping_fields(stamps: dict[str, int] | None, fields: set[str], base_version: int) -> set[str]:
+    """The fields written after ``base_version``; all of them when the stamps do not tell."""
+    stamps = stamps or {}
+    if stamps.get(WHOLE_DOCUMENT) is None or stamps[WHOLE_DOCUMENT] > base_version:
+        return set(fields)
+    return {name for name in fields if stamps.get(name, 0) > base_version}
+
+
+def conflict_metrics(model_class: type) -> dict[str, int]:
+    """Return the conflict statistics of the Model's patches; empty without a retry policy."""
+    policy = getattr(model_class, 'patch_retry', None)
+    return policy.metrics.to_dict() if policy else {}
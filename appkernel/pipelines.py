@@ -0,0 +1,256 @@
+"""Named aggregation pipelines declared on the Model.
+
+Instead of sending whole pipelines as JSON with every ``GET aggregate/`` call, reports
+can be registered on the server with typed parameters. The pipeline is validated once,
+parameters are bound into :class:`Param` placeholders, results are cached and each call
+is timed::
+
+    class Order(Model, MongoRepository):
+        named_pipelines: ClassVar[dict[str, NamedPipeline]] = {
+            'revenue_by_day': NamedPipeline([
+                {'$match': {'status': Param('status', default='PAID'),
+                            'created': {'$gte': Param('since', datetime)}}},
+                {'$group': {'_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created'}},
+                            'revenue': {'$sum': '$total'}}},
+                {'$sort': {'_id': 1}},
+            ], ttl_seconds=300),
+        }
+
+    rows = await Order.aggregate_named('revenue_by_day', since=datetime(2024, 1, 1))
+
+Registered models expose every named pipeline as ``GET {model}/aggregate/{name}``, with
+the parameters taken from the query string.
+"""
+from __future__ import annotations
+
+import copy
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any
+
+from bson import ObjectId
+
+from .repository import collection_write_version, validate_pipeline
+from .time_budget import operation_options
+from .util import OBJ_PREFIX, to_boolean
+from .validators import ValidationException
+
+_MISSING = object()
+
+
+def _convert_object_id(value: Any) -> ObjectId:
+    value = str(value)
+    return ObjectId(value[len(OBJ_PREFIX):] if value.startswith(OBJ_PREFIX) else value)
+
+
+_CONVERTERS = {
+    str: str,
+    int: int,
+    float: float,
+    bool: to_boolean,
+    datetime: lambda value: value if isinstance(value, datetime) else datetime.fromisoformat(value),
+    date: lambda value: value if isinstance(value, date) else date.fromisoformat(value),
+    ObjectId: _convert_object_id,
+}
+
+
+@dataclass(frozen=True)
+class Param:
+    """Typed placeholder inside a :class:`NamedPipeline`, replaced by the caller's value.
+
+    Values are converted to ``type`` before binding, so a parameter can never smuggle an
+    operator document into the pipeline.
+
+    Args:
+        name: The parameter (and query string) name.
+        type: One of ``str``, ``int``, ``float``, ``bool``, ``datetime``, ``date`` or ``ObjectId``.
+        default: Value used when the caller omits the parameter; required when not given.
+        many: Accept a comma separated list (or a Python list) of values, e.g. for ``$in``.
+    """
+    name: str
+    type: type = str
+    default: Any = _MISSING
+    many: bool = False
+
+    def __post_init__(self) -> None:
+        if self.type not in _CONVERTERS:
+            raise TypeError(f'Param {self.name!r}: unsupported type {self.type!r}.')
+
+    @property
+    def required(self) -> bool:
+        return self.default is _MISSING
+
+    def convert(self, raw: Any) -> Any:
+        converter = _CONVERTERS[self.type]
+        try:
+            if self.many:
+                items = raw.split(',') if isinstance(raw, str) else list(raw)
+                return [converter(item) for item in items]
+            return converter(raw)
+        except (TypeError, ValueError) as exc:
+            raise ValidationException(f'Parameter {self.name!r} is not a valid {self.type.__name__}: {raw!r}') \
+                from exc
+
+
+@dataclass
+class PipelineMetrics:
+    """Call statistics of one named pipeline."""
+    calls: int = 0
+    cache_hits: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+
+    @property
+    def mean_ms(self) -> float:
+        executed = self.calls - self.cache_hits
+        return self.total_ms / executed if executed else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'calls': self.calls, 'cache_hits': self.cache_hits, 'mean_ms': round(self.mean_ms, 3),
+            'max_ms': round(self.max_ms, 3), 'last_ms': round(self.last_ms, 3),
+        }
+
+
+@dataclass
+class PipelineResult:
+    """Outcome of one named pipeline call."""
+    items: list[dict[str, Any]]
+    cached: bool
+    duration_ms: float
+
+
+@dataclass
+class NamedPipeline:
+    """A server side aggregation pipeline with typed parameters and an optional result cache.
+
+    Args:
+        stages: The aggregation stages; values may be :class:`Param` placeholders.
+        ttl_seconds: How long results are cached; ``0`` disables caching.
+        invalidate_on_write: Drop cached results as soon as this process writes to the
+            collection. Writes by other processes are only picked up when the TTL expires,
+            as are changes to collections joined with ``$lookup``.
+        max_results: Appends a ``$limit`` stage; ``None`` disables it.
+        max_cache_entries: Number of distinct parameter combinations kept in the cache.
+        description: Shown in the OpenAPI document.
+    """
+    stages: list[dict[str, Any]]
+    ttl_seconds: float = 0
+    invalidate_on_write: bool = True
+    max_results: int | None = 10_000
+    max_cache_entries: int = 128
+    description: str | None = None
+    params: dict[str, Param] = field(init=False, default_factory=dict)
+    metrics: PipelineMetrics = field(init=False, default_factory=PipelineMetrics)
+    _cache: OrderedDict = field(init=False, repr=False, default_factory=OrderedDict)
+
+    def __post_init__(self) -> None:
+        # the pipeline is authored by the application: trusted, but write and JS stages stay blocked
+        validate_pipeline(self.stages, trusted=True)
+        for param in _collect_params(self.stages):
+            known = self.params.setdefault(param.name, param)
+            if known != param:
+                raise TypeError(f'Param {param.name!r} is declared twice with different settings.')
+        if self.max_results is not None:
+            self.stages = self.stages + [{'$limit': self.max_results}]
+
+    def bind(self, arguments: dict[str, Any]) -> list[dict[str, Any]]:
+        """Return a copy of the stages with every placeholder replaced by its converted value.
+
+        Raises:
+            ValidationException: A required parameter is missing or a value cannot be converted.
+        """
+        values = self.bind_values(arguments)
+        return _substitute(self.stages, values)
+
+    def bind_values(self, arguments: dict[str, Any]) -> dict[str, Any]:
+        values = {}
+        for name, param in self.params.items():
+            raw = arguments.get(name, _MISSING)
+            if raw is _MISSING:
+                if param.required:
+                    raise ValidationException(f'Parameter {name!r} is required.')
+                values[name] = copy.deepcopy(param.default)
+            else:
+                values[name] = param.convert(raw)
+        return values
+
+    async def run(self, model_class: type, **arguments: Any) -> list[dict[str, Any]]:
+        """Bind ``arguments``, then serve the result from the cache or run the pipeline on the Model's collection."""
+        return (await self.execute(model_class, **arguments)).items
+
+    async def execute(self, model_class: type, **arguments: Any) -> PipelineResult:
+        """Like :meth:`run`, but also reports whether the cache answered and how long the call took."""
+        started = time.perf_counter()
+        values = self.bind_values(arguments)
+        collection = model_class.read_collection('aggregate')
+        key = _cache_key(values)
+        self.metrics.calls += 1
+        if self.ttl_seconds:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.monotonic() and (
+                    not self.invalidate_on_write or entry[1] == collection_write_version(collection.name)):
+                self.metrics.cache_hits += 1
+                self._cache.move_to_end(key)
+                return PipelineResult(copy.deepcopy(entry[2]), True, (time.perf_counter() - started) * 1000)
+        write_version = collection_write_version(collection.name)
+        cursor = collection.aggregate(_substitute(self.stages, values), allowDiskUse=True, **operation_options())
+        items = await cursor.to_list(length=self.max_results)
+        if self.ttl_seconds:
+            self._cache[key] = (time.monotonic() + self.ttl_seconds, write_version, copy.deepcopy(items))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics.total_ms += elapsed_ms
+        self.metrics.max_ms = max(self.metrics.max_ms, elapsed_ms)
+        self.metrics.last_ms = elapsed_ms
+        return PipelineResult(items, False, elapsed_ms)
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+
+def _collect_params(node: Any) -> list[Param]:
+    if isinstance(node, Param):
+        return [node]
+    if isinstance(node, dict):
+        return [param for value in node.values() for param in _collect_params(value)]
+    if isinstance(node, (list, tuple)):
+        return [param for value in node for param in _collect_params(value)]
+    return []
+
+
+def _substitute(node: Any, values: dict[str, Any]) -> Any:
+    if isinstance(node, Param):
+        return values[node.name]
+    if isinstance(node, dict):
+        return {key: _substitute(value, values) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_substitute(value, values) for value in node]
+    return node
+
+
+def _cache_key(values: dict[str, Any]) -> tuple:
+    return tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in sorted(values.items()))
+
+
+def get_named_pipeline(model_class: type, name: str) -> NamedPipeline:
+    """Look up a pipeline declared in the Model's ``named_pipelines``.
+
+    Raises:
+        KeyError: No pipeline with this name is declared.
+    """
+    pipelines = getattr(model_class, 'named_pipelines', None) or {}
+    if name not in pipelines:
+        raise KeyError(f'{model_class.__name__} has no named pipeline {name!r}.')
+    return pipelines[name]
+
+
+def pipeline_metrics(model_class: type) -> dict[str, dict[str, Any]]:
+    """Return the call statistics of every named pipeline of the Model, keyed by pipeline name."""
+    pipelines = getattr(model_class, 'named_pipelines', None) or {}
+    return {name: pipeline.metrics.to_dict() for name, pipeline in pipelines.items()}
@@ -0,0 +1,155 @@
+"""Read preference and read concern routing.
+
+Every read goes to the primary unless a :class:`ReadPolicy` routes it elsewhere. The policy is
+resolved per Model and per repository method, the first match wins:
+
+- :func:`reading` — a policy for every read issued inside the ``with`` block;
+- the ``read_policy`` class variable of the Model, either one policy or a dict keyed by method name
+  (``{'find_by_query': ReadPolicy('secondaryPreferred'), 'default': ReadPolicy(concern='majority')}``);
+- ``appkernel.mongo.read`` in the configuration::
+
+      mongo:
+        read:
+          preference: secondaryPreferred
+          max_staleness_seconds: 120
+          concern: majority
+
+A single class policy, a ``'default'`` entry and the configuration only apply to the list, count
+and aggregate reads (:data:`ROUTED_METHODS`); ``find_by_id`` and ``stream_by_query`` keep reading
+from the primary unless they are named explicitly, so that a document is found right after it was
+written. Alternatively reads and writes issued inside :func:`causal_session` share a causally
+consistent session and observe each other's effects on any member.
+"""
+from __future__ import annotations
+
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+from .configuration import config
+
+READ_PREFERENCES = ('primary', 'primaryPreferred', 'secondary', 'secondaryPreferred', 'nearest')
+READ_CONCERNS = ('local', 'available', 'majority', 'linearizable', 'snapshot')
+# the reads a Model wide policy applies to; the others stay on the primary unless named explicitly
+ROUTED_METHODS = frozenset({'find_by_query', 'find', 'count', 'aggregate', 'parallel_stream_by_query'})
+MIN_MAX_STALENESS_SECONDS = 90
+
+_policy_override: ContextVar[ReadPolicy | None] = ContextVar('appkernel_read_policy', default=None)
+_session: ContextVar[Any] = ContextVar('appkernel_session', default=None)
+
+
+@dataclass(frozen=True)
+class ReadPolicy:
+    """Where a read is served from and which read concern it uses.
+
+    Args:
+        preference: One of :data:`READ_PREFERENCES`.
+        max_staleness_seconds: Secondaries lagging more are not selected; ``-1`` for no limit,
+            otherwise at least 90 seconds. Not allowed with ``primary``.
+        tag_sets: Replica set tag sets restricting the eligible members.
+        concern: Read concern level, one of :data:`READ_CONCERNS`; ``None`` keeps the server default.
+    """
+    preference: str = 'primary'
+    max_staleness_seconds: int = -1
+    tag_sets: tuple[dict[str, str], ...] | None = None
+    concern: str | None = None
+
+    def __post_init__(self) -> None:
+        if self.preference not in READ_PREFERENCES:
+            raise ValueError(f"Read preference must be one of {', '.join(READ_PREFERENCES)}, got {self.preference!r}.")
+        if self.concern is not None and self.concern not in READ_CONCERNS:
+            raise ValueError(f"Read concern must be one of {', '.join(READ_CONCERNS)}, got {self.concern!r}.")
+        if self.max_staleness_seconds != -1 and self.max_staleness_seconds < MIN_MAX_STALENESS_SECONDS:
+            raise ValueError(f'max_staleness_seconds must be -1 or at least {MIN_MAX_STALENESS_SECONDS}.')
+        if self.preference == 'primary' and (self.max_staleness_seconds != -1 or self.tag_sets):
+            raise ValueError('The primary read preference takes no max_staleness_seconds or tag_sets.')
+
+    @classmethod
+    def from_config(cls, section: dict[str, Any]) -> ReadPolicy:
+        """Build a policy from a ``preference``/``max_staleness_seconds``/``tag_sets``/``concern`` mapping."""
+        tag_sets = section.get('tag_sets')
+        return cls(preference=section.get('preference', 'primary'),
+                   max_staleness_seconds=int(section.get('max_staleness_seconds', -1)),
+                   tag_sets=tuple(tag_sets) if tag_sets else None, concern=section.get('concern'))
+
+    def read_preference(self) -> Any:
+        return make_read_preference(read_pref_mode_from_name(self.preference),
+                                    list(self.tag_sets) if self.tag_sets else None, self.max_staleness_seconds)
+
+    def read_concern(self) -> ReadConcern | None:
+        return ReadConcern(self.concern) if self.concern else None
+
+    def collection_options(self) -> dict[str, Any]:
+        """Keyword arguments of ``Collection.with_options`` applying this policy."""
+        options: dict[str, Any] = {'read_preference': self.read_preference()}
+        if self.concern:
+            options['read_concern'] = self.read_concern()
+        return options
+
+
+PRIMARY = ReadPolicy()
+
+
+def configured_read_policy() -> ReadPolicy | None:
+    cfg_engine = getattr(config, 'cfg_engine', None)
+    section = cfg_engine.get('appkernel.mongo.read', None) if cfg_engine else None
+    return ReadPolicy.from_config(section) if section else None
+
+
+def resolve_read_policy(model_class: type, method: str) -> ReadPolicy | None:
+    """Return the policy of ``method`` on ``model_class``; ``None`` when the client default applies."""
+    override = _policy_override.get()
+    if override is not None:
+        return override
+    policy = getattr(model_class, 'read_policy', None)
+    if isinstance(policy, dict):
+        if method in policy:
+            return policy[method]
+        policy = policy.get('default')
+    if method not in ROUTED_METHODS:
+        return None
+    return policy if policy is not None else configured_read_policy()
+
+
+@contextmanager
+def reading(policy: ReadPolicy) -> Iterator[ReadPolicy]:
+    """Serve every repository read inside the block according to ``policy``::
+
+        with reading(ReadPolicy('nearest')):
+            users = await User.find_by_query({'active': True})
+    """
+    token = _policy_override.set(policy)
+    try:
+        yield policy
+    finally:
+        _policy_override.reset(token)
+
+
+@asynccontextmanager
+async def causal_session() -> AsyncIterator[Any]:
+    """Run the repository operations inside the block in one causally consistent session::
+
+        async with causal_session():
+            await order.save()
+            order = await Order.find_by_id(order.id)   # sees the save, even on a secondary
+
+    Reads on secondaries should use the ``majority`` read concern to keep the guarantee
+    across elections.
+    """
+    session = await config.mongo_database.client.start_session(causal_consistency=True)
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+        await session.end_session()
+
+
+def current_session() -> Any:
+    """The session opened by the enclosing :func:`causal_session`, if any."""
+    return _session.get()
@@ -0,0 +1,168 @@
+"""Batched population of reference fields.
+
+A field marked with :class:`~appkernel.fields.Ref` stores the id (or a list of ids) of another
+Model's document::
+
+    class FileRef(Model, MongoRepository):
+        owner_id: Annotated[str | None, Ref(User)] = None
+
+    page = await FileRef.find_by_query({'kind': 'image'}, expand='owner')
+    page[0].owner  # -> User
+
+Instead of one ``find_by_id`` per document, :func:`populate` collects the ids of a whole page
+and issues a single ``{'_id': {'$in': [...]}}`` query per referenced collection (the queries of
+different collections run concurrently). Application code may use :func:`find_with_lookup`
+instead, which resolves the references server side with ``$lookup`` in the same round trip.
+Populated Models are attached under :meth:`Ref.attach_as` and are never written back on save.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterable
+from typing import Any
+
+import pymongo
+from bson import ObjectId
+
+from .dsl import SortOrder
+from .fields import Ref, extract_base_type, reference_fields
+from .hydration import hydrate
+from .time_budget import operation_options
+from .util import OBJ_PREFIX
+from .validators import ValidationException
+
+
+def parse_expand(model_class: type, expand: str | Iterable[str] | None) -> list[str]:
+    """Return the reference field names selected by ``expand``.
+
+    Accepts a comma separated string or a list; both the field name (``owner_id``) and the
+    attribute name (``owner``) select a reference.
+    """
+    if not expand:
+        return []
+    names = [name.strip() for name in expand.split(',')] if isinstance(expand, str) else list(expand)
+    references = reference_fields(model_class)
+    by_attribute = {ref.attach_as(field_name): field_name for field_name, ref in references.items()}
+    selected = []
+    for name in filter(None, names):
+        field_name = name if name in references else by_attribute.get(name)
+        if field_name is None:
+            raise ValidationException(f'{name} is not a reference of {model_class.__name__}; '
+                                      f"expandable: {', '.join(sorted(by_attribute)) or 'none'}.")
+        if field_name not in selected:
+            selected.append(field_name)
+    return selected
+
+
+def _storage_id(object_id: Any) -> Any:
+    if isinstance(object_id, str) and object_id.startswith(OBJ_PREFIX):
+        return ObjectId(object_id.split(OBJ_PREFIX)[1])
+    return object_id
+
+
+def _referenced_ids(models: list[Any], field_name: str) -> list[Any]:
+    ids = []
+    for model in models:
+        value = getattr(model, field_name, None)
+        for object_id in value if isinstance(value, list) else [value]:
+            if object_id is not None and object_id not in ids:
+                ids.append(object_id)
+    return ids
+
+
+def _attach(models: list[Any], field_name: str, ref: Ref, found: dict[Any, Any]) -> None:
+    attribute = ref.attach_as(field_name)
+    for model in models:
+        value = getattr(model, field_name, None)
+        if isinstance(value, list):
+            setattr(model, attribute, [found[key] for key in map(_storage_id, value) if key in found])
+        elif value is not None:
+            setattr(model, attribute, found.get(_storage_id(value)))
+
+
+async def _fetch(target: type, ids: list[Any]) -> dict[Any, Any]:
+    cursor = target.read_collection('find').find({'_id': {'$in': [_storage_id(object_id) for object_id in ids]}},
+                                          **operation_options())
+    return {_storage_id(model.id): model for model in await hydrate(target, await cursor.to_list(length=None))}
+
+
+async def populate(models: list[Any], *field_names: str) -> list[Any]:
+    """Attach the documents referenced by ``field_names`` to every Model in ``models``.
+
+    Issues one ``$in`` query per referenced collection, whatever the number of Models; fields
+    referencing the same collection share the query. Missing documents are attached as ``None``
+    (or left out of a list). Without ``field_names`` every reference field is populated.
+    Returns ``models``.
+    """
+    if not models:
+        return models
+    references = reference_fields(models[0].__class__)
+    field_names = field_names or tuple(references)
+    ids_by_target: dict[type, list[Any]] = {}
+    for field_name in field_names:
+        target_ids = ids_by_target.setdefault(references[field_name].target(), [])
+        target_ids.extend(object_id for object_id in _referenced_ids(models, field_name) if object_id not in target_ids)
+    targets = [target for target, ids in ids_by_target.items() if ids]
+    results = await asyncio.gather(*[_fetch(target, ids_by_target[target]) for target in targets])
+    found_by_target = dict(zip(targets, results))
+    for field_name in field_names:
+        ref = references[field_name]
+        _attach(models, field_name, ref, found_by_target.get(ref.target(), {}))
+    return models
+
+
+def lookup_stages(model_class: type, *field_names: str) -> list[dict[str, Any]]:
+    """Return the ``$lookup`` stages resolving ``field_names`` into their attach attributes.
+
+    Scalar references are unwound (keeping documents without a match), list references stay arrays.
+    The stored reference values must have the same type as the referenced ``_id``.
+    """
+    references = reference_fields(model_class)
+    stages: list[dict[str, Any]] = []
+    for field_name in field_names:
+        ref = references[field_name]
+        attribute = ref.attach_as(field_name)
+        stages.append({'$lookup': {'from': ref.target().get_collection().name, 'localField': field_name,
+                                   'foreignField': '_id', 'as': attribute}})
+        if not _is_list_field(model_class, field_name):
+            stages.append({'$unwind': {'path': f'${attribute}', 'preserveNullAndEmptyArrays': True}})
+    return stages
+
+
+def _is_list_field(model_class: type, field_name: str) -> bool:
+    base_type, _ = extract_base_type(model_class.model_fields[field_name].annotation)
+    return base_type is list
+
+
+async def find_with_lookup(
+    model_class: type,
+    query: dict[str, Any],
+    *field_names: str,
+    page: int = 1,
+    page_size: int = 50,
+    sort_by: str | None = None,
+    sort_order: SortOrder = SortOrder.ASC,
+) -> list[Any]:
+    """Fetch one page and resolve ``field_names`` server side with ``$lookup`` (a single round trip).
+
+    Meant for application code only: the query is not checked against the query allowlist.
+    """
+    references = reference_fields(model_class)
+    field_names = field_names or tuple(references)
+    pipeline: list[dict[str, Any]] = [{'$match': query}]
+    if sort_by:
+        pipeline.append({'$sort': {sort_by: pymongo.ASCENDING if sort_order == SortOrder.ASC else pymongo.DESCENDING}})
+    pipeline.extend([{'$skip': (page - 1) * page_size}, {'$limit': page_size}])
+    pipeline.extend(lookup_stages(model_class, *field_names))
+    cursor = model_class.read_collection('aggregate').aggregate(pipeline, **operation_options())
+    documents = await cursor.to_list(length=None)
+    attached = {name: [document.pop(references[name].attach_as(name), None) for document in documents]
+                for name in field_names}
+    models = await hydrate(model_class, documents)
+    for field_name, values in attached.items():
+        ref = references[field_name]
+        referenced = [item for value in values for item in (value if isinstance(value, list) else [value])
+                      if item is not None]
+        found = {_storage_id(item.id): item for item in await hydrate(ref.target(), referenced)}
+        _attach(models, field_name, ref, found)
+    return models
@@ -1,29 +1,45 @@
 from __future__ import annotations
 
+import asyncio
 import inspect
 import operator
 import re
+from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
 from functools import reduce
 from collections.abc import AsyncGenerator
-from typing import Any
+from typing import Any, ClassVar, TYPE_CHECKING
 
 import pymongo
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, WriteConcern
 from pymongo.errors import CollectionInvalid
 
 from appkernel.configuration import config
 from appkernel.util import OBJ_PREFIX
 from .model import Model, AppKernelException
-from .dsl import SortOrder, Expression, CustomProperty, DslBase
+from .validators import ValidationException
+from .time_budget import operation_options
+from .read_routing import ReadPolicy, resolve_read_policy
+from .patch_retry import (
+    FIELD_VERSIONS, UNKNOWN_VERSION, PatchRetryPolicy, overlapping_fields, patched_fields, stamp_expression,
+)
+from .atomic_updates import JsonPatch, compile_json_patch, compile_operator_update, is_operator_update, updated_fields
+from .hydration import decode_raw_in_pool, hydrate, hydrate_in_pool, should_offload
+from .references import find_with_lookup, parse_expand, populate
+from .dsl import OPS, TEXT_SCORE, SortOrder, Expression, CustomProperty, DslBase
 from .fields import (
-    FieldProxy, MongoIndex, MongoTextIndex, MongoUniqueIndex,
+    FieldProxy, MongoCaseInsensitiveIndex, MongoGeoIndex, MongoIndex, MongoTextIndex, MongoUniqueIndex,
     get_field_index,
 )
+from .search import has_text_search, query_collation, text_score_projection
+from .time_series import TimeSeriesOptions
+
+if TYPE_CHECKING:
+    from .pipelines import NamedPipeline
 
 # ---------------------------------------------------------------------------
 # Query validation (find_by_query operator injection defence)
@@ -37,6 +53,9 @@ _ALLOWED_QUERY_OPERATORS: frozenset[str] = frozenset({
     '$regex', '$options',
     '$not', '$and', '$or', '$nor',
     '$all', '$elemMatch', '$size',
+    '$text', '$search', '$language', '$caseSensitive', '$diacriticSensitive',
+    '$near', '$nearSphere', '$geoWithin', '$geoIntersects', '$geometry', '$centerSphere',
+    '$maxDistance', '$minDistance',
     '$mod', '$bitsAllClear', '$bitsAllSet', '$bitsAnyClear', '$bitsAnySet',
 })
 
@@ -47,7 +66,12 @@ _ALWAYS_BLOCKED_QUERY_OPERATORS: frozenset[str] = frozenset({
 })
 
 
-def validate_query(query: dict[str, Any], trusted: bool = False) -> None:
+def validate_query(
+    query: dict[str, Any],
+    trusted: bool = False,
+    cost_policy: QueryCostPolicy | None = None,
+    sort_by: str | None = None,
+) -> None:
     """Validate a find() filter dict before passing it to MongoDB.
 
     Blocks operators that execute server-side code or expose data beyond the
@@ -59,13 +83,21 @@ def validate_query(query: dict[str, Any], trusted: bool = False) -> None:
             blocked operators are rejected. When False (HTTP / untrusted
             callers), only operators in ``_ALLOWED_QUERY_OPERATORS`` are
             permitted.
+        cost_policy: Optional :class:`QueryCostPolicy` applied to untrusted
+            callers. In ``'reject'`` mode a filter or sort that is not covered
+            by a declared index prefix raises :exc:`QueryCostException`.
+        sort_by: The sort field requested together with the filter.
 
     Raises:
         PermissionError: If a forbidden or unrecognised operator is present.
+        QueryCostException: If the cost policy rejects the query.
     """
-    if not query:
-        return
-    _validate_query_node(query, trusted=trusted)
+    if query:
+        _validate_query_node(query, trusted=trusted)
+    if cost_policy is not None and not trusted and cost_policy.mode == 'reject':
+        uncovered = cost_policy.uncovered_fields(query, sort_by)
+        if uncovered:
+            raise QueryCostException(uncovered, cost_policy.indexed_fields)
 
 
 def _validate_query_node(node: Any, trusted: bool) -> None:
@@ -90,6 +122,232 @@ def _validate_query_node(node: Any, trusted: bool) -> None:
         _validate_query_node(value, trusted)
 
 
+# ---------------------------------------------------------------------------
+# Query cost policy (unindexed HTTP query defence)
+# ---------------------------------------------------------------------------
+
+@dataclass
+class QueryCostPolicy:
+    """Limits what untrusted (HTTP) queries may cost on a collection.
+
+    A query is *covered* when at least one of its filter fields is the leading
+    key of a declared index and the sort field (if any) directly follows the
+    equality-matched fields in a declared index prefix. Uncovered queries are
+    either rejected with :exc:`QueryCostException` (HTTP 422) or capped to a
+    small page. ``max_time_ms`` is applied to every untrusted query.
+
+    Declare the policy on the Model::
+
+        class User(Model, MongoRepository):
+            query_cost_policy: ClassVar[QueryCostPolicy] = QueryCostPolicy(
+                indexed_fields=[('name', 'sequence')], max_time_ms=1000)
+
+    Args:
+        indexed_fields: Compound index key tuples whose prefixes may serve
+            queries. Fields carrying ``MongoIndex``/``MongoUniqueIndex``
+            metadata and ``_id`` are added automatically.
+        mode: ``'reject'`` (default) or ``'cap'``.
+        capped_page_size: Page size applied to uncovered queries in ``'cap'`` mode.
+        max_time_ms: Server-side execution limit for untrusted queries;
+            ``None`` disables it.
+    """
+    indexed_fields: list[tuple[str, ...]] = field(default_factory=list)
+    mode: str = 'reject'
+    capped_page_size: int = 20
+    max_time_ms: int | None = 2000
+
+    def __post_init__(self) -> None:
+        if self.mode not in ('reject', 'cap'):
+            raise ValueError(f"QueryCostPolicy.mode must be 'reject' or 'cap', got {self.mode!r}.")
+        self.indexed_fields = [(item,) if isinstance(item, str) else tuple(item) for item in self.indexed_fields]
+
+    def with_model_indexes(self, model_class: type) -> QueryCostPolicy:
+        """Return a copy whose ``indexed_fields`` include the Model's index metadata."""
+        declared = [('_id',)] + list(self.indexed_fields)
+        for field_name, field_info in getattr(model_class, 'model_fields', {}).items():
+            idx = get_field_index(field_info)
+            if idx is not None and not isinstance(idx, MongoTextIndex):
+                declared.append(('_id',) if field_name == 'id' else (field_name,))
+        time_series = getattr(model_class, 'time_series', None)
+        if time_series is not None:
+            declared.extend(time_series.indexed_fields())
+        unique = list(dict.fromkeys(declared))
+        return QueryCostPolicy(indexed_fields=unique, mode=self.mode,
+                               capped_page_size=self.capped_page_size, max_time_ms=self.max_time_ms)
+
+    def uncovered_fields(self, query: dict[str, Any] | None, sort_by: str | None = None) -> list[str]:
+        """Return the filter/sort fields that make the query uncovered (empty when covered)."""
+        uncovered: list[str] = []
+        for branch in _split_or_branches(query or {}):
+            equality, others = _branch_fields(branch)
+            filter_fields = equality | others
+            if filter_fields and not any(keys[0] in filter_fields for keys in self.indexed_fields):
+                uncovered.extend(sorted(filter_fields))
+            if sort_by and not self._sort_covered(equality, sort_by):
+                uncovered.append(sort_by)
+        return list(dict.fromkeys(uncovered))
+
+    def _sort_covered(self, equality: set[str], sort_by: str) -> bool:
+        for keys in self.indexed_fields:
+            position = 0
+            while position < len(keys) and keys[position] in equality:
+                position += 1
+            if position < len(keys) and keys[position] == sort_by:
+                return True
+        return False
+
+
+def _split_or_branches(query: dict[str, Any]) -> list[dict[str, Any]]:
+    """Expand a top-level ``$or`` into the branches MongoDB plans independently."""
+    if not isinstance(query.get('$or'), list):
+        return [query]
+    common = {key: value for key, value in query.items() if key != '$or'}
+    return [{'$and': [common, alternative]} for alternative in query['$or']]
+
+
+def _branch_fields(query: Any) -> tuple[set[str], set[str]]:
+    """Split the field names of an $or-free filter into equality and other predicates."""
+    equality: set[str] = set()
+    others: set[str] = set()
+    if isinstance(query, list):
+        for item in query:
+            eq, ot = _branch_fields(item)
+            equality |= eq
+            others |= ot
+        return equality, others
+    if not isinstance(query, dict):
+        return equality, others
+    for key, value in query.items():
+        if key in ('$and', '$or', '$nor'):
+            eq, ot = _branch_fields(value)
+            # fields inside a nested $or still filter, but never by equality alone
+            equality |= eq if key == '$and' else set()
+            others |= ot if key == '$and' else eq | ot
+        elif key.startswith('$'):
+            continue
+        elif isinstance(value, dict) and value and all(k.startswith('$') for k in value):
+            (equality if set(value) <= {'$eq'} else others).add(key)
+        else:
+            equality.add(key)
+    return equality, others - equality
+
+
+# ---------------------------------------------------------------------------
+# Paginated results
+# ---------------------------------------------------------------------------
+
+_COUNT_MODES: tuple[str, ...] = ('none', 'exact', 'estimated')
+
+
+class ResultPage(list):
+    """A page of query results which also carries the paging coordinates.
+
+    Behaves exactly like a ``list``; ``total`` is ``None`` when counting was skipped.
+    """
+
+    def __init__(self, items: Any = (), total: int | None = None, page: int = 1, page_size: int | None = None):
+        super().__init__(items)
+        self.total = total
+        self.page = page
+        self.page_size = page_size
+
+    @property
+    def page_count(self) -> int | None:
+        if self.total is None or not self.page_size:
+            return None
+        return -(-self.total // self.page_size)
+
+
+def build_page_pipeline(
+    query: dict[str, Any] | None,
+    page: int,
+    page_size: int,
+    sort_by: str | None = None,
+    direction: int = pymongo.ASCENDING,
+    text_score: bool = False,
+) -> list[dict[str, Any]]:
+    """Build the ``$facet`` pipeline returning one page of documents and the total match count.
+
+    The result is a single document ``{'items': [...], 'total': [{'count': n}]}``; ``total`` is an
+    empty list when nothing matches. With ``text_score`` the items of a ``$text`` query carry their
+    relevance and are sorted by it unless ``sort_by`` is given.
+    """
+    items_stages: list[dict[str, Any]] = [{'$addFields': text_score_projection()}] if text_score else []
+    if sort_by:
+        items_stages.append({'$sort': {sort_by: direction}})
+    elif text_score:
+        items_stages.append({'$sort': {TEXT_SCORE: {'$meta': 'textScore'}}})
+    items_stages += [{'$skip': (page - 1) * page_size}, {'$limit': page_size}]
+    return [
+        {'$match': query or {}},
+        {'$facet': {'items': items_stages, 'total': [{'$count': 'count'}]}},
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Partitioned collection scans
+# ---------------------------------------------------------------------------
+
+_SCAN_OVERSAMPLING = 20
+_SCAN_DONE = object()
+
+
+async def compute_scan_boundaries(
+    collection: AsyncIOMotorCollection,
+    query: dict[str, Any] | None,
+    partitions: int,
+    partition_field: str = '_id',
+) -> list[Any]:
+    """Split the documents matching ``query`` into ``partitions`` ranges of ``partition_field``.
+
+    A ``$sample`` of ``partitions`` x 20 documents is sorted and cut at evenly spaced positions,
+    which approximates the chunk boundaries ``splitVector`` would compute without requiring
+    cluster privileges. Returns the sorted inner boundaries, i.e. at most ``partitions - 1``
+    values; an empty list means the scan cannot (or need not) be split.
+    """
+    if partitions < 2:
+        return []
+    pipeline = [
+        {'$match': query or {}},
+        {'$sample': {'size': partitions * _SCAN_OVERSAMPLING}},
+        {'$project': {partition_field: 1}},
+    ]
+    samples = await collection.aggregate(pipeline).to_list(length=None)
+    values = [sample[partition_field] for sample in samples if sample.get(partition_field) is not None]
+    try:
+        values.sort()
+    except TypeError:
+        # mixed BSON types cannot be ordered client side: fall back to a single range
+        return []
+    boundaries: list[Any] = []
+    for index in range(1, partitions):
+        value = values[len(values) * index // partitions] if values else None
+        if value is not None and (not boundaries or value > boundaries[-1]):
+            boundaries.append(value)
+    return boundaries
+
+
+def build_range_filters(boundaries: list[Any], partition_field: str = '_id') -> list[dict[str, Any]]:
+    """Turn sorted boundaries into half open range filters covering the whole key space.
+
+    Only the last range has no upper bound, so documents stored after the boundaries were sampled with a
+    growing key (``ObjectId``, timestamps) fall into the range read last.
+    """
+    if not boundaries:
+        return [{}]
+    lower_bounds = [None] + boundaries
+    upper_bounds = boundaries + [None]
+    filters = []
+    for lower, upper in zip(lower_bounds, upper_bounds):
+        condition = {}
+        if lower is not None:
+            condition['$gte'] = lower
+        if upper is not None:
+            condition['$lt'] = upper
+        filters.append({partition_field: condition})
+    return filters
+
+
 # ---------------------------------------------------------------------------
 # Aggregation pipeline validation
 # ---------------------------------------------------------------------------
@@ -108,6 +366,9 @@ _ALWAYS_BLOCKED_STAGES: frozenset[str] = frozenset({
     '$out', '$merge', '$function', '$accumulator',
 })
 
+# Upper bound of the streamed aggregation results of untrusted (HTTP) callers.
+_HTTP_MAX_RESULTS = 10_000
+
 
 def validate_pipeline(pipe: list[dict[str, Any]], trusted: bool = False) -> None:
     """Validate an aggregation pipeline before sending it to MongoDB.
@@ -139,6 +400,76 @@ def validate_pipeline(pipe: list[dict[str, Any]], trusted: bool = False) -> None
             )
 
 
+def _record_query_shape(collection: AsyncIOMotorCollection, query: dict[str, Any] | None, sort: Any = None) -> None:
+    """Feed the query shape to the index advisor, when one is enabled."""
+    advisor = getattr(config, 'index_advisor', None)
+    if advisor is not None:
+        advisor.record(collection, query, sort)
+
+
+# Per-collection counter of writes issued through this process; cached read results
+# (see appkernel.pipelines) compare it to detect that they became stale.
+_collection_write_versions: dict[str, int] = {}
+
+
+def _record_write(collection: AsyncIOMotorCollection) -> None:
+    """Bump the write counter of the collection."""
+    _collection_write_versions[collection.name] = _collection_write_versions.get(collection.name, 0) + 1
+
+
+def collection_write_version(collection_name: str) -> int:
+    """Return the number of writes this process issued against the collection so far."""
+    return _collection_write_versions.get(collection_name, 0)
+
+
+# Collection handles per Model class, configured with the write concern of the class and kept as long
+# as the database object stays the same; read handles are also keyed by method and kept per read policy.
+_collection_handles: dict[type, tuple[Any, AsyncIOMotorCollection]] = {}
+_read_handles: dict[tuple[type, str], tuple[AsyncIOMotorCollection, ReadPolicy, AsyncIOMotorCollection]] = {}
+
+
+def _acknowledged(result: Any) -> bool:
+    """False for the results of unacknowledged (``w: 0``) writes, which carry no counts."""
+    return getattr(result, 'acknowledged', True)
+
+
+def _acknowledges(collection: Any) -> bool:
+    """False for collections with an unacknowledged (``w: 0``) write concern."""
+    return getattr(getattr(collection, 'write_concern', None), 'acknowledged', True)
+
+
+def _set_fields_expression(document: dict[str, Any]) -> dict[str, Any]:
+    """The ``$mergeObjects`` argument of an update pipeline setting ``document`` like ``$set`` does.
+
+    The values are literals and a dotted key (``{'address.city': 'Bonn'}``) sets the embedded field,
+    merged into the stored sub-document; the field names of an expression may not contain dots.
+
+    Raises:
+        ValidationException: A key is no field path (an array index, a ``$`` name, an empty segment)
+            or a field is set both whole and by one of its embedded fields.
+    """
+    fields: dict[str, Any] = {}
+    for key, value in document.items():
+        segments = key.split('.')
+        if any(not segment or segment.isdigit() or segment.startswith('$') for segment in segments):
+            raise ValidationException(f'{key!r} is not a field path which can be set on a versioned document.')
+        node = fields
+        for segment in segments[:-1]:
+            node = node.setdefault(segment, {})
+            if '$literal' in node:
+                raise ValidationException(f'{key!r} conflicts with the value set for {segment!r}.')
+        if segments[-1] in node:
+            raise ValidationException(f'{key!r} conflicts with the values set for its embedded fields.')
+        node[segments[-1]] = {'$literal': value}
+    return _merge_embedded(fields, '')
+
+
+def _merge_embedded(fields: dict[str, Any], path: str) -> dict[str, Any]:
+    return {name: node if '$literal' in node else
+            {'$mergeObjects': [{'$ifNull': [f'${path}{name}', {}]}, _merge_embedded(node, f'{path}{name}.')]}
+            for name, node in fields.items()}
+
+
 def xtract(clazz_or_instance: Any) -> str:
     """
     Extract class name from class, removing the Service/Controller/Resource ending and adding a plural -s or -ies.
@@ -173,8 +504,7 @@ class Query:
                     self.filter_expr[str(where.lhs.backreference.array_parameter_name)] = where.ops.lmbda(
                         (where.lhs.backreference.parameter_name, Query.__extract_rhs(where.rhs)))
                 else:
-                    self.filter_expr[str(where.lhs.backreference.parameter_name)] = where.ops.lmbda(
-                        Query.__extract_rhs(where.rhs))
+                    self.filter_expr[Query.__filter_key(where)] = where.ops.lmbda(Query.__extract_rhs(where.rhs))
             elif isinstance(where.lhs, Expression) and isinstance(where.rhs, Expression):
                 exprs: list[Any] = []
                 exprs.extend(self.__xtract_expression(where))
@@ -188,14 +518,18 @@ class Query:
             ret_val.extend(self.__xtract_expression(expression.rhs))
         if isinstance(expression.lhs, (FieldProxy, CustomProperty, DslBase)) and not isinstance(expression.lhs, Expression):
             ret_val.append({
-                expression.lhs.backreference.parameter_name:
-                    expression.ops.lmbda(Query.__extract_rhs(expression.rhs))
+                Query.__filter_key(expression): expression.ops.lmbda(Query.__extract_rhs(expression.rhs))
             })
         if isinstance(expression.rhs, (FieldProxy, CustomProperty, DslBase)) and not isinstance(expression.rhs, Expression):
             ret_val.append({expression.lhs.backreference.parameter_name:
                                 expression.ops.lmbda(Query.__extract_rhs(expression.rhs))})
         return ret_val
 
+    @staticmethod
+    def __filter_key(expression: Expression) -> str:
+        # a $text search is not bound to the field it was built from but to the collection's text index
+        return '$text' if expression.ops is OPS.TEXT else str(expression.lhs.backreference.parameter_name)
+
     @staticmethod
     def __extract_rhs(right_hand_side: Any) -> Any:
         if hasattr(right_hand_side, 'backreference') and not isinstance(right_hand_side, Expression):
@@ -241,30 +575,46 @@ class MongoQuery(Query):
         super().__init__(*expressions)
         self.connection: AsyncIOMotorCollection = connection_object
         self.user_class = user_class
+        self.collation = query_collation(user_class, self.filter_expr)
+        self.text_search = has_text_search(self.filter_expr)
+
+    def __options(self, **options: Any) -> dict[str, Any]:
+        if self.collation:
+            options.update(collation=self.collation)
+        return {**options, **operation_options()}
 
     async def find(self, page: int = 0, page_size: int = 100) -> list[Model]:
-        if self.sorting_expr:
-            cursor = self.connection.find(self.filter_expr).sort(self.sorting_expr).skip(page * page_size).limit(page_size)
+        _record_query_shape(self.connection, self.filter_expr, self.sorting_expr)
+        if self.text_search:
+            cursor = self.connection.find(self.filter_expr, **self.__options(projection=text_score_projection()))
+            cursor = cursor.sort(self.sorting_expr or [(TEXT_SCORE, {'$meta': 'textScore'})])
         else:
-            cursor = self.connection.find(self.filter_expr).skip(page * page_size).limit(page_size)
+            cursor = self.connection.find(self.filter_expr, **self.__options())
+            if self.sorting_expr:
+                cursor = cursor.sort(self.sorting_expr)
+        cursor = cursor.skip(page * page_size).limit(page_size)
         docs = await cursor.to_list(length=page_size if page_size > 0 else 100)
-        return [Model.from_dict(item, self.user_class, convert_ids=True,
-                                converter_func=mongo_type_converter_from_dict) for item in docs]
+        return await hydrate(self.user_class, docs)
 
     async def get(self, page: int = 0, page_size: int = 100) -> list[Model]:
         return await self.find(page=page, page_size=page_size)
 
     async def find_one(self) -> Model | None:
-        hit = await self.connection.find_one(self.filter_expr)
+        _record_query_shape(self.connection, self.filter_expr)
+        hit = await self.connection.find_one(self.filter_expr, **self.__options())
         return Model.from_dict(hit, self.user_class, convert_ids=True,
                                converter_func=mongo_type_converter_from_dict) if hit else None
 
     async def delete(self) -> int:
-        result = await self.connection.delete_many(self.filter_expr)
-        return result.deleted_count
+        # MongoDB rejects a collation on an unacknowledged write: such deletes match case-sensitively
+        collation = {'collation': self.collation} if self.collation and _acknowledges(self.connection) else {}
+        result = await self.connection.delete_many(self.filter_expr, **collation)
+        _record_write(self.connection)
+        return result.deleted_count if _acknowledged(result) else 0
 
     async def count(self) -> int:
-        return await self.connection.count_documents(self.filter_expr)
+        _record_query_shape(self.connection, self.filter_expr)
+        return await self.connection.count_documents(self.filter_expr, **self.__options())
 
     def __get_update_expression(self, **update_expression: Any) -> dict[str, Any]:
         update_dict: dict[str, Any] = dict()
@@ -278,18 +628,21 @@ class MongoQuery(Query):
     async def find_one_and_update(self, **update_expression: Any) -> Model | None:
         upd = self.__get_update_expression(**update_expression)
         hit = await self.connection.find_one_and_update(self.filter_expr, upd, return_document=ReturnDocument.AFTER)
+        _record_write(self.connection)
         return Model.from_dict(hit, self.user_class, convert_ids=True,
                                converter_func=mongo_type_converter_from_dict) if hit else None
 
     async def update_one(self, **update_expression: Any) -> int:
         upd = self.__get_update_expression(**update_expression)
         update_result = await self.connection.update_one(self.filter_expr, upd, upsert=False)
-        return update_result.modified_count
+        _record_write(self.connection)
+        return update_result.modified_count if _acknowledged(update_result) else 0
 
     async def update_many(self, **update_expression: Any) -> int:
         upd = self.__get_update_expression(**update_expression)
         update_result = await self.connection.update_many(self.filter_expr, upd, upsert=False)
-        return update_result.modified_count
+        _record_write(self.connection)
+        return update_result.modified_count if _acknowledged(update_result) else 0
 
 
 class RepositoryException(AppKernelException):
@@ -297,6 +650,24 @@ class RepositoryException(AppKernelException):
         super().__init__(message)
 
 
+class QueryCostException(RepositoryException):
+    """Raised when a :class:`QueryCostPolicy` rejects an untrusted query whose
+    filter or sort is not backed by an index.
+
+    HTTP callers receive 422 Unprocessable Entity with the list of indexed fields.
+    """
+    status_code: int = 422
+
+    def __init__(self, uncovered_fields: list[str], indexed_fields: list[tuple[str, ...]]) -> None:
+        self.uncovered_fields = uncovered_fields
+        self.indexed_fields = indexed_fields
+        described = ', '.join('+'.join(keys) for keys in indexed_fields)
+        super().__init__(
+            f"Query on [{', '.join(uncovered_fields)}] is not supported by an index. "
+            f"Filter or sort on one of the indexed fields: {described}."
+        )
+
+
 class VersionConflictError(RepositoryException):
     """Raised when an update is rejected because another writer already modified
     the document since it was last loaded (optimistic locking violation).
@@ -313,14 +684,25 @@ class VersionConflictError(RepositoryException):
         )
 
 
+class PatchTestFailedError(VersionConflictError):
+    """Raised when a ``test`` operation of a JSON Patch, or the target of a ``replace`` or ``remove``,
+    does not match the stored document. HTTP callers receive 409 Conflict, as required by RFC 6902.
+    """
+
+    def __init__(self, document_id: Any) -> None:
+        RepositoryException.__init__(
+            self, f"The JSON patch of document '{document_id}' does not apply to its current state."
+        )
+
+
 class Repository:
 
     @classmethod
-    async def find_by_id(cls, object_id: str) -> Model | None:
+    async def find_by_id(cls, object_id: str, expand: str | None = None) -> Model | None:
         raise NotImplementedError('abstract method')
 
     @classmethod
-    async def delete_by_id(cls, object_id: str) -> int:
+    async def delete_by_id(cls, object_id: str) -> int | None:
         raise NotImplementedError('abstract method')
 
     @classmethod
@@ -360,6 +742,8 @@ class Repository:
         sort_by: str | None = None,
         sort_order: SortOrder = SortOrder.ASC,
         trusted: bool = False,
+        count_mode: str = 'none',
+        expand: str | None = None,
         **kwargs: Any,
     ) -> list[Model]:
         raise NotImplementedError('abstract method')
@@ -369,7 +753,9 @@ class Repository:
         raise NotImplementedError('abstract method')
 
     @classmethod
-    async def stream_by_query(cls, query: dict[str, Any], batch_size: int = 500) -> AsyncGenerator[Model, None]:
+    async def stream_by_query(
+        cls, query: dict[str, Any], batch_size: int = 500, sort_by: str | None = None
+    ) -> AsyncGenerator[Model, None]:
         raise NotImplementedError('abstract method')
         yield  # marks this as an async generator so the signature is correct
 
@@ -397,18 +783,31 @@ class Repository:
 
 
 class MongoRepository(Repository):
+    query_cost_policy: ClassVar[QueryCostPolicy | None] = None
+    read_policy: ClassVar[ReadPolicy | dict[str, ReadPolicy] | None] = None
+    # e.g. WriteConcern(w=1, j=False) for telemetry, WriteConcern(w=0) for fire-and-forget appends
+    write_concern: ClassVar[WriteConcern | None] = None
+    patch_retry: ClassVar[PatchRetryPolicy | None] = None
+    named_pipelines: ClassVar[dict[str, NamedPipeline]] = {}
+    time_series: ClassVar[TimeSeriesOptions | None] = None
 
     @classmethod
     async def init_indexes(cls) -> None:
+        if cls.time_series is not None:
+            await cls.create_collection()
         if issubclass(cls, Model) and hasattr(cls, 'model_fields'):
             index_factories = {
                 MongoTextIndex: MongoRepository.create_text_index,
+                MongoGeoIndex: MongoRepository.create_geo_index,
                 MongoUniqueIndex: MongoRepository.create_unique_index,
                 MongoIndex: MongoRepository.create_index,
             }
             for field_name, field_info in cls.model_fields.items():
                 idx = get_field_index(field_info)
-                if idx:
+                if isinstance(idx, MongoCaseInsensitiveIndex):
+                    await MongoRepository.create_index(cls.get_collection(), field_name, idx.sort_order,
+                                                       collation=idx.collation)
+                elif idx:
                     # Match most specific type first
                     fct = MongoRepository.not_supported
                     for idx_type, factory in index_factories.items():
@@ -427,12 +826,40 @@ class MongoRepository(Repository):
                 f"This feature requires a min version of: {'.'.join(str(v) for v in required_version_tuple)}")
 
     @classmethod
-    async def add_schema_validation(cls, validation_action: str = 'warn') -> None:
-        await MongoRepository.version_check(tuple([3, 6, 0]))
+    async def create_collection(cls) -> None:
+        """Create the collection of the Model, as a time-series collection if it declares ``time_series``.
+
+        An existing time-series collection gets the current ``expire_after_seconds``.
+
+        Raises:
+            RepositoryException: The Model declares ``time_series`` but its collection exists as an
+                ordinary collection, which cannot be converted in place.
+        """
+        database = cls.get_collection().database
+        options = cls.time_series.collection_options() if cls.time_series is not None else {}
         try:
-            await config.mongo_database.create_collection(xtract(cls))
+            await database.create_collection(xtract(cls), **options)
         except CollectionInvalid:
-            pass
+            if cls.time_series is None:
+                return
+            if not await database.list_collection_names(filter={'name': xtract(cls), 'type': 'timeseries'}):
+                raise RepositoryException(f'The collection {xtract(cls)} exists and is not a time-series collection; '
+                                          'copy its documents into a new time-series collection.')
+            if cls.time_series.expire_after_seconds is not None:
+                await database.command('collMod', xtract(cls),
+                                       expireAfterSeconds=cls.time_series.expire_after_seconds)
+
+    @classmethod
+    async def add_schema_validation(cls, validation_action: str = 'warn') -> None:
+        """Create the collection and validate its documents against the JSON schema of the Model.
+
+        Time-series collections take no validator: for a Model declaring ``time_series`` the
+        collection is only created.
+        """
+        await MongoRepository.version_check(tuple([3, 6, 0]))
+        await cls.create_collection()
+        if cls.time_series is not None:
+            return
         await config.mongo_database.command(
             'collMod', xtract(cls),
             validator={'$jsonSchema': cls.get_json_schema(mongo_compatibility=True)},
@@ -446,6 +873,7 @@ class MongoRepository(Repository):
         field_name: str,
         sort_order: SortOrder,
         unique: bool = False,
+        collation: dict[str, Any] | None = None,
     ) -> None:
         existing = await collection.index_information()
         if field_name not in existing:
@@ -453,14 +881,19 @@ class MongoRepository(Repository):
                 direction = pymongo.ASCENDING if sort_order == SortOrder.ASC else pymongo.DESCENDING
             else:
                 direction = sort_order
+            options = {'collation': collation} if collation else {}
             await collection.create_index(
                 [(field_name, direction)],
-                unique=unique, name=f'{field_name}_idx')
+                unique=unique, name=f'{field_name}_idx', **options)
 
     @staticmethod
     async def create_text_index(collection: AsyncIOMotorCollection, field_name: str, *args: Any) -> None:
         await MongoRepository.create_index(collection, field_name, pymongo.TEXT)
 
+    @staticmethod
+    async def create_geo_index(collection: AsyncIOMotorCollection, field_name: str, *args: Any) -> None:
+        await MongoRepository.create_index(collection, field_name, pymongo.GEOSPHERE)
+
     @staticmethod
     async def create_unique_index(collection: AsyncIOMotorCollection, field_name: str, sort_order: SortOrder) -> None:
         await MongoRepository.create_index(collection, field_name, sort_order, unique=True)
@@ -471,25 +904,60 @@ class MongoRepository(Repository):
 
     @classmethod
     def get_collection(cls) -> AsyncIOMotorCollection:
+        """Return the collection of the Model, configured with its ``write_concern``.
+
+        The handle is built once per class and reused until the database changes.
+        """
         db = config.mongo_database
-        if db is not None:
-            return db.get_collection(xtract(cls))
-        else:
+        if db is None:
             raise AppKernelException('The database engine is not set')
+        cached = _collection_handles.get(cls)
+        if cached is not None and cached[0] is db:
+            return cached[1]
+        collection = db.get_collection(xtract(cls))
+        write_concern = getattr(cls, 'write_concern', None)
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=write_concern)
+        _collection_handles[cls] = (db, collection)
+        return collection
 
     @classmethod
-    async def find_by_id(cls, object_id: str) -> Model | None:
+    def read_collection(cls, method: str) -> AsyncIOMotorCollection:
+        """Return the collection with the read preference and read concern of ``method`` applied.
+
+        See :mod:`appkernel.read_routing`; without a policy this is :meth:`get_collection` itself.
+        """
+        policy = resolve_read_policy(cls, method)
+        collection = cls.get_collection()
+        if policy is None:
+            return collection
+        cached = _read_handles.get((cls, method))
+        if cached is not None and cached[0] is collection and cached[1] == policy:
+            return cached[2]
+        handle = collection.with_options(**policy.collection_options())
+        _read_handles[(cls, method)] = (collection, policy, handle)
+        return handle
+
+    @classmethod
+    async def find_by_id(cls, object_id: str, expand: str | None = None) -> Model | None:
         assert object_id, 'the id of the lookup object must be provided'
+        expanded = parse_expand(cls, expand)
         if isinstance(object_id, str) and object_id.startswith(OBJ_PREFIX):
             object_id = ObjectId(object_id.split(OBJ_PREFIX)[1])
-        document_dict = await cls.get_collection().find_one({'_id': object_id})
-        return Model.from_dict(document_dict, cls, convert_ids=True,
-                               converter_func=mongo_type_converter_from_dict) if document_dict else None
+        document_dict = await cls.read_collection('find_by_id').find_one({'_id': object_id}, **operation_options())
+        if not document_dict:
+            return None
+        model = Model.from_dict(document_dict, cls, convert_ids=True, converter_func=mongo_type_converter_from_dict)
+        if expanded:
+            await populate([model], *expanded)
+        return model
 
     @classmethod
-    async def delete_by_id(cls, object_id: str) -> int:
-        result = await cls.get_collection().delete_one({'_id': object_id})
-        return result.deleted_count
+    async def delete_by_id(cls, object_id: str) -> int | None:
+        """Return the number of deleted documents; ``None`` for an unacknowledged write, whose outcome is unknown."""
+        result = await cls.get_collection().delete_one({'_id': object_id}, **operation_options())
+        _record_write(cls.get_collection())
+        return result.deleted_count if _acknowledged(result) else None
 
     @staticmethod
     def prepare_document(
@@ -509,7 +977,101 @@ class MongoRepository(Repository):
 
     @classmethod
     async def patch_object(cls, document: dict[str, Any] | Model, object_id: str | None = None) -> Any:
-        return await cls._save_or_update_dict(document, object_id=object_id, insert_if_none_found=False)
+        """Set the fields of ``document`` on the stored document; ``None`` if there is none.
+
+        A ``version`` in the document is checked by optimistic locking. With a ``patch_retry``
+        policy a conflict is retried on the server when the patched fields were not written since
+        that version (see :mod:`appkernel.patch_retry`). An update operator document is applied
+        with :meth:`update_fields` and a :class:`JsonPatch` with :meth:`apply_json_patch`; both
+        return the updated Model.
+        """
+        if isinstance(document, JsonPatch):
+            return await cls.apply_json_patch(object_id, document)
+        if is_operator_update(document):
+            return await cls.update_fields(object_id, document)
+        policy = cls.patch_retry
+        _, document_id, document = MongoRepository.prepare_document(document, object_id)
+        base_version = document.get('version')
+        if policy is None or base_version is None:
+            return await cls._save_or_update_dict(document, object_id=document_id, insert_if_none_found=False,
+                                                  partial=True)
+        fields = patched_fields(document)
+        retry = 0
+        while True:
+            try:
+                db_id = await cls._save_or_update_dict(dict(document), object_id=document_id,
+                                                       insert_if_none_found=False, partial=True)
+                if retry:
+                    policy.metrics.resolved += 1
+                return db_id
+            except VersionConflictError:
+                policy.metrics.conflicts += 1
+                if retry >= policy.max_retries:
+                    policy.metrics.exhausted += 1
+                    raise
+                await asyncio.sleep(policy.backoff_seconds(retry))
+                current = await cls.get_collection().find_one(
+                    {'_id': document_id}, {'version': True, FIELD_VERSIONS: True}, **operation_options())
+                if current is None:
+                    return None
+                if overlapping_fields(current.get(FIELD_VERSIONS), fields, base_version):
+                    policy.metrics.overlapping += 1
+                    raise
+                document['version'] = current.get('version')
+                retry += 1
+                policy.metrics.retries += 1
+
+    @classmethod
+    async def update_fields(cls, object_id: Any, update: dict[str, Any]) -> Model | None:
+        """Apply an update operator document (``$set``, ``$inc``, ...) atomically in one round trip.
+
+        The update is validated against the fields of the Model (see :mod:`appkernel.atomic_updates`)
+        and increments ``version``; no version is checked, the operators apply to the current values.
+
+        Returns:
+            The updated Model, or ``None`` if there is no document with this id.
+
+        Raises:
+            ValidationException: The update is not allowed on this Model.
+        """
+        update = compile_operator_update(cls, update, converter_func=mongo_type_converter_to_dict)
+        return await cls._apply_update(object_id, {}, update)
+
+    @classmethod
+    async def apply_json_patch(cls, object_id: Any, operations: list[dict[str, Any]]) -> Model | None:
+        """Apply a JSON Patch (RFC 6902) atomically in one round trip.
+
+        The operations are compiled to targeted update operators, and ``test`` operations (including
+        one of ``/version``) to conditions of the filter (see :mod:`appkernel.atomic_updates`).
+
+        Returns:
+            The updated Model, or ``None`` if there is no document with this id.
+
+        Raises:
+            ValidationException: The patch is malformed or not allowed on this Model.
+            PatchTestFailedError: A test or the target of a replace or remove did not match.
+        """
+        conditions, update = compile_json_patch(cls, operations, converter_func=mongo_type_converter_to_dict)
+        return await cls._apply_update(object_id, conditions, update)
+
+    @classmethod
+    async def _apply_update(cls, object_id: Any, conditions: dict[str, Any],
+                            update: dict[str, dict[str, Any]]) -> Model | None:
+        update.setdefault('$inc', {})['version'] = 1
+        if cls.patch_retry is not None:
+            update.setdefault('$set', {}).update(
+                {f'{FIELD_VERSIONS}.{name}': UNKNOWN_VERSION for name in updated_fields(update) - {'version'}})
+        if isinstance(object_id, str) and object_id.startswith(OBJ_PREFIX):
+            object_id = ObjectId(object_id.split(OBJ_PREFIX)[1])
+        collection = cls.get_collection()
+        hit = await collection.find_one_and_update(
+            {'_id': object_id, **conditions}, update, return_document=ReturnDocument.AFTER, **operation_options())
+        _record_write(collection)
+        if hit is None:
+            if conditions and await collection.find_one({'_id': object_id}, {'_id': True}, **operation_options()):
+                raise PatchTestFailedError(object_id)
+            return None
+        return Model.from_dict(hit, cls, convert_ids=True, converter_func=mongo_type_converter_from_dict)
 
     @classmethod
     async def _save_or_update_dict(
@@ -517,50 +1079,110 @@ class MongoRepository(Repository):
         document: dict[str, Any] | Model,
         object_id: str | None = None,
         insert_if_none_found: bool = True,
+        partial: bool = False,
     ) -> Any:
-        """Persist a document, tracking version and enforcing optimistic locking.
+        """Persist a document and return its id, or ``None`` when there was nothing to update.
+
+        See :meth:`_write_document` for the version handling.
+        """
+        db_id, _ = await cls._write_document(document, object_id, insert_if_none_found, partial)
+        return db_id
+
+    @classmethod
+    async def _write_document(
+        cls,
+        document: dict[str, Any] | Model,
+        object_id: str | None = None,
+        insert_if_none_found: bool = True,
+        partial: bool = False,
+    ) -> tuple[Any, int | None]:
+        """Persist a document in a single round trip, enforcing optimistic locking.
+
+        Returns the id of the stored (or upserted) document and its new version; ``(None, None)``
+        when an update found no document, and ``version=None`` for unacknowledged writes.
 
         On insert (no id): stores the document with ``version=1``.
 
-        On update: removes ``version`` from the ``$set`` payload and increments
-        it atomically with ``$inc``. When the document carries a known version
-        (loaded from the database), the filter includes ``version == current``
-        so a concurrent writer that already incremented the version causes
-        ``matched_count == 0``, which raises :exc:`VersionConflictError` (HTTP 409).
+        On update without a known version (e.g. a model constructed in memory) the document is
+        matched by ``_id`` only and ``version`` is incremented with ``$inc``; the new version is
+        read back with the projection of the same ``find_one_and_update``.
 
-        When no version is present on the document (e.g. the model was constructed
-        in-memory without loading from the database), the update falls back to
-        ``_id``-only matching — safe for first-time saves.
+        On update with a known version (loaded from the database) a pipeline update sets the fields
+        of the document, like ``$set`` (a dotted key sets an embedded field), only if its stored
+        version is still the one the caller holds, and returns the version found before the update
+        (MongoDB 4.2+). A different version means a concurrent
+        writer got there first and raises :exc:`VersionConflictError` (HTTP 409); no document
+        at all means it was deleted, which returns ``(None, None)``.
+
+        Models with a ``patch_retry`` policy also stamp the new version into ``_field_versions``,
+        for the whole document or, for a ``partial`` write (a patch), for the written fields.
+
+        Models with ``time_series`` options are append-only: a save inserts the document as it
+        is, without a version (see :mod:`appkernel.time_series`); a document which already has
+        an id raises :exc:`RepositoryException`.
         """
         has_id, document_id, document = MongoRepository.prepare_document(document, object_id)
-        if has_id:
-            current_version = document.pop('version', None)
-            update_expr = {'$set': document, '$inc': {'version': 1}}
-            if current_version is not None:
-                update_result = await cls.get_collection().update_one(
-                    {'_id': document_id, 'version': current_version},
-                    update_expr, upsert=False)
-                if update_result.matched_count == 0:
-                    existing = await cls.get_collection().find_one({'_id': document_id}, {'_id': 1})
-                    if existing:
-                        raise VersionConflictError(document_id)
-                db_id = document_id if update_result.matched_count > 0 else None
-            else:
-                update_result = await cls.get_collection().update_one(
-                    {'_id': document_id}, update_expr, upsert=insert_if_none_found)
-                db_id = update_result.upserted_id or (document_id if update_result.matched_count > 0 else None)
-        else:
+        collection = cls.get_collection()
+        if cls.time_series is not None and insert_if_none_found and not partial:
+            if has_id:
+                raise RepositoryException(f'{cls.__name__} is an append-only time series: {document_id!r} is '
+                                          f'already stored or carries a generated id.')
+            insert_result = await collection.insert_one(document, **operation_options())
+            _record_write(collection)
+            return insert_result.inserted_id, None
+        acknowledged = _acknowledges(collection)
+        stamped = cls.patch_retry is not None
+        if not has_id:
             document['version'] = 1
-            insert_result = await cls.get_collection().insert_one(document)
-            db_id = insert_result.inserted_id
-        return db_id
+            if stamped:
+                document[FIELD_VERSIONS] = stamp_expression(1)
+            insert_result = await collection.insert_one(document, **operation_options())
+            _record_write(collection)
+            return insert_result.inserted_id, 1 if _acknowledged(insert_result) else None
+        current_version = document.pop('version', None)
+        fields = patched_fields(document) if partial else None
+        if current_version is None:
+            update: Any = {'$set': document, '$inc': {'version': 1}}
+            if stamped:
+                # the new version is only known on the server: an update pipeline computes and stamps it
+                next_version = {'$add': [{'$ifNull': ['$version', 0]}, 1]}
+                update = [{'$replaceWith': {'$mergeObjects': [
+                    '$$ROOT', _set_fields_expression(document),
+                    {'version': next_version, FIELD_VERSIONS: stamp_expression(next_version, fields)}]}}]
+            stored = await collection.find_one_and_update(
+                {'_id': document_id}, update, projection={'version': True},
+                upsert=insert_if_none_found, return_document=ReturnDocument.AFTER, **operation_options())
+            _record_write(collection)
+            if not acknowledged:
+                return document_id, None
+            return (document_id, stored.get('version')) if stored else (None, None)
+        new_version = current_version + 1
+        new_fields: dict[str, Any] = {'version': new_version}
+        if stamped:
+            new_fields[FIELD_VERSIONS] = stamp_expression(new_version, fields)
+        replacement = {'$mergeObjects': ['$$ROOT', _set_fields_expression(document), new_fields]}
+        stored = await collection.find_one_and_update(
+            {'_id': document_id},
+            [{'$replaceWith': {'$cond': [{'$eq': ['$version', current_version]}, replacement, '$$ROOT']}}],
+            projection={'version': True}, return_document=ReturnDocument.BEFORE, **operation_options())
+        _record_write(collection)
+        if not acknowledged:
+            return document_id, None
+        if stored is None:
+            return None, None
+        if stored.get('version') != current_version:
+            raise VersionConflictError(document_id)
+        return document_id, new_version
 
     @classmethod
     async def save_object(cls, model: Model, object_id: str | None = None, insert_if_none_found: bool = True) -> Any:
         assert model, 'the object must be handed over as a parameter'
         assert isinstance(model, Model), 'the object should be a Model'
         document = Model.to_dict(model, convert_id=True, converter_func=mongo_type_converter_to_dict)
-        model.id = await cls._save_or_update_dict(document=document, object_id=object_id)
+        model.id, version = await cls._write_document(document, object_id=object_id,
+                                                      insert_if_none_found=insert_if_none_found)
+        if version is not None:
+            model.version = version
         return model.id
 
     @classmethod
@@ -568,27 +1190,66 @@ class MongoRepository(Repository):
         assert model, 'the document must be provided before replacing'
         document = Model.to_dict(model, convert_id=True, converter_func=mongo_type_converter_to_dict)
         has_id, document_id, document = MongoRepository.prepare_document(document, None)
-        update_result = await cls.get_collection().replace_one({'_id': document_id}, document, upsert=False)
+        update_result = await cls.get_collection().replace_one({'_id': document_id}, document, upsert=False,
+                                                               **operation_options())
+        _record_write(cls.get_collection())
+        if not _acknowledged(update_result):
+            return document_id
         return (update_result.upserted_id or document_id) if update_result.matched_count > 0 else None
 
     @classmethod
     async def bulk_insert(cls, list_of_model_instances: list[Model]) -> list[Any]:
-        result = await cls.get_collection().insert_many(
-            [Model.to_dict(model, convert_id=True, converter_func=mongo_type_converter_to_dict)
-             for model in list_of_model_instances])
-        return result.inserted_ids
+        """Insert the Models in one batch and return their ids, in the order of the Models.
+
+        Time-series measurements are grouped by ``meta_field`` and inserted unordered.
+        """
+        documents = [Model.to_dict(model, convert_id=True, converter_func=mongo_type_converter_to_dict)
+                     for model in list_of_model_instances]
+        if cls.time_series is None:
+            result = await cls.get_collection().insert_many(documents, **operation_options())
+            _record_write(cls.get_collection())
+            return result.inserted_ids
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+        await cls.get_collection().insert_many(cls.time_series.bucket_order(documents), ordered=False,
+                                               **operation_options())
+        _record_write(cls.get_collection())
+        return [document['_id'] for document in documents]
 
     @classmethod
     async def find(cls, *expressions: Expression) -> list[Model]:
-        return await MongoQuery(cls.get_collection(), cls, *expressions).find()
+        return await MongoQuery(cls.read_collection('find'), cls, *expressions).find()
 
     @classmethod
     async def find_one(cls, *expressions: Expression) -> Model | None:
-        return await MongoQuery(cls.get_collection(), cls, *expressions).find_one()
+        return await MongoQuery(cls.read_collection('find'), cls, *expressions).find_one()
 
     @classmethod
     def where(cls, *expressions: Expression) -> MongoQuery:
-        return MongoQuery(cls.get_collection(), cls, *expressions)
+        return MongoQuery(cls.read_collection('find'), cls, *expressions)
+
+    @classmethod
+    async def find_time_range(
+        cls,
+        start: Any = None,
+        end: Any = None,
+        meta: Any = None,
+        page: int = 1,
+        page_size: int = 50,
+        sort_order: SortOrder = SortOrder.ASC,
+    ) -> ResultPage:
+        """Return one page of the measurements taken in ``[start, end)``, sorted by time.
+
+        ``meta`` restricts the page to one source (a value of the ``meta_field``); an open
+        ``start`` or ``end`` leaves that side of the range unbounded.
+
+        Raises:
+            RepositoryException: The Model declares no ``time_series``.
+        """
+        if cls.time_series is None:
+            raise RepositoryException(f'{cls.__name__} declares no time_series options.')
+        return await cls.find_by_query(cls.time_series.range_filter(start, end, meta), page=page, page_size=page_size,
+                                       sort_by=cls.time_series.time_field, sort_order=sort_order, trusted=True)
 
     @classmethod
     async def find_by_query(
@@ -599,55 +1260,211 @@ class MongoRepository(Repository):
         sort_by: str | None = None,
         sort_order: SortOrder = SortOrder.ASC,
         trusted: bool = False,
+        count_mode: str = 'none',
+        expand: str | None = None,
         **kwargs: Any,
+    ) -> ResultPage:
+        """Return one page of matching documents.
+
+        ``count_mode`` controls whether the total number of matches is reported on the returned
+        :class:`ResultPage`: ``'none'`` skips counting, ``'exact'`` fetches the page and the count in a
+        single ``$facet`` aggregation, ``'estimated'`` uses the collection metadata count for unfiltered
+        queries (and falls back to ``'exact'`` otherwise). ``expand`` names the :class:`~appkernel.fields.Ref`
+        fields to populate (comma separated), with one extra query per referenced collection. Queries on a
+        :class:`~appkernel.fields.MongoCaseInsensitiveIndex` field run with the collation of its index and
+        ``$text`` results are sorted by relevance unless ``sort_by`` is given (see :mod:`appkernel.search`).
+        """
+        if count_mode not in _COUNT_MODES:
+            raise ValidationException(f"count_mode must be one of {', '.join(_COUNT_MODES)}, got {count_mode!r}.")
+        expanded = parse_expand(cls, expand)
+        cost_policy = cls.query_cost_policy.with_model_indexes(cls) if cls.query_cost_policy and not trusted else None
+        validate_query(query, trusted=trusted, cost_policy=cost_policy, sort_by=sort_by)
+        if cost_policy and cost_policy.mode == 'cap' and cost_policy.uncovered_fields(query, sort_by):
+            page_size = min(page_size, cost_policy.capped_page_size)
+        max_time_ms = cost_policy.max_time_ms if cost_policy else None
+        collection = cls.read_collection('find_by_query')
+        py_direction = pymongo.ASCENDING if sort_order == SortOrder.ASC else pymongo.DESCENDING
+        _record_query_shape(collection, query, [(sort_by, py_direction)] if sort_by else None)
+        collation = query_collation(cls, query)
+        text_score = has_text_search(query)
+        search_options: dict[str, Any] = {'collation': collation} if collation else {}
+        total = None
+        if count_mode == 'estimated' and not query:
+            total = await collection.estimated_document_count()
+            count_mode = 'none'
+        if count_mode == 'none':
+            # large pages are fetched as raw BSON and decoded by the decoder pool, off the event loop
+            raw = should_offload(page_size)
+            find = collection.find_raw_batches if raw else collection.find
+            if text_score:
+                search_options.update(projection=text_score_projection())
+            cursor = find(query, **search_options, **operation_options()).skip((page - 1) * page_size).limit(page_size)
+            if sort_by:
+                cursor = cursor.sort(sort_by, direction=py_direction)
+            elif text_score:
+                cursor = cursor.sort([(TEXT_SCORE, {'$meta': 'textScore'})])
+            if max_time_ms:
+                cursor = cursor.max_time_ms(max_time_ms)
+            if raw:
+                items = await decode_raw_in_pool(cls, await cursor.to_list(length=None), collection.codec_options)
+            else:
+                items = await hydrate(cls, await cursor.to_list(length=page_size))
+        else:
+            pipeline = build_page_pipeline(query, page, page_size, sort_by, py_direction, text_score=text_score)
+            options = {'maxTimeMS': max_time_ms, **operation_options()} if max_time_ms else operation_options()
+            options.update(search_options)
+            facet = (await collection.aggregate(pipeline, **options).to_list(length=1))[0]
+            items = await hydrate(cls, facet['items'])
+            total = facet['total'][0]['count'] if facet['total'] else 0
+        if expanded:
+            await populate(items, *expanded)
+        return ResultPage(items, total=total, page=page, page_size=page_size)
+
+    @classmethod
+    async def populate(cls, models: list[Model], *field_names: str) -> list[Model]:
+        """Attach the Models referenced by ``field_names`` (all :class:`~appkernel.fields.Ref` fields
+        when omitted), with one ``$in`` query per referenced collection."""
+        return await populate(models, *parse_expand(cls, field_names))
+
+    @classmethod
+    async def find_with_lookup(
+        cls,
+        query: dict[str, Any],
+        *field_names: str,
+        page: int = 1,
+        page_size: int = 50,
+        sort_by: str | None = None,
+        sort_order: SortOrder = SortOrder.ASC,
     ) -> list[Model]:
-        validate_query(query, trusted=trusted)
-        cursor = cls.get_collection().find(query).skip((page - 1) * page_size).limit(page_size)
-        if sort_by:
-            py_direction = pymongo.ASCENDING if sort_order == SortOrder.ASC else pymongo.DESCENDING
-            cursor = cursor.sort(sort_by, direction=py_direction)
-        docs = await cursor.to_list(length=page_size)
-        return [Model.from_dict(result, cls, convert_ids=True, converter_func=mongo_type_converter_from_dict)
-                for result in docs]
+        """Fetch a page with its references resolved server side by ``$lookup``; application code only."""
+        return await find_with_lookup(cls, query, *parse_expand(cls, field_names), page=page, page_size=page_size,
+                                      sort_by=sort_by, sort_order=sort_order)
 
     @classmethod
     async def create_cursor_by_query(
         cls, query: dict[str, Any], page: int = 0, page_size: int = 500
     ) -> list[Model]:
-        cursor = cls.get_collection().find(query).skip(page * page_size).limit(page_size)
+        cursor = cls.read_collection('find').find(query, **operation_options()).skip(page * page_size).limit(page_size)
         docs = await cursor.to_list(length=page_size)
-        return [Model.from_dict(result, cls, convert_ids=True, converter_func=mongo_type_converter_from_dict)
-                for result in docs]
+        return await hydrate(cls, docs)
 
     @classmethod
     async def stream_by_query(
-        cls, query: dict[str, Any], batch_size: int = 500
+        cls, query: dict[str, Any], batch_size: int = 500, sort_by: str | None = None
     ) -> AsyncGenerator[Model, None]:
         """Async generator that streams all matching documents in batches without loading
         the full result set into memory. Use for bulk processing, exports, and migrations
         where create_cursor_by_query's page limit is not appropriate."""
-        async for doc in cls.get_collection().find(query).batch_size(batch_size):
+        collation = query_collation(cls, query)
+        options = {'collation': collation, **operation_options()} if collation else operation_options()
+        cursor = cls.read_collection('stream_by_query').find(query, **options).batch_size(batch_size)
+        if sort_by:
+            cursor = cursor.sort(sort_by, pymongo.ASCENDING)
+        async for doc in cursor:
             yield Model.from_dict(doc, cls, convert_ids=True,
                                   converter_func=mongo_type_converter_from_dict)
 
+    @classmethod
+    async def parallel_stream_by_query(
+        cls,
+        query: dict[str, Any] | None,
+        partitions: int = 4,
+        batch_size: int = 500,
+        ordered: bool = False,
+        partition_field: str | None = None,
+    ) -> AsyncGenerator[Model, None]:
+        """Async generator scanning the matching documents with several cursors at once.
+
+        The key space of ``partition_field`` is split into ``partitions`` ranges (see
+        :func:`compute_scan_boundaries`), each range is read by its own cursor and every
+        batch is decoded into Model instances by the shared decoder pool
+        (:mod:`appkernel.hydration`). Use it for exports and migrations which are bound by a
+        single connection and by decoding when run through :meth:`stream_by_query`.
+
+        Args:
+            partitions: Number of concurrent cursors.
+            batch_size: Documents fetched per round trip and decoded per worker task.
+            ordered: Yield the documents sorted by ``partition_field``; later ranges are read
+                ahead while earlier ones are consumed. Otherwise documents are yielded in
+                whichever order the batches are ready.
+            partition_field: An indexed field present in every document; ``_id`` by default and
+                the ``time_field`` of a time-series Model, whose ``_id`` is not indexed.
+
+        The scan is not a consistent snapshot: like any cursor, a range misses the documents stored
+        behind its position while it is read, and ranges which already finished miss every later write.
+        Run it on quiesced data, or re-read the documents changed since the scan started, when that matters.
+        """
+        query = query or {}
+        if partition_field is None:
+            partition_field = cls.time_series.time_field if cls.time_series is not None else '_id'
+        collection = cls.read_collection('parallel_stream_by_query')
+        # the cursors run concurrently, which a single session does not allow
+        options = {key: value for key, value in operation_options().items() if key != 'session'}
+        boundaries = await compute_scan_boundaries(collection, query, partitions, partition_field)
+        range_filters = build_range_filters(boundaries, partition_field)
+        # a couple of decoded batches per cursor may wait for the consumer; beyond that cursors pause
+        queues = [asyncio.Queue(maxsize=2) for _ in range_filters] if ordered \
+            else [asyncio.Queue(maxsize=2 * len(range_filters))] * len(range_filters)
+
+        async def scan(range_filter: dict[str, Any], queue: asyncio.Queue) -> None:
+            try:
+                cursor = collection.find({'$and': [query, range_filter]} if range_filter else query,
+                                         **options).batch_size(batch_size)
+                if ordered:
+                    cursor = cursor.sort(partition_field, pymongo.ASCENDING)
+                batch = []
+                async for document in cursor:
+                    batch.append(document)
+                    if len(batch) >= batch_size:
+                        await queue.put(await hydrate_in_pool(cls, batch))
+                        batch = []
+                if batch:
+                    await queue.put(await hydrate_in_pool(cls, batch))
+                await queue.put(_SCAN_DONE)
+            except Exception as exc:  # pylint: disable=W0703 - re-raised in the consumer
+                await queue.put(exc)
+
+        tasks = [asyncio.create_task(scan(range_filter, queue)) for range_filter, queue in zip(range_filters, queues)]
+        try:
+            pending = len(tasks)
+            for queue in (queues if ordered else queues[:1]):
+                while pending:
+                    item = await queue.get()
+                    if item is _SCAN_DONE:
+                        pending -= 1
+                        if ordered:
+                            break
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        for model in item:
+                            yield model
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     @classmethod
     async def update_many(cls, match_query_dict: dict[str, Any], update_expression_dict: dict[str, Any]) -> int:
         result = await cls.get_collection().update_many(match_query_dict, update_expression_dict)
-        return result.modified_count
+        _record_write(cls.get_collection())
+        return result.modified_count if _acknowledged(result) else 0
 
     @classmethod
     async def delete_many(cls, match_query_dict: dict[str, Any]) -> int:
         result = await cls.get_collection().delete_many(match_query_dict)
-        return result.deleted_count
+        _record_write(cls.get_collection())
+        return result.deleted_count if _acknowledged(result) else 0
 
     @classmethod
     async def delete_all(cls) -> int:
         result = await cls.get_collection().delete_many({})
-        return result.deleted_count
+        _record_write(cls.get_collection())
+        return result.deleted_count if _acknowledged(result) else 0
 
     @classmethod
     async def count(cls, query_filter: dict[str, Any] | None = None) -> int:
-        return await cls.get_collection().count_documents(query_filter or {})
+        return await cls.read_collection('count').count_documents(query_filter or {}, **operation_options())
 
     @classmethod
     async def aggregate(
@@ -674,17 +1491,62 @@ class MongoRepository(Repository):
         """
         validate_pipeline(pipe, trusted=trusted)
         pipeline = pipe + [{'$limit': max_results}] if max_results is not None else pipe
-        cursor = cls.get_collection().aggregate(pipeline, allowDiskUse=allow_disk_use, batchSize=batch_size)
+        cursor = cls.read_collection('aggregate').aggregate(pipeline, allowDiskUse=allow_disk_use,
+                                                            batchSize=batch_size, **operation_options())
         return await cursor.to_list(length=max_results)
 
+    @classmethod
+    async def aggregate_stream(
+        cls,
+        pipe: list[dict[str, Any]] = [],  # noqa: B006 - used by _autobox_parameters() for runtime type detection
+        allow_disk_use: bool = True,
+        batch_size: int = 500,
+        max_results: int = 0,
+        trusted: bool = False,
+    ) -> AsyncGenerator[dict[str, Any], None]:
+        """Async generator running an aggregation pipeline and yielding the result documents one by one.
+
+        Unlike :meth:`aggregate` the result set is never buffered: documents are fetched from the server
+        ``batch_size`` at a time, only when the consumer asks for them, so memory stays flat for large
+        analytical results. The server side cursor is closed when the consumer stops early.
+
+        Args:
+            pipe: Aggregation stages, validated like in :meth:`aggregate`.
+            batch_size: Number of documents fetched per round trip.
+            max_results: Appends a ``$limit`` stage when positive; ``0`` streams the full result. Untrusted
+                callers get at most 10,000 documents, which is also their default.
+            trusted: See :meth:`aggregate`.
+        """
+        validate_pipeline(pipe, trusted=trusted)
+        if not trusted:
+            max_results = min(max_results, _HTTP_MAX_RESULTS) if max_results > 0 else _HTTP_MAX_RESULTS
+        pipeline = pipe + [{'$limit': max_results}] if max_results > 0 else pipe
+        cursor = cls.read_collection('aggregate').aggregate(pipeline, allowDiskUse=allow_disk_use,
+                                                            batchSize=batch_size, **operation_options())
+        try:
+            async for document in cursor:
+                yield document
+        finally:
+            await cursor.close()
+
+    @classmethod
+    async def aggregate_named(cls, pipeline_name: str, **arguments: Any) -> list[dict[str, Any]]:
+        """Run one of the Model's ``named_pipelines`` with the given parameter values.
+
+        See :mod:`appkernel.pipelines`.
+        """
+        from .pipelines import get_named_pipeline
+        return await get_named_pipeline(cls, pipeline_name).run(cls, **arguments)
+
     async def save(self) -> Any:
         self.id = await self.__class__.save_object(self)  # pylint: disable=C0103
         return self.id
 
     async def delete(self) -> None:
         assert self.id is not None
-        result = await self.get_collection().delete_one({'_id': self.id})
-        if result.deleted_count != 1:
+        result = await self.get_collection().delete_one({'_id': self.id}, **operation_options())
+        _record_write(self.get_collection())
+        if _acknowledged(result) and result.deleted_count != 1:
             raise RepositoryException("the instance couldn't be deleted")
 
 
@@ -703,8 +1565,12 @@ class AuditableRepository(MongoRepository):
             document['inserted'] = now
         else:
             document.pop('inserted', None)  # preserve the original insertion timestamp
-        model.id = await cls._save_or_update_dict(document, object_id=doc_id,
-                                                   insert_if_none_found=not has_id)
+        model.id, version = await cls._write_document(document, object_id=doc_id, insert_if_none_found=not has_id)
+        if version is not None:
+            model.version = version
+        model.updated = now
+        if not has_id:
+            model.inserted = now
         return model.id
 
     async def save(self) -> Any:
@@ -0,0 +1,86 @@
+"""Index-backed search modes of the query DSL and the HTTP query syntax.
+
+``%`` and ``?name=~Jo`` compile to an unanchored, case-insensitive ``$regex``, which no index can
+serve: every query scans the collection. The search modes below are served by an index:
+
+- prefix: ``User.name.startswith('Jo')`` or ``?name=^Jo`` is an anchored ``$regex``, which uses a
+  ``MongoIndex`` on the field (``^`` only starts a search on an indexed field);
+- case-insensitive: on a field with a :class:`~appkernel.fields.MongoCaseInsensitiveIndex`,
+  equality (``User.email == 'Jane@x.org'``, ``?email=jane@x.org``) and the prefix
+  (``User.email.startswith('jane')``, ``?email=^jane``, sent as a range) use that index;
+- full-text: ``Product.description.search('desk lamp')`` or ``?description=*desk lamp`` is a
+  ``$text`` query, which uses the ``MongoTextIndex`` of the collection (``*`` only starts a search
+  on a text-indexed field).
+
+A query filtering on a case-insensitively indexed field runs with the collation of that index,
+which is what lets MongoDB use it; the collation applies to every string comparison of the query.
+``$text`` matches stemmed words, not substrings; its results carry their relevance in
+``text_score`` and are sorted by it unless another sort is given.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from .dsl import OPS, TEXT_SCORE
+from .fields import MongoGeoIndex, MongoTextIndex, get_field_collation, get_field_index
+
+_LOGICAL_OPERATORS = ('$and', '$or', '$nor')
+
+
+def prefix_filter(prefix: str, collated: bool = False) -> dict[str, Any]:
+    """The filter matching values starting with ``prefix``, as a range when the query is collated."""
+    return (OPS.COLLATED_PREFIX if collated else OPS.STARTS_WITH).lmbda(prefix)
+
+
+def text_filter(terms: str) -> dict[str, Any]:
+    return {'$text': OPS.TEXT.lmbda(terms)}
+
+
+def field_collation(model_class: type | None, field_name: str) -> dict[str, Any] | None:
+    """The collation of the field's case-insensitive index; ``None`` for other fields."""
+    field_info = (getattr(model_class, 'model_fields', None) or {}).get(field_name)
+    return get_field_collation(field_info) if field_info is not None else None
+
+
+def search_markers(model_class: type | None, field_name: str | None) -> str:
+    """The leading characters starting a search in the URL query syntax on this field.
+
+    ``^`` (prefix) on a field with a regular, unique or case-insensitive index, ``*`` (full-text) on a
+    field with a text index and ``@`` (geo) on a field with a geo index; on any other field a value
+    starting with one of them is matched as typed.
+    """
+    field_info = (getattr(model_class, 'model_fields', None) or {}).get(field_name) if field_name else None
+    index = get_field_index(field_info) if field_info is not None else None
+    if index is None:
+        return ''
+    if isinstance(index, MongoTextIndex):
+        return '*'
+    return '@' if isinstance(index, MongoGeoIndex) else '^'
+
+
+def query_collation(model_class: type, query: Any) -> dict[str, Any] | None:
+    """The collation to run ``query`` with: that of the first case-insensitively indexed field it filters."""
+    if isinstance(query, list):
+        return next((collation for item in query if (collation := query_collation(model_class, item))), None)
+    if not isinstance(query, dict):
+        return None
+    for key, value in query.items():
+        if key in _LOGICAL_OPERATORS:
+            collation = query_collation(model_class, value)
+        else:
+            collation = None if key.startswith('$') else field_collation(model_class, 'id' if key == '_id' else key)
+        if collation:
+            return collation
+    return None
+
+
+def has_text_search(query: Any) -> bool:
+    """True if the filter contains a ``$text`` search (at the top level or inside ``$and``/``$or``)."""
+    if isinstance(query, list):
+        return any(has_text_search(item) for item in query)
+    return isinstance(query, dict) and ('$text' in query or any(
+        has_text_search(query[key]) for key in _LOGICAL_OPERATORS if key in query))
+
+
+def text_score_projection() -> dict[str, Any]:
+    return {TEXT_SCORE: {'$meta': 'textScore'}}
@@ -11,6 +11,8 @@ from enum import Enum
 from typing import Any
 
 from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pymongo.errors import PyMongoError
 from .util import AppJSONResponse as JSONResponse
 
 from appkernel.http_client import RequestHandlingException
@@ -21,9 +23,19 @@ from .iam import RbacMixin, Denied
 from .model import Model, PropertyRequiredException
 from .dsl import get_argument_spec, OPS, tag_class_items
 from .query import QueryProcessor
+from .time_budget import ClientDisconnected, TIME_BUDGET_HEADER, resolve_time_budget, run_with_time_budget, \
+    stream_with_time_budget, timeout_status_code
+from .materialized import view_headers
+from .atomic_updates import JsonPatch, is_json_patch, is_merge_patch, merge_patch_to_update
+from .bulk import EXPORT_BATCH_SIZE, EXPORT_MEDIA_TYPES, IMPORT_BATCH_SIZE, ImportReportResponse, export_stream, import_rows, \
+    iter_body_lines, negotiate_compression, negotiate_format, negotiate_import_format, report_lines
+from .fields import reference_fields
+from .references import parse_expand
 from .reflection import is_noncomplex, is_primitive, is_dictionary, is_dictionary_subclass
-from .repository import xtract, Repository, VersionConflictError
-from .util import create_custom_error
+from .geo import geo_filter
+from .search import field_collation, prefix_filter, search_markers, text_filter
+from .repository import xtract, Repository, VersionConflictError, QueryCostException, ResultPage, validate_query
+from .util import create_custom_error, default_json_serializer
 from .validators import ValidationException
 
 try:
@@ -88,10 +100,13 @@ def _add_app_rule(
     view_function: Callable,
     path_param: str = '',
     openapi_meta: dict | None = None,
+    stream_body: bool = False,
     **options,
 ):
     """
     Registers the service in the service registry and adds a route to FastAPI.
+    With ``stream_body`` the request body is not read up front; the view reads it from
+    ``request_data['request']``.
     """
     clazz_name = xtract(cls).lower()
     base_name = f'{url_base}{clazz_name}'
@@ -118,7 +133,7 @@ def _add_app_rule(
     # Create an async wrapper that extracts request data and calls the sync view function
     async def _make_handler(request: Request):
         # Read body
-        body = await request.body()
+        body = b'' if stream_body else await request.body()
         json_body = None
         form_data = {}
         if body:
@@ -150,6 +165,7 @@ def _add_app_rule(
             'form_data': form_data,
             'headers': request.headers,
             'path_params': path_params,
+            'request': request,
         }
 
         # Await the async view function
@@ -200,7 +216,7 @@ model_endpoints = {
     ],
     'aggregate': [
         {
-            'func': lambda cls, engine: _execute(cls, engine, cls.aggregate, cls),
+            'func': lambda cls, engine: _execute(cls, engine, cls.aggregate_stream, cls),
             'method': 'GET',
             'param': 'aggregate/'
         }
@@ -233,7 +249,9 @@ model_endpoints = {
 
 
 def expose_service(clazz_or_instance: type | Any, app_engine: AppKernelEngine, url_base: str, methods: list[str],
-                   enable_hateoas: bool = True, tags: list | None = None) -> None:
+                   enable_hateoas: bool = True, tags: list | None = None,
+                   time_budget_ms: int | dict[str, int] | None = None, enable_export: bool = False,
+                   enable_import: bool = False) -> None:
     """
     :param clazz_or_instance: the class name of the service which is going to be exposed
     :param enable_hateoas: if enabled (default) it will expose the service descriptors
@@ -244,6 +262,12 @@ def expose_service(clazz_or_instance: type | Any, app_engine: AppKernelEngine, u
     :type app_engine: AppKernelEngine
     :param tags: OpenAPI tags applied to every endpoint registered for this service;
         merged with any per-decorator ``tags`` kwargs (registration tags come first).
+    :param time_budget_ms: database time budget of the CRUD endpoints, in milliseconds; one value
+        or a dict keyed by operation name (see :mod:`appkernel.time_budget`).
+    :param enable_export: expose ``GET {model}/export`` streaming the collection as NDJSON or CSV
+        (see :mod:`appkernel.bulk`).
+    :param enable_import: expose ``POST {model}/import`` loading NDJSON or CSV in batches
+        (see :mod:`appkernel.bulk`).
     :return:
     """
     clazz = clazz_or_instance if inspect.isclass(clazz_or_instance) else clazz_or_instance.__class__
@@ -258,6 +282,7 @@ def expose_service(clazz_or_instance: type | Any, app_engine: AppKernelEngine, u
     clazz = clazz_or_instance if inspect.isclass(clazz_or_instance) else clazz_or_instance.__class__
     clazz.methods = methods
     clazz.enable_hateoas = enable_hateoas
+    clazz.time_budget_ms = time_budget_ms
     class_methods = [cm for cm in dir(clazz_or_instance) if
                      not cm.startswith('_') and callable(getattr(clazz_or_instance, cm))]
     if inspect.isclass(clazz_or_instance):
@@ -273,6 +298,29 @@ def expose_service(clazz_or_instance: type | Any, app_engine: AppKernelEngine, u
                           path_param='meta', methods=['GET'],
                           openapi_meta={'internal': True})
 
+        # registered before the CRUD routes, so that '{object_id}' does not capture 'export'
+        if enable_export and issubclass(clazz_or_instance, Repository):
+            _add_app_rule(clazz_or_instance, url_base, 'export',
+                          _create_export_executor(clazz_or_instance, app_engine),
+                          path_param='export', methods=['GET'],
+                          openapi_meta={
+                              'model_class': clazz_or_instance,
+                              'query_params': sorted(_EXPORT_PARAMS),
+                              'summary': f'Export {clazz.__name__} documents as NDJSON or CSV',
+                              'tags': tags or None,
+                          })
+
+        if enable_import and issubclass(clazz_or_instance, Repository):
+            _add_app_rule(clazz_or_instance, url_base, 'import',
+                          _create_import_executor(clazz_or_instance, app_engine),
+                          path_param='import', methods=['POST'], stream_body=True,
+                          openapi_meta={
+                              'model_class': clazz_or_instance,
+                              'query_params': ['batch_size', 'format'],
+                              'summary': f'Import {clazz.__name__} documents from NDJSON or CSV',
+                              'tags': tags or None,
+                          })
+
         if issubclass(clazz_or_instance, (Model, Repository)):
             for method in class_methods:
                 mdef_list = model_endpoints.get(method)
@@ -289,6 +337,17 @@ def expose_service(clazz_or_instance: type | Any, app_engine: AppKernelEngine, u
                                           'tags': tags or None,
                                       })
 
+        for pipeline_name, pipeline in (getattr(clazz_or_instance, 'named_pipelines', None) or {}).items():
+            _add_app_rule(clazz_or_instance, url_base, f'aggregate_{pipeline_name}',
+                          _create_named_pipeline_executor(clazz_or_instance, app_engine, pipeline_name),
+                          path_param=f'aggregate/{pipeline_name}', methods=['GET'],
+                          openapi_meta={
+                              'model_class': clazz_or_instance,
+                              'query_params': list(pipeline.params),
+                              'summary': pipeline.description,
+                              'tags': tags or None,
+                          })
+
     setup_security = hasattr(config, 'security_enabled') and config.security_enabled
     cls_items = clazz_or_instance.__dict__ if inspect.isclass(
         clazz_or_instance) else clazz_or_instance.__class__.__dict__
@@ -491,6 +550,136 @@ def _create_simple_wrapper_executor(cls, app_engine, provisioner_method):
     return create_executor
 
 
+def _create_named_pipeline_executor(cls, app_engine: AppKernelEngine, pipeline_name: str):
+    """
+    View function of a named pipeline: binds the query parameters, runs (or serves from the cache)
+    the pipeline and reports the timing in the ``X-Pipeline-Duration-Ms`` header.
+    """
+    async def create_executor(request_data=None, **named_args):
+        try:
+            pipeline = cls.named_pipelines[pipeline_name]
+            arguments = _get_request_args(request_data)
+            headers = (request_data.get('headers') or {}) if request_data else {}
+            time_budget_ms = resolve_time_budget(getattr(cls, 'time_budget_ms', None), 'aggregate',
+                                                 headers.get(TIME_BUDGET_HEADER))
+            outcome = await run_with_time_budget(lambda: pipeline.execute(cls, **arguments), time_budget_ms,
+                                                 request_data.get('request') if request_data else None)
+            response = JSONResponse(content=_xvert(cls, outcome.items), status_code=200 if outcome.items else 204)
+            response.headers['X-Pipeline-Duration-Ms'] = f'{outcome.duration_ms:.1f}'
+            response.headers['X-Cache'] = 'HIT' if outcome.cached else 'MISS'
+            return response
+        except ValidationException as vexc:
+            app_engine.logger.warning(f'validation error: {vexc}')
+            return create_custom_error(400, f'{vexc.__class__.__name__}/{vexc}', cls.__name__)
+        except ClientDisconnected as cdexc:
+            return create_custom_error(cdexc.status_code, str(cdexc), cls.__name__)
+        except PyMongoError as dbexc:
+            status_code = timeout_status_code(dbexc)
+            if status_code is None:
+                return app_engine.generic_error_handler(dbexc, upstream_service=cls.__name__)
+            app_engine.logger.warning(f'database timeout: {dbexc}')
+            return create_custom_error(status_code, 'The operation exceeded its time budget.', cls.__name__)
+        except Exception as exc:
+            return app_engine.generic_error_handler(exc, upstream_service=cls.__name__)
+
+    return create_executor
+
+
+_EXPORT_PARAMS = frozenset({'format', 'compression', 'query'})
+
+
+def _create_export_executor(cls, app_engine: AppKernelEngine):
+    """
+    View function of ``GET {model}/export``: builds the filter from the query parameters like the
+    collection endpoint does and streams the matching documents as NDJSON or CSV.
+    """
+    async def create_executor(request_data=None, **named_args):
+        try:
+            query_params = (request_data.get('query_params') or {}) if request_data else {}
+            headers = (request_data.get('headers') or {}) if request_data else {}
+            export_format = negotiate_format(query_params.get('format'), headers.get('accept'))
+            encoding = negotiate_compression(query_params.get('compression'), headers.get('accept-encoding'))
+            query_param_names = set(query_params.keys()) - _EXPORT_PARAMS
+            if query_param_names:
+                query = convert_to_query(query_param_names, query_params, cls)
+            else:
+                query = json.loads(query_params.get('query')) if query_params.get('query') else {}
+            cost_policy = cls.query_cost_policy.with_model_indexes(cls) if cls.query_cost_policy else None
+            validate_query(query, cost_policy=cost_policy)
+            response_headers = {'Content-Disposition': f'attachment; filename="{xtract(cls).lower()}.{export_format}"'}
+            if encoding:
+                response_headers['Content-Encoding'] = encoding
+            # exports are long running by design: only an explicit 'export' budget applies
+            budget = getattr(cls, 'time_budget_ms', None)
+            time_budget_ms = budget.get('export') if isinstance(budget, dict) else None
+            models = stream_with_time_budget(cls.stream_by_query(query, batch_size=EXPORT_BATCH_SIZE), time_budget_ms)
+            return StreamingResponse(export_stream(cls, models, export_format, encoding),
+                                     media_type=EXPORT_MEDIA_TYPES[export_format], headers=response_headers)
+        except ValidationException as vexc:
+            app_engine.logger.warning(f'validation error: {vexc}')
+            return create_custom_error(400, f'{vexc.__class__.__name__}/{vexc}', cls.__name__)
+        except ValueError as verr:
+            return create_custom_error(400, f'The query parameter is not valid JSON: {verr}', cls.__name__)
+        except PermissionError as pexc:
+            app_engine.logger.warning(f'permission denied: {pexc}')
+            return create_custom_error(403, str(pexc), cls.__name__)
+        except QueryCostException as qce:
+            app_engine.logger.warning(f'export rejected by cost policy: {qce}')
+            return create_custom_error(qce.status_code, str(qce), cls.__name__)
+        except Exception as exc:
+            return app_engine.generic_error_handler(exc, upstream_service=cls.__name__)
+
+    return create_executor
+
+
+def _create_import_executor(cls, app_engine: AppKernelEngine):
+    """
+    View function of ``POST {model}/import``: validates and inserts the rows of the streamed NDJSON
+    or CSV body and streams back the per-line error report, closed by a summary line.
+    """
+    async def create_executor(request_data=None, **named_args):
+        try:
+            query_params = (request_data.get('query_params') or {}) if request_data else {}
+            headers = (request_data.get('headers') or {}) if request_data else {}
+            import_format = negotiate_import_format(query_params.get('format'), headers.get('content-type'))
+            batch_size = int(query_params.get('batch_size', IMPORT_BATCH_SIZE))
+            if batch_size < 1:
+                raise ValidationException('batch_size must be a positive number.')
+            lines = iter_body_lines(request_data['request'].stream(), headers.get('content-encoding'))
+            report = import_rows(cls, lines, import_format, batch_size=batch_size)
+            return ImportReportResponse(report_lines(report), media_type=EXPORT_MEDIA_TYPES['ndjson'])
+        except ValidationException as vexc:
+            app_engine.logger.warning(f'validation error: {vexc}')
+            return create_custom_error(400, f'{vexc.__class__.__name__}/{vexc}', cls.__name__)
+        except ValueError as verr:
+            return create_custom_error(400, f'batch_size must be a number: {verr}', cls.__name__)
+        except Exception as exc:
+            return app_engine.generic_error_handler(exc, upstream_service=cls.__name__)
+
+    return create_executor
+
+
+def _authorize_expansion(cls, app_engine: AppKernelEngine, expand: str, headers: Any) -> JSONResponse | None:
+    """
+    Check that the caller may read every Model embedded by ``expand``; returns the error response of a denied one.
+    A referenced Model is only embedded when it is served by a ``GET {model}/{object_id}`` endpoint whose access
+    rules (with security enabled) the caller passes.
+    """
+    references = reference_fields(cls)
+    authorisation_method = getattr(app_engine, '_security_authorisation_method', None)
+    for field_name in parse_expand(cls, expand):
+        target = references[field_name].target()
+        endpoint = f'{xtract(target).lower()}_find_by_id_get'
+        if config.service_registry.get(endpoint) is not target:
+            raise PermissionError(f'{references[field_name].attach_as(field_name)} cannot be expanded: '
+                                  f'{target.__name__} is not served over HTTP.')
+        if authorisation_method is not None:
+            denied = authorisation_method(method='GET', endpoint=endpoint, headers=headers, view_args={})
+            if denied is not None:
+                return denied
+    return None
+
+
 def _execute(cls, app_engine: AppKernelEngine, provisioner_method: Callable, model_class: Model):
     """
     The main view function for FastAPI routes.
@@ -515,7 +704,7 @@ def _execute(cls, app_engine: AppKernelEngine, provisioner_method: Callable, mod
                     executable_method, set(query_params.keys()) if query_params else set())
                 if query_param_names and len(query_param_names) > 0:
                     named_and_request_arguments.update(
-                        query=convert_to_query(query_param_names, query_params))
+                        query=convert_to_query(query_param_names, query_params, model_class))
 
                     for query_param_name in query_param_names:
                         if query_param_name in named_and_request_arguments:
@@ -527,10 +716,35 @@ def _execute(cls, app_engine: AppKernelEngine, provisioner_method: Callable, mod
                 model_instance = Model.from_dict(_extract_dict_from_payload(request_data), model_class)
                 named_and_request_arguments.update(model=model_instance)
                 return_code = 201
-            elif method == 'PATCH':
-                named_and_request_arguments.update(document=_extract_dict_from_payload(request_data))
-            result = await provisioner_method(
-                **_autobox_parameters(executable_method, named_and_request_arguments))
+            headers = (request_data.get('headers') or {}) if request_data else {}
+            if method == 'PATCH':
+                document = _extract_dict_from_payload(request_data)
+                if is_merge_patch(headers.get('content-type')):
+                    # compiled to $set / $unset and applied atomically by the repository
+                    document = merge_patch_to_update(document)
+                elif is_json_patch(headers.get('content-type')):
+                    if not isinstance(document, list):
+                        raise ValidationException('A JSON patch must be a non-empty JSON array.')
+                    document = JsonPatch(document)
+                named_and_request_arguments.update(document=document)
+            time_budget_ms = resolve_time_budget(getattr(cls, 'time_budget_ms', None), executable_method.__name__,
+                                                 headers.get(TIME_BUDGET_HEADER))
+            # only application code may bypass the query / pipeline allowlists
+            named_and_request_arguments.pop('trusted', None)
+            if named_and_request_arguments.get('expand'):
+                denied = _authorize_expansion(cls, app_engine, named_and_request_arguments['expand'], headers)
+                if denied is not None:
+                    return denied
+            arguments = _autobox_parameters(executable_method, named_and_request_arguments)
+            if inspect.isasyncgenfunction(executable_method):
+                stream = stream_with_time_budget(provisioner_method(**arguments), time_budget_ms)
+                # pull the first item here, so that validation errors still produce a proper error response
+                first_item = await anext(stream, _END_OF_STREAM)
+                if first_item is _END_OF_STREAM:
+                    return JSONResponse(content={}, status_code=204)
+                return StreamingResponse(_stream_list_envelope(cls, first_item, stream), media_type='application/json')
+            result = await run_with_time_budget(lambda: provisioner_method(**arguments), time_budget_ms,
+                                                request_data.get('request') if request_data else None)
             if method in ['GET', 'PUT', 'PATCH']:
                 if result is None:
                     object_id = named_args.get('object_id', None)
@@ -542,7 +756,10 @@ def _execute(cls, app_engine: AppKernelEngine, provisioner_method: Callable, mod
             if result is None or isinstance(result, list) and len(result) == 0:
                 return_code = 204
             result_dic_tentative = {} if result is None else _xvert(cls, result)
-            return JSONResponse(content=result_dic_tentative, status_code=return_code)
+            response = JSONResponse(content=result_dic_tentative, status_code=return_code)
+            if getattr(cls, 'materialized_view', None) is not None:
+                response.headers.update(await view_headers(cls))
+            return response
         except PropertyRequiredException as pexc:
             app_engine.logger.warning(f'missing parameter: {pexc.__class__.__name__}/{pexc}')
             return create_custom_error(400, str(pexc), cls.__name__)
@@ -555,6 +772,20 @@ def _execute(cls, app_engine: AppKernelEngine, provisioner_method: Callable, mod
         except VersionConflictError as ce:
             app_engine.logger.warning(f'version conflict: {ce}')
             return create_custom_error(409, str(ce), cls.__name__)
+        except QueryCostException as qce:
+            app_engine.logger.warning(f'query rejected by cost policy: {qce}')
+            return create_custom_error(qce.status_code, str(qce), cls.__name__)
+        except ClientDisconnected as cdexc:
+            app_engine.logger.info(f'client disconnected: {cdexc}')
+            return create_custom_error(cdexc.status_code, str(cdexc), cls.__name__)
+        except PyMongoError as dbexc:
+            status_code = timeout_status_code(dbexc)
+            if status_code is None:
+                return app_engine.generic_error_handler(dbexc, upstream_service=cls.__name__)
+            app_engine.logger.warning(f'database timeout: {dbexc}')
+            message = 'The operation exceeded its time budget.' if status_code == 504 \
+                else 'The database is not available in time, please retry later.'
+            return create_custom_error(status_code, message, cls.__name__)
         except RequestHandlingException as rexc:
             app_engine.logger.error(f'request forwarding error: {str(rexc)}')
             app_engine.logger.exception(rexc)
@@ -567,7 +798,7 @@ def _execute(cls, app_engine: AppKernelEngine, provisioner_method: Callable, mod
     return create_executor
 
 
-def convert_to_query(query_param_names: set[str], request_args: Any) -> dict[str, Any]:
+def convert_to_query(query_param_names: set[str], request_args: Any, model_class: type | None = None) -> dict[str, Any]:
     """
     Result example: ::
 
@@ -589,6 +820,28 @@ def convert_to_query(query_param_names: set[str], request_args: Any) -> dict[str
 
         {"first_name" : "/.*{firstName}.*/i"}
 
+    ?first_name=^{prefix}
+    The first name starts with the given value, on a field with an index (on other fields ``^`` is
+    matched as typed); an anchored regex served by that index, or (case-insensitively) a range
+    served by its ``MongoCaseInsensitiveIndex``.
+    Converted to: ::
+
+        {"first_name": {"$regex": "^{prefix}"}}
+
+    ?description=*{terms}
+    Full-text search in the fields of the text index, on a field with a ``MongoTextIndex`` (on
+    other fields ``*`` is matched as typed).
+    Converted to: ::
+
+        {"$text": {"$search": "{terms}"}}
+
+    ?location=@{lon},{lat},{meters} or ?location=@{min_lon},{min_lat},{max_lon},{max_lat}
+    Locations within a radius or a bounding box; only on fields with a ``MongoGeoIndex``.
+    Converted to: ::
+
+        {"location": {"$geoWithin": {"$centerSphere": [[{lon}, {lat}], {meters} / 6378100]}}}
+        {"location": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [...]}}}}
+
     ?birth_date=>{birthDate}
     Birth date after the given parameter (inclusive >=)
     Converted to: ::
@@ -607,9 +860,15 @@ def convert_to_query(query_param_names: set[str], request_args: Any) -> dict[str
 
         {"state":{"$in":["NEW", "CLOSED"]}}
 
+    On a field where ``^``, ``*`` or ``@`` starts a search, a backslash before it (or before another
+    backslash) keeps the rest of the value as typed: ``?name=\\^Ja`` matches the name ``^Ja``.
+    Only one ``*`` search is allowed per request, and not with ``logic=OR``: MongoDB accepts a single
+    ``$text`` and not inside ``$or``.
+
     :param query_param_names: the names of all query parameters as a set; example set(['birth_date','logic'])
     :type query_param_names: set
     :param request_args: the names and the values of the query parameters; must support .getlist() and .get() methods
+    :param model_class: the queried Model, which decides how the ``^``, ``*`` and ``@`` searches are served
     :return: the query expression which than can be converted to repository specific queries (eg. Mongo or SQL query)
     :rtype: dict
     """
@@ -627,34 +886,56 @@ def convert_to_query(query_param_names: set[str], request_args: Any) -> dict[str
     expression_list = []
     for query_item in [[key, val] for key, val in query_dict.items()]:
         if isinstance(query_item[1], list) and len(query_item[1]) > 1:
-            value_list = [_remap_expressions(expr) for expr in query_item[1]]
+            value_list = [_remap_expressions(expr, model_class, query_item[0]) for expr in query_item[1]]
             if isinstance(value_list[0], tuple):
                 expression_list.append(
                     {query_item[0]: dict(value_list)})
             else:
                 for val in value_list:
-                    expression_list.append({query_item[0]: val})
+                    expression_list.append(_field_expression(query_item[0], val))
         else:
-            mapped_value = _remap_expressions(query_item[1][0])
+            mapped_value = _remap_expressions(query_item[1][0], model_class, query_item[0])
             if isinstance(mapped_value, tuple):
                 expression_list.append({query_item[0]: dict([mapped_value])})
             else:
-                expression_list.append({query_item[0]: mapped_value})
+                expression_list.append(_field_expression(query_item[0], mapped_value))
 
+    text_searches = sum(1 for expression in expression_list if '$text' in expression)
+    if text_searches > 1:
+        raise ValidationException('Only one full-text (*) search is allowed per query.')
     if len(expression_list) == 0:
         return {}
     elif len(expression_list) == 1:
         return expression_list[0]
     else:
         logic = str(OPS.__getattr__(request_args.get('logic', 'and').upper()))
+        if text_searches and logic != '$and':
+            raise ValidationException('A full-text (*) search can only be combined with logic=AND.')
         return {logic: expression_list}
 
 
-def _remap_expressions(expression: Any) -> Any:
+def _field_expression(field_name: str, value: Any) -> dict[str, Any]:
+    # a $text search applies to the collection's text index, not to the field it was given for
+    return value if isinstance(value, dict) and '$text' in value else {field_name: value}
+
+
+def _remap_expressions(expression: Any, model_class: type | None = None, field_name: str | None = None) -> Any:
     """
     Takes a query expression such as >1994-12-02 and turns into a {'$gte':'1994-12-02'}.
-    Additionally converts the date string into datetime object;
+    Additionally converts the date string into datetime object. On indexed fields a leading ``^``
+    (prefix), ``*`` (text) or ``@`` (geo) starts the search the index serves (see
+    :func:`~appkernel.search.search_markers`); a backslash before that character, or before a
+    backslash, keeps the value as typed. Values of other fields are not interpreted this way.
     """
+    markers = search_markers(model_class, field_name)
+    if markers and expression[:1] == '\\' and expression[1:2] in (markers, '\\'):
+        return expression[1:]
+    if markers == '^' and expression[:1] == '^':
+        return prefix_filter(expression[1:], collated=field_collation(model_class, field_name) is not None)
+    if markers == '*' and expression[:1] == '*':
+        return text_filter(expression[1:])
+    if markers == '@' and expression[:1] == '@':
+        return geo_filter(expression[1:])
     if expression[0] in qp.supported_expressions:
         converted_value = _convert_expressions(expression[1:])
         return qp.expression_mapper.get(expression[0])(converted_value)
@@ -728,9 +1009,13 @@ def _xvert(cls: type, result_item: Any, generate_links: bool = True) -> dict[str
         return result_item
     elif isinstance(result_item, (list, set, tuple)):
         result = {
-            '_type': result_item.__class__.__name__,
+            '_type': 'list' if isinstance(result_item, ResultPage) else result_item.__class__.__name__,
             '_items': [_xvert(cls, item, generate_links=False) for item in result_item]
         }
+        if isinstance(result_item, ResultPage):
+            if result_item.total is not None:
+                result.update(_total=result_item.total)
+            result.update(_page=result_item.page, _page_size=result_item.page_size)
         if hasattr(cls, 'enable_hateoas') and cls.enable_hateoas:
             result.update(_links={'self': {'href': url_for_endpoint(f'{xtract(cls).lower()}_find_by_query_get')}})
         return result
@@ -738,6 +1023,34 @@ def _xvert(cls: type, result_item: Any, generate_links: bool = True) -> dict[str
         return {'_type': 'OperationResult', 'result': result_item}
 
 
+_END_OF_STREAM = object()
+_STREAM_CHUNK_SIZE = 100
+
+
+async def _stream_list_envelope(cls: type, first_item: Any, items: Any) -> Any:
+    """
+    Streams the same ``{"_type": "list", "_items": [...]}`` envelope as :func:`_xvert`, a chunk of
+    items at a time; the next chunk is only produced once the client consumed the previous one.
+    """
+    def dumps(item):
+        return json.dumps(_xvert(cls, item, generate_links=False), ensure_ascii=False, default=default_json_serializer)
+
+    yield '{"_type": "list", "_items": [' + dumps(first_item)
+    chunk = []
+    async for item in items:
+        chunk.append(dumps(item))
+        if len(chunk) >= _STREAM_CHUNK_SIZE:
+            yield ', ' + ', '.join(chunk)
+            chunk = []
+    if chunk:
+        yield ', ' + ', '.join(chunk)
+    tail = ']'
+    if hasattr(cls, 'enable_hateoas') and cls.enable_hateoas:
+        links = {'self': {'href': url_for_endpoint(f'{xtract(cls).lower()}_find_by_query_get')}}
+        tail += ', "_links": ' + json.dumps(links)
+    yield tail + '}'
+
+
 def _calculate_links(cls: type, object_id: Any) -> dict[str, Any] | None:
     links = {}
     clazz_name = xtract(cls).lower()
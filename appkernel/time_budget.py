@@ -0,0 +1,185 @@
+"""Time budgets and cancellation for database work triggered by HTTP requests.
+
+A request handled within a time budget runs inside :func:`pymongo.timeout`, so every
+Motor operation it issues carries a ``maxTimeMS`` derived from the remaining budget
+(client side operation timeout). The budget is resolved from three sources, the
+smallest one wins:
+
+- ``appkernel.mongo.time_budget_ms`` in the configuration (global default);
+- the ``time_budget_ms`` argument of :meth:`AppKernelEngine.register` (per endpoint);
+- the ``X-Time-Budget-Ms`` request header (per request, can only shorten the budget).
+
+Cursor based operations are additionally tagged with a per-request ``comment``. When
+the HTTP client disconnects the request task is cancelled and the tagged operations
+still running on the server are killed with ``killOp``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import nullcontext
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from contextvars import ContextVar
+from typing import Any
+
+import pymongo
+from pymongo.errors import ExecutionTimeout, PyMongoError
+
+from .configuration import config
+from .read_routing import current_session
+
+logger = logging.getLogger(__name__)
+
+TIME_BUDGET_HEADER = 'x-time-budget-ms'
+KILL_TIMEOUT_SECONDS = 2.0
+
+_operation_tag: ContextVar[str | None] = ContextVar('appkernel_operation_tag', default=None)
+
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client went away before the response was ready."""
+    status_code: int = 499
+
+
+def operation_options() -> dict[str, Any]:
+    """Return the extra keyword arguments tagging a Motor operation with the current request.
+
+    Also carries the session of an enclosing :func:`~appkernel.read_routing.causal_session`.
+    Empty outside of a time budgeted request or session.
+    """
+    tag = _operation_tag.get()
+    options: dict[str, Any] = {'comment': tag} if tag else {}
+    session = current_session()
+    if session is not None:
+        options['session'] = session
+    return options
+
+
+def resolve_time_budget(
+    endpoint_budget_ms: int | dict[str, int] | None,
+    operation: str | None = None,
+    requested_ms: str | int | None = None,
+) -> int | None:
+    """Combine the configured, per-endpoint and per-request budgets into one (milliseconds).
+
+    Args:
+        endpoint_budget_ms: Budget given at registration; either one value for all
+            endpoints of the service or a dict keyed by operation name
+            (e.g. ``{'find_by_query': 2000, 'aggregate': 10000}``).
+        operation: The operation name used to look up a dict budget.
+        requested_ms: The value of the ``X-Time-Budget-Ms`` header, if any; invalid or
+            non-positive values are ignored.
+    """
+    cfg_engine = getattr(config, 'cfg_engine', None)
+    candidates = [cfg_engine.get('appkernel.mongo.time_budget_ms', None) if cfg_engine else None]
+    if isinstance(endpoint_budget_ms, dict):
+        candidates.append(endpoint_budget_ms.get(operation))
+    else:
+        candidates.append(endpoint_budget_ms)
+    try:
+        candidates.append(int(requested_ms) if requested_ms is not None else None)
+    except (TypeError, ValueError):
+        pass
+    budgets = [int(value) for value in candidates if value is not None and int(value) > 0]
+    return min(budgets) if budgets else None
+
+
+def timeout_status_code(exc: BaseException) -> int | None:
+    """Map a driver timeout to an HTTP status code.
+
+    Returns 504 when the server aborted the operation because its ``maxTimeMS`` expired,
+    503 for any other driver timeout (server selection, connection checkout, network)
+    and ``None`` if ``exc`` is not a timeout.
+    """
+    if isinstance(exc, ExecutionTimeout):
+        return 504
+    if isinstance(exc, PyMongoError) and exc.timeout:
+        return 503
+    return None
+
+
+async def kill_tagged_operations(tag: str) -> int:
+    """Kill the server side operations carrying ``tag`` as comment; returns the number killed.
+
+    Best effort: lacking the ``inprog``/``killop`` privileges only logs a warning.
+    """
+    database = getattr(config, 'mongo_database', None)
+    if database is None:
+        return 0
+    admin = database.client.admin
+    killed = 0
+    try:
+        with pymongo.timeout(KILL_TIMEOUT_SECONDS):
+            cursor = admin.aggregate([{'$currentOp': {}}, {'$match': {'command.comment': tag}}])
+            async for operation in cursor:
+                await admin.command('killOp', op=operation['opid'])
+                killed += 1
+    except PyMongoError as exc:
+        logger.warning(f'could not kill operations tagged {tag}: {exc}')
+    return killed
+
+
+async def run_with_time_budget(
+    func: Callable[[], Awaitable[Any]],
+    budget_ms: int | None = None,
+    request: Any = None,
+    poll_interval: float = 0.1,
+) -> Any:
+    """Run ``func()`` within a time budget, cancelling it when the client disconnects.
+
+    Args:
+        func: Zero argument callable returning the awaitable doing the work.
+        budget_ms: Time budget in milliseconds; ``None`` means unlimited.
+        request: The Starlette request watched for disconnects; ``None`` disables watching.
+        poll_interval: Seconds between two disconnect checks.
+
+    Raises:
+        ClientDisconnected: The client disconnected; the work was cancelled.
+    """
+    tag = uuid.uuid4().hex
+    token = _operation_tag.set(tag)
+    try:
+        # the task copies the current context, including the pymongo deadline and the tag
+        with pymongo.timeout(budget_ms / 1000) if budget_ms else nullcontext():
+            task = asyncio.ensure_future(func())
+    finally:
+        _operation_tag.reset(token)
+    if request is None:
+        return await task
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    task.cancel()
+    killed = await kill_tagged_operations(tag)
+    logger.info(f'client disconnected, cancelled request work ({killed} server operations killed)')
+    raise ClientDisconnected('The client closed the connection before the response was ready.')
+
+
+async def stream_with_time_budget(items: AsyncIterator[Any], budget_ms: int | None = None) -> AsyncGenerator[Any, None]:
+    """Re-yield ``items`` with ``budget_ms`` covering the whole iteration.
+
+    Streamed responses are consumed by the server's response task, not by the request handler, so
+    the budget is re-applied around each step with the time remaining instead of being inherited.
+    Disconnects need no watching here: the server stops consuming and the producer is closed.
+    """
+    deadline = time.monotonic() + budget_ms / 1000 if budget_ms else None
+    try:
+        while True:
+            with pymongo.timeout(max(deadline - time.monotonic(), 0.001)) if deadline else nullcontext():
+                try:
+                    item = await items.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        if hasattr(items, 'aclose'):
+            await items.aclose()
@@ -0,0 +1,101 @@
+"""Time-series collections for append-heavy Models.
+
+Metrics and events are written once and read by time range. Stored in an ordinary collection,
+every measurement is a document of its own with an ``_id`` index entry; a time-series collection
+groups the measurements of one ``meta_field`` value and time span into compressed buckets and
+indexes the buckets instead::
+
+    class Reading(Model, MongoRepository):
+        id: str | None = None
+        sensor: str | None = None
+        taken: datetime | None = None
+        value: float | None = None
+        time_series: ClassVar[TimeSeriesOptions] = TimeSeriesOptions(
+            time_field='taken', meta_field='sensor', granularity='minutes', expire_after_seconds=30 * 86400)
+
+    await Reading.init_indexes()  # creates the time-series collection
+    await Reading.find_time_range(datetime(2024, 5, 1), datetime(2024, 5, 2), meta='sensor-7')
+
+A time-series Model is append-only: ``save()`` inserts, without the ``version`` of the optimistic
+locking, and raises :exc:`~appkernel.repository.RepositoryException` for a measurement which
+already has an id (the ``_id`` of a time-series collection is not unique, a second insert would
+store a duplicate); ``bulk_insert`` groups the measurements by ``meta_field`` and inserts them
+unordered, so that consecutive writes land in the same bucket. Leave ``id`` without a generator:
+MongoDB assigns an ``ObjectId``. Filter on ``time_field`` and ``meta_field``: buckets are skipped by their
+time range and MongoDB 6.3+ indexes ``meta_field`` + ``time_field``; lookups by ``_id`` scan.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+GRANULARITIES = ('seconds', 'minutes', 'hours')
+
+
+@dataclass(frozen=True)
+class TimeSeriesOptions:
+    """The time-series options of a Model's collection (MongoDB 5.0+).
+
+    Args:
+        time_field: The ``datetime`` field holding the time of the measurement; required in every document.
+        meta_field: The field identifying the source of the measurement (e.g. a sensor id); measurements
+            are bucketed per value.
+        granularity: ``'seconds'``, ``'minutes'`` or ``'hours'``, the closest to the interval between
+            two measurements of the same source; ``'seconds'`` when not set.
+        expire_after_seconds: Delete measurements older than this.
+    """
+    time_field: str
+    meta_field: str | None = None
+    granularity: str | None = None
+    expire_after_seconds: int | None = None
+
+    def __post_init__(self) -> None:
+        if not self.time_field or self.time_field in ('id', '_id'):
+            raise ValueError(f'TimeSeriesOptions.time_field must name a datetime field, got {self.time_field!r}.')
+        if self.meta_field == self.time_field:
+            raise ValueError('TimeSeriesOptions.meta_field must differ from the time_field.')
+        if self.granularity is not None and self.granularity not in GRANULARITIES:
+            raise ValueError(f"TimeSeriesOptions.granularity must be one of {', '.join(GRANULARITIES)}, "
+                             f'got {self.granularity!r}.')
+        if self.expire_after_seconds is not None and self.expire_after_seconds <= 0:
+            raise ValueError('TimeSeriesOptions.expire_after_seconds must be positive.')
+
+    def collection_options(self) -> dict[str, Any]:
+        """The keyword arguments of ``create_collection`` creating the time-series collection."""
+        timeseries = {'timeField': self.time_field}
+        if self.meta_field:
+            timeseries['metaField'] = self.meta_field
+        if self.granularity:
+            timeseries['granularity'] = self.granularity
+        options: dict[str, Any] = {'timeseries': timeseries}
+        if self.expire_after_seconds is not None:
+            options['expireAfterSeconds'] = self.expire_after_seconds
+        return options
+
+    def indexed_fields(self) -> list[tuple[str, ...]]:
+        """The keys serving queries without a declared index: the bucket time ranges and the meta index."""
+        fields = [(self.time_field,)]
+        if self.meta_field:
+            fields.insert(0, (self.meta_field, self.time_field))
+        return fields
+
+    def range_filter(self, start: Any = None, end: Any = None, meta: Any = None) -> dict[str, Any]:
+        """The filter of the measurements taken in ``[start, end)``, of the source ``meta`` when given."""
+        query: dict[str, Any] = {}
+        if meta is not None:
+            if not self.meta_field:
+                raise ValueError('The time series has no meta_field to filter on.')
+            query[self.meta_field] = meta
+        window = {key: value for key, value in (('$gte', start), ('$lt', end)) if value is not None}
+        if window:
+            query[self.time_field] = window
+        return query
+
+    def bucket_order(self, documents: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Group ``documents`` by ``meta_field``, keeping their order within a group."""
+        if not self.meta_field:
+            return documents
+        groups: dict[str, list[dict[str, Any]]] = {}
+        for document in documents:
+            groups.setdefault(repr(document.get(self.meta_field)), []).append(document)
+        return [document for group in groups.values() for document in group]
@@ -0,0 +1,147 @@
+"""Throughput and CPU cost of ``find_by_query`` with and without MongoDB wire compression.
+
+Needs a running MongoDB; run it from a host in another zone than the database to see the effect
+of the network::
+
+    python benchmarks/compression_benchmark.py --host mongodb://db.example:27017 --documents 20000
+
+Seeds ``--documents`` typical order documents into the ``compression_benchmark`` database, then
+for every compressor setting reads all pages with ``find_by_query`` ``--rounds`` times and reports
+the documents per second, the CPU seconds of this process per 10k documents and the bytes sent by
+the server. The byte counts come from the server wide ``serverStatus`` network counters, so use an
+otherwise idle server. The database is dropped at the end unless ``--keep`` is given.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import random
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from appkernel import Model, MongoRepository  # noqa: E402
+from appkernel.configuration import config  # noqa: E402
+
+DATABASE = 'compression_benchmark'
+SETTINGS = [
+    ('none', {}),
+    ('zlib (level 1)', {'compressors': 'zlib', 'zlibCompressionLevel': 1}),
+    ('zlib (level 6)', {'compressors': 'zlib', 'zlibCompressionLevel': 6}),
+    ('snappy', {'compressors': 'snappy'}),
+    ('zstd', {'compressors': 'zstd'}),
+]
+_WORDS = ('express', 'delivery', 'fragile', 'gift', 'warehouse', 'returned', 'priority', 'customer', 'invoice',
+          'paid', 'pending', 'shipped', 'address', 'berlin', 'paris', 'lisbon', 'madrid', 'package')
+
+
+class LineItem(Model):
+    sku: str | None = None
+    name: str | None = None
+    quantity: int | None = None
+    price: float | None = None
+
+
+class BenchmarkOrder(Model, MongoRepository):
+    id: str | None = None
+    customer: str | None = None
+    status: str | None = None
+    created: datetime | None = None
+    tags: list[str] | None = None
+    items: list[LineItem] | None = None
+    notes: str | None = None
+
+
+def _order(index: int, rnd: random.Random) -> BenchmarkOrder:
+    return BenchmarkOrder(
+        id=f'O{index:08d}', customer=f'customer-{rnd.randrange(5000)}',
+        status=rnd.choice(('NEW', 'PAID', 'SHIPPED', 'DELIVERED')),
+        created=datetime(2024, 1, 1) + timedelta(minutes=rnd.randrange(500_000)),
+        tags=rnd.sample(_WORDS, 3),
+        items=[LineItem(sku=f'SKU-{rnd.randrange(900):04d}', name=' '.join(rnd.sample(_WORDS, 2)),
+                        quantity=rnd.randrange(1, 5), price=round(rnd.uniform(1, 300), 2))
+               for _ in range(rnd.randrange(1, 8))],
+        notes=' '.join(rnd.choice(_WORDS) for _ in range(40)))
+
+
+async def seed(host: str, documents: int) -> None:
+    client = AsyncIOMotorClient(host)
+    config.mongo_database = client[DATABASE]
+    await BenchmarkOrder.delete_all()
+    rnd = random.Random(42)
+    for start in range(0, documents, 1000):
+        await BenchmarkOrder.bulk_insert([_order(i, rnd) for i in range(start, min(start + 1000, documents))])
+    client.close()
+
+
+def _negotiated(before: dict, after: dict) -> str:
+    compression_before = before['network'].get('compression', {})
+    for name, counters in after['network'].get('compression', {}).items():
+        sent = counters['compressor']['bytesOut'] - compression_before.get(name, {}).get('compressor', {}).get(
+            'bytesOut', 0)
+        if sent > 0:
+            return name
+    return 'none'
+
+
+async def measure(host: str, options: dict, documents: int, page_size: int, rounds: int) -> dict | None:
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        client = AsyncIOMotorClient(host, **options)
+    if any('compression' in str(warning.message) for warning in caught):
+        client.close()
+        return None
+    config.mongo_database = client[DATABASE]
+    pages = math.ceil(documents / page_size)
+    await BenchmarkOrder.find_by_query({}, page=1, page_size=page_size, sort_by='_id')  # connect and warm up
+    before = await client.admin.command('serverStatus')
+    wall, cpu = time.perf_counter(), time.process_time()
+    fetched = 0
+    for _ in range(rounds):
+        for page in range(1, pages + 1):
+            fetched += len(await BenchmarkOrder.find_by_query({}, page=page, page_size=page_size, sort_by='_id'))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    after = await client.admin.command('serverStatus')
+    client.close()
+    return {
+        'docs_per_second': fetched / wall,
+        'cpu_per_10k': cpu / fetched * 10_000,
+        'megabytes_out': (after['network']['bytesOut'] - before['network']['bytesOut']) / 1_000_000,
+        'negotiated': _negotiated(before, after),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='mongodb://localhost:27017')
+    parser.add_argument('--documents', type=int, default=20_000)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark database')
+    args = parser.parse_args()
+
+    await seed(args.host, args.documents)
+    print(f'{args.documents} documents, pages of {args.page_size}, {args.rounds} rounds\n')
+    print(f"{'setting':<16}{'negotiated':>12}{'docs/s':>12}{'CPU s/10k':>12}{'MB sent':>12}")
+    for name, options in SETTINGS:
+        result = await measure(args.host, options, args.documents, args.page_size, args.rounds)
+        if result is None:
+            print(f'{name:<16}{"not available in this environment":>48}')
+            continue
+        print(f"{name:<16}{result['negotiated']:>12}{result['docs_per_second']:>12.0f}"
+              f"{result['cpu_per_10k']:>12.3f}{result['megabytes_out']:>12.1f}")
+    if not args.keep:
+        client = AsyncIOMotorClient(args.host)
+        await client.drop_database(DATABASE)
+        client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
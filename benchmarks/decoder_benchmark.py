@@ -0,0 +1,92 @@
+"""Decoding throughput of raw BSON batches inline, in a thread pool and in a process pool.
+
+Needs no database: the documents are generated and encoded to BSON up front, as
+``find_raw_batches`` would return them, and then decoded into Model instances::
+
+    python benchmarks/decoder_benchmark.py --documents 200000 --batch-size 1000 --workers 4
+
+Reports the documents per second of each decoder (``appkernel.mongo.decoder_pool``); the process
+pool includes sending the batches to the workers and the pickled Models back.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bson
+from bson.codec_options import CodecOptions
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from appkernel import Model  # noqa: E402
+from appkernel.hydration import decode_raw_batches  # noqa: E402
+
+CODEC_OPTIONS = CodecOptions(tz_aware=False)
+
+
+class Line(Model):
+    sku: str | None = None
+    quantity: int | None = None
+    price: float | None = None
+
+
+class Order(Model):
+    id: str | None = None
+    customer: str | None = None
+    status: str | None = None
+    total: float | None = None
+    created: datetime | None = None
+    lines: list[Line] | None = None
+
+
+def raw_batches(documents: int, batch_size: int) -> list[bytes]:
+    started = datetime(2024, 1, 1)
+    batches = []
+    for start in range(0, documents, batch_size):
+        batches.append(b''.join(bson.encode({
+            '_id': f'O{index}', 'customer': f'C{index % 5000}', 'status': 'NEW', 'total': index * 1.5,
+            'created': started + timedelta(seconds=index),
+            'lines': [{'_type': f'{__name__}.Line', 'sku': f'S{line}', 'quantity': line, 'price': 9.9}
+                      for line in range(3)],
+        }) for index in range(start, min(start + batch_size, documents))))
+    return batches
+
+
+async def decode_in(pool: Executor, batches: list[bytes]) -> int:
+    loop = asyncio.get_running_loop()
+    decoded = await asyncio.gather(*(loop.run_in_executor(pool, decode_raw_batches, Order, [batch], CODEC_OPTIONS)
+                                     for batch in batches))
+    return sum(len(models) for models in decoded)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    batches = raw_batches(args.documents, args.batch_size)
+    print(f'{args.documents} documents, batches of {args.batch_size}, {args.workers} workers\n')
+    print(f"{'decoder':<10}{'docs/s':>12}")
+    started = time.perf_counter()
+    decode_raw_batches(Order, batches, CODEC_OPTIONS)
+    print(f"{'inline':<10}{args.documents / (time.perf_counter() - started):>12.0f}")
+    pools = [('thread', ThreadPoolExecutor(max_workers=args.workers)),
+             ('process', ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')))]
+    for name, pool in pools:
+        with pool:
+            await decode_in(pool, batches[:args.workers])  # start the workers
+            started = time.perf_counter()
+            decoded = await decode_in(pool, batches)
+            print(f'{name:<10}{decoded / (time.perf_counter() - started):>12.0f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
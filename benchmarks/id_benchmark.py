@@ -0,0 +1,88 @@
+"""Insert throughput and ``_id`` index size of random and time ordered id generators.
+
+Needs a running MongoDB; the effect shows once the ``_id`` index outgrows the WiredTiger cache, so
+either insert a lot of documents or start a ``mongod`` with a small cache::
+
+    mongod --dbpath /tmp/id-benchmark --wiredTigerCacheSizeGB 0.25
+    python benchmarks/id_benchmark.py --host mongodb://localhost:27017 --documents 2000000
+
+For every generator inserts ``--documents`` small documents in batches of ``--batch-size`` into a
+fresh collection of the ``id_benchmark`` database and reports the documents per second (overall and
+of the last tenth, where random ids suffer the most), the size of the ``_id`` index and the number
+of pages the server read into its cache during the run. The database is dropped at the end unless
+``--keep`` is given.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from appkernel.generators import (  # noqa: E402
+    create_object_id_generator, create_ulid_generator, create_uuid7_generator, create_uuid_generator,
+)
+
+DATABASE = 'id_benchmark'
+GENERATORS = [
+    ('uuid4', create_uuid_generator('U')),
+    ('uuid7', create_uuid7_generator('U')),
+    ('ulid', create_ulid_generator('U')),
+    ('ObjectId', create_object_id_generator()),
+]
+
+
+def _pages_read(status: dict) -> int:
+    return status['wiredTiger']['cache']['pages read into cache']
+
+
+async def measure(database, name: str, generate, documents: int, batch_size: int) -> dict:
+    collection = database[f'orders_{name.lower()}']
+    await collection.drop()
+    status_before = await database.client.admin.command('serverStatus')
+    started = time.perf_counter()
+    tail_started = tail_from = None
+    for start in range(0, documents, batch_size):
+        if tail_from is None and start >= documents * 0.9:
+            tail_started, tail_from = time.perf_counter(), start
+        await collection.insert_many([{'_id': generate(), 'status': 'NEW', 'amount': index % 997, 'sequence': index}
+                                      for index in range(start, min(start + batch_size, documents))], ordered=False)
+    finished = time.perf_counter()
+    status_after = await database.client.admin.command('serverStatus')
+    stats = await database.command('collStats', collection.name)
+    return {
+        'docs_per_second': documents / (finished - started),
+        'tail_docs_per_second': (documents - tail_from) / (finished - tail_started) if tail_from is not None else 0,
+        'id_index_mb': stats['indexSizes']['_id_'] / 1_000_000,
+        'pages_read': _pages_read(status_after) - _pages_read(status_before),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='mongodb://localhost:27017')
+    parser.add_argument('--documents', type=int, default=500_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark database')
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(args.host)
+    database = client[DATABASE]
+    print(f'{args.documents} documents, batches of {args.batch_size}\n')
+    print(f"{'generator':<12}{'docs/s':>12}{'last 10%':>12}{'_id MB':>10}{'pages read':>12}")
+    for name, generate in GENERATORS:
+        result = await measure(database, name, generate, args.documents, args.batch_size)
+        print(f"{name:<12}{result['docs_per_second']:>12.0f}{result['tail_docs_per_second']:>12.0f}"
+              f"{result['id_index_mb']:>10.1f}{result['pages_read']:>12}")
+    if not args.keep:
+        await client.drop_database(DATABASE)
+    client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,482 @@
+"""In-memory stand-ins for the Motor database, collection and cursor, shared by the unit tests.
+
+The fakes keep the documents by ``_id`` and evaluate the subset of the query and update
+language the repository sends (comparison, ``$in``, ``$exists`` and logical operators; ``$set``,
+``$unset``, ``$inc``, ``$rename``, ``$push`` and ``$addToSet``; update pipelines of ``$set`` and
+``$replaceWith`` stages). Every call is recorded, so a test can assert on what was sent. Tests
+needing more (a ``$sample``, a failure) subclass them and override the method::
+
+    @pytest.fixture
+    def collection(monkeypatch):
+        return patch_collection(monkeypatch, User, FakeCollection('Users', [{'_id': 'U1', 'name': 'Jane'}]))
+"""
+import copy
+from typing import Any
+
+from bson import ObjectId
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from pymongo import ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+_MISSING = object()
+
+
+def field_value(document: dict, path: str) -> Any:
+    """The value at the dotted ``path`` of ``document``; ``_MISSING`` when absent."""
+    value: Any = document
+    for segment in path.split('.'):
+        if isinstance(value, dict) and segment in value:
+            value = value[segment]
+        elif isinstance(value, list) and segment.isdigit() and int(segment) < len(value):
+            value = value[int(segment)]
+        else:
+            return _MISSING
+    return value
+
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    if operator == '$exists':
+        return (value is not _MISSING) == bool(operand)
+    if operator == '$in':
+        candidates = value if isinstance(value, list) else [value]
+        return any(candidate in operand for candidate in candidates)
+    if operator == '$nin':
+        return not _compare(value, '$in', operand)
+    if operator == '$ne':
+        return not _compare(value, '$eq', operand)
+    if operator == '$eq':
+        return value == operand or (isinstance(value, list) and operand in value)
+    if operator == '$not':
+        return not _condition_matches(value, operand)
+    if value is _MISSING or value is None:
+        return False
+    try:
+        return {'$gt': value > operand, '$gte': value >= operand,
+                '$lt': value < operand, '$lte': value <= operand}.get(operator, True)
+    except TypeError:
+        return False
+
+
+def _condition_matches(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+        return all(_compare(value, operator, operand) for operator, operand in condition.items()
+                   if operator != '$options')
+    return _compare(value, '$eq', condition)
+
+
+def matches(document: dict, query: dict | None) -> bool:
+    """Whether ``document`` matches ``query``; operators the fakes do not know (``$text``, ``$expr``) match."""
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(document, part) for part in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(document, part) for part in condition):
+                return False
+        elif key.startswith('$'):
+            continue
+        elif not _condition_matches(field_value(document, key), condition):
+            return False
+    return True
+
+
+def apply_update(document: dict, update: dict) -> None:
+    """Apply the operators of ``update`` to ``document`` in place (top-level fields)."""
+    for operator, changes in update.items():
+        for key, value in changes.items():
+            if operator == '$set':
+                document[key] = value
+            elif operator == '$unset':
+                document.pop(key, None)
+            elif operator == '$inc':
+                document[key] = document.get(key, 0) + value
+            elif operator == '$rename':
+                if key in document:
+                    document[value] = document.pop(key)
+            elif operator == '$push':
+                document.setdefault(key, []).extend(value['$each'] if isinstance(value, dict) else [value])
+            elif operator == '$addToSet':
+                items = document.setdefault(key, [])
+                items.extend(item for item in (value['$each'] if isinstance(value, dict) else [value])
+                             if item not in items)
+
+
+def evaluate(expression: Any, root: dict) -> Any:
+    """The value of the aggregation ``expression`` for the document ``root`` (the subset the repository sends)."""
+    if isinstance(expression, str):
+        if expression == '$$ROOT':
+            return copy.deepcopy(root)
+        if expression.startswith('$'):
+            value = field_value(root, expression[1:])
+            return None if value is _MISSING else copy.deepcopy(value)
+        return expression
+    if isinstance(expression, list):
+        return [evaluate(item, root) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) == 1:
+        operator, argument = next(iter(expression.items()))
+        if operator == '$literal':
+            return copy.deepcopy(argument)
+        if operator == '$mergeObjects':
+            merged = {}
+            for item in evaluate(argument, root):
+                merged.update(item or {})
+            return merged
+        if operator == '$ifNull':
+            value, default = evaluate(argument, root)
+            return default if value is None else value
+        if operator == '$add':
+            return sum(evaluate(argument, root))
+        if operator == '$eq':
+            left, right = evaluate(argument, root)
+            return left == right
+        if operator == '$cond':
+            condition, then, otherwise = argument
+            return evaluate(then if evaluate(condition, root) else otherwise, root)
+    return {key: evaluate(value, root) for key, value in expression.items()}
+
+
+def apply_pipeline(document: dict, pipeline: list) -> None:
+    """Apply the ``$set`` and ``$replaceWith`` stages of an update ``pipeline`` to ``document`` in place."""
+    for stage in pipeline:
+        if '$replaceWith' in stage:
+            replacement = evaluate(stage['$replaceWith'], document)
+        else:
+            replacement = copy.deepcopy(document)
+            for key, expression in stage['$set'].items():
+                *parents, name = key.split('.')
+                node = replacement
+                for parent in parents:
+                    node = node.setdefault(parent, {})
+                node[name] = evaluate(expression, document)
+        document.clear()
+        document.update(replacement)
+
+
+def _update(document: dict, update: Any) -> None:
+    if isinstance(update, list):
+        apply_pipeline(document, update)
+    else:
+        apply_update(document, update)
+
+
+def project(document: dict | None, projection: Any) -> dict | None:
+    """``document`` reduced to the fields of an inclusion ``projection``."""
+    if document is None or not projection:
+        return document
+    fields = projection if isinstance(projection, (list, tuple)) else \
+        [name for name, included in projection.items() if included]
+    return {key: value for key, value in document.items() if key == '_id' or key in fields}
+
+
+def _sort_key(field_name: str):
+    def key(document):
+        value = field_value(document, field_name)
+        return (value is not _MISSING and value is not None, None if value is _MISSING else value)
+    return key
+
+
+class FakeCursor:
+    """A cursor over a list of documents: ``sort``, ``skip``, ``limit``, ``to_list`` and async iteration."""
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.calls = []
+        self.sorting = None
+        self.consumed = 0
+        self.closed = False
+
+    def batch_size(self, size):
+        self.calls.append(('batch_size', size))
+        return self
+
+    def sort(self, sorting, direction=None):
+        self.sorting = sorting if direction is None else (sorting, direction)
+        keys = [(sorting, direction or 1)] if isinstance(sorting, str) else list(sorting or [])
+        for field_name, order in reversed(keys):
+            if isinstance(order, int):
+                self.documents.sort(key=_sort_key(field_name), reverse=order < 0)
+        return self
+
+    def skip(self, count):
+        self.calls.append(('skip', count))
+        self.documents = self.documents[count:]
+        return self
+
+    def limit(self, count):
+        self.calls.append(('limit', count))
+        if count:
+            self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length=None):
+        self.consumed = len(self.documents)
+        return [copy.deepcopy(document) for document in self.documents[:length or None]]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed >= len(self.documents):
+            raise StopAsyncIteration
+        self.consumed += 1
+        return copy.deepcopy(self.documents[self.consumed - 1])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    """An in-memory collection recording its calls.
+
+    ``calls`` lists ``(method, filter or pipeline or documents)`` of every call, ``updates`` the
+    ``(filter, update)`` of every update, ``options`` the keyword arguments of the last call per method
+    and ``cursors`` the cursors handed out by ``find`` and ``aggregate``.
+    """
+    codec_options = DEFAULT_CODEC_OPTIONS
+    cursor_class = FakeCursor
+
+    def __init__(self, name='collection', documents=(), database=None):
+        self.name = name
+        self.database = database
+        self.documents = {}
+        self.calls = []
+        self.updates = []
+        self.options = {}
+        self.cursors = []
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+        self.created_indexes = []
+        self.collection_options = {}
+        for document in documents:
+            self._store(copy.deepcopy(document))
+
+    def _record(self, method, argument, options):
+        self.calls.append((method, argument))
+        self.options[method] = options
+
+    def _store(self, document):
+        document.setdefault('_id', ObjectId())
+        self.documents[document['_id']] = document
+        return document['_id']
+
+    def _matching(self, query):
+        return [document for document in self.documents.values() if matches(document, query)]
+
+    def _cursor(self, documents):
+        cursor = self.cursor_class(documents)
+        self.cursors.append(cursor)
+        return cursor
+
+    @property
+    def queries(self):
+        return [argument for method, argument in self.calls if method in ('find', 'find_one')]
+
+    @property
+    def pipelines(self):
+        return [argument for method, argument in self.calls if method == 'aggregate']
+
+    def with_options(self, **options):
+        routed = copy.copy(self)
+        routed.collection_options = options
+        return routed
+
+    # -- reads ------------------------------------------------------------------------------
+
+    def find(self, query=None, *args, **kwargs):
+        self._record('find', query, kwargs)
+        return self._cursor(self._matching(query))
+
+    async def find_one(self, query=None, projection=None, sort=None, **kwargs):
+        self._record('find_one', query, kwargs)
+        documents = self._matching(query)
+        for field_name, order in reversed(sort or []):
+            documents.sort(key=_sort_key(field_name), reverse=order < 0)
+        return project(copy.deepcopy(documents[0]), projection) if documents else None
+
+    def aggregate(self, pipeline, **kwargs):
+        self._record('aggregate', pipeline, kwargs)
+        return self._cursor(self.aggregate_documents(pipeline))
+
+    def aggregate_documents(self, pipeline):
+        """The result of an aggregation: the stored documents, unless overridden."""
+        return list(self.documents.values())
+
+    async def count_documents(self, query, **kwargs):
+        self._record('count_documents', query, kwargs)
+        return len(self._matching(query))
+
+    async def estimated_document_count(self, **kwargs):
+        self._record('estimated_document_count', None, kwargs)
+        return len(self.documents)
+
+    # -- writes -----------------------------------------------------------------------------
+
+    async def insert_one(self, document, **kwargs):
+        self._record('insert_one', document, kwargs)
+        if document.get('_id') in self.documents:
+            raise DuplicateKeyError('E11000 duplicate key error')
+        document.setdefault('_id', ObjectId())
+        return InsertOneResult(self._store(copy.deepcopy(document)), True)
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        self._record('insert_many', documents, {'ordered': ordered, **kwargs})
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+            self._store(copy.deepcopy(document))
+        return InsertManyResult([document['_id'] for document in documents], True)
+
+    async def replace_one(self, query, document, upsert=False, **kwargs):
+        self._record('replace_one', query, kwargs)
+        matching = self._matching(query)
+        if not matching and not upsert:
+            return UpdateResult({'n': 0, 'nModified': 0}, True)
+        object_id = matching[0]['_id'] if matching else query.get('_id', ObjectId())
+        self.documents[object_id] = {**copy.deepcopy(document), '_id': object_id}
+        return UpdateResult({'n': 1, 'nModified': 1 if matching else 0}, True)
+
+    def _upsert(self, query, update):
+        document = {key: value for key, value in query.items() if not key.startswith('$')
+                    and not isinstance(value, dict)}
+        if document.get('_id') in self.documents:
+            raise DuplicateKeyError('E11000 duplicate key error')
+        if isinstance(update, dict):
+            apply_update(document, {'$set': update.get('$setOnInsert', {})})
+        self._store(document)
+        return document
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        self._record('update_one', query, kwargs)
+        self.updates.append((query, update))
+        matching = self._matching(query)[:1]
+        for document in matching:
+            _update(document, update)
+        if not matching and upsert:
+            _update(self._upsert(query, update), update)
+        return UpdateResult({'n': len(matching), 'nModified': len(matching)}, True)
+
+    async def update_many(self, query, update, **kwargs):
+        self._record('update_many', query, kwargs)
+        self.updates.append((query, update))
+        matching = self._matching(query)
+        for document in matching:
+            _update(document, update)
+        return UpdateResult({'n': len(matching), 'nModified': len(matching)}, True)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE, **kwargs):
+        self._record('find_one_and_update', query, kwargs)
+        self.updates.append((query, update))
+        matching = self._matching(query)
+        if not matching and not upsert:
+            return None
+        document = matching[0] if matching else self._upsert(query, update)
+        before = copy.deepcopy(document) if matching else None
+        _update(document, update)
+        result = copy.deepcopy(document) if return_document == ReturnDocument.AFTER else before
+        return project(result, projection)
+
+    async def delete_one(self, query, **kwargs):
+        self._record('delete_one', query, kwargs)
+        matching = self._matching(query)[:1]
+        for document in matching:
+            del self.documents[document['_id']]
+        return DeleteResult({'n': len(matching)}, True)
+
+    async def delete_many(self, query, **kwargs):
+        self._record('delete_many', query, kwargs)
+        matching = self._matching(query)
+        for document in matching:
+            del self.documents[document['_id']]
+        return DeleteResult({'n': len(matching)}, True)
+
+    async def bulk_write(self, operations, ordered=True, **kwargs):
+        self._record('bulk_write', operations, {'ordered': ordered, **kwargs})
+        counts = {'nInserted': 0, 'nMatched': 0, 'nModified': 0, 'nUpserted': 0, 'nRemoved': 0, 'upserted': []}
+        for operation in operations:
+            kind = type(operation).__name__
+            if kind == 'InsertOne':
+                self._store(copy.deepcopy(operation._doc))
+                counts['nInserted'] += 1
+            elif kind in ('DeleteOne', 'DeleteMany'):
+                counts['nRemoved'] += (await getattr(self, 'delete_one' if kind == 'DeleteOne' else 'delete_many')(
+                    operation._filter)).deleted_count
+            else:
+                matching = self._matching(operation._filter)
+                matching = matching[:1] if kind != 'UpdateMany' else matching
+                for document in matching:
+                    if kind == 'ReplaceOne':
+                        self.documents[document['_id']] = {**operation._doc, '_id': document['_id']}
+                    else:
+                        _update(document, operation._doc)
+                counts['nMatched'] += len(matching)
+                counts['nModified'] += len(matching)
+        return BulkWriteResult(counts, True)
+
+    # -- indexes and administration ---------------------------------------------------------
+
+    async def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+    async def create_index(self, keys, **kwargs):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = kwargs.get('name') or '_'.join(f'{field_name}_{order}' for field_name, order in keys)
+        self.created_indexes.append((keys, kwargs))
+        self.indexes[name] = {'key': keys, **{key: value for key, value in kwargs.items() if key != 'name'}}
+        return name
+
+    async def drop_index(self, name, **kwargs):
+        self.indexes.pop(name, None)
+
+    async def rename(self, new_name, dropTarget=False, **kwargs):
+        self._record('rename', new_name, {'dropTarget': dropTarget, **kwargs})
+        if self.database is not None:
+            self.database.renamed.append((self.name, new_name))
+            target = self.database.get_collection(new_name)
+            target.documents = self.documents
+            self.documents = {}
+
+    async def drop(self):
+        self.documents.clear()
+
+
+class FakeDatabase:
+    """Collections by name, with the collection management commands the repository sends."""
+
+    def __init__(self, collection_class=FakeCollection):
+        self.collection_class = collection_class
+        self.collections = {}
+        self.created = []
+        self.commands = []
+        self.renamed = []
+
+    def get_collection(self, name, **kwargs):
+        if name not in self.collections:
+            self.collections[name] = self.collection_class(name, database=self)
+        return self.collections[name]
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    async def create_collection(self, name, **kwargs):
+        if name in self.collections:
+            raise CollectionInvalid(f'collection {name} already exists')
+        self.created.append((name, kwargs))
+        return self.get_collection(name)
+
+    async def list_collection_names(self, filter=None, **kwargs):
+        return [name for name in self.collections if not filter or filter.get('name', name) == name]
+
+    async def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+        return {'ok': 1}
+
+
+def patch_collection(monkeypatch, model_class, collection):
+    """Make ``model_class`` read and write ``collection``; returns the collection."""
+    monkeypatch.setattr(model_class, 'get_collection', classmethod(lambda cls: collection))
+    return collection
@@ -0,0 +1,148 @@
+"""Live MongoDB tests of the server-side behaviour which the fakes of the unit tests only emulate.
+Needs a mongod on localhost (5.0+ for the time-series collection).
+"""
+from datetime import datetime
+from typing import Annotated, ClassVar
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from appkernel import GeoPoint, GeoPolygon, MaterializedView, Model, MongoGeoIndex, MongoRepository, TimeSeriesOptions
+from appkernel.configuration import config
+from appkernel.materialized import METADATA_COLLECTION, _status_cache, refresh_view
+from appkernel.repository import RepositoryException, VersionConflictError
+from .utils import run_async
+
+MAY_1, MAY_2 = datetime(2024, 5, 1), datetime(2024, 5, 2)
+
+
+class Purchase(Model, MongoRepository):
+    id: str | None = None
+    total: float | None = None
+    sequence: int | None = None
+
+
+class PurchaseTotal(Model, MongoRepository):
+    id: str | None = None
+    revenue: float | None = None
+    materialized_view: ClassVar[MaterializedView] = MaterializedView(
+        source=Purchase,
+        pipeline=[{'$group': {'_id': None, 'revenue': {'$sum': '$total'}}}],
+        watermark_field='sequence',
+        when_matched=[{'$set': {'revenue': {'$add': ['$revenue', '$$new.revenue']}}}],
+    )
+
+
+class Listing(Model, MongoRepository):
+    id: str | None = None
+    title: str | None = None
+
+
+class Store(Model, MongoRepository):
+    id: str | None = None
+    name: str | None = None
+    location: Annotated[GeoPoint | None, MongoGeoIndex()] = None
+
+
+class Sample(Model, MongoRepository):
+    id: str | None = None
+    sensor: str | None = None
+    taken: datetime | None = None
+    value: float | None = None
+    time_series: ClassVar[TimeSeriesOptions] = TimeSeriesOptions(
+        time_field='taken', meta_field='sensor', granularity='minutes', expire_after_seconds=86400)
+
+
+def setup_module(module):
+    config.mongo_database = AsyncIOMotorClient(host='localhost')['appkernel']
+
+
+async def _reset():
+    for model_class in (Purchase, Listing, Store):
+        await model_class.delete_all()
+    for model_class in (PurchaseTotal, Sample):
+        await model_class.get_collection().drop()
+    await config.mongo_database.get_collection(METADATA_COLLECTION).delete_one(
+        {'_id': PurchaseTotal.get_collection().name})
+    _status_cache.clear()
+
+
+def setup_function(function):
+    run_async(_reset())
+
+
+@pytest.mark.anyio
+async def test_save_updates_with_a_pipeline_and_detects_conflicts():
+    listing = Listing(title='first')
+    await listing.save()
+    listing.title = 'second'
+    await listing.save()
+    listing.title = 'third'
+    await listing.save()
+    assert listing.version == 3
+    stored = await Listing.get_collection().find_one({'_id': listing.id})
+    assert (stored['title'], stored['version']) == ('third', 3)
+
+    stale = Listing(id=listing.id, title='lost update', version=2)
+    with pytest.raises(VersionConflictError):
+        await stale.save()
+    stored = await Listing.get_collection().find_one({'_id': listing.id})
+    assert (stored['title'], stored['version']) == ('third', 3)
+
+
+@pytest.mark.anyio
+async def test_save_does_not_recreate_a_deleted_document():
+    assert await Listing(id='L1', title='gone', version=4).save() is None
+    assert await Listing.find_by_id('L1') is None
+
+
+@pytest.mark.anyio
+async def test_read_model_is_rebuilt_then_merged():
+    for sequence, total in ((1, 10.0), (2, 20.0)):
+        await Purchase(total=total, sequence=sequence).save()
+    stats = await refresh_view(PurchaseTotal)
+    assert (stats.mode, stats.watermark) == ('full', 2)
+    assert (await PurchaseTotal.get_collection().find_one({}))['revenue'] == 30.0
+
+    await Purchase(total=5.0, sequence=3).save()
+    stats = await refresh_view(PurchaseTotal)
+    assert (stats.mode, stats.watermark, stats.refresh_count) == ('incremental', 3, 2)
+    assert await PurchaseTotal.get_collection().count_documents({}) == 1
+    assert (await PurchaseTotal.get_collection().find_one({}))['revenue'] == 35.0
+
+
+@pytest.mark.anyio
+async def test_geo_queries_use_the_2dsphere_index():
+    await Store.init_indexes()
+    indexes = await Store.get_collection().index_information()
+    assert [('location', '2dsphere')] in [index['key'] for index in indexes.values()]
+    await Store(name='Mitte', location=GeoPoint.of(13.405, 52.52)).save()
+    await Store(name='Steglitz', location=GeoPoint.of(13.32, 52.457)).save()
+    await Store(name='Paris', location=GeoPoint.of(2.35, 48.857)).save()
+
+    near = await Store.where(Store.location.near(GeoPoint.of(13.4, 52.52), max_distance=1000)).find()
+    assert [store.name for store in near] == ['Mitte']
+    boxed = await Store.where(Store.location.within(GeoPolygon.box(13.3, 52.4, 13.5, 52.6))).find()
+    assert sorted(store.name for store in boxed) == ['Mitte', 'Steglitz']
+    around = await Store.where(Store.location.within_radius(GeoPoint.of(13.4, 52.5), 20_000)).find()
+    assert sorted(store.name for store in around) == ['Mitte', 'Steglitz']
+
+
+@pytest.mark.anyio
+async def test_time_series_collection_is_created_and_queried():
+    await Sample.init_indexes()
+    names = await config.mongo_database.list_collection_names(filter={'name': 'Samples', 'type': 'timeseries'})
+    assert names == ['Samples']
+    await Sample.init_indexes()
+
+    sample = Sample(sensor='s1', taken=MAY_1, value=1.0)
+    await sample.save()
+    with pytest.raises(RepositoryException):
+        await sample.save()
+    await Sample.bulk_insert([Sample(sensor=sensor, taken=datetime(2024, 5, 1, hour), value=hour)
+                              for hour, sensor in enumerate('abab', start=1)])
+
+    page = await Sample.find_time_range(MAY_1, MAY_2, meta='a')
+    assert [(reading.taken.hour, reading.value) for reading in page] == [(1, 1), (3, 3)]
+    assert len(await Sample.find_time_range(MAY_1, MAY_2)) == 5
+    assert len(await Sample.find_time_range(end=MAY_1)) == 0
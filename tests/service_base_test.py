@@ -241,6 +241,27 @@ def test_pagination_with_sort(client):
         assert result_set.get('_items')[0].get('sequence') == 55 - (page * 5)
 
 
+def test_pagination_with_total(client):
+    run_async(create_and_save_some_users())
+    rsp = client.get('/users/?page=2&page_size=5&sort_by=sequence&count_mode=exact')
+    print(f'\nResponse: {rsp.status_code} -> {rsp.content}')
+    assert rsp.status_code == 200
+    result_set = rsp.json()
+    assert len(result_set.get('_items')) == 5
+    assert result_set.get('_items')[0].get('sequence') == 6
+    assert result_set.get('_total') == 50
+    assert result_set.get('_page') == 2
+    assert result_set.get('_page_size') == 5
+
+
+def test_pagination_without_count(client):
+    run_async(create_and_save_some_users())
+    rsp = client.get('/users/?page_size=5')
+    assert rsp.status_code == 200
+    assert '_total' not in rsp.json()
+    assert client.get('/users/?count_mode=approx').status_code == 400
+
+
 def test_default_pagination(client):
     run_async(create_and_save_some_users(urange=101))
     rsp = client.get('/users/')
@@ -461,6 +482,22 @@ def test_aggregate_allowed_stages_work_via_http(client):
     assert rsp.json().get('_items')[0].get('name') == 'Jane'
 
 
+def test_aggregate_streams_full_result(client):
+    run_async(create_and_save_some_users())
+    pipe = json.dumps([{'$sort': {'sequence': 1}}])
+    rsp = client.get(f'/users/aggregate/?pipe={pipe}&batch_size=7')
+    assert rsp.status_code == 200
+    items = rsp.json().get('_items')
+    assert len(items) == 50
+    assert [item.get('sequence') for item in items] == list(range(1, 51))
+
+
+def test_aggregate_trusted_flag_ignored_via_http(client):
+    pipe = json.dumps([{'$lookup': {'from': 'other', 'localField': 'id', 'foreignField': 'id', 'as': 'x'}}])
+    rsp = client.get(f'/users/aggregate/?pipe={pipe}&trusted=true')
+    assert rsp.status_code == 403
+
+
 def test_aggregate_lookup_blocked_via_http(client):
     """$lookup must be rejected over HTTP to prevent cross-collection data exfiltration."""
     pipe = json.dumps([{'$lookup': {'from': 'other_collection', 'localField': 'id', 'foreignField': 'user_id', 'as': 'leaked'}}])
@@ -0,0 +1,100 @@
+"""Tests for streamed aggregation: aggregate_stream(), the time budget wrapper and the HTTP envelope."""
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from appkernel import AppKernelEngine
+from appkernel.service import _stream_list_envelope
+from appkernel.time_budget import stream_with_time_budget
+from tests.fakes import FakeCollection, patch_collection
+from tests.utils import User
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, User, FakeCollection('users', [{'_id': i, 'name': f'user_{i}'}
+                                                                        for i in range(250)]))
+
+
+async def _collect(stream, limit=None):
+    items = []
+    async for item in stream:
+        items.append(item)
+        if limit and len(items) == limit:
+            break
+    return items
+
+
+def test_stream_yields_every_document(collection):
+    items = asyncio.run(_collect(User.aggregate_stream([{'$match': {}}], batch_size=20, trusted=True)))
+    assert len(items) == 250
+    assert collection.pipelines[-1] == [{'$match': {}}]
+    assert collection.options['aggregate']['batchSize'] == 20
+    assert collection.cursors[-1].closed
+
+
+def test_stream_appends_limit(collection):
+    asyncio.run(_collect(User.aggregate_stream([{'$match': {}}], max_results=10)))
+    assert collection.pipelines[-1] == [{'$match': {}}, {'$limit': 10}]
+
+
+def test_untrusted_stream_is_capped(collection):
+    asyncio.run(_collect(User.aggregate_stream([{'$match': {}}])))
+    assert collection.pipelines[-1] == [{'$match': {}}, {'$limit': 10_000}]
+    asyncio.run(_collect(User.aggregate_stream([{'$match': {}}], max_results=50_000)))
+    assert collection.pipelines[-1] == [{'$match': {}}, {'$limit': 10_000}]
+
+
+def test_stream_is_lazy_and_closes_cursor_on_early_stop(collection):
+    async def scenario():
+        stream = User.aggregate_stream([{'$match': {}}])
+        items = await _collect(stream, limit=5)
+        await stream.aclose()
+        return items
+
+    assert len(asyncio.run(scenario())) == 5
+    assert collection.cursors[-1].consumed == 5
+    assert collection.cursors[-1].closed
+
+
+def test_stream_validates_pipeline(collection):
+    with pytest.raises(PermissionError):
+        asyncio.run(_collect(User.aggregate_stream([{'$out': 'copy'}])))
+
+
+def test_budget_wrapper_closes_inner_stream(collection):
+    async def scenario():
+        stream = stream_with_time_budget(User.aggregate_stream([{'$match': {}}]), 1000)
+        items = await _collect(stream, limit=3)
+        await stream.aclose()
+        return items
+
+    assert len(asyncio.run(scenario())) == 3
+    assert collection.cursors[-1].closed
+
+
+def test_envelope_is_valid_json_in_chunks(collection):
+    async def scenario():
+        stream = User.aggregate_stream([{'$match': {}}])
+        first = await stream.__anext__()
+        return [chunk async for chunk in _stream_list_envelope(User, first, stream)]
+
+    chunks = asyncio.run(scenario())
+    assert len(chunks) > 3
+    document = json.loads(''.join(chunks))
+    assert document['_type'] == 'list'
+    assert len(document['_items']) == 250
+    assert document['_items'][-1]['name'] == 'user_249'
+
+
+def test_http_aggregate_is_capped(collection):
+    app = FastAPI()
+    kernel = AppKernelEngine('aggregate-test', app=app, enable_defaults=True)
+    kernel.register(User, methods=['GET'])
+    with TestClient(app) as client:
+        response = client.get('/users/aggregate/?pipe=[{"$match":{}}]&max_results=50000&trusted=true')
+    assert response.status_code == 200
+    assert collection.pipelines[-1] == [{'$match': {}}, {'$limit': 10_000}]
@@ -0,0 +1,256 @@
+"""Tests for atomic_updates.py: operator and merge patch validation and the atomic PATCH endpoint."""
+import asyncio
+from datetime import datetime
+from enum import Enum
+from typing import Annotated, ClassVar
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from appkernel import AppKernelEngine, Max, Min, Model, MongoRepository, PatchRetryPolicy, Required, Validators
+from appkernel.atomic_updates import compile_json_patch, compile_operator_update, merge_patch_to_update
+from appkernel.repository import PatchTestFailedError
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+
+
+class Status(Enum):
+    NEW = 1
+    RESERVED = 2
+
+
+class Dimensions(Model):
+    width: int | None = None
+    height: int | None = None
+
+
+class Variant(Model):
+    sku: str | None = None
+    quantity: int | None = None
+
+
+class Product(Model, MongoRepository):
+    id: str | None = None
+    name: Annotated[str | None, Required()] = None
+    stock: Annotated[int | None, Validators(Min(0), Max(1000))] = None
+    price: float | None = None
+    status: Status | None = None
+    tags: list[str] | None = None
+    ratings: list[int] | None = None
+    size: Dimensions | None = None
+    variants: list[Variant] | None = None
+    updated: datetime | None = None
+
+
+class Counter(Model, MongoRepository):
+    id: str | None = None
+    hits: int | None = None
+    patch_retry: ClassVar[PatchRetryPolicy] = PatchRetryPolicy()
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = FakeCollection('Products', [{'_id': 'P1', 'name': 'Lamp', 'stock': 10, 'status': 'RESERVED', 'version': 3,
+                                         'variants': [{'sku': 'S', 'quantity': 1}, {'sku': 'M', 'quantity': 1}]}])
+    patch_collection(monkeypatch, Counter, fake)
+    return patch_collection(monkeypatch, Product, fake)
+
+
+def test_operator_update_is_validated_and_converted():
+    update = compile_operator_update(Product, {
+        '$inc': {'stock': -1}, '$set': {'status': 'RESERVED', 'updated': '2024-05-01T10:00:00', 'size.width': 3},
+        '$addToSet': {'tags': 'sale'}, '$unset': {'price': ''}})
+    assert update['$set'] == {'status': 'RESERVED', 'updated': datetime(2024, 5, 1, 10), 'size.width': 3}
+    assert update['$inc'] == {'stock': -1}
+
+
+@pytest.mark.parametrize('update', [
+    {'$rename': {'name': 'title'}},
+    {'$set': {'colour': 'red'}},
+    {'$set': {'version': 7}},
+    {'$inc': {'id': 1}},
+    {'$inc': {'stock': 'one'}},
+    {'$inc': {'stock': True}},
+    {'$mul': {'name': 2}},
+    {'$unset': {'name': ''}},
+    {'$set': {'stock': 5000}},
+    {'$set': {'stock': 'many'}},
+    {'$set': {'size': {'width': 1}}, '$inc': {'size.width': 1}},
+    {'$set': {'size.$where': 1}},
+    {'$set': {}},
+    {},
+])
+def test_invalid_operator_updates(update):
+    with pytest.raises(ValidationException):
+        compile_operator_update(Product, update)
+
+
+def test_nested_and_array_values_are_validated():
+    update = compile_operator_update(Product, {
+        '$set': {'variants.1.quantity': '2', 'size.height': 4}, '$push': {'ratings': {'$each': ['4', 5], '$slice': -9}},
+        '$pull': {'tags': {'$in': ['old', 'stale']}}})
+    assert update['$set'] == {'variants.1.quantity': 2, 'size.height': 4}
+    assert update['$push'] == {'ratings': {'$each': [4, 5], '$slice': -9}}
+    update = compile_operator_update(Product, {'$addToSet': {'variants': {'sku': 'B', 'quantity': '1'}}})
+    assert {key: update['$addToSet']['variants'][key] for key in ('sku', 'quantity')} == {'sku': 'B', 'quantity': 1}
+    assert compile_operator_update(Product, {'$pull': {'ratings': {'$lt': 2}}}) == {'$pull': {'ratings': {'$lt': 2}}}
+
+
+@pytest.mark.parametrize('update', [
+    {'$push': {'ratings': 'notanint'}},
+    {'$addToSet': {'ratings': {'$each': [1, 'x']}}},
+    {'$addToSet': {'ratings': {'$each': [1], '$position': 0}}},
+    {'$push': {'ratings': {'$each': [1], '$slice': 'x'}}},
+    {'$push': {'ratings': {'$position': 0}}},
+    {'$push': {'name': 'x'}},
+    {'$pull': {'ratings': {'$where': 'true'}}},
+    {'$pull': {'ratings': {'$in': 3}}},
+    {'$set': {'size.width': 'abc'}},
+    {'$set': {'size.depth': 1}},
+    {'$set': {'name.first': 'x'}},
+    {'$set': {'variants.0.quantity': 'many'}},
+    {'$set': {'variants.first.quantity': 1}},
+    {'$max': {'ratings.0': 'x'}},
+    {'$unset': {'ratings.0': ''}},
+])
+def test_invalid_nested_and_array_updates(update):
+    with pytest.raises(ValidationException):
+        compile_operator_update(Product, update)
+
+
+def test_merge_patch_translation():
+    assert merge_patch_to_update({'name': 'Desk', 'price': None, 'size': {'width': 120, 'height': None}}) == {
+        '$set': {'name': 'Desk', 'size.width': 120}, '$unset': {'price': '', 'size.height': ''}}
+    with pytest.raises(ValidationException):
+        merge_patch_to_update(['name'])
+    with pytest.raises(ValidationException):
+        compile_operator_update(Product, merge_patch_to_update({'size': {'width': 'abc'}}))
+    with pytest.raises(ValidationException):
+        compile_operator_update(Product, merge_patch_to_update({'size': {'colour': 'red'}}))
+
+
+def test_update_fields_is_one_atomic_update(collection):
+    product = asyncio.run(Product.update_fields('P1', {'$inc': {'stock': -1}}))
+    assert (product.id, product.stock, product.status, product.version) == ('P1', 9, Status.RESERVED, 4)
+    assert collection.updates == [({'_id': 'P1'}, {'$inc': {'stock': -1, 'version': 1}})]
+    assert asyncio.run(Product.update_fields('missing', {'$inc': {'stock': 1}})) is None
+
+
+def test_update_fields_stamps_unknown_version(collection):
+    asyncio.run(Counter.update_fields('C1', {'$inc': {'hits': 1}}))
+    assert collection.updates[-1][1]['$set'] == {'_field_versions.hits': float('inf')}
+
+
+def test_patch_endpoint(collection):
+    app = FastAPI()
+    kernel = AppKernelEngine('atomic-update-test', app=app, enable_defaults=True)
+    kernel.register(Product, methods=['PATCH'])
+    with TestClient(app) as client:
+        response = client.patch('/products/P1', json={'$inc': {'stock': -1}, '$set': {'status': 'RESERVED'}})
+        assert response.status_code == 200
+        assert response.json()['stock'] == 9
+        response = client.patch('/products/P1', content=b'{"price": null, "size": {"width": 2}}',
+                                headers={'content-type': 'application/merge-patch+json'})
+        assert response.status_code == 200
+        assert client.patch('/products/P1', json={'$rename': {'name': 'title'}}).status_code == 400
+        assert client.patch('/products/missing', json={'$inc': {'stock': 1}}).status_code == 404
+    assert collection.updates[1][1] == {'$set': {'size.width': 2}, '$unset': {'price': ''}, '$inc': {'version': 1}}
+
+
+def test_json_patch_compiles_to_targeted_updates():
+    conditions, update = compile_json_patch(Product, [
+        {'op': 'test', 'path': '/version', 'value': 3},
+        {'op': 'replace', 'path': '/variants/4/quantity', 'value': 7},
+        {'op': 'add', 'path': '/tags/-', 'value': 'sale'},
+        {'op': 'add', 'path': '/tags/-', 'value': 'new'},
+        {'op': 'add', 'path': '/size/width', 'value': 3},
+        {'op': 'remove', 'path': '/price'},
+        {'op': 'replace', 'path': '/status', 'value': 'RESERVED'},
+    ])
+    assert conditions == {'version': 3, 'variants.4.quantity': {'$exists': True}, 'price': {'$exists': True},
+                          'status': {'$exists': True}}
+    assert update == {'$set': {'variants.4.quantity': 7, 'size.width': 3, 'status': 'RESERVED'},
+                      '$push': {'tags': {'$each': ['sale', 'new']}}, '$unset': {'price': ''}}
+
+
+def test_json_patch_array_elements():
+    _, update = compile_json_patch(Product, [{'op': 'add', 'path': '/variants/0',
+                                              'value': {'sku': 'A', 'quantity': 1}}])
+    assert update['$push']['variants']['$position'] == 0
+    assert update['$push']['variants']['$each'][0]['sku'] == 'A'
+    conditions, update = compile_json_patch(Product, [{'op': 'test', 'path': '/tags/2', 'value': 'old'},
+                                                      {'op': 'remove', 'path': '/tags/2'}])
+    assert (conditions, update) == ({'tags.2': 'old'}, {'$pull': {'tags': 'old'}})
+
+
+def test_json_patch_tests_compare_whole_values():
+    write = {'op': 'replace', 'path': '/price', 'value': 2.5}
+    conditions, _ = compile_json_patch(Product, [{'op': 'test', 'path': '/ratings', 'value': 3}, write])
+    assert conditions == {'$expr': {'$eq': ['$ratings', {'$literal': 3}]}, 'price': {'$exists': True}}
+    conditions, _ = compile_json_patch(Product, [{'op': 'test', 'path': '/ratings', 'value': ['3', 4]},
+                                                 {'op': 'test', 'path': '/variants/1', 'value': {'sku': 'A'}},
+                                                 {'op': 'test', 'path': '/variants/0/sku', 'value': 'B'}, write])
+    first, second = conditions['$expr']['$and']
+    assert first == {'$eq': ['$ratings', {'$literal': [3, 4]}]}
+    assert second['$eq'][0] == {'$arrayElemAt': ['$variants', 1]} and second['$eq'][1]['$literal']['sku'] == 'A'
+    assert conditions['variants.0.sku'] == 'B'
+
+
+@pytest.mark.parametrize('operations', [
+    [{'op': 'replace', 'path': '/size/width', 'value': 'abc'}],
+    [{'op': 'replace', 'path': '/size/depth', 'value': 1}],
+    [{'op': 'add', 'path': '/variants/0/quantity', 'value': 'many'}],
+    [{'op': 'add', 'path': '/ratings/-', 'value': 'x'}],
+    [{'op': 'replace', 'path': '/ratings/-', 'value': 1}],
+    [{'op': 'replace', 'path': '/stock', 'value': 2}, {'op': 'test', 'path': '/stock', 'value': 2}],
+    [{'op': 'add', 'path': '/tags/-', 'value': 'x'}, {'op': 'test', 'path': '/tags/0', 'value': 'x'}],
+])
+def test_invalid_nested_json_patches(operations):
+    with pytest.raises(ValidationException):
+        compile_json_patch(Product, operations)
+
+
+@pytest.mark.parametrize('operations', [
+    {'op': 'add', 'path': '/name', 'value': 'x'},
+    [],
+    [{'op': 'move', 'from': '/name', 'path': '/title'}],
+    [{'op': 'add', 'path': '/colour', 'value': 'red'}],
+    [{'op': 'replace', 'path': '/version', 'value': 9}],
+    [{'op': 'replace', 'path': '/stock'}],
+    [{'op': 'replace', 'path': '', 'value': {}}],
+    [{'op': 'remove', 'path': '/name'}],
+    [{'op': 'remove', 'path': '/tags/1'}],
+    [{'op': 'test', 'path': '/stock', 'value': 1}],
+    [{'op': 'replace', 'path': '/variants', 'value': []}, {'op': 'add', 'path': '/variants/-', 'value': {}}],
+])
+def test_invalid_json_patches(operations):
+    with pytest.raises(ValidationException):
+        compile_json_patch(Product, operations)
+
+
+def test_failed_json_patch_test(collection):
+    with pytest.raises(PatchTestFailedError):
+        asyncio.run(Product.apply_json_patch('P1', [{'op': 'test', 'path': '/version', 'value': 1},
+                                                    {'op': 'replace', 'path': '/stock', 'value': 2}]))
+    assert asyncio.run(Product.apply_json_patch('missing', [{'op': 'replace', 'path': '/stock', 'value': 2}])) \
+        is None
+
+
+def test_json_patch_endpoint(collection):
+    app = FastAPI()
+    kernel = AppKernelEngine('json-patch-test', app=app, enable_defaults=True)
+    kernel.register(Product, methods=['PATCH'])
+    patch = [{'op': 'test', 'path': '/version', 'value': 3},
+             {'op': 'replace', 'path': '/variants/1/quantity', 'value': 2}]
+    with TestClient(app) as client:
+        response = client.patch('/products/P1', json=patch, headers={'content-type': 'application/json-patch+json'})
+        assert response.status_code == 200
+        patch[0]['value'] = 1
+        response = client.patch('/products/P1', json=patch, headers={'content-type': 'application/json-patch+json'})
+        assert response.status_code == 409
+        response = client.patch('/products/P1', json={'op': 'remove', 'path': '/price'},
+                                headers={'content-type': 'application/json-patch+json'})
+        assert response.status_code == 400
+    assert collection.updates[0] == ({'_id': 'P1', 'version': 3, 'variants.1.quantity': {'$exists': True}},
+                                     {'$set': {'variants.1.quantity': 2}, '$inc': {'version': 1}})
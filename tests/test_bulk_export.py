@@ -0,0 +1,108 @@
+"""Tests for bulk.py and the export endpoint: negotiation, NDJSON/CSV serialisation and compression."""
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from appkernel.bulk import compress_chunks, csv_chunks, ndjson_chunks, negotiate_compression, negotiate_format
+from appkernel.service import _create_export_executor
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+from tests.utils import User
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, User, FakeCollection('Users', [
+        {'_id': f'U{i}', 'name': f'user_{i}', 'roles': ['User']} for i in range(450)]))
+
+
+_engine = SimpleNamespace(logger=logging.getLogger('test'),
+                          generic_error_handler=lambda exc, upstream_service=None: pytest.fail(str(exc)))
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def _export(query_params, headers=None):
+    async def scenario():
+        response = await _create_export_executor(User, _engine)(
+            request_data={'query_params': query_params, 'headers': headers or {}})
+        body = b''.join([chunk async for chunk in response.body_iterator]) \
+            if hasattr(response, 'body_iterator') else response.body
+        return response, body
+    return asyncio.run(scenario())
+
+
+def test_format_negotiation():
+    assert negotiate_format(None) == 'ndjson'
+    assert negotiate_format(None, 'text/csv') == 'csv'
+    assert negotiate_format('csv', 'application/json') == 'csv'
+    with pytest.raises(ValidationException):
+        negotiate_format('xml')
+
+
+def test_compression_negotiation():
+    assert negotiate_compression(None, 'gzip, deflate') == 'gzip'
+    assert negotiate_compression(None, None) is None
+    assert negotiate_compression('identity', 'gzip') is None
+    with pytest.raises(ValidationException):
+        negotiate_compression('brotli')
+
+
+def test_ndjson_chunks_are_bounded():
+    users = [User(id=f'U{i}', name=f'user_{i}') for i in range(450)]
+    chunks = asyncio.run(_collect(ndjson_chunks(_iterate(users))))
+    assert len(chunks) == 3
+    lines = ''.join(chunks).splitlines()
+    assert len(lines) == 450
+    assert json.loads(lines[0])['name'] == 'user_0'
+
+
+def test_csv_chunks_write_header_once():
+    users = [User(id='U1', name='first', roles=['Admin', 'User'])]
+    text = ''.join(asyncio.run(_collect(csv_chunks(_iterate(users), ['id', 'name', 'roles']))))
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert rows == [{'id': 'U1', 'name': 'first', 'roles': '["Admin", "User"]'}]
+
+
+def test_gzip_compression_round_trip():
+    blocks = asyncio.run(_collect(compress_chunks(_iterate(['a\n', 'b\n']), 'gzip')))
+    assert gzip.decompress(b''.join(blocks)) == b'a\nb\n'
+
+
+def test_export_endpoint_streams_ndjson(collection):
+    response, body = _export({'roles': 'User'})
+    assert response.media_type == 'application/x-ndjson'
+    assert collection.queries == [{'roles': 'User'}]
+    assert len(body.decode().splitlines()) == 450
+    assert len(_export({'name': 'user_1'})[1].decode().splitlines()) == 1
+    assert 'users.ndjson' in response.headers['content-disposition']
+
+
+def test_export_endpoint_csv_gzip(collection):
+    response, body = _export({'format': 'csv'}, headers={'accept-encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(body).decode())))
+    assert len(rows) == 450 and rows[0]['name'] == 'user_0'
+
+
+def test_export_endpoint_rejects_blocked_operators(collection):
+    response, _ = _export({'query': json.dumps({'$where': 'sleep(1000)'})})
+    assert response.status_code == 403
+
+
+def test_export_endpoint_rejects_unknown_format(collection):
+    response, _ = _export({'format': 'xml'})
+    assert response.status_code == 400
@@ -0,0 +1,148 @@
+"""Tests for the bulk import: body splitting, row validation, batched inserts and the streamed report."""
+import asyncio
+import gzip
+import json
+from datetime import datetime
+from typing import Annotated, ClassVar
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError
+
+from appkernel import AppKernelEngine, Model, MongoRepository, Required, TimeSeriesOptions
+from appkernel.bulk import csv_chunks, export_columns, import_rows, iter_body_lines, validate_rows
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+
+
+class _ShipmentCollection(FakeCollection):
+    """Rejects the documents carrying ``duplicate_code`` like a unique index would."""
+    duplicate_code = None
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        assert ordered is False
+        duplicates = [index for index, doc in enumerate(documents) if doc.get('code') == self.duplicate_code]
+        if duplicates:
+            self._record('insert_many', documents, {'ordered': ordered})
+            raise BulkWriteError({
+                'nInserted': len(documents) - len(duplicates),
+                'writeErrors': [{'index': index, 'errmsg': 'E11000 duplicate key'} for index in duplicates],
+            })
+        return await super().insert_many(documents, ordered=ordered, **kwargs)
+
+    @property
+    def batches(self):
+        return [documents for method, documents in self.calls if method == 'insert_many']
+
+
+class Shipment(Model, MongoRepository):
+    code: Annotated[str | None, Required()] = None
+    amount: int | None = None
+
+
+class Reading(Model, MongoRepository):
+    taken: datetime | None = None
+    value: float | None = None
+    time_series: ClassVar[TimeSeriesOptions] = TimeSeriesOptions(time_field='taken')
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, Shipment, _ShipmentCollection('Shipments'))
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def _collect(stream):
+    return [item async for item in stream]
+
+
+def _ndjson(count, broken=()):
+    lines = []
+    for i in range(count):
+        lines.append('{"code": ' if i in broken else json.dumps({'code': f'C{i}', 'amount': i}))
+    return lines
+
+
+def test_body_lines_are_split_across_chunks():
+    lines = asyncio.run(_collect(iter_body_lines(_chunks(b'{"a": 1}\r\n{"a"', b': 2}\n', b'{"a": 3}'))))
+    assert lines == ['{"a": 1}', '{"a": 2}', '{"a": 3}']
+
+
+def test_gzip_body_is_decompressed():
+    body = gzip.compress(b'first\nsecond\n')
+    lines = asyncio.run(_collect(iter_body_lines(_chunks(body[:10], body[10:]), 'gzip')))
+    assert lines == ['first', 'second']
+
+
+def test_unsupported_content_encoding():
+    with pytest.raises(ValidationException):
+        asyncio.run(_collect(iter_body_lines(_chunks(b''), 'br')))
+
+
+def test_validate_rows_reports_broken_lines():
+    documents, errors = validate_rows(Shipment, [(1, '{"code": "A", "amount": 3}'), (2, '[1, 2]'), (3, '{')], 'ndjson')
+    assert [line for line, _ in documents] == [1]
+    assert documents[0][1]['code'] == 'A' and documents[0][1]['version'] == 1
+    assert [error['line'] for error in errors] == [2, 3]
+
+
+def test_time_series_rows_carry_no_version():
+    documents, errors = validate_rows(Reading, [(1, '{"taken": "2024-05-01T10:00:00.000", "value": 1.5}')], 'ndjson')
+    assert not errors
+    assert 'version' not in documents[0][1] and documents[0][1]['taken'] == datetime(2024, 5, 1, 10)
+
+
+def test_validate_csv_rows():
+    documents, errors = validate_rows(Shipment, [(2, ['A', '3']), (3, ['B'])], 'csv', header=['code', 'amount'])
+    assert documents[0][1]['amount'] == 3
+    assert errors[0]['line'] == 3
+
+
+def test_import_inserts_in_batches(collection):
+    report = asyncio.run(_collect(import_rows(Shipment, _chunks(*_ndjson(25, broken={4})), batch_size=10)))
+    assert [len(batch) for batch in collection.batches] == [9, 10, 5]
+    assert report[0]['line'] == 5
+    assert report[-1]['_type'] == 'ImportReport'
+    assert (report[-1]['lines'], report[-1]['inserted'], report[-1]['failed']) == (25, 24, 1)
+
+
+def test_write_errors_are_mapped_to_lines(collection):
+    collection.duplicate_code = 'C3'
+    report = asyncio.run(_collect(import_rows(Shipment, _chunks(*_ndjson(6)), batch_size=4)))
+    assert report[0] == {'line': 4, 'error': 'E11000 duplicate key'}
+    assert (report[-1]['inserted'], report[-1]['failed']) == (5, 1)
+
+
+def test_import_csv(collection):
+    report = asyncio.run(_collect(import_rows(Shipment, _chunks('code,amount', 'A,1', '', 'B,2'), 'csv')))
+    assert [doc['code'] for doc in collection.batches[0]] == ['A', 'B']
+    assert report[-1]['inserted'] == 2
+
+
+def test_csv_export_is_imported_with_multiline_fields(collection):
+    shipments = [Shipment(code='A\nsecond "line"', amount=1), Shipment(code='B', amount=2)]
+    exported = ''.join(asyncio.run(_collect(csv_chunks(_chunks(*shipments), export_columns(Shipment)))))
+    body = exported.encode() + b'"C,3\n'
+    report = asyncio.run(_collect(import_rows(Shipment, iter_body_lines(_chunks(body[:9], body[9:])), 'csv')))
+    assert [(doc['code'], doc['amount']) for doc in collection.batches[0]] == [('A\nsecond "line"', 1), ('B', 2)]
+    assert report[0]['line'] == 5 and 'not closed' in report[0]['error']
+    assert (report[-1]['lines'], report[-1]['inserted'], report[-1]['failed']) == (3, 2, 1)
+
+
+def test_import_endpoint_streams_report(collection):
+    app = FastAPI()
+    kernel = AppKernelEngine('import-test', app=app, enable_defaults=True)
+    kernel.register(Shipment, methods=['GET'], enable_import=True)
+    body = '\n'.join(_ndjson(30, broken={7})).encode()
+    with TestClient(app) as client:
+        response = client.post('/shipments/import?batch_size=8', content=body,
+                               headers={'content-type': 'application/x-ndjson'})
+    assert response.status_code == 200
+    report = [json.loads(line) for line in response.text.splitlines()]
+    assert report[0]['line'] == 8
+    assert report[-1]['inserted'] == 29
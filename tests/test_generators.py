@@ -1,6 +1,13 @@
+import time
+import uuid
 from datetime import date, datetime
 
-from appkernel.generators import CypherMarshaller, MongoDateTimeMarshaller, TimestampMarshaller
+from bson import ObjectId
+
+from appkernel.generators import (
+    CypherMarshaller, MongoDateTimeMarshaller, TimestampMarshaller, create_object_id_generator, create_ulid_generator,
+    create_uuid7_generator, ulid, uuid7,
+)
 
 
 def test_mongo_date_time_marshaller():
@@ -90,3 +97,35 @@ def test_cypher_marshaller_to_wireformat_returns_none():
 def test_cypher_marshaller_from_wire_format_returns_none():
     m = CypherMarshaller()
     assert m.from_wire_format('encrypted') is None
+
+
+# ---------------------------------------------------------------------------
+# Time ordered id generators
+# ---------------------------------------------------------------------------
+
+def test_uuid7_layout_and_order():
+    before_ms = time.time_ns() // 1_000_000
+    ids = [uuid7() for _ in range(5000)]
+    assert all(value.version == 7 and value.variant == uuid.RFC_4122 for value in ids)
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert ids[0].int >> 80 >= before_ms
+
+
+def test_ulid_layout_and_order():
+    ids = [ulid() for _ in range(5000)]
+    assert all(len(value) == 26 and set(value) <= set('0123456789ABCDEFGHJKMNPQRSTVWXYZ') for value in ids)
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+
+
+def test_prefixed_generators_keep_the_order():
+    for factory in (create_uuid7_generator, create_ulid_generator, create_object_id_generator):
+        generate = factory('U')
+        first, second = generate(), generate()
+        assert first.startswith('U') and first < second
+    assert create_uuid7_generator()()[14] == '7'
+
+
+def test_object_id_generator():
+    generated = create_object_id_generator()()
+    assert isinstance(generated, ObjectId)
+    assert create_object_id_generator('O')()[1:] > str(generated)
@@ -0,0 +1,84 @@
+"""Tests for geo.py: GeoJSON field types, 2dsphere indexes and the geo queries of the DSL and the URL."""
+import asyncio
+from typing import Annotated
+
+import pytest
+from pydantic import ValidationError
+from starlette.datastructures import QueryParams
+
+from appkernel import GeoPoint, GeoPolygon, Model, MongoGeoIndex, MongoRepository
+from appkernel.geo import geo_filter
+from appkernel.index_advisor import normalise_query_shape
+from appkernel.repository import validate_query
+from appkernel.service import convert_to_query
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+
+BOX = GeoPolygon.box(13.3, 52.4, 13.5, 52.6)
+
+
+class Shop(Model, MongoRepository):
+    id: str | None = None
+    name: str | None = None
+    location: Annotated[GeoPoint | None, MongoGeoIndex()] = None
+    area: GeoPolygon | None = None
+
+
+def test_geometry_validation():
+    assert GeoPoint.of(13.4, 52.5).to_geojson() == {'type': 'Point', 'coordinates': [13.4, 52.5]}
+    assert BOX.to_geojson()['coordinates'][0][2] == [13.5, 52.6]
+    with pytest.raises(ValidationError):
+        GeoPoint.of(13.4, 95)
+    with pytest.raises(ValidationError):
+        GeoPolygon(coordinates=[[(0, 0), (1, 0), (1, 1)]])
+    with pytest.raises(ValueError):
+        GeoPolygon.box(2, 0, 1, 1)
+
+
+def test_geometry_fields_round_trip():
+    shop = Shop(name='Kiosk', location={'type': 'Point', 'coordinates': [13.4, 52.5]}, area=BOX)
+    stored = Model.to_dict(shop, convert_id=True)
+    assert stored['location'] == {'type': 'Point', 'coordinates': [13.4, 52.5]}
+    loaded = Model.from_dict(stored, Shop, convert_ids=True)
+    assert (loaded.location, loaded.area) == (GeoPoint.of(13.4, 52.5), BOX)
+    with pytest.raises(ValidationException):
+        Model.from_dict({'location': {'type': 'Polygon', 'coordinates': []}}, Shop)
+    with pytest.raises(ValidationException):
+        Model.from_dict({'location': {'type': 'Point', 'coordinates': [200, 0]}}, Shop)
+    schema = Shop.get_json_schema(mongo_compatibility=True)['properties']['location']
+    assert schema['bsonType'] == ['object', 'null'] and schema['properties']['type'] == {'enum': ['Point']}
+
+
+def test_dsl_geo_operators(monkeypatch):
+    patch_collection(monkeypatch, Shop, FakeCollection('Shops'))
+    point = GeoPoint.of(13.4, 52.5)
+    assert Shop.where(Shop.location.near(point, max_distance=500)).filter_expr == {'location': {'$near': {
+        '$geometry': {'type': 'Point', 'coordinates': [13.4, 52.5]}, '$maxDistance': 500}}}
+    assert Shop.where(Shop.location.within(BOX)).filter_expr == {
+        'location': {'$geoWithin': {'$geometry': BOX.to_geojson()}}}
+    assert Shop.where(Shop.location.within_radius(point, 6378.1)).filter_expr == {
+        'location': {'$geoWithin': {'$centerSphere': [[13.4, 52.5], 0.001]}}}
+    assert Shop.where(Shop.area.intersects(point)).filter_expr == {
+        'area': {'$geoIntersects': {'$geometry': point.to_geojson()}}}
+
+
+def test_url_geo_searches():
+    assert convert_to_query(['location'], QueryParams([('location', '@13.4,52.5,6378.1')]), Shop) == {
+        'location': {'$geoWithin': {'$centerSphere': [[13.4, 52.5], 0.001]}}}
+    query = convert_to_query(['location'], QueryParams([('location', '@13.3,52.4,13.5,52.6')]), Shop)
+    assert query == {'location': {'$geoWithin': {'$geometry': BOX.to_geojson()}}}
+    validate_query(query)
+    assert convert_to_query(['name'], QueryParams([('name', '@home')]), Shop) == {'name': '@home'}
+    assert normalise_query_shape(query).fields == ()
+
+
+@pytest.mark.parametrize('expression', ['13.4,52.5', '13.4,52.5,-1', '13.4,95,10', '13.5,52.4,13.3,52.6', 'a,b,c'])
+def test_invalid_url_geo_searches(expression):
+    with pytest.raises(ValidationException):
+        geo_filter(expression)
+
+
+def test_geo_index_is_created(monkeypatch):
+    collection = patch_collection(monkeypatch, Shop, FakeCollection('Shops'))
+    asyncio.run(Shop.init_indexes())
+    assert [keys for keys, _ in collection.created_indexes] == [[('location', '2dsphere')]]
@@ -0,0 +1,137 @@
+"""Tests for hydration.py: offload threshold, raw batch decoding and the raw find_by_query path."""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import bson
+import pytest
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+
+from appkernel import Model, MongoRepository
+from appkernel.configuration import config
+from appkernel.hydration import (
+    decode_raw_batches, decode_raw_in_pool, decoder_pool_kind, get_decoder_pool, hydrate, offload_threshold,
+    should_offload, shutdown_decoder_pool,
+)
+from tests.fakes import FakeCollection, patch_collection
+
+
+class _Cfg:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class _RawCollection(FakeCollection):
+    def find_raw_batches(self, query, **kwargs):
+        self._record('find_raw_batches', query, kwargs)
+        documents = self._matching(query)
+        half = len(documents) // 2
+        return self._cursor([b''.join(bson.encode(doc) for doc in batch) for batch in (documents[:half], documents[half:])])
+
+    def called(self, method):
+        return sum(1 for name, _ in self.calls if name == method)
+
+
+class Measurement(Model, MongoRepository):
+    id: int | None = None
+    value: float | None = None
+
+
+@pytest.fixture
+def threshold():
+    previous = getattr(config, 'cfg_engine', None)
+    config.cfg_engine = _Cfg({'appkernel.mongo.offload_threshold': 10})
+    yield 10
+    config.cfg_engine = previous
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, Measurement,
+                            _RawCollection('Measurements', [{'_id': i, 'value': i / 2} for i in range(20)]))
+
+
+def test_threshold_from_configuration(threshold):
+    assert offload_threshold() == 10
+    assert should_offload(10)
+    assert not should_offload(9)
+
+
+def test_zero_threshold_disables_offloading():
+    previous = getattr(config, 'cfg_engine', None)
+    config.cfg_engine = _Cfg({'appkernel.mongo.offload_threshold': 0})
+    try:
+        assert not should_offload(1_000_000)
+    finally:
+        config.cfg_engine = previous
+
+
+def test_decode_raw_batches():
+    raw = bson.encode({'_id': 1, 'value': 0.5}) + bson.encode({'_id': 2, 'value': 1.0})
+    models = decode_raw_batches(Measurement, [raw], DEFAULT_CODEC_OPTIONS)
+    assert [(model.id, model.value) for model in models] == [(1, 0.5), (2, 1.0)]
+
+
+def test_hydrate_small_and_large_results_alike(threshold):
+    small = asyncio.run(hydrate(Measurement, [{'_id': 1, 'value': 1.0}]))
+    large = asyncio.run(hydrate(Measurement, [{'_id': i} for i in range(50)]))
+    assert small[0].id == 1
+    assert [model.id for model in large] == list(range(50))
+
+
+def test_large_page_uses_raw_batches(threshold, collection):
+    page = asyncio.run(Measurement.find_by_query({}, page=1, page_size=20))
+    assert collection.called('find_raw_batches') == 1 and collection.called('find') == 0
+    assert [model.id for model in page] == list(range(20))
+    assert page.page_size == 20
+
+
+def test_small_page_stays_inline(threshold, collection):
+    asyncio.run(Measurement.find_by_query({}, page=1, page_size=5))
+    assert collection.called('find_raw_batches') == 0 and collection.called('find') == 1
+
+
+def test_query_find_hydrates_results(threshold, collection):
+    models = asyncio.run(Measurement.where().find(page_size=20))
+    assert len(models) == 20
+    assert isinstance(models[0], Measurement)
+
+
+def test_cfg_engine_absent_uses_default():
+    previous = getattr(config, 'cfg_engine', None)
+    config.cfg_engine = SimpleNamespace(get=lambda key, default=None: default)
+    try:
+        assert offload_threshold() == 1000
+    finally:
+        config.cfg_engine = previous
+
+
+@pytest.fixture
+def process_pool():
+    previous = getattr(config, 'cfg_engine', None)
+    shutdown_decoder_pool()
+    config.cfg_engine = _Cfg({'appkernel.mongo.decoder_pool': 'process', 'appkernel.mongo.decoder_workers': 1})
+    yield
+    shutdown_decoder_pool()
+    config.cfg_engine = previous
+
+
+def test_process_pool_decodes_raw_batches(process_pool):
+    assert isinstance(get_decoder_pool(), ProcessPoolExecutor)
+    raw = [bson.encode({'_id': 1, 'value': 0.5}), bson.encode({'_id': 2, 'value': 1.0})]
+    models = asyncio.run(decode_raw_in_pool(Measurement, raw, DEFAULT_CODEC_OPTIONS))
+    assert [(model.id, model.value) for model in models] == [(1, 0.5), (2, 1.0)]
+    assert all(isinstance(model, Measurement) for model in models)
+
+
+def test_unknown_decoder_pool_kind():
+    previous = getattr(config, 'cfg_engine', None)
+    config.cfg_engine = _Cfg({'appkernel.mongo.decoder_pool': 'fiber'})
+    try:
+        with pytest.raises(ValueError):
+            decoder_pool_kind()
+    finally:
+        config.cfg_engine = previous
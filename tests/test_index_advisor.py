@@ -0,0 +1,165 @@
+"""Tests for index_advisor.py: query shape normalisation, index reports and auto-creation."""
+import asyncio
+
+import pytest
+
+from appkernel import index_advisor
+from appkernel.configuration import config
+from appkernel.index_advisor import IndexAdvisor, IndexAdvisorConfig, QueryShape, normalise_query_shape
+from appkernel.repository import _record_query_shape
+from tests.fakes import FakeCollection, patch_collection
+from tests.utils import User
+
+
+# ---------------------------------------------------------------------------
+# Shape normalisation
+# ---------------------------------------------------------------------------
+
+def test_shape_strips_values():
+    assert normalise_query_shape({'name': 'John'}) == normalise_query_shape({'name': 'Jane'})
+
+
+def test_shape_classifies_operators():
+    shape = normalise_query_shape({'name': 'John', 'sequence': {'$gte': 10, '$lte': 20}})
+    assert shape.equality_fields == ('name',)
+    assert shape.range_fields == ('sequence',)
+    assert ('sequence', '$gte') in shape.fields
+
+
+def test_shape_ignores_regex_options():
+    shape = normalise_query_shape({'name': {'$regex': '.*Jo.*', '$options': 'i'}})
+    assert shape.fields == (('name', '$regex'),)
+
+
+def test_shape_flattens_logical_operators():
+    shape = normalise_query_shape({'$and': [{'name': 'John'}, {'sequence': {'$gt': 1}}]})
+    assert shape.equality_fields == ('name',)
+    assert shape.range_fields == ('sequence',)
+
+
+def test_shape_sort_variants():
+    assert normalise_query_shape({}, 'name').sort == (('name', 1),)
+    assert normalise_query_shape({}, [('name', -1)]).sort == (('name', -1),)
+    assert normalise_query_shape({}, {}).sort == ()
+
+
+def test_suggested_index_follows_esr():
+    shape = normalise_query_shape({'sequence': {'$gt': 3}, 'name': 'x'}, [('created', -1)])
+    assert shape.suggested_index() == (('name', 1), ('created', -1), ('sequence', 1))
+
+
+# ---------------------------------------------------------------------------
+# Reports
+# ---------------------------------------------------------------------------
+
+def test_report_lists_missing_index():
+    advisor = IndexAdvisor()
+    for _ in range(3):
+        advisor.record('users', {'name': 'x'}, [('sequence', 1)])
+    report = advisor.build_report('users', {'_id_': {'key': [('_id', 1)]}})
+    assert len(report.missing) == 1
+    assert report.missing[0].keys == (('name', 1), ('sequence', 1))
+    assert report.missing[0].occurrences == 3
+
+
+def test_report_accepts_serving_index_and_inverted_sort():
+    advisor = IndexAdvisor()
+    advisor.record('users', {'name': 'x'}, [('sequence', -1)])
+    report = advisor.build_report('users', {
+        '_id_': {'key': [('_id', 1)]},
+        'name_seq': {'key': [('name', 1), ('sequence', 1)]},
+    })
+    assert report.missing == []
+    assert report.unused == []
+
+
+def test_report_rejects_index_with_wrong_sort_order():
+    advisor = IndexAdvisor()
+    advisor.record('users', {'name': 'x'}, [('sequence', 1), ('created', 1)])
+    report = advisor.build_report('users', {'name_seq': {'key': [('name', 1), ('sequence', 1), ('created', -1)]}})
+    assert len(report.missing) == 1
+
+
+def test_report_flags_redundant_and_unused_indexes():
+    advisor = IndexAdvisor()
+    advisor.record('users', {'name': 'x'})
+    report = advisor.build_report('users', {
+        '_id_': {'key': [('_id', 1)]},
+        'name_idx': {'key': [('name', 1)]},
+        'name_seq': {'key': [('name', 1), ('sequence', 1)]},
+        'description_idx': {'key': [('_fts', 'text'), ('_ftsx', 1)]},
+        'sequence_idx': {'key': [('sequence', 1)]},
+    })
+    assert report.redundant == ['name_idx']
+    assert report.unused == ['sequence_idx']
+
+
+def test_report_to_dict_is_serialisable():
+    advisor = IndexAdvisor()
+    advisor.record('users', {'name': 'x'})
+    result = advisor.build_report('users', {}).to_dict()
+    assert result['missing'][0]['keys'] == [['name', 1]]
+    assert result['shapes'][0]['count'] == 1
+
+
+def test_shape_limit_per_collection():
+    advisor = IndexAdvisor(IndexAdvisorConfig(max_shapes_per_collection=2))
+    for field_name in ('a', 'b', 'c'):
+        advisor.record('users', {field_name: 1})
+    assert len(advisor.shapes('users')) == 2
+
+
+def test_min_occurrences_hides_rare_shapes():
+    advisor = IndexAdvisor(IndexAdvisorConfig(min_occurrences=2))
+    advisor.record('users', {'name': 'x'})
+    assert advisor.build_report('users', {}).missing == []
+
+
+def test_create_missing_honours_whitelist():
+    collection = FakeCollection('users')
+    advisor = IndexAdvisor(IndexAdvisorConfig(auto_create_whitelist=[('name',)]))
+    advisor.record(collection.name, {'name': 'x'})
+    advisor.record(collection.name, {'sequence': {'$gt': 1}})
+    created = asyncio.run(advisor.create_missing(collection))
+    assert created == ['name_adv_idx']
+    assert collection.created_indexes == [([('name', 1)], {'name': 'name_adv_idx'})]
+
+
+def test_auto_create_runs_in_background():
+    async def scenario():
+        collection = FakeCollection('users')
+        advisor = IndexAdvisor(IndexAdvisorConfig(auto_create=True, auto_create_whitelist=[('name',)],
+                                                  min_occurrences=2))
+        advisor.record(collection, {'name': 'x'})
+        await asyncio.sleep(0)
+        assert collection.created_indexes == []
+        advisor.record(collection, {'name': 'y'})
+        advisor.record(collection, {'name': 'z'})
+        assert len(index_advisor._background_tasks) == 1
+        await asyncio.sleep(0.01)
+        assert not index_advisor._background_tasks
+        return collection
+
+    collection = asyncio.run(scenario())
+    assert len(collection.created_indexes) == 1
+
+
+def test_mongo_query_records_shape(monkeypatch):
+    patch_collection(monkeypatch, User, FakeCollection('users'))
+    config.index_advisor = IndexAdvisor()
+    try:
+        asyncio.run(User.where(User.name == 'John').sort_by(User.sequence.desc()).find())
+        shapes = config.index_advisor.shapes('users')
+        assert shapes == [(QueryShape(fields=(('name', '$eq'),), sort=(('sequence', -1),)), 1)]
+    finally:
+        config.index_advisor = None
+
+
+def test_record_is_noop_without_advisor():
+    config.index_advisor = None
+    _record_query_shape(FakeCollection('users'), {'name': 'x'})
+
+
+@pytest.mark.parametrize('query', [None, {}])
+def test_empty_query_has_empty_shape(query):
+    assert normalise_query_shape(query) == QueryShape()
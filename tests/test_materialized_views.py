@@ -0,0 +1,122 @@
+"""Tests for materialized.py: refresh pipelines, full/incremental refreshes and staleness metadata."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import ClassVar
+
+import pytest
+
+from appkernel import Model, MongoRepository
+from appkernel.configuration import config
+from appkernel.materialized import METADATA_COLLECTION, MaterializedView, RefreshStats, _status_cache, \
+    refresh_view, staleness_headers, view_status
+from tests.fakes import FakeDatabase
+
+
+class Sale(Model, MongoRepository):
+    id: str | None = None
+    total: float | None = None
+    sequence: int | None = None
+
+
+class SalesSummary(Model, MongoRepository):
+    id: str | None = None
+    revenue: float | None = None
+    materialized_view: ClassVar[MaterializedView] = MaterializedView(
+        source=Sale,
+        pipeline=[{'$group': {'_id': None, 'revenue': {'$sum': '$total'}}}],
+        watermark_field='sequence',
+        when_matched=[{'$set': {'revenue': {'$add': ['$revenue', '$$new.revenue']}}}],
+    )
+
+
+@pytest.fixture
+def database():
+    previous = getattr(config, 'mongo_database', None)
+    fake = FakeDatabase()
+    config.mongo_database = fake
+    _status_cache.clear()
+    yield fake
+    config.mongo_database = previous
+    _status_cache.clear()
+
+
+def test_declaration_validates_pipeline():
+    with pytest.raises(PermissionError):
+        MaterializedView(source=Sale, pipeline=[{'$out': 'elsewhere'}])
+
+
+def test_incremental_grouping_needs_accumulating_merge():
+    with pytest.raises(ValueError):
+        MaterializedView(source=Sale, pipeline=[{'$group': {'_id': None, 'revenue': {'$sum': '$total'}}}],
+                         watermark_field='sequence')
+    MaterializedView(source=Sale, pipeline=[{'$group': {'_id': None, 'revenue': {'$sum': '$total'}}}])
+    MaterializedView(source=Sale, pipeline=[{'$project': {'total': 1}}], watermark_field='sequence')
+
+
+def test_full_pipeline_ends_with_out():
+    view = SalesSummary.materialized_view
+    assert view.build_pipeline('target')[-1] == {'$out': 'target'}
+    assert view.build_pipeline('target', until=10)[0] == {'$match': {'sequence': {'$lte': 10}}}
+
+
+def test_incremental_pipeline_ends_with_merge():
+    pipeline = SalesSummary.materialized_view.build_pipeline('target', since=5, until=10, incremental=True)
+    assert pipeline[0] == {'$match': {'sequence': {'$gt': 5, '$lte': 10}}}
+    merge = pipeline[-1]['$merge']
+    assert merge['into'] == 'target'
+    assert merge['whenMatched'][0]['$set']['revenue'] == {'$add': ['$revenue', '$$new.revenue']}
+
+
+def test_first_refresh_is_full_then_incremental(database):
+    sales = database.get_collection('Sales')
+    sales.documents = {1: {'_id': 1, 'sequence': 1}, 2: {'_id': 2, 'sequence': 2}}
+
+    stats = asyncio.run(refresh_view(SalesSummary))
+    assert stats.mode == 'full'
+    assert stats.watermark == 2
+    assert database.renamed == [('SalesSummarys__rebuild', 'SalesSummarys')]
+
+    sales.documents[3] = {'_id': 3, 'sequence': 3}
+    stats = asyncio.run(refresh_view(SalesSummary))
+    assert stats.mode == 'incremental'
+    assert stats.watermark == 3
+    assert stats.refresh_count == 2
+    assert sales.pipelines[-1][0] == {'$match': {'sequence': {'$gt': 2, '$lte': 3}}}
+    assert database.get_collection(METADATA_COLLECTION).documents['SalesSummarys']['watermark'] == 3
+
+    sales.documents[4] = {'_id': 4, 'sequence': 4}
+    sales.documents[5] = {'_id': 5, 'sequence': 5}
+    stats = asyncio.run(refresh_view(SalesSummary))
+    assert (stats.mode, stats.watermark, stats.refresh_count) == ('incremental', 5, 3)
+    assert sales.pipelines[-1][0] == {'$match': {'sequence': {'$gt': 3, '$lte': 5}}}
+    assert sales.pipelines[-1][-1]['$merge']['whenMatched'] == SalesSummary.materialized_view.when_matched
+
+
+def test_incremental_refresh_without_changes_skips_aggregation(database):
+    sales = database.get_collection('Sales')
+    sales.documents = {1: {'_id': 1, 'sequence': 1}}
+    asyncio.run(refresh_view(SalesSummary))
+    asyncio.run(refresh_view(SalesSummary))
+    assert len(sales.pipelines) == 1
+
+
+def test_forced_full_refresh(database):
+    database.get_collection('Sales').documents = {1: {'_id': 1, 'sequence': 1}}
+    asyncio.run(refresh_view(SalesSummary))
+    assert asyncio.run(refresh_view(SalesSummary, full=True)).mode == 'full'
+
+
+def test_status_and_headers(database):
+    assert asyncio.run(view_status(SalesSummary)) is None
+    database.get_collection('Sales').documents = {1: {'_id': 1, 'sequence': 1}}
+    asyncio.run(refresh_view(SalesSummary))
+    headers = staleness_headers(asyncio.run(view_status(SalesSummary)))
+    assert headers['X-Staleness-Seconds'] == '0'
+    assert 'X-Materialized-At' in headers
+
+
+def test_staleness_of_old_refresh():
+    finished = datetime.now(timezone.utc) - timedelta(minutes=10)
+    stats = RefreshStats(view='v', mode='full', started=finished, finished=finished.replace(tzinfo=None))
+    assert 599 < stats.staleness_seconds < 610
+    assert staleness_headers(None) == {'X-Materialized-At': 'never'}
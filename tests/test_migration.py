@@ -0,0 +1,210 @@
+"""Tests for migration.py: declarations, batched bulk writes, checkpoints, resumption and throttling."""
+import asyncio
+from datetime import timedelta
+from typing import ClassVar
+
+import pytest
+
+from appkernel import Model, MongoRepository
+from appkernel.configuration import config
+from appkernel.migration import CHECKPOINT_COLLECTION, CONFLICT_RETRIES, LEASE_ID, Migration, MigrationRunner, \
+    Throttle, migration_status, rename_field, run_migration, set_default
+from tests.fakes import FakeCollection, FakeDatabase
+
+
+class _AccountCollection(FakeCollection):
+    """Fails the bulk writes after ``fail_after`` and runs ``before_update`` ahead of every update_one."""
+    fail_after = None
+    before_update = None
+
+    @property
+    def bulk_sizes(self):
+        return [len(operations) for method, operations in self.calls if method == 'bulk_write']
+
+    async def update_one(self, query, update, **kwargs):
+        if self.before_update is not None:
+            self.before_update(self)
+        return await super().update_one(query, update, **kwargs)
+
+    async def bulk_write(self, operations, **kwargs):
+        if self.fail_after is not None and len(self.bulk_sizes) >= self.fail_after:
+            raise RuntimeError('primary stepped down')
+        return await super().bulk_write(operations, **kwargs)
+
+
+class Account(Model, MongoRepository):
+    id: int | None = None
+    username: str | None = None
+    status: str | None = None
+    migrations: ClassVar[list[Migration]] = [
+        set_default('0001-status', 'status', 'ACTIVE', batch_size=4, max_ops_per_second=None),
+        rename_field('0002-login', 'login', 'username', batch_size=4, max_ops_per_second=None),
+    ]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    previous = getattr(config, 'mongo_database', None)
+    fake = FakeDatabase(_AccountCollection)
+    config.mongo_database = fake
+    accounts = fake.get_collection('Accounts')
+    accounts.documents = {i: {'_id': i, 'login': f'user{i}'} for i in range(10)}
+    monkeypatch.setattr(Account, 'get_collection', classmethod(lambda cls: accounts))
+    yield fake
+    config.mongo_database = previous
+
+
+def test_migration_needs_transform_or_update():
+    with pytest.raises(ValueError):
+        Migration('broken')
+    with pytest.raises(ValueError):
+        Migration('broken', update={'$set': {'a': 1}}, transform=lambda model: None)
+
+
+def test_runner_applies_migrations_in_batches(database):
+    results = asyncio.run(MigrationRunner([Account]).run_all())
+    assert [progress.status for progress in results] == ['completed', 'completed']
+    accounts = database.get_collection('Accounts')
+    assert accounts.bulk_sizes == [4, 4, 2, 4, 4, 2]
+    assert all(doc['status'] == 'ACTIVE' and 'username' in doc and 'login' not in doc
+               for doc in accounts.documents.values())
+    checkpoint = database.get_collection(CHECKPOINT_COLLECTION).documents['Accounts:0001-status']
+    assert (checkpoint['processed'], checkpoint['modified'], checkpoint['batches']) == (10, 10, 3)
+
+
+def test_completed_migration_is_not_run_again(database):
+    migration = Account.migrations[0]
+    asyncio.run(run_migration(Account, migration))
+    asyncio.run(run_migration(Account, migration))
+    assert database.get_collection('Accounts').bulk_sizes == [4, 4, 2]
+
+
+def test_failed_migration_resumes_from_checkpoint(database):
+    accounts = database.get_collection('Accounts')
+    accounts.fail_after = 1
+    migration = Migration('0003-flag', update={'$set': {'flag': True}}, batch_size=3, max_ops_per_second=None)
+    progress = asyncio.run(run_migration(Account, migration))
+    assert progress.status == 'failed' and progress.last_id == 2
+    accounts.fail_after = None
+    progress = asyncio.run(run_migration(Account, migration))
+    assert progress.status == 'completed'
+    assert progress.processed == 10
+    assert accounts.bulk_sizes == [3, 3, 3, 1]
+
+
+def test_transform_may_skip_documents(database):
+    migration = Migration('0004-even', transform=lambda account: {'$set': {'even': True}} if account.id % 2 == 0
+                          else None, max_ops_per_second=None)
+    progress = asyncio.run(run_migration(Account, migration))
+    assert progress.processed == 10 and progress.modified == 5
+
+
+def test_status_report(database):
+    asyncio.run(run_migration(Account, Account.migrations[0]))
+    status = asyncio.run(migration_status(Account))
+    assert status['0001-status']['status'] == 'completed'
+    assert status['0002-login'] == {'migration': '0002-login', 'status': 'pending'}
+
+
+def test_runner_rejects_duplicate_names():
+    class Duplicated(Model, MongoRepository):
+        migrations: ClassVar[list[Migration]] = [set_default('x', 'a', 1), set_default('x', 'b', 2)]
+    with pytest.raises(ValueError):
+        MigrationRunner().add(Duplicated)
+
+
+def test_throttle_adapts_to_replication_lag(monkeypatch):
+    throttle = Throttle(max_ops_per_second=1000, max_lag_seconds=10)
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr('appkernel.migration.asyncio.sleep', fake_sleep)
+    lags = iter([30.0, 30.0, 1.0])
+
+    async def fake_lag():
+        return next(lags)
+
+    throttle.replication_lag = fake_lag
+    asyncio.run(throttle.pace(500, 0.0))
+    assert throttle.rate == 500 and sleeps[-1] == pytest.approx(1.0)
+    asyncio.run(throttle.pace(500, 0.0))
+    assert throttle.rate == 250
+    asyncio.run(throttle.pace(500, 0.0))
+    assert throttle.rate == pytest.approx(275)
+
+
+def test_constant_updates_skip_documents_changed_meanwhile(database):
+    accounts = database.get_collection('Accounts')
+    migration = Account.migrations[0]
+    original = accounts.find
+
+    def find_then_change(query, **kwargs):
+        cursor = original(query, **kwargs)
+        accounts.documents[3]['status'] = 'LOCKED'
+        return cursor
+
+    accounts.find = find_then_change
+    progress = asyncio.run(run_migration(Account, migration))
+    assert progress.processed == 10 and progress.modified == 9
+    assert accounts.documents[3]['status'] == 'LOCKED'
+
+
+def test_transform_retries_documents_changed_meanwhile(database):
+    accounts = database.get_collection('Accounts')
+    for document in accounts.documents.values():
+        document['version'] = 1
+    changed = []
+
+    def concurrent_write(collection):
+        if not changed:
+            changed.append(True)
+            collection.documents[0].update(login='renamed', version=2)
+
+    accounts.before_update = concurrent_write
+    migration = Migration('0005-upper', transform=lambda account: {'$set': {'login': account.login.upper()}},
+                          max_ops_per_second=None)
+    progress = asyncio.run(run_migration(Account, migration))
+    assert accounts.documents[0] == {'_id': 0, 'login': 'RENAMED', 'version': 3}
+    assert accounts.documents[1] == {'_id': 1, 'login': 'USER1', 'version': 2}
+    assert [query for query, _ in accounts.updates[:2]] == [{'_id': 0, 'version': 1}, {'_id': 0, 'version': 2}]
+    assert (progress.processed, progress.modified, progress.conflicts) == (10, 10, 1)
+
+
+def test_transform_gives_up_after_repeated_conflicts(database):
+    accounts = database.get_collection('Accounts')
+    accounts.documents = {0: {'_id': 0, 'login': 'user0', 'version': 1}}
+
+    def concurrent_write(collection):
+        collection.documents[0]['version'] += 1
+
+    accounts.before_update = concurrent_write
+    migration = Migration('0006-flag', transform=lambda account: {'$set': {'flag': True}}, max_ops_per_second=None)
+    progress = asyncio.run(run_migration(Account, migration))
+    assert progress.status == 'completed' and progress.conflicts == CONFLICT_RETRIES + 1
+    assert 'flag' not in accounts.documents[0]
+
+
+def test_only_one_runner_holds_the_lease(database):
+    first, second = MigrationRunner([Account]), MigrationRunner([Account])
+    checkpoints = database.get_collection(CHECKPOINT_COLLECTION)
+
+    async def scenario():
+        assert await first.acquire_lease()
+        assert await second.run_leased() is None
+        await first.release_lease()
+        return await second.run_leased()
+
+    results = asyncio.run(scenario())
+    assert [progress.status for progress in results] == ['completed', 'completed']
+    assert LEASE_ID not in checkpoints.documents
+
+
+def test_expired_lease_is_taken_over(database):
+    checkpoints = database.get_collection(CHECKPOINT_COLLECTION)
+    runner = MigrationRunner([Account], lease_seconds=30)
+    asyncio.run(runner.acquire_lease())
+    checkpoints.documents[LEASE_ID]['expires'] -= timedelta(seconds=31)
+    assert asyncio.run(MigrationRunner([Account]).acquire_lease())
+    assert checkpoints.documents[LEASE_ID]['owner'] != runner.owner
@@ -0,0 +1,135 @@
+"""Tests for mongo_metrics.py: pool settings from the configuration and the pool / command listeners."""
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo import monitoring
+
+from appkernel import AppKernelEngine
+from appkernel.configuration import config
+from appkernel.iam import IdentityMixin
+from appkernel.mongo_metrics import MongoMetrics, command_collection, compression_options, pool_options
+
+ADDRESS = ('db.local', 27017)
+
+
+class _Cfg:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+@pytest.fixture
+def pool_config():
+    previous = getattr(config, 'cfg_engine', None)
+    config.cfg_engine = _Cfg({'appkernel.mongo.pool': {'max_pool_size': 20, 'wait_queue_timeout_ms': 500}})
+    yield
+    config.cfg_engine = previous
+
+
+def test_pool_options(pool_config):
+    assert pool_options() == {'maxPoolSize': 20, 'waitQueueTimeoutMS': 500}
+
+
+def test_unknown_pool_setting():
+    previous = getattr(config, 'cfg_engine', None)
+    config.cfg_engine = _Cfg({'appkernel.mongo.pool': {'max_size': 20}})
+    try:
+        with pytest.raises(ValueError):
+            pool_options()
+    finally:
+        config.cfg_engine = previous
+
+
+def test_compression_options():
+    previous = getattr(config, 'cfg_engine', None)
+    try:
+        config.cfg_engine = _Cfg({'appkernel.mongo.compressors': 'zstd, zlib',
+                                  'appkernel.mongo.zlib_compression_level': 3})
+        assert compression_options() == {'compressors': 'zstd,zlib', 'zlibCompressionLevel': 3}
+        config.cfg_engine = _Cfg({'appkernel.mongo.compressors': ['snappy']})
+        assert compression_options() == {'compressors': 'snappy'}
+        config.cfg_engine = _Cfg({'appkernel.mongo.compressors': ['lz4']})
+        with pytest.raises(ValueError):
+            compression_options()
+        config.cfg_engine = _Cfg({'appkernel.mongo.zlib_compression_level': 12})
+        with pytest.raises(ValueError):
+            compression_options()
+    finally:
+        config.cfg_engine = previous
+
+
+def test_pool_listener_tracks_in_use_and_waiting():
+    metrics = MongoMetrics(max_pool_size=2)
+    pool, _ = metrics.listeners()
+    pool.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 1))
+    for _ in range(3):
+        pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+    pool.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1, 0.002))
+    pool.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 2, 0.010))
+    pool.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(ADDRESS, 'timeout', 0.5))
+    pool.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+    stats = metrics.snapshot()['pools']['db.local:27017']
+    assert (stats['in_use'], stats['max_in_use'], stats['waiting'], stats['max_waiting']) == (1, 2, 0, 3)
+    assert stats['checkout_failures'] == {'timeout': 1}
+    assert stats['checkout_wait'] == {'count': 3, 'mean_ms': 170.667, 'max_ms': 500.0}
+    metrics.reset()
+    stats = metrics.snapshot()['pools']['db.local:27017']
+    assert (stats['in_use'], stats['max_in_use'], stats['checkout_wait']['count']) == (1, 1, 0)
+
+
+def test_command_latency_per_collection():
+    metrics = MongoMetrics()
+    _, commands = metrics.listeners()
+    for request_id, (command, duration, failed) in enumerate([
+        ({'find': 'users', 'filter': {}}, 4, False),
+        ({'find': 'users', 'filter': {}}, 8, False),
+        ({'insert': 'orders', 'documents': []}, 3, True),
+        ({'hello': 1}, 1, False),
+    ]):
+        commands.started(monitoring.CommandStartedEvent(command, 'app', request_id, ADDRESS, request_id))
+        event_class = monitoring.CommandFailedEvent if failed else monitoring.CommandSucceededEvent
+        name = next(iter(command))
+        (commands.failed if failed else commands.succeeded)(
+            event_class(timedelta(milliseconds=duration), {}, name, request_id, ADDRESS, request_id))
+    snapshot = metrics.snapshot()['commands']
+    assert snapshot['users']['find'] == {'count': 2, 'mean_ms': 6.0, 'max_ms': 8.0, 'failures': 0}
+    assert snapshot['orders']['insert']['failures'] == 1
+    assert set(snapshot) == {'users', 'orders'}
+
+
+def test_command_collection():
+    assert command_collection('getMore', {'getMore': 1, 'collection': 'users'}) == 'users'
+    assert command_collection('aggregate', {'aggregate': 1, 'pipeline': []}) is None
+    assert command_collection('ping', {'ping': 1}) is None
+
+
+def test_metrics_endpoint():
+    app = FastAPI()
+    kernel = AppKernelEngine('metrics-test', app=app, enable_defaults=True).enable_mongo_metrics()
+    assert config.mongo_metrics is kernel.mongo_metrics
+    listeners = kernel.mongo_client.delegate.options.event_listeners
+    assert any(listener.metrics is kernel.mongo_metrics for listener in listeners)
+    with TestClient(app) as client:
+        response = client.get('/mongo/metrics')
+    assert response.status_code == 200
+    assert response.json()['max_pool_size'] == 100
+
+
+def test_secured_metrics_endpoint():
+    app = FastAPI()
+    cfg_dir = str(Path(__file__).resolve().parent.parent)
+    kernel = AppKernelEngine('metrics-test', app=app, cfg_dir=cfg_dir, enable_defaults=True)
+    kernel.enable_security()
+    kernel.enable_mongo_metrics()
+    with TestClient(app) as client:
+        assert client.get('/mongo/metrics').status_code == 401
+        user_token = IdentityMixin(id='U1', roles=['user']).auth_token
+        assert client.get('/mongo/metrics', headers={'Authorization': f'Bearer {user_token}'}).status_code == 403
+        admin_token = IdentityMixin(id='U2', roles=['admin']).auth_token
+        response = client.get('/mongo/metrics', headers={'Authorization': f'Bearer {admin_token}'})
+    assert response.status_code == 200 and 'pools' in response.json()
@@ -0,0 +1,117 @@
+"""Tests for pipelines.py: parameter binding, validation at declaration, caching and metrics."""
+import asyncio
+from datetime import datetime
+from typing import ClassVar
+
+import pytest
+
+from appkernel import Model, MongoRepository, NamedPipeline, Param, pipeline_metrics
+from appkernel.repository import _record_write
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+
+
+class _ReportCollection(FakeCollection):
+    def aggregate_documents(self, pipeline):
+        return [{'_id': 'Admin', 'count': len(self.pipelines)}]
+
+
+class Report(Model, MongoRepository):
+    id: str | None = None
+    named_pipelines: ClassVar[dict[str, NamedPipeline]] = {
+        'by_role': NamedPipeline([
+            {'$match': {'roles': {'$in': Param('roles', many=True)},
+                        'created': {'$gte': Param('since', datetime, default=datetime(2020, 1, 1))}}},
+            {'$group': {'_id': '$roles', 'count': {'$sum': 1}}},
+        ], ttl_seconds=60),
+        'top': NamedPipeline([{'$sort': {'sequence': -1}}, {'$limit': Param('limit', int, default=5)}],
+                             max_results=None),
+    }
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = patch_collection(monkeypatch, Report, _ReportCollection('reports'))
+    for pipeline in Report.named_pipelines.values():
+        pipeline.clear_cache()
+    return fake
+
+
+def test_params_are_collected():
+    pipeline = Report.named_pipelines['by_role']
+    assert set(pipeline.params) == {'roles', 'since'}
+    assert pipeline.params['roles'].required
+    assert not pipeline.params['since'].required
+
+
+def test_bind_converts_values():
+    stages = Report.named_pipelines['by_role'].bind({'roles': 'Admin,User', 'since': '2024-03-01T00:00:00'})
+    assert stages[0]['$match']['roles'] == {'$in': ['Admin', 'User']}
+    assert stages[0]['$match']['created'] == {'$gte': datetime(2024, 3, 1)}
+    assert stages[-1] == {'$limit': 10_000}
+
+
+def test_bind_uses_defaults_and_types():
+    assert Report.named_pipelines['top'].bind({}) == [{'$sort': {'sequence': -1}}, {'$limit': 5}]
+    assert Report.named_pipelines['top'].bind({'limit': '3'})[1] == {'$limit': 3}
+
+
+def test_missing_or_invalid_parameter_is_rejected():
+    with pytest.raises(ValidationException):
+        Report.named_pipelines['by_role'].bind({})
+    with pytest.raises(ValidationException):
+        Report.named_pipelines['top'].bind({'limit': '{"$gt": 1}'})
+
+
+def test_forbidden_stage_rejected_at_declaration():
+    with pytest.raises(PermissionError):
+        NamedPipeline([{'$match': {}}, {'$out': 'copy'}])
+
+
+def test_conflicting_param_declarations_rejected():
+    with pytest.raises(TypeError):
+        NamedPipeline([{'$match': {'a': Param('x'), 'b': Param('x', int)}}])
+
+
+def test_unsupported_param_type_rejected():
+    with pytest.raises(TypeError):
+        Param('x', dict)
+
+
+def test_results_are_cached(collection):
+    first = asyncio.run(Report.aggregate_named('by_role', roles='Admin'))
+    second = asyncio.run(Report.aggregate_named('by_role', roles='Admin'))
+    assert first == second
+    assert len(collection.pipelines) == 1
+    asyncio.run(Report.aggregate_named('by_role', roles='User'))
+    assert len(collection.pipelines) == 2
+
+
+def test_write_invalidates_cache(collection):
+    asyncio.run(Report.aggregate_named('by_role', roles='Admin'))
+    _record_write(collection)
+    outcome = asyncio.run(Report.named_pipelines['by_role'].execute(Report, roles='Admin'))
+    assert not outcome.cached
+    assert len(collection.pipelines) == 2
+
+
+def test_uncached_pipeline_always_runs(collection):
+    asyncio.run(Report.aggregate_named('top'))
+    asyncio.run(Report.aggregate_named('top'))
+    assert len(collection.pipelines) == 2
+
+
+def test_metrics_are_recorded(collection):
+    pipeline = Report.named_pipelines['by_role']
+    calls, hits = pipeline.metrics.calls, pipeline.metrics.cache_hits
+    asyncio.run(Report.aggregate_named('by_role', roles='Ops'))
+    asyncio.run(Report.aggregate_named('by_role', roles='Ops'))
+    metrics = pipeline_metrics(Report)['by_role']
+    assert metrics['calls'] == calls + 2
+    assert metrics['cache_hits'] == hits + 1
+    assert metrics['max_ms'] >= metrics['last_ms'] >= 0
+
+
+def test_unknown_pipeline(collection):
+    with pytest.raises(KeyError):
+        asyncio.run(Report.aggregate_named('missing'))
@@ -108,6 +108,12 @@ def test_crud_patch_in_paths():
     assert 'patch' in _spec['paths']['/users/{object_id}']
 
 
+def test_crud_patch_accepts_merge_and_json_patch():
+    content = _spec['paths']['/users/{object_id}']['patch']['requestBody']['content']
+    assert set(content) == {'application/json', 'application/merge-patch+json', 'application/json-patch+json'}
+    assert content['application/json-patch+json']['schema']['type'] == 'array'
+
+
 def test_crud_delete_in_paths():
     assert 'delete' in _spec['paths']['/users/{object_id}']
 
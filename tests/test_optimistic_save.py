@@ -0,0 +1,97 @@
+"""Tests for the single round trip save: version refresh, conflicts and auditable timestamps."""
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from appkernel import AuditableRepository, Model, MongoRepository
+from appkernel.repository import VersionConflictError
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+
+
+class Article(Model, MongoRepository):
+    id: str | None = None
+    title: str | None = None
+
+
+class Note(Model, AuditableRepository):
+    id: str | None = None
+    text: str | None = None
+
+
+class _ArticleCollection(FakeCollection):
+    """Assigns string ids, like the id generators of the Models."""
+
+    async def insert_one(self, document, **kwargs):
+        document.setdefault('_id', str(ObjectId()))
+        return await super().insert_one(document, **kwargs)
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = patch_collection(monkeypatch, Article, _ArticleCollection('Articles'))
+    return patch_collection(monkeypatch, Note, fake)
+
+
+def test_saves_refresh_the_version(collection):
+    article = Article(title='first')
+    asyncio.run(article.save())
+    assert article.version == 1
+    article.title = 'second'
+    asyncio.run(article.save())
+    article.title = 'third'
+    asyncio.run(article.save())
+    assert article.version == 3
+    assert (collection.documents[article.id]['title'], collection.documents[article.id]['version']) == ('third', 3)
+    assert [method for method, _ in collection.calls] == ['insert_one', 'find_one_and_update', 'find_one_and_update']
+
+
+def test_save_without_version_upserts(collection):
+    article = Article(id='A1', title='created in memory')
+    assert asyncio.run(article.save()) == 'A1'
+    assert article.version == 1
+    assert collection.documents['A1']['title'] == 'created in memory'
+
+
+def test_stale_version_conflicts(collection):
+    article = Article(title='original')
+    asyncio.run(article.save())
+    stale = Article(id=article.id, title='lost update', version=1)
+    asyncio.run(article.save())
+    with pytest.raises(VersionConflictError):
+        asyncio.run(stale.save())
+    assert collection.documents[article.id]['title'] == 'original'
+    assert stale.version == 1
+
+
+def test_deleted_document_is_not_recreated(collection):
+    article = Article(id='A2', title='gone', version=4)
+    assert asyncio.run(article.save()) is None
+    assert collection.documents == {}
+    assert asyncio.run(Article.patch_object({'title': 'patched'}, object_id='A2')) is None
+
+
+def test_patch_sets_embedded_fields_of_a_versioned_document(collection):
+    collection.documents['A3'] = {'_id': 'A3', 'title': 'lamp', 'address': {'street': 'Main', 'city': 'Berlin'},
+                                  'version': 2}
+    assert asyncio.run(Article.patch_object({'address.city': 'Bonn', 'geo.position.lat': 50.7, 'version': 2},
+                                            object_id='A3')) == 'A3'
+    assert collection.documents['A3'] == {'_id': 'A3', 'title': 'lamp', 'address': {'street': 'Main', 'city': 'Bonn'},
+                                          'geo': {'position': {'lat': 50.7}}, 'version': 3}
+    for patch in ({'tags.0': 'x'}, {'address.$': 'x'}, {'address': {}, 'address.city': 'x'}, {'address.': 'x'}):
+        with pytest.raises(ValidationException):
+            asyncio.run(Article.patch_object({**patch, 'version': 3}, object_id='A3'))
+    assert collection.documents['A3']['version'] == 3
+
+
+def test_auditable_timestamps_are_refreshed(collection):
+    note = Note(text='draft')
+    asyncio.run(note.save())
+    inserted = note.inserted
+    assert note.version == 1 and note.updated == inserted
+    note.text = 'final'
+    asyncio.run(note.save())
+    assert note.version == 2
+    assert note.inserted == inserted and note.updated >= inserted
+    assert collection.documents[note.id]['inserted'] == inserted
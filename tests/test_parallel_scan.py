@@ -0,0 +1,112 @@
+"""Tests for the partitioned parallel scan: boundaries, range filters, ordered and unordered delivery."""
+import asyncio
+import random
+
+import pytest
+
+from appkernel import Model, MongoRepository
+from appkernel.hydration import hydrate_batch
+from appkernel.repository import build_range_filters, compute_scan_boundaries
+from tests.fakes import FakeCollection, FakeCursor, matches, patch_collection
+
+
+class _ScanCursor(FakeCursor):
+    """Yields to the event loop between documents, so that the partitions interleave."""
+    fail = False
+
+    async def __anext__(self):
+        if self.fail:
+            raise RuntimeError('cursor failed')
+        await asyncio.sleep(0)
+        return await super().__anext__()
+
+
+class _ScanCollection(FakeCollection):
+    """Answers the ``$sample`` of the boundaries and returns the partitions in random order."""
+    cursor_class = _ScanCursor
+    fail = False
+
+    def aggregate_documents(self, pipeline):
+        matching = self._matching(pipeline[0]['$match'])
+        return random.sample(matching, min(pipeline[1]['$sample']['size'], len(matching)))
+
+    def find(self, query=None, *args, **kwargs):
+        cursor = super().find(query, *args, **kwargs)
+        random.shuffle(cursor.documents)
+        cursor.fail = self.fail
+        return cursor
+
+
+class Reading(Model, MongoRepository):
+    id: int | None = None
+    kind: str | None = None
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    documents = [{'_id': i, 'kind': 'even' if i % 2 == 0 else 'odd'} for i in range(1000)]
+    return patch_collection(monkeypatch, Reading, _ScanCollection('Readings', documents))
+
+
+async def _collect(generator):
+    return [item async for item in generator]
+
+
+def test_boundaries_are_sorted_and_distinct(collection):
+    boundaries = asyncio.run(compute_scan_boundaries(collection, {}, 4))
+    assert len(boundaries) == 3
+    assert boundaries == sorted(set(boundaries))
+
+
+def test_no_boundaries_for_single_partition_or_empty_match(collection):
+    assert asyncio.run(compute_scan_boundaries(collection, {}, 1)) == []
+    assert asyncio.run(compute_scan_boundaries(collection, {'kind': 'none'}, 4)) == []
+
+
+def test_range_filters_cover_key_space():
+    assert build_range_filters([]) == [{}]
+    assert build_range_filters([10, 20]) == [
+        {'_id': {'$lt': 10}}, {'_id': {'$gte': 10, '$lt': 20}}, {'_id': {'$gte': 20}},
+    ]
+
+
+def test_every_key_falls_into_exactly_one_range():
+    filters = build_range_filters([10, 20])
+    for key in (-5, 9, 10, 19, 20, 10_000):
+        assert sum(matches({'_id': key}, range_filter) for range_filter in filters) == 1
+    assert matches({'_id': 10_000}, filters[-1])
+
+
+def test_unordered_scan_returns_every_document_once(collection):
+    models = asyncio.run(_collect(Reading.parallel_stream_by_query({'kind': 'odd'}, partitions=4, batch_size=30)))
+    assert sorted(model.id for model in models) == list(range(1, 1000, 2))
+    assert all(isinstance(model, Reading) for model in models)
+    assert len(collection.queries) == 4
+
+
+def test_scan_without_query(collection):
+    models = asyncio.run(_collect(Reading.parallel_stream_by_query(None, partitions=3, batch_size=100)))
+    assert sorted(model.id for model in models) == list(range(1000))
+
+
+def test_ordered_scan_yields_sorted_documents(collection):
+    models = asyncio.run(_collect(Reading.parallel_stream_by_query({}, partitions=3, batch_size=50, ordered=True)))
+    assert [model.id for model in models] == list(range(1000))
+
+
+def test_scan_errors_are_raised_to_the_consumer(collection):
+    collection.fail = True
+    with pytest.raises(RuntimeError):
+        asyncio.run(_collect(Reading.parallel_stream_by_query({}, partitions=2)))
+
+
+def test_early_exit_stops_the_cursors(collection):
+    async def take_one():
+        async for model in Reading.parallel_stream_by_query({}, partitions=4, batch_size=10):
+            return model
+    assert isinstance(asyncio.run(take_one()), Reading)
+
+
+def test_hydrate_batch_converts_documents():
+    models = hydrate_batch(Reading, [{'_id': 7, 'kind': 'odd'}])
+    assert models[0].id == 7 and models[0].kind == 'odd'
@@ -0,0 +1,113 @@
+"""Tests for patch_retry.py: field version stamps and the server side retry of conflicting patches."""
+import asyncio
+from typing import ClassVar
+
+import pytest
+
+from appkernel import Model, MongoRepository, PatchRetryPolicy, conflict_metrics
+from appkernel.patch_retry import overlapping_fields, patched_fields
+from appkernel.repository import VersionConflictError
+from tests.fakes import FakeCollection, patch_collection
+
+
+class _OrderCollection(FakeCollection):
+    """``before_write`` runs once ahead of the next write."""
+    before_write = None
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        if self.before_write:
+            hook, self.before_write = self.before_write, None
+            await hook()
+        return await super().find_one_and_update(query, update, **kwargs)
+
+
+class Order(Model, MongoRepository):
+    id: str | None = None
+    status: str | None = None
+    note: str | None = None
+    patch_retry: ClassVar[PatchRetryPolicy] = PatchRetryPolicy(max_retries=2, base_delay_ms=0, max_delay_ms=0)
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = patch_collection(monkeypatch, Order, _OrderCollection('Orders', [
+        {'_id': 'O1', 'status': 'NEW', 'note': '', 'version': 1, '_field_versions': {'*': 1}}]))
+    Order.patch_retry.metrics.__init__()
+    return fake
+
+
+def test_policy_validation():
+    with pytest.raises(ValueError):
+        PatchRetryPolicy(max_retries=-1)
+    with pytest.raises(ValueError):
+        PatchRetryPolicy(base_delay_ms=50, max_delay_ms=10)
+    assert 0 <= PatchRetryPolicy(base_delay_ms=10, max_delay_ms=30).backoff_seconds(5) <= 0.03
+
+
+def test_overlapping_fields():
+    assert patched_fields({'_id': 'O1', 'version': 2, 'status': 'PAID'}) == {'status'}
+    assert overlapping_fields({'*': 1, 'note': 3}, {'status'}, 2) == set()
+    assert overlapping_fields({'*': 1, 'note': 3}, {'note', 'status'}, 2) == {'note'}
+    assert overlapping_fields({'*': 3}, {'status'}, 2) == {'status'}
+    assert overlapping_fields(None, {'status'}, 2) == {'status'}
+
+
+def test_patches_stamp_the_fields(collection):
+    assert asyncio.run(Order.patch_object({'status': 'PAID', 'version': 1}, object_id='O1')) == 'O1'
+    assert asyncio.run(Order.patch_object({'note': 'fragile'}, object_id='O1')) == 'O1'
+    stored = collection.documents['O1']
+    assert (stored['status'], stored['note'], stored['version']) == ('PAID', 'fragile', 3)
+    assert stored['_field_versions'] == {'*': 1, 'status': 2, 'note': 3}
+
+
+def test_embedded_fields_are_stamped_by_their_field(collection):
+    collection.documents['O1']['address'] = {'street': 'Main', 'city': 'Berlin'}
+    assert patched_fields({'address.city': 'Bonn', 'version': 1}) == {'address'}
+    assert asyncio.run(Order.patch_object({'address.city': 'Bonn', 'version': 1}, object_id='O1')) == 'O1'
+    stored = collection.documents['O1']
+    assert stored['address'] == {'street': 'Main', 'city': 'Bonn'} and 'address.city' not in stored
+    assert stored['_field_versions'] == {'*': 1, 'address': 2}
+
+
+def test_disjoint_conflict_is_retried(collection):
+    async def concurrent_note():
+        await Order.patch_object({'note': 'gift'}, object_id='O1')
+
+    collection.before_write = concurrent_note
+    assert asyncio.run(Order.patch_object({'status': 'PAID', 'version': 1}, object_id='O1')) == 'O1'
+    stored = collection.documents['O1']
+    assert (stored['status'], stored['note'], stored['version']) == ('PAID', 'gift', 3)
+    assert conflict_metrics(Order) == {'conflicts': 1, 'retries': 1, 'resolved': 1, 'overlapping': 0,
+                                       'exhausted': 0}
+
+
+def test_overlapping_conflict_is_raised(collection):
+    async def concurrent_status():
+        await Order.patch_object({'status': 'CANCELLED'}, object_id='O1')
+
+    collection.before_write = concurrent_status
+    with pytest.raises(VersionConflictError):
+        asyncio.run(Order.patch_object({'status': 'PAID', 'version': 1}, object_id='O1'))
+    assert collection.documents['O1']['status'] == 'CANCELLED'
+    assert conflict_metrics(Order)['overlapping'] == 1
+
+
+def test_save_overlaps_every_field(collection):
+    async def concurrent_save():
+        await Order(id='O1', status='NEW', note='saved', version=1).save()
+
+    collection.before_write = concurrent_save
+    with pytest.raises(VersionConflictError):
+        asyncio.run(Order.patch_object({'status': 'PAID', 'version': 1}, object_id='O1'))
+    assert collection.documents['O1']['_field_versions'] == {'*': 2}
+
+
+def test_retries_are_bounded(collection, monkeypatch):
+    async def always_conflict(document, object_id=None, insert_if_none_found=True, partial=False):
+        raise VersionConflictError(object_id)
+
+    monkeypatch.setattr(Order, '_save_or_update_dict', always_conflict)
+    with pytest.raises(VersionConflictError):
+        asyncio.run(Order.patch_object({'status': 'PAID', 'version': 1}, object_id='O1'))
+    assert conflict_metrics(Order) == {'conflicts': 3, 'retries': 2, 'resolved': 0, 'overlapping': 0,
+                                       'exhausted': 1}
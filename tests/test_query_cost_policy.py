@@ -0,0 +1,78 @@
+"""Tests for QueryCostPolicy: index-prefix coverage of untrusted filters and sorts."""
+from typing import Annotated
+
+import pytest
+
+from appkernel import Model, MongoRepository
+from appkernel.fields import MongoIndex, MongoTextIndex, MongoUniqueIndex
+from appkernel.repository import QueryCostException, QueryCostPolicy, validate_query
+
+
+class Article(Model, MongoRepository):
+    id: str | None = None
+    slug: Annotated[str | None, MongoUniqueIndex()] = None
+    author: Annotated[str | None, MongoIndex()] = None
+    body: Annotated[str | None, MongoTextIndex()] = None
+    rating: int | None = None
+    published: str | None = None
+
+
+@pytest.fixture
+def policy():
+    return QueryCostPolicy(indexed_fields=[('author', 'published')]).with_model_indexes(Article)
+
+
+def test_model_indexes_are_merged(policy):
+    assert ('_id',) in policy.indexed_fields
+    assert ('slug',) in policy.indexed_fields
+    assert ('author',) in policy.indexed_fields
+    assert ('body',) not in policy.indexed_fields
+
+
+def test_string_entries_are_normalised():
+    assert QueryCostPolicy(indexed_fields=['name']).indexed_fields == [('name',)]
+
+
+def test_invalid_mode_is_rejected():
+    with pytest.raises(ValueError):
+        QueryCostPolicy(mode='ignore')
+
+
+@pytest.mark.parametrize('query, sort_by', [
+    ({}, None),
+    ({'author': 'a'}, None),
+    ({'author': 'a', 'rating': {'$gt': 3}}, None),
+    ({'author': 'a'}, 'published'),
+    ({}, 'slug'),
+    ({'$or': [{'slug': 'x'}, {'author': 'y'}]}, None),
+    ({'$and': [{'author': 'a'}, {'rating': 4}]}, 'published'),
+])
+def test_covered_queries(policy, query, sort_by):
+    assert policy.uncovered_fields(query, sort_by) == []
+    validate_query(query, cost_policy=policy, sort_by=sort_by)
+
+
+@pytest.mark.parametrize('query, sort_by, expected', [
+    ({'rating': 4}, None, ['rating']),
+    ({'author': 'a'}, 'rating', ['rating']),
+    ({}, 'published', ['published']),
+    ({'author': {'$gt': 'a'}}, 'published', ['published']),
+    ({'$or': [{'slug': 'x'}, {'rating': 1}]}, None, ['rating']),
+])
+def test_uncovered_queries(policy, query, sort_by, expected):
+    assert policy.uncovered_fields(query, sort_by) == expected
+    with pytest.raises(QueryCostException) as exc_info:
+        validate_query(query, cost_policy=policy, sort_by=sort_by)
+    assert exc_info.value.status_code == 422
+    assert exc_info.value.uncovered_fields == expected
+    assert 'author+published' in str(exc_info.value)
+
+
+def test_trusted_callers_bypass_policy(policy):
+    validate_query({'rating': 4}, trusted=True, cost_policy=policy)
+
+
+def test_cap_mode_does_not_raise():
+    policy = QueryCostPolicy(mode='cap').with_model_indexes(Article)
+    validate_query({'rating': 4}, cost_policy=policy)
+    assert policy.uncovered_fields({'rating': 4}) == ['rating']
@@ -0,0 +1,140 @@
+"""Tests for read_routing.py: read policies, their resolution per Model and method, and causal sessions."""
+import asyncio
+from types import SimpleNamespace
+from typing import ClassVar
+
+import pytest
+from pymongo.read_preferences import Nearest, Primary, SecondaryPreferred
+
+from appkernel import Model, MongoRepository
+from appkernel.configuration import config
+from appkernel.read_routing import ReadPolicy, causal_session, reading, resolve_read_policy
+from appkernel.time_budget import operation_options
+from tests.fakes import FakeCollection, patch_collection
+
+
+class _Cfg:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class _RoutedCollection(FakeCollection):
+    """Records every read with the options of the collection it was sent to."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+
+    def _record(self, method, argument, options):
+        super()._record(method, argument, options)
+        self.reads.append((method, self.collection_options, options))
+
+
+class Invoice(Model, MongoRepository):
+    id: str | None = None
+    total: int | None = None
+    read_policy: ClassVar[ReadPolicy] = ReadPolicy('secondaryPreferred', max_staleness_seconds=120, concern='majority')
+
+
+class Ledger(Model, MongoRepository):
+    id: str | None = None
+    read_policy: ClassVar[dict[str, ReadPolicy]] = {'find_by_id': ReadPolicy('nearest'),
+                                                    'default': ReadPolicy('secondary')}
+
+
+class Plain(Model, MongoRepository):
+    id: str | None = None
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, Invoice, _RoutedCollection('Invoices', [{'_id': 'I1', 'total': 10}]))
+
+
+@pytest.fixture
+def read_config():
+    previous = getattr(config, 'cfg_engine', None)
+    config.cfg_engine = _Cfg({'appkernel.mongo.read': {'preference': 'nearest', 'concern': 'local'}})
+    yield
+    config.cfg_engine = previous
+
+
+def test_policy_validation():
+    with pytest.raises(ValueError):
+        ReadPolicy('fastest')
+    with pytest.raises(ValueError):
+        ReadPolicy(concern='eventual')
+    with pytest.raises(ValueError):
+        ReadPolicy('secondary', max_staleness_seconds=10)
+    with pytest.raises(ValueError):
+        ReadPolicy(max_staleness_seconds=120)
+
+
+def test_policy_options():
+    options = ReadPolicy('secondaryPreferred', max_staleness_seconds=90, tag_sets=({'dc': 'east'},),
+                         concern='majority').collection_options()
+    assert options['read_preference'] == SecondaryPreferred([{'dc': 'east'}], max_staleness=90)
+    assert options['read_concern'].level == 'majority'
+    assert ReadPolicy().collection_options() == {'read_preference': Primary()}
+
+
+def test_class_policy_applies_to_list_reads_only():
+    assert resolve_read_policy(Invoice, 'find_by_query').preference == 'secondaryPreferred'
+    assert resolve_read_policy(Invoice, 'aggregate').preference == 'secondaryPreferred'
+    assert resolve_read_policy(Invoice, 'find_by_id') is None
+    assert resolve_read_policy(Invoice, 'stream_by_query') is None
+
+
+def test_per_method_policies():
+    assert resolve_read_policy(Ledger, 'find_by_id').preference == 'nearest'
+    assert resolve_read_policy(Ledger, 'count').preference == 'secondary'
+    assert resolve_read_policy(Ledger, 'stream_by_query') is None
+
+
+def test_configured_default(read_config):
+    assert resolve_read_policy(Plain, 'find_by_query') == ReadPolicy('nearest', concern='local')
+    assert resolve_read_policy(Plain, 'find_by_id') is None
+    assert resolve_read_policy(Invoice, 'find_by_query').preference == 'secondaryPreferred'
+
+
+def test_reading_overrides_everything():
+    with reading(ReadPolicy('nearest')):
+        assert resolve_read_policy(Invoice, 'find_by_id').preference == 'nearest'
+    assert resolve_read_policy(Invoice, 'find_by_id') is None
+
+
+def test_repository_reads_are_routed(collection):
+    asyncio.run(Invoice.find_by_query({}))
+    asyncio.run(Invoice.find_by_id('I1'))
+    (_, list_options, _), (_, by_id_options, _) = collection.reads
+    assert list_options['read_preference'] == SecondaryPreferred(max_staleness=120)
+    assert list_options['read_concern'].level == 'majority'
+    assert by_id_options == {}
+    with reading(ReadPolicy('nearest')):
+        asyncio.run(Invoice.find_by_id('I1'))
+    assert collection.reads[-1][1]['read_preference'] == Nearest()
+
+
+def test_causal_session_is_passed_to_operations(collection, monkeypatch):
+    ended = []
+    session = SimpleNamespace(end_session=lambda: asyncio.sleep(0, ended.append(True)))
+
+    async def start_session(causal_consistency=None):
+        assert causal_consistency is True
+        return session
+
+    monkeypatch.setattr(config, 'mongo_database', SimpleNamespace(client=SimpleNamespace(start_session=start_session)),
+                        raising=False)
+
+    async def scenario():
+        async with causal_session():
+            assert operation_options()['session'] is session
+            await Invoice.find_by_id('I1')
+        assert 'session' not in operation_options()
+
+    asyncio.run(scenario())
+    assert collection.reads[-1][2] == {'session': session}
+    assert ended == [True]
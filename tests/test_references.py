@@ -0,0 +1,129 @@
+"""Tests for references.py: Ref markers, batched population, $lookup and serialisation of populated Models."""
+import asyncio
+from pathlib import Path
+from typing import Annotated
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from appkernel import Anonymous, AppKernelEngine, IdentityMixin, Model, MongoRepository, Ref, Role
+from appkernel.configuration import config
+from appkernel.references import lookup_stages, parse_expand
+from appkernel.repository import mongo_type_converter_to_dict
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+from tests.utils import User
+
+
+class Project(Model, MongoRepository):
+    id: str | None = None
+    name: str | None = None
+
+
+class Document(Model, MongoRepository):
+    id: str | None = None
+    title: str | None = None
+    owner_id: Annotated[str | None, Ref(User)] = None
+    reviewer_ids: Annotated[list[str] | None, Ref(User)] = None
+    project_id: Annotated[str | None, Ref(lambda: Project, attribute='parent')] = None
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    users = FakeCollection('Users', [{'_id': f'U{i}', 'name': f'user_{i}', 'password': 'hash'} for i in range(3)])
+    projects = FakeCollection('Projects', [{'_id': 'P1', 'name': 'apollo'}])
+    documents = FakeCollection('Documents', [
+        {'_id': f'D{i}', 'title': f'doc_{i}', 'owner_id': f'U{i % 2}', 'reviewer_ids': ['U2', 'U0'], 'project_id': 'P1'}
+        for i in range(10)])
+    for model_class, collection in ((User, users), (Project, projects), (Document, documents)):
+        patch_collection(monkeypatch, model_class, collection)
+    return users, projects, documents
+
+
+def test_attach_names():
+    assert Ref(User).attach_as('owner_id') == 'owner'
+    assert Ref(User).attach_as('reviewer_ids') == 'reviewers'
+    assert Ref(User).attach_as('author') == 'author_ref'
+    assert Ref(User, attribute='writer').attach_as('owner_id') == 'writer'
+
+
+def test_parse_expand():
+    assert parse_expand(Document, 'owner, reviewer_ids,owner_id') == ['owner_id', 'reviewer_ids']
+    assert parse_expand(Document, ['parent']) == ['project_id']
+    assert parse_expand(Document, None) == []
+    with pytest.raises(ValidationException):
+        parse_expand(Document, 'title')
+
+
+def test_page_is_populated_with_one_query_per_collection(collections):
+    users, projects, _ = collections
+    page = asyncio.run(Document.find_by_query({}, expand='owner,reviewers,parent'))
+    assert len(users.queries) == 1 and len(projects.queries) == 1
+    assert set(users.queries[0]['_id']['$in']) == {'U0', 'U1', 'U2'}
+    assert [doc.owner.name for doc in page[:2]] == ['user_0', 'user_1']
+    assert [user.id for user in page[0].reviewers] == ['U2', 'U0']
+    assert page[0].parent.name == 'apollo'
+
+
+def test_find_by_id_expands(collections):
+    document = asyncio.run(Document.find_by_id('D3', expand='owner'))
+    assert document.owner.id == 'U1'
+    assert not hasattr(document, 'reviewers')
+
+
+def test_missing_references(collections):
+    documents = [Document(id='X', owner_id='U9', reviewer_ids=['U9', 'U1'])]
+    asyncio.run(Document.populate(documents, 'owner', 'reviewers'))
+    assert documents[0].owner is None
+    assert [user.id for user in documents[0].reviewers] == ['U1']
+
+
+def test_populated_models_are_not_stored(collections):
+    document = asyncio.run(Document.find_by_id('D0', expand='owner'))
+    stored = Model.to_dict(document, convert_id=True, converter_func=mongo_type_converter_to_dict)
+    assert 'owner' not in stored and stored['owner_id'] == 'U0'
+    served = Model.to_dict(document, skip_omitted_fields=True)
+    assert served['owner']['name'] == 'user_0'
+    assert 'password' not in served['owner']
+
+
+def test_lookup_stages(collections):
+    stages = lookup_stages(Document, 'owner_id', 'reviewer_ids')
+    assert stages == [
+        {'$lookup': {'from': 'Users', 'localField': 'owner_id', 'foreignField': '_id', 'as': 'owner'}},
+        {'$unwind': {'path': '$owner', 'preserveNullAndEmptyArrays': True}},
+        {'$lookup': {'from': 'Users', 'localField': 'reviewer_ids', 'foreignField': '_id', 'as': 'reviewers'}},
+    ]
+
+
+def test_find_with_lookup(collections, monkeypatch):
+    _, _, documents = collections
+    documents.documents = {'D1': {'_id': 'D1', 'owner_id': 'U1', 'reviewer_ids': ['U2', 'U0'],
+                                  'owner': {'_id': 'U1', 'name': 'user_1'},
+                                  'reviewers': [{'_id': 'U0', 'name': 'user_0'}, {'_id': 'U2', 'name': 'user_2'}]}}
+    page = asyncio.run(Document.find_with_lookup({'title': 'doc_1'}, 'owner', 'reviewers', page_size=5))
+    assert documents.pipelines[0][:3] == [{'$match': {'title': 'doc_1'}}, {'$skip': 0}, {'$limit': 5}]
+    assert page[0].owner.name == 'user_1'
+    assert [user.id for user in page[0].reviewers] == ['U2', 'U0']
+
+
+def test_http_expansion_follows_the_access_rules_of_the_referenced_model(collections, monkeypatch):
+    monkeypatch.setattr(config, 'security_enabled', False, raising=False)
+    app = FastAPI()
+    kernel = AppKernelEngine('references-test', app=app, cfg_dir=str(Path(__file__).resolve().parent.parent),
+                             enable_defaults=True)
+    kernel.enable_security()
+    kernel.register(Document, methods=['GET']).require(Anonymous(), methods='GET')
+    kernel.register(User, methods=['GET']).require(Role('admin'), methods='GET')
+    with TestClient(app) as client:
+        assert client.get('/documents/D1').json()['owner_id'] == 'U1'
+        assert client.get('/documents/D1?expand=owner').status_code == 401
+        user_token = IdentityMixin(id='U5', roles=['user']).auth_token
+        denied = client.get('/documents/?expand=owner', headers={'Authorization': f'Bearer {user_token}'})
+        assert denied.status_code == 403
+        admin_token = IdentityMixin(id='U6', roles=['admin']).auth_token
+        allowed = client.get('/documents/D1?expand=owner', headers={'Authorization': f'Bearer {admin_token}'})
+        assert allowed.json()['owner']['name'] == 'user_1'
+        unserved = client.get('/documents/D1?expand=parent', headers={'Authorization': f'Bearer {admin_token}'})
+        assert unserved.status_code == 403 and 'Project is not served' in unserved.json()['message']
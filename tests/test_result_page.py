@@ -0,0 +1,85 @@
+"""Tests for paginated results: the $facet page pipeline, count modes and the response envelope."""
+import asyncio
+
+import pymongo
+import pytest
+
+from appkernel.repository import ResultPage, build_page_pipeline
+from appkernel.service import _xvert
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+from tests.utils import User
+
+
+class _PageCollection(FakeCollection):
+    """Answers the ``$facet`` page pipeline and estimates a large collection."""
+
+    def aggregate_documents(self, pipeline):
+        items = self._matching(pipeline[0]['$match'])
+        return [{'items': items, 'total': [{'count': len(items)}] if items else []}]
+
+    async def estimated_document_count(self, **kwargs):
+        await super().estimated_document_count(**kwargs)
+        return 1000
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, User, _PageCollection('users', [
+        {'_id': 'U1', 'name': 'John'}, {'_id': 'U2', 'name': 'Jane'}, {'_id': 'U3', 'name': 'John'}]))
+
+
+def test_page_pipeline_contains_facet():
+    pipeline = build_page_pipeline({'name': 'John'}, page=3, page_size=10, sort_by='sequence',
+                                   direction=pymongo.DESCENDING)
+    assert pipeline[0] == {'$match': {'name': 'John'}}
+    assert pipeline[1]['$facet']['items'] == [{'$sort': {'sequence': -1}}, {'$skip': 20}, {'$limit': 10}]
+    assert pipeline[1]['$facet']['total'] == [{'$count': 'count'}]
+
+
+def test_page_pipeline_without_sort():
+    assert build_page_pipeline(None, 1, 5)[1]['$facet']['items'] == [{'$skip': 0}, {'$limit': 5}]
+
+
+def test_result_page_is_a_list():
+    page = ResultPage([1, 2], total=12, page=1, page_size=5)
+    assert page == [1, 2]
+    assert page.page_count == 3
+    assert ResultPage([]).page_count is None
+
+
+def test_exact_count_uses_single_aggregation(collection):
+    result = asyncio.run(User.find_by_query({'name': 'John'}, page_size=2, count_mode='exact'))
+    assert [u.id for u in result] == ['U1', 'U3']
+    assert result.total == 2
+    assert len(collection.pipelines) == 1
+
+
+def test_estimated_count_for_unfiltered_query(collection):
+    result = asyncio.run(User.find_by_query({}, count_mode='estimated'))
+    assert result.total == 1000
+    assert collection.pipelines == []
+
+
+def test_estimated_count_falls_back_to_facet_when_filtered(collection):
+    result = asyncio.run(User.find_by_query({'name': 'John'}, count_mode='estimated'))
+    assert result.total == 2
+    assert len(collection.pipelines) == 1
+
+
+def test_count_can_be_skipped(collection):
+    result = asyncio.run(User.find_by_query({}))
+    assert result.total is None
+    assert collection.pipelines == []
+
+
+def test_unknown_count_mode_is_rejected(collection):
+    with pytest.raises(ValidationException):
+        asyncio.run(User.find_by_query({}, count_mode='approx'))
+
+
+def test_envelope_reports_paging():
+    envelope = _xvert(User, ResultPage([], total=7, page=2, page_size=5))
+    assert envelope['_type'] == 'list'
+    assert (envelope['_total'], envelope['_page'], envelope['_page_size']) == (7, 2, 5)
+    assert '_total' not in _xvert(User, ResultPage([], page=1, page_size=5))
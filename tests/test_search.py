@@ -0,0 +1,100 @@
+"""Tests for search.py: prefix, case-insensitive and $text searches in the DSL and the URL query syntax."""
+import asyncio
+from typing import Annotated
+
+import pytest
+from starlette.datastructures import QueryParams
+
+from appkernel import Model, MongoCaseInsensitiveIndex, MongoIndex, MongoRepository, MongoTextIndex
+from appkernel.repository import build_page_pipeline, validate_query
+from appkernel.search import has_text_search, query_collation
+from appkernel.service import convert_to_query
+from appkernel.validators import ValidationException
+from tests.fakes import FakeCollection, patch_collection
+
+CASE_INSENSITIVE = {'locale': 'en', 'strength': 2}
+
+
+class Article(Model, MongoRepository):
+    id: str | None = None
+    title: Annotated[str | None, MongoIndex()] = None
+    author: Annotated[str | None, MongoCaseInsensitiveIndex()] = None
+    body: Annotated[str | None, MongoTextIndex()] = None
+    summary: str | None = None
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, Article,
+                            FakeCollection('Articles', [{'_id': 'A1', 'title': 'Lamps', 'text_score': 1.5}]))
+
+
+def test_dsl_search_modes(collection):
+    assert Article.where(Article.title.startswith('a.b')).filter_expr == {'title': {'$regex': '^a\\.b'}}
+    query = Article.where(Article.author.startswith('jo'), Article.author != 'Joe')
+    assert query.filter_expr == {'$and': [{'author': {'$gte': 'jo', '$lt': 'jo\uffff'}}, {'author': {'$ne': 'Joe'}}]}
+    assert query.collation == CASE_INSENSITIVE
+    query = Article.where(Article.body.search('desk lamp'), Article.title == 'Lamps')
+    assert query.filter_expr == {'$and': [{'$text': {'$search': 'desk lamp'}}, {'title': {'$eq': 'Lamps'}}]}
+    assert query.text_search and query.collation is None
+
+
+def test_query_collation_and_text_detection():
+    assert query_collation(Article, {'$or': [{'title': 'x'}, {'author': 'jane'}]}) == CASE_INSENSITIVE
+    assert query_collation(Article, {'title': 'x', 'body': 'y'}) is None
+    assert has_text_search({'$and': [{'$text': {'$search': 'lamp'}}]})
+    assert not has_text_search({'body': 'lamp'})
+
+
+def test_url_query_syntax():
+    assert convert_to_query(['title'], QueryParams([('title', '^2024 report')]), Article) == {
+        'title': {'$regex': '^2024\\ report'}}
+    assert convert_to_query(['author'], QueryParams([('author', '^jo')]), Article) == {
+        'author': {'$gte': 'jo', '$lt': 'jo\uffff'}}
+    params = QueryParams([('body', '*desk lamp'), ('title', 'Lamps')])
+    assert convert_to_query(['body', 'title'], params, Article) == {
+        '$and': [{'$text': {'$search': 'desk lamp'}}, {'title': 'Lamps'}]}
+    assert convert_to_query(['title', 'body'], QueryParams([('title', '\\^2024'), ('body', '\\*lamp')]), Article) == {
+        '$and': [{'title': '^2024'}, {'body': '*lamp'}]}
+
+
+def test_url_search_markers_are_opt_in_per_index():
+    assert convert_to_query(['title'], QueryParams([('title', '*lamp')]), Article) == {'title': '*lamp'}
+    assert convert_to_query(['body'], QueryParams([('body', '^desk')]), Article) == {'body': '^desk'}
+    for value in ('^x', '*y', '@z', '\\^x'):
+        assert convert_to_query(['summary'], QueryParams([('summary', value)]), Article) == {'summary': value}
+    assert convert_to_query(['title'], QueryParams([('title', '\\\\^x')]), Article) == {'title': '\\^x'}
+    assert convert_to_query(['title'], QueryParams([('title', '\\lamp')]), Article) == {'title': '\\lamp'}
+
+
+@pytest.mark.parametrize('params', [
+    [('body', '*desk'), ('body', '*lamp')],
+    [('body', '*desk'), ('title', 'Lamps'), ('logic', 'or')],
+])
+def test_text_search_combinations_mongodb_rejects(params):
+    with pytest.raises(ValidationException):
+        convert_to_query(['body', 'title'], QueryParams(params), Article)
+
+
+def test_text_search_is_allowed_for_untrusted_queries():
+    validate_query({'$text': {'$search': 'lamp', '$caseSensitive': False}})
+
+
+def test_find_by_query_collation_and_text_score(collection):
+    asyncio.run(Article.find_by_query({'author': 'jane'}))
+    assert collection.options['find'] == {'collation': CASE_INSENSITIVE}
+    result = asyncio.run(Article.find_by_query({'$text': {'$search': 'lamp'}}))
+    assert collection.options['find'] == {'projection': {'text_score': {'$meta': 'textScore'}}}
+    assert collection.cursors[-1].sorting == [('text_score', {'$meta': 'textScore'})]
+    assert result[0].text_score == 1.5
+    assert 'text_score' not in Model.to_dict(result[0], convert_id=True)
+    pipeline = build_page_pipeline({'$text': {'$search': 'lamp'}}, 1, 10, text_score=True)
+    assert pipeline[1]['$facet']['items'][:2] == [{'$addFields': {'text_score': {'$meta': 'textScore'}}},
+                                                  {'$sort': {'text_score': {'$meta': 'textScore'}}}]
+
+
+def test_case_insensitive_index_is_created_with_collation(collection):
+    asyncio.run(Article.init_indexes())
+    created = {keys[0][0]: options for keys, options in collection.created_indexes}
+    assert created['author'] == {'unique': False, 'name': 'author_idx', 'collation': CASE_INSENSITIVE}
+    assert 'collation' not in created['title']
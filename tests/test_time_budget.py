@@ -0,0 +1,101 @@
+"""Tests for time_budget.py: budget resolution, timeout mapping and cancellation on disconnect."""
+import asyncio
+import time
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ExecutionTimeout, NetworkTimeout, OperationFailure
+
+from appkernel.time_budget import ClientDisconnected, operation_options, resolve_time_budget, \
+    run_with_time_budget, timeout_status_code
+
+
+class _FakeRequest:
+    """Stand-in for a Starlette request which disconnects after ``after`` checks."""
+
+    def __init__(self, after=1):
+        self.after = after
+        self.checks = 0
+
+    async def is_disconnected(self):
+        self.checks += 1
+        return self.checks >= self.after
+
+
+def test_smallest_budget_wins():
+    assert resolve_time_budget(5000, requested_ms='1500') == 1500
+    assert resolve_time_budget(1000, requested_ms=8000) == 1000
+
+
+def test_budget_per_operation():
+    budgets = {'find_by_query': 2000, 'aggregate': 10000}
+    assert resolve_time_budget(budgets, 'aggregate') == 10000
+    assert resolve_time_budget(budgets, 'delete_by_id') is None
+
+
+@pytest.mark.parametrize('requested', ['abc', '0', '-5', None])
+def test_invalid_header_is_ignored(requested):
+    assert resolve_time_budget(3000, requested_ms=requested) == 3000
+
+
+def test_timeout_status_codes():
+    assert timeout_status_code(ExecutionTimeout('operation exceeded time limit', 50)) == 504
+    assert timeout_status_code(NetworkTimeout('timed out')) == 503
+    assert timeout_status_code(OperationFailure('duplicate', 11000)) is None
+    assert timeout_status_code(ValueError()) is None
+
+
+def test_operations_are_tagged_within_budget():
+    async def scenario():
+        assert operation_options() == {}
+        return await run_with_time_budget(lambda: _current_options(), 1000)
+
+    options = asyncio.run(scenario())
+    assert len(options['comment']) == 32
+
+
+async def _current_options():
+    return operation_options()
+
+
+def test_result_is_returned_while_client_is_connected():
+    async def work():
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    request = _FakeRequest(after=100)
+    assert asyncio.run(run_with_time_budget(work, None, request, poll_interval=0.01)) == 'done'
+    assert request.checks > 0
+
+
+def test_disconnect_cancels_work():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        with pytest.raises(ClientDisconnected):
+            await run_with_time_budget(work, None, _FakeRequest(), poll_interval=0.01)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert cancelled == [True]
+
+
+def test_budget_bounds_motor_operations():
+    async def scenario():
+        client = AsyncIOMotorClient('mongodb://localhost:27999')
+        started = time.monotonic()
+        with pytest.raises(Exception) as exc_info:
+            await run_with_time_budget(lambda: client.db.items.find_one({}), 200)
+        client.close()
+        return exc_info.value, time.monotonic() - started
+
+    exc, elapsed = asyncio.run(scenario())
+    assert timeout_status_code(exc) == 503
+    assert elapsed < 5
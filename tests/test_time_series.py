@@ -0,0 +1,115 @@
+"""Tests for time_series.py: time-series collection options, append-only writes and time range queries."""
+import asyncio
+from datetime import datetime
+from typing import ClassVar
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid
+
+from appkernel import Model, MongoRepository, QueryCostPolicy, TimeSeriesOptions
+from appkernel.repository import RepositoryException, collection_write_version
+from tests.fakes import FakeCollection, FakeDatabase, patch_collection
+
+MAY_1, MAY_2 = datetime(2024, 5, 1), datetime(2024, 5, 2)
+
+
+class Reading(Model, MongoRepository):
+    id: str | None = None
+    sensor: str | None = None
+    taken: datetime | None = None
+    value: float | None = None
+    time_series: ClassVar[TimeSeriesOptions] = TimeSeriesOptions(
+        time_field='taken', meta_field='sensor', granularity='minutes', expire_after_seconds=86400)
+
+
+class _TimeSeriesDatabase(FakeDatabase):
+    """Reports the collection as existing with the type ``existing_type``, when set."""
+    existing_type = None
+
+    async def create_collection(self, name, **kwargs):
+        if self.existing_type:
+            raise CollectionInvalid(f'collection {name} already exists')
+        return await super().create_collection(name, **kwargs)
+
+    async def list_collection_names(self, filter=None, **kwargs):
+        return [filter['name']] if self.existing_type == filter['type'] else []
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    return patch_collection(monkeypatch, Reading, FakeCollection('Readings', database=_TimeSeriesDatabase()))
+
+
+@pytest.mark.parametrize('options', [
+    dict(time_field='id'), dict(time_field='taken', meta_field='taken'),
+    dict(time_field='taken', granularity='days'), dict(time_field='taken', expire_after_seconds=0),
+])
+def test_invalid_options(options):
+    with pytest.raises(ValueError):
+        TimeSeriesOptions(**options)
+
+
+def test_collection_options_and_filters():
+    assert Reading.time_series.collection_options() == {
+        'timeseries': {'timeField': 'taken', 'metaField': 'sensor', 'granularity': 'minutes'},
+        'expireAfterSeconds': 86400}
+    assert TimeSeriesOptions('at').collection_options() == {'timeseries': {'timeField': 'at'}}
+    assert Reading.time_series.range_filter(MAY_1, MAY_2, meta='s1') == {
+        'sensor': 's1', 'taken': {'$gte': MAY_1, '$lt': MAY_2}}
+    assert Reading.time_series.range_filter(start=MAY_1) == {'taken': {'$gte': MAY_1}}
+    with pytest.raises(ValueError):
+        TimeSeriesOptions('at').range_filter(meta='s1')
+
+
+def test_time_series_collection_is_created(collection):
+    asyncio.run(Reading.init_indexes())
+    assert collection.database.created == [('Readings', Reading.time_series.collection_options())]
+
+
+def test_existing_collections(collection):
+    collection.database.existing_type = 'timeseries'
+    asyncio.run(Reading.create_collection())
+    assert collection.database.commands == [(('collMod', 'Readings'), {'expireAfterSeconds': 86400})]
+    collection.database.existing_type = 'collection'
+    with pytest.raises(RepositoryException):
+        asyncio.run(Reading.create_collection())
+
+
+def test_save_appends_without_version(collection):
+    reading = Reading(sensor='s1', taken=MAY_1, value=1.5)
+    write_version = collection_write_version('Readings')
+    asyncio.run(reading.save())
+    assert isinstance(reading.id, ObjectId) and getattr(reading, 'version', None) is None
+    assert len(collection.documents) == 1 and 'version' not in collection.documents[reading.id]
+    assert collection_write_version('Readings') == write_version + 1
+
+
+def test_saving_a_stored_measurement_is_rejected(collection):
+    reading = Reading(sensor='s1', taken=MAY_1, value=1.5)
+    asyncio.run(reading.save())
+    with pytest.raises(RepositoryException):
+        asyncio.run(reading.save())
+    with pytest.raises(RepositoryException):
+        asyncio.run(Reading(id='R1', sensor='s1', taken=MAY_1).save())
+    assert len(collection.documents) == 1
+
+
+def test_bulk_insert_groups_by_source(collection):
+    readings = [Reading(sensor=sensor, taken=MAY_1, value=index) for index, sensor in enumerate('abab')]
+    write_version = collection_write_version('Readings')
+    ids = asyncio.run(Reading.bulk_insert(readings))
+    assert collection_write_version('Readings') == write_version + 1
+    inserted = list(collection.documents.values())
+    assert [document['sensor'] for document in inserted] == ['a', 'a', 'b', 'b']
+    assert collection.options['insert_many'] == {'ordered': False}
+    assert ids == [document['_id'] for document in sorted(inserted, key=lambda d: d['value'])]
+
+
+def test_time_range_queries(collection):
+    asyncio.run(Reading.find_time_range(MAY_1, MAY_2, meta='s1'))
+    assert collection.queries[-1] == {'sensor': 's1', 'taken': {'$gte': MAY_1, '$lt': MAY_2}}
+    assert collection.cursors[-1].sorting == ('taken', 1)
+    policy = QueryCostPolicy().with_model_indexes(Reading)
+    assert policy.uncovered_fields({'sensor': 's1', 'taken': {'$gte': MAY_1}}, sort_by='taken') == []
+    assert policy.uncovered_fields({'value': 1}) == ['value']
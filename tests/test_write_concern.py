@@ -0,0 +1,115 @@
+"""Tests for per-Model write concerns, cached collection handles and unacknowledged writes."""
+import asyncio
+from typing import Annotated, ClassVar
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+from pymongo.errors import ConfigurationError
+from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
+
+from appkernel import AppKernelEngine, Model, MongoCaseInsensitiveIndex, MongoRepository, ReadPolicy
+from appkernel.configuration import config
+
+
+class AuditEntry(Model, MongoRepository):
+    id: str | None = None
+    action: str | None = None
+    write_concern: ClassVar[WriteConcern] = WriteConcern(w=1, j=False, wtimeout=500)
+
+
+class Heartbeat(Model, MongoRepository):
+    id: str | None = None
+    write_concern: ClassVar[WriteConcern] = WriteConcern(w=0)
+    read_policy: ClassVar[ReadPolicy] = ReadPolicy('secondaryPreferred')
+
+
+class Metric(Model, MongoRepository):
+    id: str | None = None
+    value: int | None = None
+    host: Annotated[str | None, MongoCaseInsensitiveIndex()] = None
+
+
+class _UnacknowledgedCollection:
+    name = 'Heartbeats'
+    write_concern = WriteConcern(w=0)
+
+    async def insert_one(self, document, **kwargs):
+        return InsertOneResult(document.get('_id'), False)
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        return UpdateResult({}, False)
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        return None
+
+    async def update_many(self, query, update, upsert=False, **kwargs):
+        return UpdateResult({}, False)
+
+    async def delete_one(self, query, **kwargs):
+        return DeleteResult({}, False)
+
+    async def delete_many(self, query, collation=None, **kwargs):
+        if collation is not None:
+            raise ConfigurationError('Collation is unsupported for unacknowledged writes.')
+        return DeleteResult({}, False)
+
+
+@pytest.fixture
+def database():
+    previous = getattr(config, 'mongo_database', None)
+    client = AsyncIOMotorClient('mongodb://localhost:27017', connect=False)
+    config.mongo_database = client['write_concern_test']
+    yield config.mongo_database
+    config.mongo_database = previous
+    client.close()
+
+
+def test_collection_carries_write_concern(database):
+    collection = AuditEntry.get_collection()
+    assert collection.write_concern == WriteConcern(w=1, j=False, wtimeout=500)
+    assert Metric.get_collection().write_concern == database.write_concern
+
+
+def test_collection_handles_are_cached(database):
+    assert AuditEntry.get_collection() is AuditEntry.get_collection()
+    assert Heartbeat.read_collection('find_by_query') is Heartbeat.read_collection('find_by_query')
+    assert Heartbeat.read_collection('find_by_query').write_concern == WriteConcern(w=0)
+    assert Heartbeat.read_collection('find_by_id') is Heartbeat.get_collection()
+
+
+def test_cache_follows_the_database(database):
+    first = AuditEntry.get_collection()
+    config.mongo_database = database.client['another_database']
+    second = AuditEntry.get_collection()
+    assert second is not first and second.database.name == 'another_database'
+
+
+def test_unacknowledged_writes(monkeypatch):
+    monkeypatch.setattr(Heartbeat, 'get_collection', classmethod(lambda cls: _UnacknowledgedCollection()))
+    heartbeat = Heartbeat(id='H1')
+    assert asyncio.run(heartbeat.save()) == 'H1'
+    heartbeat.version = 3
+    assert asyncio.run(heartbeat.save()) == 'H1'
+    assert heartbeat.version == 3
+    asyncio.run(heartbeat.delete())
+    assert asyncio.run(Heartbeat.delete_by_id('H1')) is None
+
+
+def test_unacknowledged_dsl_writes(monkeypatch):
+    monkeypatch.setattr(Metric, 'get_collection', classmethod(lambda cls: _UnacknowledgedCollection()))
+    assert asyncio.run(Metric.where(Metric.id == 'M1').delete()) == 0
+    assert asyncio.run(Metric.where(Metric.id == 'M1').update_one(value=Metric.value + 1)) == 0
+    assert asyncio.run(Metric.where(Metric.id == 'M1').update_many(value=Metric.value + 1)) == 0
+    assert asyncio.run(Metric.where(Metric.host == 'Web-1').delete()) == 0
+
+
+def test_unacknowledged_http_delete_is_not_a_404(monkeypatch):
+    monkeypatch.setattr(Heartbeat, 'get_collection', classmethod(lambda cls: _UnacknowledgedCollection()))
+    app = FastAPI()
+    kernel = AppKernelEngine('write-concern-test', app=app, enable_defaults=True)
+    kernel.register(Heartbeat, methods=['DELETE'])
+    with TestClient(app) as client:
+        assert client.delete('/heartbeats/H1').status_code == 204